@@ -9,6 +9,10 @@ python demo/large_image_demo.py \
     configs/faster_rcnn/faster-rcnn_r101_fpn_2x_coco.py \
     checkpoint/faster_rcnn_r101_fpn_2x_coco_bbox_mAP-0.398_20200504_210455-1d2dac9c.pth
 ```
+
+The patches of all the images are batched together. For the dual-stream
+detectors, pass the images of the second stream, e.g. the TIR images, with
+``--img2``.
 """
 
 import os
@@ -22,16 +26,10 @@ from mmengine.config import Config, ConfigDict
 from mmengine.logging import print_log
 from mmengine.utils import ProgressBar
 
-from mmdet.apis import inference_detector, init_detector
-
-try:
-    from sahi.slicing import slice_image
-except ImportError:
-    raise ImportError('Please run "pip install -U sahi" '
-                      'to install sahi first for large image inference.')
-
+from mmdet.apis import init_detector, sliced_inference_detector
 from mmdet.registry import VISUALIZERS
-from mmdet.utils.large_image import merge_results_by_nms, shift_predictions
+from mmdet.utils.large_image import (MERGE_TYPES, shift_predictions,
+                                     slice_image)
 from mmdet.utils.misc import get_file_list
 
 
@@ -42,6 +40,10 @@ def parse_args():
         'img', help='Image path, include image file, dir and URL.')
     parser.add_argument('config', help='Config file')
     parser.add_argument('checkpoint', help='Checkpoint file')
+    parser.add_argument(
+        '--img2',
+        help='Image path of the second stream of the dual-stream detectors, '
+        'a file or a dir with the same structure as `img`.')
     parser.add_argument(
         '--out-dir', default='./output', help='Path to output file')
     parser.add_argument(
@@ -70,7 +72,9 @@ def parse_args():
         '--merge-nms-type',
         type=str,
         default='nms',
-        help='NMS type for merging results')
+        choices=MERGE_TYPES,
+        help='Method for merging results, NMS, Soft-NMS, weighted boxes '
+        'fusion or NMS favoring the objects not cut by a patch')
     parser.add_argument(
         '--batch-size',
         type=int,
@@ -129,41 +133,39 @@ def main():
 
     # get file list
     files, source_type = get_file_list(args.img)
+    files2 = None
+    if args.img2 is not None:
+        files2 = [
+            os.path.join(args.img2, os.path.relpath(file, args.img))
+            for file in files
+        ] if source_type['is_dir'] else [args.img2]
+
+    iou_key = 'iou_thr' if args.merge_nms_type == 'wbf' else \
+        'iou_threshold'
+    merge_cfg = {'type': args.merge_nms_type, iou_key: args.merge_iou_thr}
 
     # start detector inference
     print(f'Performing inference on {len(files)} images.... '
           'This may take a while.')
+    results = sliced_inference_detector(
+        model,
+        files,
+        files2,
+        patch_size=args.patch_size,
+        overlap_ratio=args.patch_overlap_ratio,
+        batch_size=args.batch_size,
+        merge_cfg=merge_cfg,
+        return_patch_results=args.debug)
+
     progress_bar = ProgressBar(len(files))
-    for file in files:
+    for file, result in zip(files, results):
         # read image
         img = mmcv.imread(file)
-
-        # arrange slices
         height, width = img.shape[:2]
-        sliced_image_object = slice_image(
-            img,
-            slice_height=args.patch_size,
-            slice_width=args.patch_size,
-            auto_slice_resolution=False,
-            overlap_height_ratio=args.patch_overlap_ratio,
-            overlap_width_ratio=args.patch_overlap_ratio,
-        )
-        # perform sliced inference
-        slice_results = []
-        start = 0
-        while True:
-            # prepare batch slices
-            end = min(start + args.batch_size, len(sliced_image_object))
-            images = []
-            for sliced_image in sliced_image_object.images[start:end]:
-                images.append(sliced_image)
-
-            # forward the model
-            slice_results.extend(inference_detector(model, images))
-
-            if end >= len(sliced_image_object):
-                break
-            start += args.batch_size
+        if args.debug:
+            image_result, slice_results, offsets = result
+        else:
+            image_result = result
 
         if source_type['is_dir']:
             filename = os.path.relpath(file, args.img).replace('/', '_')
@@ -179,9 +181,7 @@ def main():
             name, suffix = os.path.splitext(filename)
 
             shifted_instances = shift_predictions(
-                slice_results,
-                sliced_image_object.starting_pixels,
-                src_image_shape=(height, width))
+                slice_results, offsets, src_image_shape=(height, width))
             merged_result = slice_results[0].clone()
             merged_result.pred_instances = shifted_instances
 
@@ -191,7 +191,7 @@ def main():
             visualizer.set_image(img.copy())
 
             debug_grids = []
-            for starting_point in sliced_image_object.starting_pixels:
+            for starting_point in offsets:
                 start_point_x = starting_point[0]
                 start_point_y = starting_point[1]
                 end_point_x = start_point_x + args.patch_size
@@ -232,14 +232,15 @@ def main():
             )
 
             if args.save_patch:
+                sliced_images = slice_image(
+                    mmcv.imread(file), offsets, args.patch_size)
                 debug_patch_out_dir = os.path.join(args.out_dir,
                                                    f'{name}_patch')
                 for i, slice_result in enumerate(slice_results):
                     patch_out_file = os.path.join(
                         debug_patch_out_dir,
                         f'{filename}_slice_{i}_result.jpg')
-                    image = mmcv.imconvert(sliced_image_object.images[i],
-                                           'bgr', 'rgb')
+                    image = mmcv.imconvert(sliced_images[i], 'bgr', 'rgb')
 
                     visualizer.add_datasample(
                         'patch_result',
@@ -252,15 +253,6 @@ def main():
                         pred_score_thr=args.score_thr,
                     )
 
-        image_result = merge_results_by_nms(
-            slice_results,
-            sliced_image_object.starting_pixels,
-            src_image_shape=(height, width),
-            nms_cfg={
-                'type': args.merge_nms_type,
-                'iou_threshold': args.merge_iou_thr
-            })
-
         visualizer.add_datasample(
             filename,
             img,
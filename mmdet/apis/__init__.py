@@ -2,8 +2,10 @@
 from .det_inferencer import DetInferencer
 from .inference import (async_inference_detector, inference_detector,
                         inference_mot, init_detector, init_track_model)
+from .sliced_inference import sliced_inference_detector
 
 __all__ = [
     'init_detector', 'async_inference_detector', 'inference_detector',
-    'DetInferencer', 'inference_mot', 'init_track_model'
+    'DetInferencer', 'inference_mot', 'init_track_model',
+    'sliced_inference_detector'
 ]
@@ -2,7 +2,10 @@
 import copy
 import os.path as osp
 import warnings
-from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import (Callable, Dict, Iterable, List, Optional, Sequence, Tuple,
+                    Union)
 
 import mmcv
 import mmengine
@@ -19,6 +22,7 @@ from mmengine.runner.checkpoint import _load_checkpoint_to_model
 from mmengine.visualization import Visualizer
 from rich.progress import track
 
+from mmdet.datasets.transforms.my_loading import LoadImageFromFile2
 from mmdet.evaluation import INSTANCE_OFFSET
 from mmdet.registry import DATASETS
 from mmdet.structures import DetDataSample
@@ -33,8 +37,10 @@ except ImportError:
     id2rgb = None
     VOID = None
 
-InputType = Union[str, np.ndarray]
+PairType = Union[Tuple[str, str], Tuple[np.ndarray, np.ndarray]]
+InputType = Union[str, np.ndarray, PairType]
 InputsType = Union[InputType, Sequence[InputType]]
+PairRuleType = Union[Tuple[str, str], Callable[[str], str]]
 PredType = List[DetDataSample]
 ImgType = Union[np.ndarray, Sequence[np.ndarray]]
 
@@ -63,6 +69,14 @@ class DetInferencer(BaseInferencer):
             priority is palette -> config -> checkpoint. Defaults to 'none'.
         show_progress (bool): Control whether to display the progress
             bar during the inference process. Defaults to True.
+        pair_rule (tuple[str, str] | Callable, optional): How to find the
+            second image of a pair for the dual-stream models from the path
+            of the first one, either a function or the two strings of a
+            replacement, e.g. ``('/rgb/', '/tir/')`` like
+            ``DualStreamCocoDataset.find_pair_image_path``. If it is set or
+            the test pipeline loads ``img2`` with ``LoadImageFromFile2``, the
+            pairs can also be given as tuples of two paths or arrays.
+            Defaults to None.
     """
 
     preprocess_kwargs: set = set()
@@ -89,12 +103,14 @@ class DetInferencer(BaseInferencer):
                  device: Optional[str] = None,
                  scope: Optional[str] = 'mmdet',
                  palette: str = 'none',
-                 show_progress: bool = True) -> None:
+                 show_progress: bool = True,
+                 pair_rule: Optional[PairRuleType] = None) -> None:
         # A global counter tracking the number of images processed, for
         # naming of the output images
         self.num_visualized_imgs = 0
         self.num_predicted_imgs = 0
         self.palette = palette
+        self.pair_rule = pair_rule
         init_default_scope(scope)
         super().__init__(
             model=model, weights=weights, device=device, scope=scope)
@@ -172,6 +188,13 @@ class DetInferencer(BaseInferencer):
             raise ValueError(
                 'LoadImageFromFile is not found in the test pipeline')
         pipeline_cfg[load_img_idx]['type'] = 'mmdet.InferencerLoader'
+        # the second stream of the dual-stream models
+        load_img2_idx = self._get_transform_idx(
+            pipeline_cfg, ('LoadImageFromFile2', 'mmdet.LoadImageFromFile2',
+                           LoadImageFromFile2))
+        self.with_img2 = load_img2_idx != -1
+        if self.with_img2:
+            pipeline_cfg[load_img2_idx]['type'] = 'mmdet.InferencerLoader2'
         return Compose(pipeline_cfg)
 
     def _get_transform_idx(self, pipeline_cfg: ConfigType,
@@ -203,7 +226,9 @@ class DetInferencer(BaseInferencer):
 
         Preprocess inputs to a list according to its type:
 
-        - list or tuple: return inputs
+        - list: return inputs
+        - tuple of two paths or arrays: a pair of images if ``pair_rule`` is
+          set or the pipeline loads a second stream, otherwise two images
         - str:
             - Directory path: return all files in the directory
             - other cases: return a list containing the string. The string
@@ -228,12 +253,38 @@ class DetInferencer(BaseInferencer):
                     join_path(inputs, filename) for filename in filename_list
                 ]
 
-        if not isinstance(inputs, (list, tuple)):
+        if not isinstance(inputs, (list, tuple)) or self._is_pair(inputs):
             inputs = [inputs]
 
-        return list(inputs)
-
-    def preprocess(self, inputs: InputsType, batch_size: int = 1, **kwargs):
+        return [self._pair_to_dict(inputs_) for inputs_ in inputs]
+
+    def _is_pair(self, inputs) -> bool:
+        """Whether the inputs are a pair of images, only for the dual-stream
+        models, i.e. ``pair_rule`` is set or ``img2`` is loaded."""
+        if self.pair_rule is None and not self.with_img2:
+            return False
+        return isinstance(inputs, tuple) and len(inputs) == 2 and all(
+            isinstance(x, (str, np.ndarray)) for x in inputs)
+
+    def _pair_to_dict(self, inputs_):
+        """Convert a pair of images, given as a tuple or by ``pair_rule``,
+        to the inputs of the pipeline."""
+        if isinstance(inputs_, str) and self.pair_rule is not None:
+            if callable(self.pair_rule):
+                inputs_ = (inputs_, self.pair_rule(inputs_))
+            else:
+                inputs_ = (inputs_, inputs_.replace(*self.pair_rule))
+        if not self._is_pair(inputs_):
+            return inputs_
+        if isinstance(inputs_[0], str):
+            return dict(img_path=inputs_[0], img_path2=inputs_[1])
+        return dict(img=inputs_[0], img2=inputs_[1])
+
+    def preprocess(self,
+                   inputs: InputsType,
+                   batch_size: int = 1,
+                   num_workers: int = 0,
+                   **kwargs):
         """Process the inputs into a model-feedable format.
 
         Customize your preprocess by overriding this method. Preprocess should
@@ -253,44 +304,72 @@ class DetInferencer(BaseInferencer):
         Args:
             inputs (InputsType): Inputs given by user.
             batch_size (int): batch size. Defaults to 1.
+            num_workers (int): Number of threads loading and transforming the
+                inputs ahead of the current batch. Defaults to 0, which means
+                the inputs are processed in the main thread when needed.
 
         Yields:
             Any: Data processed by the ``pipeline`` and ``collate_fn``.
         """
-        chunked_data = self._get_chunk_data(inputs, batch_size)
+        chunked_data = self._get_chunk_data(inputs, batch_size, num_workers)
         yield from map(self.collate_fn, chunked_data)
 
-    def _get_chunk_data(self, inputs: Iterable, chunk_size: int):
+    def _load_input(self, inputs_) -> tuple:
+        """Run the pipeline on an input and return it with the original
+        input to visualize."""
+        if isinstance(inputs_, dict):
+            if 'img' in inputs_:
+                ori_inputs_ = inputs_['img']
+            else:
+                ori_inputs_ = inputs_['img_path']
+            return ori_inputs_, self.pipeline(copy.deepcopy(inputs_))
+        return inputs_, self.pipeline(inputs_)
+
+    def _get_chunk_data(self,
+                        inputs: Iterable,
+                        chunk_size: int,
+                        num_workers: int = 0):
         """Get batch data from inputs.
 
+        With ``num_workers > 0``, the inputs of the next chunk are decoded
+        and transformed by a thread pool while the current chunk is yielded,
+        at most two chunks being in flight.
+
         Args:
             inputs (Iterable): An iterable dataset.
             chunk_size (int): Equivalent to batch size.
+            num_workers (int): Number of loading threads. Defaults to 0.
 
         Yields:
             list: batch data.
         """
-        inputs_iter = iter(inputs)
-        while True:
-            try:
-                chunk_data = []
-                for _ in range(chunk_size):
-                    inputs_ = next(inputs_iter)
-                    if isinstance(inputs_, dict):
-                        if 'img' in inputs_:
-                            ori_inputs_ = inputs_['img']
-                        else:
-                            ori_inputs_ = inputs_['img_path']
-                        chunk_data.append(
-                            (ori_inputs_,
-                             self.pipeline(copy.deepcopy(inputs_))))
-                    else:
-                        chunk_data.append((inputs_, self.pipeline(inputs_)))
-                yield chunk_data
-            except StopIteration:
-                if chunk_data:
+        if num_workers == 0:
+            chunk_data = []
+            for inputs_ in inputs:
+                chunk_data.append(self._load_input(inputs_))
+                if len(chunk_data) == chunk_size:
                     yield chunk_data
-                break
+                    chunk_data = []
+            if chunk_data:
+                yield chunk_data
+            return
+
+        with ThreadPoolExecutor(num_workers) as executor:
+            pending = deque()
+            inputs_iter = iter(inputs)
+            while True:
+                while len(pending) < 2 * chunk_size:
+                    try:
+                        inputs_ = next(inputs_iter)
+                    except StopIteration:
+                        break
+                    pending.append(executor.submit(self._load_input, inputs_))
+                if not pending:
+                    break
+                yield [
+                    pending.popleft().result()
+                    for _ in range(min(chunk_size, len(pending)))
+                ]
 
     # TODO: Video and Webcam are currently not supported and
     #  may consume too much memory if your input folder has a lot of images.
@@ -317,6 +396,7 @@ class DetInferencer(BaseInferencer):
             custom_entities: bool = False,
             # by Grounding DINO
             tokens_positive: Optional[Union[int, list]] = None,
+            num_workers: int = 0,
             **kwargs) -> dict:
         """Call the inferencer.
 
@@ -346,6 +426,12 @@ class DetInferencer(BaseInferencer):
                 panoptic task. Defaults to None.
             custom_entities (bool): Whether to use custom entities.
                 Defaults to False. Only used in GLIP and Grounding DINO.
+            num_workers (int): Number of threads decoding and transforming
+                the next batches during the forward of the current one. If
+                positive, the visualization and the dumping of the results of
+                a batch also run in a background thread, in order, during the
+                forward of the next batches, unless ``show`` is True.
+                Defaults to 0.
             **kwargs: Other keyword arguments passed to :meth:`preprocess`,
                 :meth:`forward`, :meth:`visualize` and :meth:`postprocess`.
                 Each key in kwargs should be in the corresponding set of
@@ -395,12 +481,14 @@ class DetInferencer(BaseInferencer):
                 ori_inputs[i]['stuff_text'] = stuff_texts[i]
 
         inputs = self.preprocess(
-            ori_inputs, batch_size=batch_size, **preprocess_kwargs)
+            ori_inputs,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            **preprocess_kwargs)
 
         results_dict = {'predictions': [], 'visualization': []}
-        for ori_imgs, data in (track(inputs, description='Inference')
-                               if self.show_progress else inputs):
-            preds = self.forward(data, **forward_kwargs)
+
+        def dump(ori_imgs, preds):
             visualization = self.visualize(
                 ori_imgs,
                 preds,
@@ -423,6 +511,27 @@ class DetInferencer(BaseInferencer):
             results_dict['predictions'].extend(results['predictions'])
             if results['visualization'] is not None:
                 results_dict['visualization'].extend(results['visualization'])
+
+        inputs = (
+            track(inputs, description='Inference')
+            if self.show_progress else inputs)
+        if num_workers == 0 or show:
+            # the windows are shown from the main thread
+            for ori_imgs, data in inputs:
+                dump(ori_imgs, self.forward(data, **forward_kwargs))
+            return results_dict
+
+        # a single thread keeps the results and the names of the output
+        # files in order
+        with ThreadPoolExecutor(1) as executor:
+            pending = deque()
+            for ori_imgs, data in inputs:
+                preds = self.forward(data, **forward_kwargs)
+                pending.append(executor.submit(dump, ori_imgs, preds))
+                if len(pending) > 2:
+                    pending.popleft().result()
+            for future in pending:
+                future.result()
         return results_dict
 
     def visualize(self,
@@ -0,0 +1,156 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import copy
+from typing import Iterator, List, Optional, Sequence, Union
+
+import mmcv
+import numpy as np
+import torch
+import torch.nn as nn
+from mmcv.transforms import Compose
+from mmengine.config import ConfigDict
+
+from mmdet.structures import DetDataSample
+from mmdet.utils import get_test_pipeline_cfg
+from mmdet.utils.large_image import (get_slice_offsets, merge_results,
+                                     slice_image)
+
+ImageType = Union[str, np.ndarray]
+
+# the transforms loading the images or the annotations, which are replaced by
+# the patches
+LOADING_TRANSFORMS = ('LoadImageFromFile', 'LoadImageFromFile2',
+                      'LoadImageFromFile3', 'LoadImageFromNDArray',
+                      'LoadImageFromFileCached', 'LoadPairedImagesFromShards',
+                      'LoadAnnotations')
+
+
+def _patch_pipeline(cfg: ConfigDict) -> Compose:
+    pipeline_cfg = copy.deepcopy(get_test_pipeline_cfg(cfg))
+    pipeline_cfg = [
+        transform for transform in pipeline_cfg
+        if transform['type'].split('.')[-1] not in LOADING_TRANSFORMS
+    ]
+    return Compose(pipeline_cfg)
+
+
+def _read(img: ImageType) -> np.ndarray:
+    return mmcv.imread(img) if isinstance(img, str) else img
+
+
+def sliced_inference_detector(
+    model: nn.Module,
+    imgs: Union[ImageType, Sequence[ImageType]],
+    imgs2: Optional[Union[ImageType, Sequence[ImageType]]] = None,
+    patch_size: int = 640,
+    overlap_ratio: float = 0.25,
+    batch_size: int = 8,
+    merge_cfg: Optional[dict] = None,
+    test_pipeline: Optional[Compose] = None,
+    return_patch_results: bool = False
+) -> Union[DetDataSample, List[DetDataSample], tuple, List[tuple]]:
+    """Inference large image(s) with the detector by overlapping patches.
+
+    The patches of all the images are run through the model by batches of
+    ``batch_size``, so that the memory is bounded whatever the size of the
+    images while the batches are full. The predictions of the patches of an
+    image are shifted to the image and merged by :func:`merge_results` once
+    all its patches have been processed.
+
+    For the dual-stream detectors, ``imgs2`` gives the second stream, e.g.
+    the TIR images, which is cut into the same patches as ``imgs`` and fed as
+    ``inputs2``.
+
+    Args:
+        model (nn.Module): The loaded detector.
+        imgs (str, ndarray, Sequence[str/ndarray]): Either image files or
+            loaded images.
+        imgs2 (str, ndarray, Sequence[str/ndarray], optional): The images of
+            the second stream, aligned with ``imgs``. Defaults to None.
+        patch_size (int): The size of the patches. Defaults to 640.
+        overlap_ratio (float): Ratio of overlap between two patches.
+            Defaults to 0.25.
+        batch_size (int): Number of patches in a batch. Defaults to 8.
+        merge_cfg (dict, optional): Config of :func:`merge_results`.
+            Defaults to None, which means NMS with an IoU threshold of 0.25.
+        test_pipeline (:obj:`Compose`, optional): The pipeline of a patch,
+            which starts from the loaded images. Defaults to None, which means
+            the test pipeline of the config of the model without the loading
+            transforms.
+        return_patch_results (bool): Whether to also return the predictions
+            of the patches of each image, e.g. to debug the merging.
+            Defaults to False.
+
+    Returns:
+        :obj:`DetDataSample` or list[:obj:`DetDataSample`]:
+        If imgs is a list or tuple, the same length list type results
+        will be returned, otherwise return the detection results directly.
+        With ``return_patch_results``, the result of an image is a tuple of
+        the merged result, the list of the results of its patches and the
+        list of the offsets of the patches.
+    """
+    is_batch = isinstance(imgs, (list, tuple))
+    if not is_batch:
+        imgs = [imgs]
+        imgs2 = None if imgs2 is None else [imgs2]
+    if imgs2 is not None:
+        assert len(imgs2) == len(imgs), \
+            'imgs2 should have the same length as imgs.'
+    if merge_cfg is None:
+        merge_cfg = dict(type='nms', iou_threshold=0.25)
+    if test_pipeline is None:
+        test_pipeline = _patch_pipeline(model.cfg)
+
+    def patches() -> Iterator[tuple]:
+        for i, img in enumerate(imgs):
+            img = _read(img)
+            img2 = None if imgs2 is None else _read(imgs2[i])
+            if img2 is not None:
+                assert img2.shape[:2] == img.shape[:2], \
+                    'The images of the two streams should have the same size.'
+            offsets = get_slice_offsets(img.shape[:2], patch_size,
+                                        overlap_ratio)
+            patches2 = [None] * len(offsets) if img2 is None else slice_image(
+                img2, offsets, patch_size)
+            for j, (patch, patch2) in enumerate(
+                    zip(slice_image(img, offsets, patch_size), patches2)):
+                data = dict(
+                    img=patch,
+                    img_shape=patch.shape[:2],
+                    ori_shape=patch.shape[:2],
+                    img_path=None,
+                    img_id=i)
+                if patch2 is not None:
+                    data.update(
+                        img2=patch2,
+                        img_shape2=patch2.shape[:2],
+                        ori_shape2=patch2.shape[:2])
+                yield i, offsets, img.shape[:2], j, test_pipeline(data)
+
+    results = [None] * len(imgs)
+    patch_results = []
+    batch = []
+
+    def run_batch():
+        data = dict()
+        for key in batch[0][-1]:
+            data[key] = [item[-1][key] for item in batch]
+        with torch.no_grad():
+            outputs = model.test_step(data)
+        for (i, offsets, image_shape, j, _), output in zip(batch, outputs):
+            patch_results.append(output)
+            if j == len(offsets) - 1:
+                results[i] = merge_results(patch_results, offsets, image_shape,
+                                           merge_cfg)
+                if return_patch_results:
+                    results[i] = (results[i], list(patch_results), offsets)
+                patch_results.clear()
+        batch.clear()
+
+    for item in patches():
+        batch.append(item)
+        if len(batch) == batch_size:
+            run_batch()
+    if batch:
+        run_batch()
+
+    return results if is_batch else results[0]
@@ -0,0 +1,166 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import os
+import os.path as osp
+import pickle
+import shutil
+import tempfile
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+from mmengine.utils import mkdir_or_exist
+
+INSTANCE_KEYS = ('bbox', 'bbox_label', 'ignore_flag')
+
+
+def _serialize(objs: list) -> tuple:
+    buffers = [pickle.dumps(obj, protocol=4) for obj in objs]
+    ends = np.cumsum([len(buffer) for buffer in buffers], dtype=np.int64)
+    return np.frombuffer(b''.join(buffers), dtype=np.uint8), ends
+
+
+class AnnotationCache:
+    """Memory-mapped columnar cache of the parsed ``data_list`` of a
+    detection dataset.
+
+    The ``bbox``, ``bbox_label`` and ``ignore_flag`` of all the instances are
+    concatenated in ``bboxes.npy``, ``labels.npy`` and ``ignore_flags.npy``,
+    ``inst_ends.npy`` holds the end offset of the instances of each image. The
+    other fields of an image, e.g. ``img_path`` or the masks of its instances,
+    are pickled in ``infos.npy`` with their end offsets in ``info_ends.npy``.
+    The arrays are mapped lazily on first access, so every dataloader worker
+    reads the annotations from the shared page cache instead of holding its
+    own copy.
+
+    Args:
+        cache_dir (str): Directory of the cache written by :meth:`dump`.
+    """
+
+    ARRAYS = ('infos', 'info_ends', 'bboxes', 'labels', 'ignore_flags',
+              'inst_ends')
+
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir = cache_dir
+        self._arrays = None
+
+    def _load(self) -> dict:
+        if self._arrays is None:
+            self._arrays = {
+                name:
+                np.load(
+                    osp.join(self.cache_dir, f'{name}.npy'), mmap_mode='r')
+                for name in self.ARRAYS
+            }
+        return self._arrays
+
+    def __len__(self) -> int:
+        return len(self._load()['info_ends'])
+
+    def __getitem__(self, index: int) -> dict:
+        """Get the data information of an image."""
+        arrays = self._load()
+        start = 0 if index == 0 else arrays['info_ends'][index - 1].item()
+        end = arrays['info_ends'][index].item()
+        data_info = pickle.loads(memoryview(arrays['infos'][start:end]))
+        if '_instance_extras' not in data_info:
+            return data_info
+
+        extras = data_info.pop('_instance_extras')
+        start = 0 if index == 0 else arrays['inst_ends'][index - 1].item()
+        end = arrays['inst_ends'][index].item()
+        columns = zip(arrays['bboxes'][start:end].tolist(),
+                      arrays['labels'][start:end].tolist(),
+                      arrays['ignore_flags'][start:end].tolist())
+        instances = []
+        for i, values in enumerate(columns):
+            instance = dict(zip(INSTANCE_KEYS, values))
+            if extras is not None:
+                instance.update(extras[i])
+            instances.append(instance)
+        data_info['instances'] = instances
+        return data_info
+
+    def load_attrs(self) -> dict:
+        """Load the dataset attributes saved with the cache, e.g.
+        ``cat_ids``."""
+        with open(osp.join(self.cache_dir, 'attrs.pkl'), 'rb') as f:
+            return pickle.load(f)
+
+    @staticmethod
+    def dump(data_list: List[dict],
+             cache_dir: str,
+             attrs: Optional[dict] = None) -> None:
+        """Write ``data_list`` into a cache.
+
+        The cache is written into a temporary directory first and then
+        renamed, so concurrent processes never read a partial cache. If
+        ``cache_dir`` already exists, it is kept.
+
+        Args:
+            data_list (List[dict]): Parsed data information of the images.
+                The instances are stored in columns if all of them have a
+                ``bbox``, a ``bbox_label`` and an ``ignore_flag``, else they
+                are pickled with the other fields of the image.
+            cache_dir (str): Output directory.
+            attrs (dict, optional): Picklable dataset attributes to restore
+                with :meth:`load_attrs`. Defaults to None.
+        """
+        infos, num_insts = [], []
+        bboxes, labels, ignore_flags = [], [], []
+        for data_info in data_list:
+            data_info = dict(data_info)
+            instances = data_info.get('instances')
+            if instances is None or not all(
+                    set(INSTANCE_KEYS) <= instance.keys()
+                    for instance in instances):
+                infos.append(data_info)
+                num_insts.append(0)
+                continue
+            extras = [{
+                key: value
+                for key, value in instance.items() if key not in INSTANCE_KEYS
+            } for instance in instances]
+            data_info.pop('instances')
+            data_info['_instance_extras'] = extras if any(extras) else None
+            for instance in instances:
+                bboxes.append(instance['bbox'])
+                labels.append(instance['bbox_label'])
+                ignore_flags.append(instance['ignore_flag'])
+            infos.append(data_info)
+            num_insts.append(len(instances))
+
+        arrays = dict(
+            bboxes=np.array(bboxes, dtype=np.float64).reshape(-1, 4),
+            labels=np.array(labels, dtype=np.int64),
+            ignore_flags=np.array(ignore_flags, dtype=np.uint8),
+            inst_ends=np.cumsum(num_insts, dtype=np.int64))
+        arrays['infos'], arrays['info_ends'] = _serialize(infos)
+
+        parent = osp.dirname(osp.abspath(cache_dir))
+        mkdir_or_exist(parent)
+        tmp_dir = tempfile.mkdtemp(dir=parent)
+        try:
+            for name, array in arrays.items():
+                np.save(osp.join(tmp_dir, f'{name}.npy'), array)
+            with open(osp.join(tmp_dir, 'attrs.pkl'), 'wb') as f:
+                pickle.dump(attrs or dict(), f, protocol=4)
+            os.rename(tmp_dir, cache_dir)
+        except OSError:
+            # another process has written the cache in the meantime
+            if not osp.isdir(cache_dir):
+                raise
+        finally:
+            if osp.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir)
+
+
+def subset_indices(num: int, indices: Union[Sequence[int], int]) -> np.ndarray:
+    """Convert the ``indices`` argument of :class:`BaseDataset` into an array
+    of indices, like ``BaseDataset._get_unserialized_subset``."""
+    if isinstance(indices, int):
+        if indices >= 0:
+            return np.arange(num)[:indices]
+        return np.arange(num)[indices:]
+    if isinstance(indices, Sequence):
+        return np.arange(num)[list(indices)]
+    raise TypeError('indices should be a int or sequence of int, '
+                    f'but got {type(indices)}')
@@ -26,6 +26,13 @@ class COCO(_COCO):
         self.img_ann_map = self.imgToAnns
         self.cat_img_map = self.catToImgs
 
+    def createIndex(self):
+        super().createIndex()
+        # the index may be rebuilt after ``__init__``, e.g. for a dataset
+        # created in memory, keep the aliases in sync
+        self.img_ann_map = self.imgToAnns
+        self.cat_img_map = self.catToImgs
+
     def get_ann_ids(self, img_ids=[], cat_ids=[], area_rng=[], iscrowd=None):
         return self.getAnnIds(img_ids, cat_ids, area_rng, iscrowd)
 
@@ -0,0 +1,440 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import copy
+import datetime
+import time
+
+import numpy as np
+from pycocotools.cocoeval import COCOeval
+
+
+def _group_ranks(groups):
+    """Rank of each element in its group, the groups should be sorted."""
+    inds = np.arange(len(groups))
+    is_first = np.ones(len(groups), dtype=bool)
+    is_first[1:] = groups[1:] != groups[:-1]
+    return inds - np.maximum.accumulate(np.where(is_first, inds, 0))
+
+
+def _index_dtype(bound):
+    """The smallest of int16 and int32 which holds the indices below
+    ``bound``."""
+    return np.int16 if bound <= np.iinfo(np.int16).max + 1 else np.int32
+
+
+def _pair_ious(dt_boxes, gt_boxes, gt_crowd):
+    """IoUs of the paired xywh boxes, computed in the same way as
+    ``pycocotools.mask.iou``."""
+    w = np.minimum(dt_boxes[:, 0] + dt_boxes[:, 2], gt_boxes[:, 0] +
+                   gt_boxes[:, 2]) - np.maximum(dt_boxes[:, 0], gt_boxes[:, 0])
+    h = np.minimum(dt_boxes[:, 1] + dt_boxes[:, 3], gt_boxes[:, 1] +
+                   gt_boxes[:, 3]) - np.maximum(dt_boxes[:, 1], gt_boxes[:, 1])
+    overlap = (w > 0) & (h > 0)
+    inter = np.where(overlap, w * h, 0)
+    dt_areas = dt_boxes[:, 2] * dt_boxes[:, 3]
+    gt_areas = gt_boxes[:, 2] * gt_boxes[:, 3]
+    # the crowd regions are divided by the areas of the detections
+    union = np.where(gt_crowd, dt_areas, dt_areas + gt_areas - inter)
+    return np.divide(
+        inter, union, out=np.zeros_like(inter), where=overlap & (union > 0))
+
+
+def _greedy_match(ious, num_dets, gt_ignore, gt_crowd, iou_thrs):
+    """Match the detections of a batch of (image, category) to the ground
+    truths in the same way as ``COCOeval.evaluateImg``.
+
+    The detections are matched one rank at a time, for all the images, the
+    categories, the area ranges and the IoU thresholds at once.
+
+    Args:
+        ious (np.ndarray): The IoUs in shape (G, D, N), padded with -1. The
+            detections are sorted by their scores.
+        num_dets (np.ndarray): The number of the detections of each group, in
+            descending order.
+        gt_ignore (np.ndarray): Whether the ground truths are ignored in each
+            area range, in shape (G, A, N).
+        gt_crowd (np.ndarray): Whether the ground truths are crowd regions,
+            in shape (G, N).
+        iou_thrs (np.ndarray): The IoU thresholds in shape (T, ).
+
+    Returns:
+        tuple[np.ndarray]: Whether the detections are matched and whether
+        the matched ground truths are ignored, both in shape (G, D, A, T).
+    """
+    G, D, N = ious.shape
+    A, T = gt_ignore.shape[1], len(iou_thrs)
+    matched = np.zeros((G, D, A, T), dtype=bool)
+    matched_ignore = np.zeros((G, D, A, T), dtype=bool)
+    gt_matched = np.zeros((G, A, T, N), dtype=bool)
+    # a crowd region can be matched more than once
+    reusable = gt_crowd[:, None, None]
+    ignore = gt_ignore[:, :, None]
+    # reversed, so that ``argmax`` takes the last of the ties like COCOeval
+    reversed_ious = ious[..., ::-1]
+    thrs = np.minimum(iou_thrs, 1 - 1e-10)[:, None]
+    for d in range(D):
+        n = np.count_nonzero(num_dets > d)
+        iou = ious[:n, d, None, None]
+        available = (iou >= thrs) & (~gt_matched[:n] | reusable[:n])
+        # the ignored ground truths are only matched when none of the others
+        # is available
+        regular = available & ~ignore[:n]
+        ignored = available & ignore[:n]
+        has_regular = regular.any(-1)
+        has_ignored = ignored.any(-1)
+        inds = np.where(has_regular[..., None], regular, ignored)[..., ::-1]
+        inds = N - 1 - np.argmax(
+            np.where(inds, reversed_ious[:n, d, None, None], -1), axis=-1)
+        hit = has_regular | has_ignored
+        matched[:n, d] = hit
+        matched_ignore[:n, d] = hit & ~has_regular
+        gt_matched[:n] |= hit[..., None] & (np.arange(N) == inds[..., None])
+    return matched, matched_ignore
+
+
+class COCOevalFast(COCOeval):
+    """Array based COCOeval for the bbox evaluation.
+
+    ``COCOeval.evaluateImg`` matches the detections of every (image,
+    category, area range) in Python. Here the IoUs of all the pairs in the
+    same image and category are computed at once, and the greedy matching
+    runs one detection rank at a time for all the images, categories, area
+    ranges and IoU thresholds. Only the detections and the ground truths
+    overlapping above the lowest IoU threshold take part in the matching.
+    ``accumulate`` sorts the detections of each category once and computes
+    the precision and the recall with cumulative sums.
+
+    The crowd regions, the area ranges, ``maxDets`` and the 101 point
+    interpolation follow COCOeval, and ``summarize`` is inherited. Note that
+    ``evalImgs`` is not filled.
+
+    Args:
+        cocoGt (COCO, optional): The ground truths.
+        cocoDt (COCO, optional): The detections.
+        iouType (str): Type of the evaluation, only 'bbox' is supported.
+            Defaults to 'bbox'.
+        chunk_size (int): Maximum number of the elements in the padded IoU
+            matrix matched at once. Defaults to 2**22.
+    """
+
+    def __init__(self,
+                 cocoGt=None,
+                 cocoDt=None,
+                 iouType='bbox',
+                 chunk_size=2**22):
+        if iouType != 'bbox':
+            raise NotImplementedError(
+                f'COCOevalFast only supports bbox, but got {iouType}')
+        super().__init__(cocoGt, cocoDt, iouType)
+        self.chunk_size = chunk_size
+
+    def catInds(self, catIds):
+        """Indices of the categories in ``params.catIds``, -1 for the
+        categories not evaluated."""
+        cat_inds = {cat_id: i for i, cat_id in enumerate(self.params.catIds)}
+        return np.array([cat_inds.get(cat_id, -1) for cat_id in catIds],
+                        dtype=np.int64).reshape(-1)
+
+    def annsToArrays(self, anns):
+        """Convert the annotations in COCO format to the arrays used by
+        :meth:`matchAnns`.
+
+        Args:
+            anns (list[dict]): The ground truths or the detections.
+
+        Returns:
+            dict: The image ids, the indices of the categories, the xywh
+            boxes, the areas, the crowd flags and the scores. The
+            annotations out of ``params.catIds`` are dropped.
+        """
+        cat = self.catInds([ann['category_id'] for ann in anns])
+        anns = [ann for ann, cat_ind in zip(anns, cat) if cat_ind >= 0]
+        return dict(
+            img=np.array([ann['image_id'] for ann in anns], dtype=np.int64),
+            cat=cat[cat >= 0],
+            bbox=np.array([ann['bbox'] for ann in anns],
+                          dtype=np.float64).reshape(-1, 4),
+            area=np.array([ann['area'] for ann in anns], dtype=np.float64),
+            crowd=np.array([bool(ann.get('iscrowd', 0)) for ann in anns],
+                           dtype=bool),
+            score=np.array([ann.get('score', 0) for ann in anns],
+                           dtype=np.float64))
+
+    def _outOfArea(self, areas):
+        """Whether the areas are out of each area range, in shape (n, A)."""
+        area_rngs = np.array(self.params.areaRng, dtype=np.float64)
+        return (areas[:, None] < area_rngs[:, 0]) | (
+            areas[:, None] > area_rngs[:, 1])
+
+    def evaluate(self):
+        """Match the detections to the ground truths of all the images."""
+        tic = time.time()
+        print('Running per image evaluation...')
+        p = self.params
+        print('Evaluate annotation type *{}*'.format(p.iouType))
+        p.imgIds = list(np.unique(p.imgIds))
+        if p.useCats:
+            p.catIds = list(np.unique(p.catIds))
+        p.maxDets = sorted(p.maxDets)
+        self.params = p
+
+        img_ids = set(p.imgIds)
+        gts, dts = [
+            self.annsToArrays([
+                ann for ann in coco.dataset.get('annotations', [])
+                if ann['image_id'] in img_ids
+            ]) for coco in (self.cocoGt, self.cocoDt)
+        ]
+        self._gts, self._dts = self.matchAnns(gts, dts)
+        self.evalImgs = []
+        self.eval = {}
+        self._paramsEval = copy.deepcopy(self.params)
+        toc = time.time()
+        print('DONE (t={:0.2f}s).'.format(toc - tic))
+
+    def matchAnns(self, gts, dts):
+        """Match the detections to the ground truths.
+
+        The images can be matched all at once or one by one, and the matches
+        of the images can be loaded together by :meth:`loadMatches`.
+
+        Args:
+            gts (dict): The arrays of the ground truths, see
+                :meth:`annsToArrays`.
+            dts (dict): The arrays of the detections.
+
+        Returns:
+            tuple[dict]: The categories of the ground truths and whether
+            they are ignored in each area range, and the images, the
+            categories, the scores, the indices in ``dts`` and the ranks in
+            the image of the detections, with whether they are true or false
+            positives for each area range and IoU threshold, packed into
+            bits.
+        """
+        p = self.params
+        # group by image and category, or only by image without useCats
+        _, img_inds = np.unique(
+            np.concatenate([gts['img'], dts['img']]), return_inverse=True)
+        num_dts = len(dts['img'])
+        gts = dict(gts, group=img_inds[:len(gts['img'])])
+        dts = dict(
+            dts, group=img_inds[len(gts['img']):], ind=np.arange(num_dts))
+        if p.useCats:
+            gts['group'] = gts['group'] * len(p.catIds) + gts['cat']
+            dts['group'] = dts['group'] * len(p.catIds) + dts['cat']
+
+        # the ground truths in order of group and the dataset, and the
+        # detections in order of group and score
+        gt_order = np.lexsort(
+            (np.arange(len(gts['group'])), gts['cat'], gts['group']))
+        gts = {key: value[gt_order] for key, value in gts.items()}
+        dt_order = np.lexsort(
+            (dts['ind'], dts['cat'], -dts['score'], dts['group']))
+        dts = {key: value[dt_order] for key, value in dts.items()}
+        dts['rank'] = _group_ranks(dts['group'])
+        # ``maxDets`` is only sorted by ``evaluate``
+        keep = dts['rank'] < max(p.maxDets)
+        dts = {key: value[keep] for key, value in dts.items()}
+
+        gts['ignore'] = gts['crowd'][:, None] | self._outOfArea(gts['area'])
+        dt_out_of_area = self._outOfArea(dts['area'])
+
+        # all the pairs in the same group
+        starts = np.searchsorted(gts['group'], dts['group'], side='left')
+        counts = np.searchsorted(
+            gts['group'], dts['group'], side='right') - starts
+        pair_dts = np.repeat(np.arange(len(counts)), counts)
+        pair_gts = np.repeat(starts - np.cumsum(counts) + counts,
+                             counts) + np.arange(counts.sum())
+        ious = _pair_ious(dts['bbox'][pair_dts], gts['bbox'][pair_gts],
+                          gts['crowd'][pair_gts])
+
+        # the others can never be matched
+        iou_thrs = np.array(p.iouThrs, dtype=np.float64).reshape(-1)
+        valid = ious >= min(iou_thrs.min(), 1 - 1e-10)
+        pair_dts = pair_dts[valid]
+        pair_gts = pair_gts[valid]
+        ious = ious[valid]
+        cand_dts = np.unique(pair_dts)
+        cand_gts = np.unique(pair_gts)
+        groups, group_inds = np.unique(
+            dts['group'][cand_dts], return_inverse=True)
+        dt_locals = np.zeros(len(dts['group']), dtype=np.int64)
+        dt_locals[cand_dts] = _group_ranks(group_inds)
+        gt_group_inds = np.searchsorted(groups, gts['group'][cand_gts])
+        gt_locals = np.zeros(len(gts['group']), dtype=np.int64)
+        gt_locals[cand_gts] = _group_ranks(gt_group_inds)
+        num_dets = np.bincount(group_inds, minlength=len(groups))
+        num_gts = np.bincount(gt_group_inds, minlength=len(groups))
+
+        A, T = len(p.areaRng), len(iou_thrs)
+        dts['matched'] = np.zeros((len(dts['group']), A, T), dtype=bool)
+        dts['ignore'] = np.zeros((len(dts['group']), A, T), dtype=bool)
+
+        # match the groups with the most detections first, in chunks of
+        # similar sizes
+        group_order = np.argsort(-num_dets, kind='stable')
+        pair_groups = np.searchsorted(groups, dts['group'][pair_dts])
+        start = 0
+        while start < len(groups):
+            max_dets = num_dets[group_order[start]]
+            max_gts = num_gts[group_order[start]]
+            end = start + 1
+            while end < len(groups):
+                max_gts_ = max(max_gts, num_gts[group_order[end]])
+                if (end + 1 - start) * max_dets * max(max_gts_,
+                                                      A * T) > self.chunk_size:
+                    break
+                max_gts = max_gts_
+                end += 1
+            chunk = group_order[start:end]
+            chunk_inds = np.full(len(groups), -1, dtype=np.int64)
+            chunk_inds[chunk] = np.arange(len(chunk))
+            in_chunk = chunk_inds[pair_groups] >= 0
+
+            chunk_ious = np.full((len(chunk), max_dets, max_gts), -1.)
+            chunk_gt_ignore = np.zeros((len(chunk), A, max_gts), dtype=bool)
+            chunk_gt_crowd = np.zeros((len(chunk), max_gts), dtype=bool)
+            chunk_pair_dts = pair_dts[in_chunk]
+            chunk_pair_gts = pair_gts[in_chunk]
+            chunk_pair_groups = chunk_inds[pair_groups[in_chunk]]
+            chunk_ious[chunk_pair_groups, dt_locals[chunk_pair_dts],
+                       gt_locals[chunk_pair_gts]] = ious[in_chunk]
+            chunk_gt_ignore[
+                chunk_pair_groups, :,
+                gt_locals[chunk_pair_gts]] = gts['ignore'][chunk_pair_gts]
+            chunk_gt_crowd[
+                chunk_pair_groups,
+                gt_locals[chunk_pair_gts]] = gts['crowd'][chunk_pair_gts]
+
+            matched, matched_ignore = _greedy_match(chunk_ious,
+                                                    num_dets[chunk],
+                                                    chunk_gt_ignore,
+                                                    chunk_gt_crowd, iou_thrs)
+            in_chunk = chunk_inds[group_inds] >= 0
+            chunk_dts = cand_dts[in_chunk]
+            chunk_dt_groups = chunk_inds[group_inds[in_chunk]]
+            dts['matched'][chunk_dts] = matched[chunk_dt_groups,
+                                                dt_locals[chunk_dts]]
+            dts['ignore'][chunk_dts] = matched_ignore[chunk_dt_groups,
+                                                      dt_locals[chunk_dts]]
+            start = end
+
+        # the unmatched detections out of the area range are ignored
+        dts['ignore'] |= ~dts['matched'] & dt_out_of_area[..., None]
+        tp = dts['matched'] & ~dts['ignore']
+        fp = ~dts['matched'] & ~dts['ignore']
+        # the flags of the area ranges and the IoU thresholds are packed into
+        # bits, and the categories, the indices and the ranks, bounded by the
+        # number of categories, of detections and ``maxDets``, are narrowed
+        # to keep the matches compact
+        cat_dtype = _index_dtype(len(p.catIds))
+        gt_matches = dict(
+            cat=gts['cat'].astype(cat_dtype), ignore=gts['ignore'])
+        dt_matches = dict(
+            img=dts['img'],
+            cat=dts['cat'].astype(cat_dtype),
+            score=dts['score'],
+            ind=dts['ind'].astype(_index_dtype(num_dts)),
+            rank=dts['rank'].astype(_index_dtype(max(p.maxDets))),
+            tp=np.packbits(tp.reshape(len(tp), A * T), axis=1),
+            fp=np.packbits(fp.reshape(len(fp), A * T), axis=1))
+        return gt_matches, dt_matches
+
+    def loadMatches(self, matches):
+        """Load the matches of :meth:`matchAnns` instead of running
+        :meth:`evaluate`, e.g. the matches of the images computed in several
+        processes.
+
+        Args:
+            matches (Sequence[tuple[dict]]): The matched ground truths and
+                detections.
+        """
+        gts, dts = zip(*matches)
+        self._gts = {
+            key: np.concatenate([gt[key] for gt in gts])
+            for key in gts[0]
+        }
+        self._dts = {
+            key: np.concatenate([dt[key] for dt in dts])
+            for key in dts[0]
+        }
+        self.evalImgs = []
+        self.eval = {}
+        # sorted like in ``evaluate``, ``summarize`` indexes ``maxDets``
+        self.params.maxDets = sorted(self.params.maxDets)
+        self._paramsEval = copy.deepcopy(self.params)
+
+    def accumulate(self):
+        """Accumulate the matches into the precision and the recall."""
+        print('Accumulating evaluation results...')
+        tic = time.time()
+        if 'tp' not in self._dts:
+            print('Please run evaluate() first')
+        p = self._paramsEval
+        catIds = p.catIds if p.useCats else [-1]
+        T = len(p.iouThrs)
+        R = len(p.recThrs)
+        K = len(catIds)
+        A = len(p.areaRng)
+        M = len(p.maxDets)
+        precision = -np.ones((T, R, K, A, M))
+        recall = -np.ones((T, K, A, M))
+        scores = -np.ones((T, R, K, A, M))
+
+        gts = self._gts
+        # all the categories are evaluated together without ``useCats``
+        gt_cats = gts['cat'] if p.useCats else np.zeros_like(gts['cat'])
+        num_gts = np.stack([
+            np.bincount(gt_cats[~ignore], minlength=K)
+            for ignore in gts['ignore'].T
+        ],
+                           axis=1)
+        # sort the detections of all the images by score, the ties are kept
+        # in order of image like COCOeval
+        order = np.lexsort(
+            (self._dts['rank'], self._dts['img'], -self._dts['score']))
+        dts = {key: value[order] for key, value in self._dts.items()}
+        tps, fps = [
+            np.unpackbits(dts[key], axis=1,
+                          count=A * T).reshape(-1, A, T).astype(bool)
+            for key in ('tp', 'fp')
+        ]
+        dt_cats = dts['cat'] if p.useCats else np.zeros_like(dts['cat'])
+        for k in range(K):
+            cat_inds = np.flatnonzero(dt_cats == k)
+            for m, maxDet in enumerate(p.maxDets):
+                inds = cat_inds[dts['rank'][cat_inds] < maxDet]
+                dtScoresSorted = dts['score'][inds]
+                nd = len(inds)
+                tp_sum = np.cumsum(tps[inds], axis=0).astype(dtype=float)
+                fp_sum = np.cumsum(fps[inds], axis=0).astype(dtype=float)
+                for a in range(A):
+                    npig = num_gts[k, a]
+                    if npig == 0:
+                        continue
+                    rc = tp_sum[:, a] / npig
+                    pr = tp_sum[:, a] / (
+                        fp_sum[:, a] + tp_sum[:, a] + np.spacing(1))
+                    # make the precision monotonically decreasing
+                    pr = np.maximum.accumulate(pr[::-1], axis=0)[::-1]
+                    recall[:, k, a, m] = rc[-1] if nd else 0
+                    for t in range(T):
+                        q = np.zeros(R)
+                        ss = np.zeros(R)
+                        rc_inds = np.searchsorted(
+                            rc[:, t], p.recThrs, side='left')
+                        valid = rc_inds < nd
+                        q[valid] = pr[rc_inds[valid], t]
+                        ss[valid] = dtScoresSorted[rc_inds[valid]]
+                        precision[t, :, k, a, m] = q
+                        scores[t, :, k, a, m] = ss
+        self.eval = {
+            'params': p,
+            'counts': [T, R, K, A, M],
+            'date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'precision': precision,
+            'recall': recall,
+            'scores': scores,
+        }
+        toc = time.time()
+        print('DONE (t={:0.2f}s).'.format(toc - tic))
@@ -1,6 +1,6 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 import copy
-import itertools
+import os
 import time
 from collections import defaultdict
 
@@ -11,7 +11,53 @@ from pycocotools.cocoeval import COCOeval
 from tqdm import tqdm
 
 
+# the evaluator shared with the workers, inherited through fork or pickled
+# once per worker otherwise
+_worker_evaluator = None
+
+
+def _init_worker(evaluator):
+    global _worker_evaluator
+    _worker_evaluator = evaluator
+
+
+def _evaluate_shard(shard):
+    return _worker_evaluator._evaluateShard(*shard)
+
+
+def _available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
 class COCOevalMP(COCOeval):
+    """COCOeval whose per image evaluation runs in a process pool.
+
+    The ground truths and the detections are prepared once in the main
+    process and shared with the workers. The work is split into shards of
+    (category, image chunk), so that the datasets with a few categories still
+    keep all the workers busy.
+
+    Args:
+        cocoGt (COCO, optional): The ground truths.
+        cocoDt (COCO, optional): The detections.
+        iouType (str): Type of the evaluation. Defaults to 'segm'.
+        nproc (int, optional): Number of the worker processes. Defaults to
+            None, which uses all the cores available to this process.
+        shards_per_proc (int): Number of the shards per worker, more shards
+            balance the load better. Defaults to 4.
+    """
+
+    def __init__(self,
+                 cocoGt=None,
+                 cocoDt=None,
+                 iouType='segm',
+                 nproc=None,
+                 shards_per_proc=4):
+        super().__init__(cocoGt, cocoDt, iouType)
+        self.nproc = _available_cpus() if nproc is None else nproc
+        self.shards_per_proc = shards_per_proc
 
     def _prepare(self):
         '''
@@ -88,44 +134,54 @@ class COCOevalMP(COCOeval):
         p.maxDets = sorted(p.maxDets)
         self.params = p
 
+        self._prepare()
         # loop through images, area range, max detection number
         catIds = p.catIds if p.useCats else [-1]
 
-        nproc = 8
-        split_size = len(catIds) // nproc
-        mp_params = []
-        for i in range(nproc):
-            begin = i * split_size
-            end = (i + 1) * split_size
-            if i == nproc - 1:
-                end = len(catIds)
-            mp_params.append((catIds[begin:end], ))
+        # split the images of each category into chunks
+        num_shards = max(self.nproc * self.shards_per_proc, 1)
+        num_chunks = min(-(-num_shards // len(catIds)), len(p.imgIds))
+        chunk_size = max(-(-len(p.imgIds) // max(num_chunks, 1)), 1)
+        shards = [(catId, p.imgIds[i:i + chunk_size]) for catId in catIds
+                  for i in range(0, len(p.imgIds), chunk_size)]
+        nproc = min(self.nproc, len(shards))
 
         MMLogger.get_current_instance().info(
-            'start multi processing evaluation ...')
-        with mp.Pool(nproc) as pool:
-            self.evalImgs = pool.starmap(self._evaluateImg, mp_params)
+            f'start multi processing evaluation with {nproc} processes and '
+            f'{len(shards)} shards ...')
+        if nproc > 1:
+            with mp.Pool(nproc, _init_worker, (self, )) as pool:
+                results = list(
+                    tqdm(
+                        pool.imap(_evaluate_shard, shards),
+                        total=len(shards)))
+        else:
+            results = [self._evaluateShard(*shard) for shard in tqdm(shards)]
 
-        self.evalImgs = list(itertools.chain(*self.evalImgs))
+        # ``accumulate`` expects the order of category, area range and image
+        numAreas = len(p.areaRng)
+        numCatShards = len(shards) // len(catIds)
+        evalImgs = []
+        for k in range(len(catIds)):
+            catResults = results[k * numCatShards:(k + 1) * numCatShards]
+            for a in range(numAreas):
+                for shardResults in catResults:
+                    numImgs = len(shardResults) // numAreas
+                    evalImgs.extend(shardResults[a * numImgs:(a + 1) *
+                                                 numImgs])
+        self.evalImgs = evalImgs
 
         self._paramsEval = copy.deepcopy(self.params)
         toc = time.time()
         print('DONE (t={:0.2f}s).'.format(toc - tic))
 
-    def _evaluateImg(self, catids_chunk):
-        self._prepare()
-        p = self.params
-        maxDet = max(p.maxDets)
-        all_params = []
-        for catId in catids_chunk:
-            for areaRng in p.areaRng:
-                for imgId in p.imgIds:
-                    all_params.append((catId, areaRng, imgId))
-        evalImgs = [
+    def _evaluateShard(self, catId, imgIds):
+        """Evaluate the images of one category in all the area ranges."""
+        maxDet = max(self.params.maxDets)
+        return [
             self.evaluateImg(imgId, catId, areaRng, maxDet)
-            for catId, areaRng, imgId in tqdm(all_params)
+            for areaRng in self.params.areaRng for imgId in imgIds
         ]
-        return evalImgs
 
     def evaluateImg(self, imgId, catId, aRng, maxDet):
         p = self.params
@@ -1,12 +1,17 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+import hashlib
 import os.path as osp
-from typing import List, Optional
+from typing import List, Optional, Sequence, Union
 
+import numpy as np
 from mmengine.dataset import BaseDataset
-from mmengine.fileio import load
+from mmengine.dataset.base_dataset import force_full_init
+from mmengine.fileio import get_local_path, load
+from mmengine.logging import print_log
 from mmengine.utils import is_abs
 
 from ..registry import DATASETS
+from .ann_cache import AnnotationCache, subset_indices
 
 
 @DATASETS.register_module()
@@ -23,8 +28,18 @@ class BaseDetDataset(BaseDataset):
             for open vocabulary-based algorithms. Defaults to False.
         caption_prompt (dict, optional): Prompt for captioning.
             Defaults to None.
+        cache_dir (str, optional): Directory of the annotation caches. If
+            set, the filtered ``data_list`` is written into an
+            :class:`AnnotationCache` keyed on the content of ``ann_file``
+            and on the arguments of the dataset, which is memory-mapped
+            instead of parsing the annotations again in the later runs.
+            Defaults to None.
     """
 
+    # attributes set while loading the annotations, restored from the cache
+    CACHE_ATTRS = ('cat_ids', 'cat2label')
+    CACHE_VERSION = 1
+
     def __init__(self,
                  *args,
                  seg_map_suffix: str = '.png',
@@ -33,8 +48,12 @@ class BaseDetDataset(BaseDataset):
                  backend_args: dict = None,
                  return_classes: bool = False,
                  caption_prompt: Optional[dict] = None,
+                 cache_dir: Optional[str] = None,
                  **kwargs) -> None:
         self.seg_map_suffix = seg_map_suffix
+        self.cache_dir = cache_dir
+        self.ann_cache = None
+        self._cache_indices = None
         self.proposal_file = proposal_file
         self.backend_args = backend_args
         self.return_classes = return_classes
@@ -69,9 +88,17 @@ class BaseDetDataset(BaseDataset):
             - slice_data: Slice dataset according to ``self._indices``
             - serialize_data: Serialize ``self.data_list`` if
             ``self.serialize_data`` is True.
+
+        If ``cache_dir`` is set, the first three steps are replaced by
+        loading the annotation cache, which is written first if it does not
+        exist.
         """
         if self._fully_initialized:
             return
+        if self.cache_dir is not None:
+            self._init_from_cache()
+            self._fully_initialized = True
+            return
         # load data information
         self.data_list = self.load_data_list()
         # get proposals from file
@@ -90,6 +117,112 @@ class BaseDetDataset(BaseDataset):
 
         self._fully_initialized = True
 
+    def _cache_key(self) -> str:
+        """Hash of the annotation file and of the arguments that change the
+        parsed ``data_list``."""
+        sha = hashlib.sha1()
+        with get_local_path(
+                self.ann_file, backend_args=self.backend_args) as local_path:
+            with open(local_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(chunk)
+        args = (self.CACHE_VERSION, type(self).__name__,
+                self.data_prefix, self.filter_cfg, self.test_mode,
+                self.metainfo.get('classes'), self.seg_map_suffix,
+                self.proposal_file, self.return_classes, self.caption_prompt)
+        sha.update(repr(args).encode())
+        return sha.hexdigest()
+
+    def _init_from_cache(self) -> None:
+        """Load, filter and dump the annotations into a cache if it does not
+        exist, then map the cache."""
+        cache_dir = osp.join(self.cache_dir, self._cache_key())
+        if not osp.isdir(cache_dir):
+            self.data_list = self.load_data_list()
+            if self.proposal_file is not None:
+                self.load_proposals()
+            data_list = self.filter_data()
+            attrs = {
+                name: getattr(self, name)
+                for name in self.CACHE_ATTRS if hasattr(self, name)
+            }
+            AnnotationCache.dump(data_list, cache_dir, attrs)
+            print_log(
+                f'The annotations of {self.ann_file} have been cached in '
+                f'{cache_dir}.',
+                logger='current')
+        self.ann_cache = AnnotationCache(cache_dir)
+        for name, value in self.ann_cache.load_attrs().items():
+            setattr(self, name, value)
+        self.data_list = []
+        if self._indices is not None:
+            self._cache_indices = subset_indices(
+                len(self.ann_cache), self._indices)
+
+    @force_full_init
+    def get_data_info(self, idx: int) -> dict:
+        """Get annotation by index, from the annotation cache if
+        ``cache_dir`` is set.
+
+        Args:
+            idx (int): The index of data.
+
+        Returns:
+            dict: The idx-th annotation of the dataset.
+        """
+        if self.ann_cache is None:
+            return super().get_data_info(idx)
+        sample_idx = idx if idx >= 0 else len(self) + idx
+        idx = sample_idx
+        if self._cache_indices is not None:
+            idx = self._cache_indices[idx].item()
+        data_info = self.ann_cache[idx]
+        data_info['sample_idx'] = sample_idx
+        return data_info
+
+    @force_full_init
+    def __len__(self) -> int:
+        """Get the length of filtered dataset."""
+        if self.ann_cache is None:
+            return super().__len__()
+        if self._cache_indices is not None:
+            return len(self._cache_indices)
+        return len(self.ann_cache)
+
+    def _get_cache_subset(self, indices: Union[Sequence[int],
+                                               int]) -> np.ndarray:
+        """Get the indices of the subset in the annotation cache."""
+        cache_indices = self._cache_indices
+        if cache_indices is None:
+            cache_indices = np.arange(len(self.ann_cache))
+        return cache_indices[subset_indices(len(cache_indices), indices)]
+
+    @force_full_init
+    def get_subset(self, indices: Union[Sequence[int], int]) -> BaseDataset:
+        """Return a subset of dataset, which shares the annotation cache if
+        ``cache_dir`` is set."""
+        if self.ann_cache is None:
+            return super().get_subset(indices)
+        sub_dataset = self._copy_without_annotation()
+        sub_dataset._cache_indices = self._get_cache_subset(indices)
+        return sub_dataset
+
+    @force_full_init
+    def get_subset_(self, indices: Union[Sequence[int], int]) -> None:
+        """The in-place version of ``get_subset``."""
+        if self.ann_cache is None:
+            super().get_subset_(indices)
+        else:
+            self._cache_indices = self._get_cache_subset(indices)
+
+    def _copy_without_annotation(self, memo=None) -> BaseDataset:
+        """Deepcopy for all attributes other than the annotations, the
+        annotation cache is shared with the copy."""
+        memo = {} if memo is None else memo
+        if self.ann_cache is not None:
+            memo[id(self.ann_cache)] = self.ann_cache
+        return super()._copy_without_annotation(memo)
+
     def load_proposals(self) -> None:
         """Load proposals from proposals file.
 
@@ -1,5 +1,11 @@
 # Copyright (c) OpenMMLab. All rights reserved.
-from typing import Optional, Tuple, Union
+import hashlib
+import json
+import os
+import os.path as osp
+import tempfile
+from contextlib import contextmanager
+from typing import Iterable, Optional, Tuple, Union
 
 import mmcv
 import numpy as np
@@ -10,6 +16,7 @@ from mmcv.transforms import LoadAnnotations as MMCV_LoadAnnotations
 from mmcv.transforms import LoadImageFromFile
 from mmengine.fileio import get
 from mmengine.structures import BaseDataElement
+from mmengine.utils import mkdir_or_exist
 
 from mmdet.registry import TRANSFORMS
 from mmdet.structures.bbox import get_box_type
@@ -144,3 +151,564 @@ class LoadImageFromFile3(LoadImageFromFile):
         results['img_shape3'] = mixup_img.shape[:2]
         results['ori_shape3'] = mixup_img.shape[:2]
         return results
+
+
+class PairedImageShards:
+    """Memory-mapped shards of paired RGB/TIR images.
+
+    The two images of a pair are stored as adjacent records of a shard
+    ``shard_{i:05d}.bin``, either encoded as in the original files or
+    decoded as uint8 arrays. ``index.npy`` holds the shard, the offset, the
+    sizes and, for the decoded records, the shapes of the images of each
+    pair, and ``keys.json`` their keys. The shards are mapped lazily on
+    first access, so a pair is read with a single access to the shared page
+    cache instead of opening two small files.
+
+    Args:
+        shard_dir (str): Directory of the shards written by :meth:`build`.
+    """
+
+    def __init__(self, shard_dir: str) -> None:
+        self.shard_dir = shard_dir
+        self._index = None
+        self._shards = dict()
+
+    def _load(self) -> tuple:
+        if self._index is None:
+            with open(osp.join(self.shard_dir, 'keys.json')) as f:
+                keys = json.load(f)
+            index = np.load(osp.join(self.shard_dir, 'index.npy'))
+            self._index = ({key: i for i, key in enumerate(keys)}, index)
+        return self._index
+
+    def _shard(self, shard: int) -> np.memmap:
+        if shard not in self._shards:
+            self._shards[shard] = np.memmap(
+                osp.join(self.shard_dir, f'shard_{shard:05d}.bin'),
+                dtype=np.uint8,
+                mode='r')
+        return self._shards[shard]
+
+    def __len__(self) -> int:
+        return len(self._load()[1])
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._load()[0]
+
+    def __getitem__(self, key: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the records of the pair ``key``.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The encoded bytes of the RGB and
+            the TIR images as flat uint8 arrays, or the images if the shards
+            are decoded.
+        """
+        keys, index = self._load()
+        shard, offset, size, size2, *shapes = index[keys[key]].tolist()
+        data = self._shard(shard)
+        records = (data[offset:offset + size],
+                   data[offset + size:offset + size + size2])
+        if shapes[0] == 0:
+            return records
+        return tuple(
+            np.array(record).reshape(shape)
+            for record, shape in zip(records, (shapes[:3], shapes[3:])))
+
+    @staticmethod
+    def build(pairs: Iterable[Tuple[str, bytes, bytes]],
+              shard_dir: str,
+              decode: bool = False,
+              color_type: str = 'color',
+              imdecode_backend: str = 'cv2',
+              shard_size: int = 2**30) -> int:
+        """Write image pairs into shards.
+
+        Args:
+            pairs (Iterable[tuple[str, bytes, bytes]]): The key, the encoded
+                RGB image and the encoded TIR image of each pair.
+            shard_dir (str): Output directory.
+            decode (bool): Whether to store the decoded images, which saves
+                the decoding when loading small images at the cost of a
+                larger storage. Defaults to False.
+            color_type (str): The flag of :func:`mmcv.imfrombytes` used if
+                ``decode`` is True. Defaults to 'color'.
+            imdecode_backend (str): The decoding backend used if ``decode``
+                is True. Defaults to 'cv2'.
+            shard_size (int): A new shard is started when a shard exceeds
+                this number of bytes. Defaults to 1 GiB.
+
+        Returns:
+            int: The number of pairs.
+        """
+        mkdir_or_exist(shard_dir)
+        keys, index = [], []
+        shard, offset, f = -1, shard_size, None
+        try:
+            for key, img_bytes, img2_bytes in pairs:
+                shapes = [0] * 6
+                records = [img_bytes, img2_bytes]
+                if decode:
+                    for i, record in enumerate(records):
+                        img = mmcv.imfrombytes(
+                            record, flag=color_type, backend=imdecode_backend)
+                        img = img.reshape(img.shape[:2] + (-1, ))
+                        shapes[i * 3:i * 3 + 3] = img.shape
+                        records[i] = np.ascontiguousarray(img).data
+                if offset >= shard_size:
+                    if f is not None:
+                        f.close()
+                    shard, offset = shard + 1, 0
+                    f = open(
+                        osp.join(shard_dir, f'shard_{shard:05d}.bin'), 'wb')
+                sizes = [
+                    len(memoryview(record).cast('B')) for record in records
+                ]
+                for record in records:
+                    f.write(record)
+                keys.append(key)
+                index.append([shard, offset] + sizes + shapes)
+                offset += sum(sizes)
+        finally:
+            if f is not None:
+                f.close()
+        with open(osp.join(shard_dir, 'keys.json'), 'w') as f:
+            json.dump(keys, f)
+        np.save(
+            osp.join(shard_dir, 'index.npy'),
+            np.array(index, dtype=np.int64).reshape(-1, 10))
+        return len(keys)
+
+
+@TRANSFORMS.register_module()
+class LoadPairedImagesFromShards(BaseTransform):
+    """Load the RGB and the TIR images of a sample from
+    :class:`PairedImageShards`.
+
+    It replaces ``LoadImageFromFile`` followed by :obj:`LoadImageFromFile2`
+    with one read of adjacent records. The shards are built with
+    ``tools/misc/pack_paired_images.py``.
+
+    Required Keys:
+
+    - img_path
+
+    Modified Keys:
+
+    - img
+    - img_shape
+    - ori_shape
+    - img2
+    - img_shape2
+    - ori_shape2
+
+    Args:
+        shard_dir (str): Directory of the shards.
+        data_root (str, optional): The keys of the shards are the paths of
+            the RGB images relative to ``data_root``, or the paths
+            themselves if it is None. Defaults to None.
+        to_float32 (bool): Whether to convert the loaded images to float32
+            numpy arrays. Defaults to False.
+        color_type (str): The flag argument for :func:`mmcv.imfrombytes`.
+            Not used if the shards are decoded. Defaults to 'color'.
+        imdecode_backend (str): The image decoding backend type. Not used if
+            the shards are decoded. Defaults to 'cv2'.
+    """
+
+    def __init__(self,
+                 shard_dir: str,
+                 data_root: Optional[str] = None,
+                 to_float32: bool = False,
+                 color_type: str = 'color',
+                 imdecode_backend: str = 'cv2') -> None:
+        self.shards = PairedImageShards(shard_dir)
+        self.data_root = data_root
+        self.to_float32 = to_float32
+        self.color_type = color_type
+        self.imdecode_backend = imdecode_backend
+
+    def transform(self, results: dict) -> dict:
+        """Functions to load the images.
+
+        Args:
+            results (dict): Result dict from
+                :class:`mmengine.dataset.BaseDataset`.
+
+        Returns:
+            dict: The dict contains loaded images and meta information.
+        """
+        key = results['img_path']
+        if self.data_root is not None:
+            key = osp.relpath(key, self.data_root)
+        imgs = self.shards[key]
+        for suffix, img in zip(('', '2'), imgs):
+            if img.ndim == 1:
+                img = mmcv.imfrombytes(
+                    img, flag=self.color_type, backend=self.imdecode_backend)
+            elif img.shape[-1] == 1:
+                img = img[..., 0]
+            assert img is not None, f'failed to load image: {key}'
+            if self.to_float32:
+                img = img.astype(np.float32)
+            results[f'img{suffix}'] = img
+            results[f'img_shape{suffix}'] = img.shape[:2]
+            results[f'ori_shape{suffix}'] = img.shape[:2]
+        return results
+
+    def __repr__(self) -> str:
+        repr_str = self.__class__.__name__
+        repr_str += f"(shard_dir='{self.shards.shard_dir}', "
+        repr_str += f"data_root='{self.data_root}', "
+        repr_str += f'to_float32={self.to_float32}, '
+        repr_str += f"color_type='{self.color_type}', "
+        repr_str += f"imdecode_backend='{self.imdecode_backend}')"
+        return repr_str
+
+
+class SharedImageCache:
+    """Cache of decoded images in a memory-mapped arena shared by all the
+    processes of a node.
+
+    The arena is a file of ``cache_dir``, ``/dev/shm`` by default, holding a
+    header, a table of slots and ``max_bytes`` of images split into slots of
+    ``slot_bytes``. Every process mapping the file with the same ``name``,
+    i.e. the dataloader workers of all the ranks, shares the images. When
+    the arena is full, a slot is evicted with the CLOCK algorithm. Images
+    larger than ``slot_bytes`` are not cached. The accesses are serialized
+    with a lock file.
+
+    The arena outlives the processes, so that the next runs start with a warm
+    cache. Remove the file to free the memory.
+
+    Args:
+        name (str): Name of the arena file.
+        max_bytes (int): Budget of the images in bytes. Defaults to 8 GiB.
+        slot_bytes (int): Maximum size of a cached image in bytes. Defaults
+            to 1 MiB, which holds a 640x512 color image.
+        cache_dir (str, optional): Directory of the arena file. Defaults to
+            ``/dev/shm`` if it exists, else the temporary directory.
+    """
+
+    MAGIC = 0x494d4743  # 'IMGC'
+    HEADER = ('magic', 'num_slots', 'slot_bytes', 'hand', 'hits', 'misses',
+              'evictions')
+    DTYPES = ('uint8', 'uint16', 'int16', 'float32')
+    # the caches of this process by path, read by ``ImageCacheLoggerHook``
+    _instances: dict = dict()
+
+    def __init__(self,
+                 name: str,
+                 max_bytes: int = 2**33,
+                 slot_bytes: int = 2**20,
+                 cache_dir: Optional[str] = None) -> None:
+        if cache_dir is None:
+            cache_dir = '/dev/shm' if osp.isdir(
+                '/dev/shm') else tempfile.gettempdir()
+        self.path = osp.join(cache_dir, name)
+        self.slot_bytes = slot_bytes
+        self.num_slots = max_bytes // slot_bytes
+        assert self.num_slots > 0, 'max_bytes should hold a slot at least.'
+        self._arrays = None
+        SharedImageCache._instances[self.path] = self
+
+    @classmethod
+    def instances(cls) -> list:
+        """The caches created in this process."""
+        return list(cls._instances.values())
+
+    def _layout(self) -> tuple:
+        """Offsets of the slot tables and of the images."""
+        n = self.num_slots
+        keys = len(self.HEADER) * 8
+        meta = keys + n * 8
+        ref = meta + n * 5 * 4
+        data = (ref + n + 63) // 64 * 64
+        return keys, meta, ref, data, data + n * self.slot_bytes
+
+    def _load(self) -> dict:
+        if self._arrays is not None:
+            return self._arrays
+        keys, meta, ref, data, size = self._layout()
+        with self._lock():
+            if not osp.exists(self.path):
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=osp.dirname(self.path), prefix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    f.truncate(size)
+                    f.write(
+                        np.array([self.MAGIC, self.num_slots, self.slot_bytes],
+                                 dtype=np.int64).tobytes())
+                os.rename(tmp_path, self.path)
+            buffer = np.memmap(self.path, dtype=np.uint8, mode='r+')
+        header = buffer[:keys].view(np.int64)
+        if (len(buffer) != size or header[0] != self.MAGIC
+                or header[1] != self.num_slots
+                or header[2] != self.slot_bytes):
+            raise ValueError(
+                f'{self.path} is not an image cache of {self.num_slots} '
+                f'slots of {self.slot_bytes} bytes, remove it or use '
+                'another name.')
+        self._arrays = dict(
+            header=header,
+            keys=buffer[keys:meta].view(np.uint64),
+            # height, width, channels (0 for a 2D image), dtype, valid
+            meta=buffer[meta:ref].view(np.int32).reshape(-1, 5),
+            ref=buffer[ref:ref + self.num_slots],
+            data=buffer[data:size])
+        return self._arrays
+
+    @contextmanager
+    def _lock(self):
+        """An exclusive lock shared by the processes of the node."""
+        import fcntl
+
+        # the lock file is opened for each access since the forked workers
+        # would share the lock of an inherited file
+        with open(self.path + '.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _hash(key: str) -> np.uint64:
+        return np.frombuffer(
+            hashlib.blake2b(key.encode(), digest_size=8).digest(),
+            dtype=np.uint64)[0]
+
+    def _find(self, key_hash: np.uint64) -> int:
+        arrays = self._load()
+        slots = np.flatnonzero((arrays['keys'] == key_hash)
+                               & (arrays['meta'][:, 4] == 1))
+        return slots[0] if len(slots) else -1
+
+    def _view(self, slot: int) -> np.ndarray:
+        arrays = self._load()
+        h, w, c, dtype, _ = arrays['meta'][slot].tolist()
+        shape = (h, w, c) if c else (h, w)
+        dtype = np.dtype(self.DTYPES[dtype])
+        start = slot * self.slot_bytes
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        img = arrays['data'][start:start + nbytes]
+        img = img.view(np.ndarray).view(dtype).reshape(shape)
+        img.flags.writeable = False
+        return img
+
+    def lookup(self, key: str, copy: bool = False) -> Optional[np.ndarray]:
+        """Get the image ``key``.
+
+        Args:
+            key (str): Key of the image, e.g. its path.
+            copy (bool): Whether to return a copy of the image instead of a
+                read-only view of the arena. A view is valid until its slot
+                is evicted, which needs a full turn of the CLOCK hand after
+                the access. Defaults to False.
+
+        Returns:
+            np.ndarray, optional: The image, None if it is not cached.
+        """
+        key_hash = self._hash(key)
+        arrays = self._load()
+        with self._lock():
+            slot = self._find(key_hash)
+            if slot < 0:
+                arrays['header'][5] += 1
+                return None
+            arrays['header'][4] += 1
+            arrays['ref'][slot] = 1
+            img = self._view(slot)
+            return img.copy() if copy else img
+
+    def insert(self, key: str, img: np.ndarray) -> bool:
+        """Cache the image ``key``.
+
+        Returns:
+            bool: Whether the image has been cached.
+        """
+        if (img.nbytes > self.slot_bytes or img.ndim not in (2, 3)
+                or img.dtype.name not in self.DTYPES):
+            return False
+        key_hash = self._hash(key)
+        arrays = self._load()
+        with self._lock():
+            if self._find(key_hash) >= 0:
+                return True
+            slot = self._evict()
+            meta = arrays['meta']
+            if meta[slot, 4]:
+                arrays['header'][6] += 1
+            meta[slot, 4] = 0
+            start = slot * self.slot_bytes
+            arrays['data'][start:start + img.nbytes] = np.frombuffer(
+                np.ascontiguousarray(img).data, dtype=np.uint8)
+            channels = img.shape[2] if img.ndim == 3 else 0
+            dtype = self.DTYPES.index(img.dtype.name)
+            meta[slot] = img.shape[:2] + (channels, dtype, 1)
+            arrays['keys'][slot] = key_hash
+            arrays['ref'][slot] = 1
+        return True
+
+    def _evict(self) -> int:
+        """Select a slot with the CLOCK algorithm, the lock being held."""
+        arrays = self._load()
+        ref, header = arrays['ref'], arrays['header']
+        hand = int(header[3])
+        for start, stop in ((hand, self.num_slots), (0, hand)):
+            zeros = np.flatnonzero(ref[start:stop] == 0)
+            if len(zeros):
+                slot = start + int(zeros[0])
+                ref[start:slot] = 0
+                break
+            ref[start:stop] = 0
+        else:
+            slot = hand
+        header[3] = (slot + 1) % self.num_slots
+        return slot
+
+    def stats(self) -> dict:
+        """The hits, misses and evictions of all the processes, and the
+        number of cached images."""
+        arrays = self._load()
+        with self._lock():
+            hits, misses, evictions = arrays['header'][4:7].tolist()
+            size = int(np.count_nonzero(arrays['meta'][:, 4]))
+        return dict(hits=hits, misses=misses, evictions=evictions, size=size)
+
+
+@TRANSFORMS.register_module()
+class LoadImageFromFileCached(LoadImageFromFile):
+    """Load an image from file through a :class:`SharedImageCache`.
+
+    Like ``LoadImageFromFile`` for the RGB images and
+    :obj:`LoadImageFromFile2` for the TIR images with ``suffix='2'``, but the
+    decoded images are cached in an arena shared by all the dataloader
+    workers of the node, so that the images are decoded once instead of once
+    per epoch. The transforms of the two streams can share an arena.
+
+    Required Keys:
+
+    - img_path{suffix}
+
+    Modified Keys:
+
+    - img{suffix}
+    - img_shape{suffix}
+    - ori_shape{suffix}
+
+    Args:
+        cache (dict): Arguments of :class:`SharedImageCache`.
+        suffix (str): Suffix of the keys of the stream, e.g. '2' for the TIR
+            images. Defaults to ''.
+        copy (bool): Whether to copy the cached images. Otherwise they are
+            read-only views of the arena, which breaks the transforms that
+            modify the images in place, and a view is overwritten once its
+            slot is reused by another image. Only set it to False if the
+            pipeline converts the images soon, e.g. with ``to_float32``.
+            Defaults to True.
+        **kwargs: Arguments of ``LoadImageFromFile``.
+    """
+
+    def __init__(self,
+                 cache: dict,
+                 suffix: str = '',
+                 copy: bool = True,
+                 **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.cache = SharedImageCache(**cache)
+        self.suffix = suffix
+        self.copy = copy
+
+    def transform(self, results: dict) -> Optional[dict]:
+        """Functions to load image.
+
+        Args:
+            results (dict): Result dict from
+                :class:`mmengine.dataset.BaseDataset`.
+
+        Returns:
+            dict: The dict contains loaded image and meta information.
+        """
+        filename = results[f'img_path{self.suffix}']
+        # the decoded image depends on the decoding arguments
+        key = f'{filename}:{self.color_type}:{self.imdecode_backend}'
+        # `to_float32` copies the image anyway
+        img = self.cache.lookup(key, copy=self.copy and not self.to_float32)
+        if img is None:
+            try:
+                if self.file_client_args is not None:
+                    file_client = fileio.FileClient.infer_client(
+                        self.file_client_args, filename)
+                    img_bytes = file_client.get(filename)
+                else:
+                    img_bytes = fileio.get(
+                        filename, backend_args=self.backend_args)
+                img = mmcv.imfrombytes(
+                    img_bytes,
+                    flag=self.color_type,
+                    backend=self.imdecode_backend)
+            except Exception as e:
+                if self.ignore_empty:
+                    return None
+                else:
+                    raise e
+            assert img is not None, f'failed to load image: {filename}'
+            self.cache.insert(key, img)
+        if self.to_float32:
+            img = img.astype(np.float32)
+
+        results[f'img{self.suffix}'] = img
+        results[f'img_shape{self.suffix}'] = img.shape[:2]
+        results[f'ori_shape{self.suffix}'] = img.shape[:2]
+        return results
+
+    def __repr__(self) -> str:
+        repr_str = super().__repr__()[:-1]
+        repr_str += f", cache_path='{self.cache.path}', "
+        repr_str += f"suffix='{self.suffix}', copy={self.copy})"
+        return repr_str
+
+
+@TRANSFORMS.register_module()
+class InferencerLoader2(BaseTransform):
+    """Load the second image of a pair from ``results['img2']`` or from
+    ``results['img_path2']``.
+
+    The counterpart of ``InferencerLoader`` for the second stream, used by
+    ``DetInferencer`` in place of :obj:`LoadImageFromFile2`.
+
+    Required Keys:
+
+    - img2 or img_path2
+
+    Modified Keys:
+
+    - img2
+    - img_shape2
+    - ori_shape2
+
+    Args:
+        **kwargs: Arguments of :obj:`LoadImageFromFile2`.
+    """
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__()
+        self.from_file = LoadImageFromFile2(**kwargs)
+
+    def transform(self, results: dict) -> dict:
+        """Transform function to load the second image.
+
+        Args:
+            results (dict): The result.
+
+        Returns:
+            dict: The dict contains loaded image and meta information.
+        """
+        if 'img2' not in results:
+            return self.from_file(results)
+        img = results['img2']
+        if self.from_file.to_float32:
+            img = img.astype(np.float32)
+        results['img2'] = img
+        results['img_shape2'] = img.shape[:2]
+        results['ori_shape2'] = img.shape[:2]
+        return results
@@ -1,7 +1,6 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 import copy
 import inspect
-import math
 import warnings
 from typing import List, Optional, Sequence, Tuple, Union
 
@@ -13,6 +12,7 @@ from mmcv.image.geometric import _scale_size
 from mmcv.transforms import BaseTransform
 from mmcv.transforms import Pad as MMCV_Pad
 from mmcv.transforms import RandomFlip as MMCV_RandomFlip
+from mmcv.transforms import RandomResize
 from mmcv.transforms import Resize as MMCV_Resize
 from mmcv.transforms.utils import avoid_cache_randomness, cache_randomness
 from mmengine.dataset import BaseDataset
@@ -38,7 +38,7 @@ except ImportError:
 
 Number = Union[int, float]
 
-from .transforms import Mosaic
+from .transforms import Mosaic, Pad, RandomFlip, Resize
 
 import torch
 
@@ -485,64 +485,62 @@ class RandDarkMask(BaseTransform):
 
 # DarkChannel
 class DarkChannel:
+    """Dark channel prior enhancement of low-light images.
+
+    The image is inverted, dehazed with the dark channel prior and inverted
+    back. Everything is computed in float32 with vectorized numpy and cv2
+    operations, see ``BatchDarkChannelEnhance`` for the batched torch
+    version which runs in the data preprocessor.
+
+    Args:
+        sz (int): Size of the erosion kernel of the dark channel.
+            Defaults to 15.
+    """
+
     def __init__(self, sz=15):
         self._sz = sz
+        self._kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (sz, sz))
 
     def _dark_channel(self, im):
-        b, g, r = cv2.split(im)
-        dc = cv2.min(cv2.min(r, g), b)
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (self._sz, self._sz))
-        dark = cv2.erode(dc, kernel)
-        return dark
+        # reduce over the channel slices, which is much faster than a strided
+        # ``min(axis=2)``
+        dc = np.minimum(np.minimum(im[..., 0], im[..., 1]), im[..., 2])
+        return cv2.erode(dc, self._kernel)
 
     def _atm_light(self, im, dark):
-        [h, w] = im.shape[:2]
-        imsz = h*w
-        numpx = int(max(math.floor(imsz/1000), 1))
-        darkvec = dark.reshape(imsz, 1)
-        imvec = im.reshape(imsz, 3)
-
-        indices = darkvec.argsort()
-        indices = indices[imsz-numpx::]
-
-        atmsum = np.zeros([1, 3])
-        for ind in range(1, numpx):
-            atmsum = atmsum + imvec[indices[ind]]
-
-        A = atmsum / numpx
-        return A
+        # mean color of the 0.1% pixels with the brightest dark channel
+        imsz = dark.size
+        numpx = max(imsz // 1000, 1)
+        indices = np.argpartition(dark.reshape(-1), imsz - numpx)[-numpx:]
+        return im.reshape(-1, 3)[indices].mean(axis=0)
 
     def _transmission_estimate(self, im, A):
         omega = 0.95
-        im3 = np.empty(im.shape, im.dtype)
-
-        for ind in range(0, 3):
-            im3[:, :, ind] = im[:, :, ind]/A[0, ind]
-
-        transmission = 1 - omega*self._dark_channel(im3)
-        return transmission
+        # per-channel scalar ops of cv2 are much faster than numpy
+        # broadcasting over the last axis of a HWC image
+        return 1 - omega * self._dark_channel(cv2.divide(im, (*A.tolist(), 0)))
 
     def _guided_filter(self, im, p, r, eps):
-        mean_I = cv2.boxFilter(im, cv2.CV_64F, (r, r))
-        mean_p = cv2.boxFilter(p, cv2.CV_64F, (r, r))
-        mean_Ip = cv2.boxFilter(im*p, cv2.CV_64F, (r, r))
-        cov_Ip = mean_Ip - mean_I*mean_p
+        mean_I = cv2.boxFilter(im, cv2.CV_32F, (r, r))
+        mean_p = cv2.boxFilter(p, cv2.CV_32F, (r, r))
+        mean_Ip = cv2.boxFilter(im * p, cv2.CV_32F, (r, r))
+        cov_Ip = mean_Ip - mean_I * mean_p
 
-        mean_II = cv2.boxFilter(im*im, cv2.CV_64F, (r, r))
-        var_I = mean_II - mean_I*mean_I
+        mean_II = cv2.boxFilter(im * im, cv2.CV_32F, (r, r))
+        var_I = mean_II - mean_I * mean_I
 
-        a = cov_Ip/(var_I + eps)
-        b = mean_p - a*mean_I
+        a = cov_Ip / (var_I + eps)
+        b = mean_p - a * mean_I
 
-        mean_a = cv2.boxFilter(a, cv2.CV_64F, (r, r))
-        mean_b = cv2.boxFilter(b, cv2.CV_64F, (r, r))
+        mean_a = cv2.boxFilter(a, cv2.CV_32F, (r, r))
+        mean_b = cv2.boxFilter(b, cv2.CV_32F, (r, r))
 
-        q = mean_a*im + mean_b
+        q = mean_a * im + mean_b
         return q
 
     def _transmission_refine(self, im, et):
         gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
-        gray = np.float64(gray)/255
+        gray = gray.astype(np.float32) / 255
         r = 60  # default 60
         eps = 0.0001
         t = self._guided_filter(gray, et, r, eps)
@@ -550,26 +548,22 @@ class DarkChannel:
         return t
 
     def _recover(self, im, t, A, tx=0.1):
-        res = np.empty(im.shape, im.dtype)
-        t = cv2.max(t, tx)
-
-        for ind in range(0, 3):
-            res[:, :, ind] = (im[:, :, ind]-A[0, ind])/t + A[0, ind]
-
+        t = np.maximum(t, tx)
+        A = (*A.tolist(), 0)
+        res = cv2.subtract(im, A)
+        cv2.divide(res, cv2.merge([t, t, t]), dst=res)
+        cv2.add(res, A, dst=res)
         return res
 
     def run(self, image):
-        rever_img = 255 - image
-        rever_img_bn = rever_img.astype('float64')/255
-        dark = self._dark_channel(rever_img_bn)
-        A = self._atm_light(rever_img_bn, dark)
+        rever_img_bn = (255 - image).astype(np.float32) / 255
+        A = self._atm_light(rever_img_bn, self._dark_channel(rever_img_bn))
         te = self._transmission_estimate(rever_img_bn, A)
         t = self._transmission_refine(image, te)
         J = self._recover(rever_img_bn, t, A, 0.1)
 
-        rever_res_img = (1-J)*255
+        rever_res_img = (1 - J) * 255
         return rever_res_img
-    
 
 
 @TRANSFORMS.register_module()
@@ -694,10 +688,8 @@ class RandomCropX(BaseTransform):
                 'homography_matrix']
 
         # crop the image
-        img = img[crop_y1:crop_y2, crop_x1:crop_x2, ...]
-        img_shape = img.shape
-        results['img'] = img
-        results['img_shape'] = img_shape[:2]
+        self._crop_img(results, (crop_x1, crop_y1, crop_x2, crop_y2))
+        img_shape = results['img'].shape
 
         # crop bboxes accordingly and clip to the image boundary
         if results.get('gt_bboxes', None) is not None:
@@ -741,6 +733,14 @@ class RandomCropX(BaseTransform):
 
         return results
 
+    def _crop_img(self, results: dict, crop_bbox: Tuple[int, int, int,
+                                                        int]) -> None:
+        """Crop the image with ``crop_bbox`` in (x1, y1, x2, y2) format."""
+        crop_x1, crop_y1, crop_x2, crop_y2 = crop_bbox
+        img = results['img'][crop_y1:crop_y2, crop_x1:crop_x2, ...]
+        results['img'] = img
+        results['img_shape'] = img.shape[:2]
+
     @cache_randomness
     def _rand_offset(self, margin: Tuple[int, int]) -> Tuple[int, int]:
         """Randomly generate crop offset.
@@ -817,6 +817,164 @@ class RandomCropX(BaseTransform):
         return repr_str
 
 
+class MultiImageMixin:
+    """Mixin of the geometric transforms applied to several images of a
+    sample in one call, e.g. the RGB image ``img`` and the TIR image ``img2``.
+
+    The random parameters are sampled once and the annotations, which belong
+    to ``img``, are transformed once. Every other image is only warped, and
+    its ``img_shape{suffix}`` is updated, e.g. ``img_shape2`` for ``img2``.
+    Compared with wrapping the single-image transforms with
+    ``Image2Broadcaster``, no view of the results dict is made and the random
+    parameters do not need to be cached and replayed.
+
+    Args:
+        img_keys (Sequence[str]): Keys of the images to transform, the first
+            one must be ``img``. Defaults to ('img', 'img2').
+    """
+
+    def __init__(self,
+                 *args,
+                 img_keys: Sequence[str] = ('img', 'img2'),
+                 **kwargs) -> None:
+        assert img_keys[0] == 'img', \
+            f'The first of `img_keys` must be `img`, but got {img_keys}'
+        self.img_keys = tuple(img_keys)
+        super().__init__(*args, **kwargs)
+
+    def _extra_img_keys(self):
+        """Iterate the keys of the extra images and their suffixes."""
+        for key in self.img_keys[1:]:
+            yield key, key[len('img'):]
+
+    def _warp_extra_imgs(self, results: dict, warp_img, *shared_keys) -> None:
+        """Apply the image warp ``warp_img`` of the single-image transform to
+        every extra image.
+
+        ``warp_img`` is called with a small dict holding the image as ``img``
+        and the ``shared_keys`` of ``results``, e.g. the sampled ``scale``.
+        """
+        for key, suffix in self._extra_img_keys():
+            view = {k: results[k] for k in shared_keys}
+            view['img'] = results[key]
+            warp_img(view)
+            results[key] = view['img']
+            results[f'img_shape{suffix}'] = view['img_shape']
+
+    def __repr__(self) -> str:
+        repr_str = super().__repr__()
+        return repr_str[:-1] + f', img_keys={self.img_keys})'
+
+
+@TRANSFORMS.register_module()
+class MultiImageResize(MultiImageMixin, Resize):
+    """Resize several images of a sample with the same scale, the bboxes,
+    masks and segmentation map are resized once.
+
+    See :class:`Resize` and :class:`MultiImageMixin` for the arguments.
+    """
+
+    def _resize_img(self, results: dict) -> None:
+        """Resize all the images with ``results['scale']``."""
+        self._warp_extra_imgs(results, super()._resize_img, 'scale')
+        super()._resize_img(results)
+
+
+@TRANSFORMS.register_module()
+class MultiImageRandomResize(RandomResize):
+    """Random resize several images of a sample with the same sampled scale.
+
+    See :class:`mmcv.transforms.RandomResize` for the arguments, the images
+    are resized by :class:`MultiImageResize`.
+
+    Args:
+        img_keys (Sequence[str]): Keys of the images to resize, the first
+            one must be ``img``. Defaults to ('img', 'img2').
+
+    Examples:
+        >>> pipeline = [
+        >>>     dict(type='LoadImageFromFile'),
+        >>>     dict(type='LoadImageFromFile2'),
+        >>>     dict(type='LoadAnnotations', with_bbox=True),
+        >>>     dict(
+        >>>         type='MultiImageRandomResize',
+        >>>         scale=(1024, 1024),
+        >>>         ratio_range=(0.5, 2.0),
+        >>>         keep_ratio=True),
+        >>>     dict(
+        >>>         type='MultiImageRandomCropX',
+        >>>         crop_type='absolute_range',
+        >>>         crop_size=(1024, 1024),
+        >>>         allow_negative_crop=True),
+        >>>     dict(type='MultiImageRandomFlip', prob=0.5),
+        >>>     dict(type='MultiImagePad', size=(1024, 1024)),
+        >>>     dict(type='DoublePackDetInputs')]
+    """
+
+    def __init__(self,
+                 scale: Union[Tuple[int, int], Sequence[Tuple[int, int]]],
+                 ratio_range: Tuple[float, float] = None,
+                 img_keys: Sequence[str] = ('img', 'img2'),
+                 **resize_kwargs) -> None:
+        super().__init__(
+            scale,
+            ratio_range,
+            resize_type=MultiImageResize,
+            img_keys=img_keys,
+            **resize_kwargs)
+
+
+@TRANSFORMS.register_module()
+class MultiImageRandomCropX(MultiImageMixin, RandomCropX):
+    """Random crop several images of a sample at the same location, the
+    bboxes, masks and segmentation map are cropped once.
+
+    See :class:`RandomCropX` and :class:`MultiImageMixin` for the arguments.
+    """
+
+    def _crop_img(self, results: dict, crop_bbox: Tuple[int, int, int,
+                                                        int]) -> None:
+        """Crop all the images with ``crop_bbox`` in (x1, y1, x2, y2)
+        format."""
+        crop_x1, crop_y1, crop_x2, crop_y2 = crop_bbox
+        for key, suffix in self._extra_img_keys():
+            img = results[key][crop_y1:crop_y2, crop_x1:crop_x2, ...]
+            results[key] = img
+            results[f'img_shape{suffix}'] = img.shape[:2]
+        super()._crop_img(results, crop_bbox)
+
+
+@TRANSFORMS.register_module()
+class MultiImageRandomFlip(MultiImageMixin, RandomFlip):
+    """Flip several images of a sample in the same direction, the bboxes,
+    masks and segmentation map are flipped once.
+
+    See :class:`RandomFlip` and :class:`MultiImageMixin` for the arguments.
+    """
+
+    def _flip(self, results: dict) -> None:
+        """Flip all the images, bounding boxes, and semantic segmentation
+        map."""
+        for key, _ in self._extra_img_keys():
+            results[key] = mmcv.imflip(
+                results[key], direction=results['flip_direction'])
+        super()._flip(results)
+
+
+@TRANSFORMS.register_module()
+class MultiImagePad(MultiImageMixin, Pad):
+    """Pad several images of a sample, the masks and segmentation map are
+    padded once.
+
+    See :class:`Pad` and :class:`MultiImageMixin` for the arguments.
+    """
+
+    def _pad_img(self, results: dict) -> None:
+        """Pad all the images according to ``self.size``."""
+        self._warp_extra_imgs(results, super()._pad_img)
+        super()._pad_img(results)
+
+
 if __name__ == "__main__":
     import imageio
     # dc = DarkChannel()
@@ -2,6 +2,7 @@
 import copy
 import inspect
 import math
+import os.path as osp
 import warnings
 from typing import List, Optional, Sequence, Tuple, Union
 
@@ -16,7 +17,7 @@ from mmcv.transforms import RandomFlip as MMCV_RandomFlip
 from mmcv.transforms import Resize as MMCV_Resize
 from mmcv.transforms.utils import avoid_cache_randomness, cache_randomness
 from mmengine.dataset import BaseDataset
-from mmengine.utils import is_str
+from mmengine.utils import is_str, mkdir_or_exist
 from numpy import random
 
 from mmdet.registry import TRANSFORMS
@@ -1360,4 +1361,307 @@ class CachedMosaic2Images_Possion(Mosaic):
         repr_str += f'max_cached_images={self.max_cached_images}, '
         repr_str += f'random_pop={self.random_pop})'
         return repr_str
-    
+
+
+class ObjectBank:
+    """Memory-mapped bank of paired RGB/TIR object patches.
+
+    The patches of all the objects are flattened and concatenated in
+    ``img.bin`` and ``img2.bin``, ``meta.npy`` holds the offset, height,
+    width and label of each object. The files are mapped lazily on first
+    access, so every dataloader worker reads the patches from the shared
+    page cache instead of holding its own copy.
+
+    Args:
+        bank_dir (str): Directory of the bank written by :meth:`build`.
+    """
+
+    def __init__(self, bank_dir: str) -> None:
+        self.bank_dir = bank_dir
+        self._arrays = None
+
+    def _load(self) -> tuple:
+        if self._arrays is None:
+            meta = np.load(osp.join(self.bank_dir, 'meta.npy'))
+            # the patch files of an empty bank are empty and cannot be mapped
+            imgs = tuple(
+                np.memmap(path, dtype=np.uint8, mode='r')
+                if osp.getsize(path) > 0 else np.empty(0, dtype=np.uint8)
+                for path in (osp.join(self.bank_dir, name)
+                             for name in ('img.bin', 'img2.bin')))
+            self._arrays = (meta, ) + imgs
+        return self._arrays
+
+    def __len__(self) -> int:
+        return len(self._load()[0])
+
+    @property
+    def labels(self) -> np.ndarray:
+        return self._load()[0][:, 3]
+
+    def __getitem__(self, index: int) -> Tuple[np.ndarray, np.ndarray, int]:
+        """Get the RGB patch, the TIR patch and the label of an object."""
+        meta, img, img2 = self._load()
+        offset, h, w, label = meta[index].tolist()
+        end = offset + h * w * 3
+        patch = img[offset:end].reshape(h, w, 3)
+        patch2 = img2[offset:end].reshape(h, w, 3)
+        return patch, patch2, label
+
+    @staticmethod
+    def build(samples,
+              bank_dir: str,
+              min_size: int = 4,
+              max_black_ratio: float = 0.1,
+              black_thr: int = 15) -> int:
+        """Extract the objects of ``samples`` into a bank.
+
+        Objects smaller than ``min_size``, ignored objects and objects whose
+        RGB patch has at least ``max_black_ratio`` of gray levels lower than
+        ``black_thr`` are skipped, like with ``copy_noBlack`` of
+        ``CopyPaste_Possion``.
+
+        Args:
+            samples (Iterable[dict]): Results with ``img``, ``img2``,
+                ``gt_bboxes`` and ``gt_bboxes_labels``, e.g. the outputs of
+                the loading transforms of a dataset.
+            bank_dir (str): Output directory.
+            min_size (int): Minimum width and height of the objects.
+                Defaults to 4.
+            max_black_ratio (float): Maximum ratio of black pixels.
+                Defaults to 0.1.
+            black_thr (int): Gray level under which a pixel is black.
+                Defaults to 15.
+
+        Returns:
+            int: The number of objects in the bank.
+        """
+        mkdir_or_exist(bank_dir)
+        meta = []
+        offset = 0
+        with open(osp.join(bank_dir, 'img.bin'), 'wb') as f, \
+                open(osp.join(bank_dir, 'img2.bin'), 'wb') as f2:
+            for results in samples:
+                img, img2 = results['img'], results['img2']
+                bboxes = results['gt_bboxes']
+                if not isinstance(bboxes, np.ndarray):
+                    bboxes = bboxes.numpy()
+                h, w = img.shape[:2]
+                bboxes = bboxes.astype(np.int64).reshape(-1, 4)
+                bboxes[:, 0::2] = bboxes[:, 0::2].clip(0, w)
+                bboxes[:, 1::2] = bboxes[:, 1::2].clip(0, h)
+                keep = ((bboxes[:, 2] - bboxes[:, 0] >= min_size) &
+                        (bboxes[:, 3] - bboxes[:, 1] >= min_size))
+                if 'gt_ignore_flags' in results:
+                    keep &= ~results['gt_ignore_flags'].astype(bool)
+
+                # count the black pixels of all the boxes at once with an
+                # integral image
+                black = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) < black_thr
+                integral = cv2.integral(black.astype(np.uint8))
+                x1, y1, x2, y2 = bboxes.T
+                num_black = (integral[y2, x2] - integral[y1, x2] -
+                             integral[y2, x1] + integral[y1, x1])
+                area = np.maximum((x2 - x1) * (y2 - y1), 1)
+                keep &= num_black / area < max_black_ratio
+
+                labels = results['gt_bboxes_labels'][keep]
+                for (x1, y1, x2, y2), label in zip(bboxes[keep], labels):
+                    f.write(np.ascontiguousarray(img[y1:y2, x1:x2]).data)
+                    f2.write(np.ascontiguousarray(img2[y1:y2, x1:x2]).data)
+                    meta.append((offset, y2 - y1, x2 - x1, label))
+                    offset += (y2 - y1) * (x2 - x1) * 3
+        meta = np.array(meta, dtype=np.int64).reshape(-1, 4)
+        np.save(osp.join(bank_dir, 'meta.npy'), meta)
+        return len(meta)
+
+
+@TRANSFORMS.register_module()
+class CopyPasteObjectBank(BaseTransform):
+    """Paste paired RGB/TIR objects of an :class:`ObjectBank` to ``img`` and
+    ``img2``.
+
+    Unlike ``CopyPaste_Possion``, which crops the objects of the current
+    sample and blends each of them with ``cv2.seamlessClone``, the objects
+    are drawn from a bank extracted once per dataset with
+    ``tools/misc/build_object_bank.py``, and the random parameters of all
+    the pastes are sampled at once. The pastes are blended according to
+    ``blend``:
+
+    - ``'copy'``: the patch replaces the image region.
+    - ``'feather'``: the patch is alpha blended with a linear ramp of
+      ``feather`` pixels on its border.
+    - ``'poisson'``: Poisson blending with ``cv2.seamlessClone``.
+
+    Whatever ``blend``, a paste uses Poisson blending with probability
+    ``poisson_prob``.
+
+    Required Keys:
+
+    - img
+    - img2
+    - gt_bboxes (BaseBoxes[torch.float32])
+    - gt_bboxes_labels (np.int64)
+    - gt_ignore_flags (bool)
+
+    Modified Keys:
+
+    - img
+    - img2
+    - gt_bboxes
+    - gt_bboxes_labels
+    - gt_ignore_flags
+
+    Args:
+        bank_dir (str): Directory of the :class:`ObjectBank`.
+        prob (float): Probability to paste objects to a sample.
+            Defaults to 0.1.
+        num_objects (Tuple[int, int]): Range of the number of pasted objects,
+            both inclusive. Defaults to (1, 4).
+        scale_range (Tuple[float, float]): Range of the scale factor of the
+            objects. Defaults to (0.9, 1.1).
+        rotate (bool): Whether to rotate the objects by a random multiple of
+            90 degrees. Defaults to True.
+        margin (int): Minimum distance between the pasted objects and the
+            image border. Defaults to 20.
+        blend (str): Blending of the pastes, one of 'copy', 'feather' and
+            'poisson'. Defaults to 'feather'.
+        feather (int): Width of the alpha ramp of 'feather'. Defaults to 3.
+        poisson_prob (float): Probability of a paste to use Poisson blending.
+            Defaults to 0.
+    """
+
+    def __init__(self,
+                 bank_dir: str,
+                 prob: float = 0.1,
+                 num_objects: Tuple[int, int] = (1, 4),
+                 scale_range: Tuple[float, float] = (0.9, 1.1),
+                 rotate: bool = True,
+                 margin: int = 20,
+                 blend: str = 'feather',
+                 feather: int = 3,
+                 poisson_prob: float = 0.) -> None:
+        assert 0 <= prob <= 1.0, 'The probability should be in range [0,1]. ' \
+                                 f'got {prob}.'
+        assert 0 <= poisson_prob <= 1.0, 'The probability should be in ' \
+                                         f'range [0,1]. got {poisson_prob}.'
+        assert blend in ('copy', 'feather', 'poisson'), \
+            f'Unsupported blend {blend}.'
+        self.bank = ObjectBank(bank_dir)
+        self.prob = prob
+        self.num_objects = num_objects
+        self.scale_range = scale_range
+        self.rotate = rotate
+        self.margin = margin
+        self.blend = blend
+        self.feather = feather
+        self.poisson_prob = 1. if blend == 'poisson' else poisson_prob
+
+    @cache_randomness
+    def _random_prob(self) -> float:
+        return random.uniform(0, 1)
+
+    @cache_randomness
+    def _sample_pastes(self) -> tuple:
+        """Sample the objects, scales, rotations, positions and blending of
+        all the pastes."""
+        num = random.randint(self.num_objects[0], self.num_objects[1] + 1)
+        indexes = random.randint(0, len(self.bank), num)
+        scales = random.uniform(*self.scale_range, num)
+        rotations = random.randint(0, 4, num) if self.rotate else np.zeros(
+            num, dtype=np.int64)
+        positions = random.uniform(0, 1, (num, 2))
+        poisson = random.uniform(0, 1, num) < self.poisson_prob
+        return indexes, scales, rotations, positions, poisson
+
+    def _feather_alpha(self, h: int, w: int) -> np.ndarray:
+        ramp_y = np.minimum(np.arange(1, h + 1), np.arange(h, 0, -1))
+        ramp_x = np.minimum(np.arange(1, w + 1), np.arange(w, 0, -1))
+        alpha = np.minimum(ramp_y[:, None], ramp_x[None]) / (self.feather + 1)
+        return np.minimum(alpha, 1).astype(np.float32)
+
+    def _paste(self, img: np.ndarray, patch: np.ndarray, x: int, y: int,
+               poisson: bool, alpha: Optional[np.ndarray]) -> np.ndarray:
+        h, w = patch.shape[:2]
+        if poisson:
+            mask = np.full(patch.shape, 255, dtype=np.uint8)
+            try:
+                return cv2.seamlessClone(patch, img, mask,
+                                         (x + w // 2, y + h // 2),
+                                         cv2.NORMAL_CLONE)
+            except cv2.error:
+                pass
+        roi = img[y:y + h, x:x + w]
+        if alpha is not None:
+            patch = cv2.blendLinear(patch, roi, alpha, 1 - alpha)
+        roi[...] = patch
+        return img
+
+    @autocast_box_type()
+    def transform(self, results: dict) -> dict:
+        """Paste objects of the bank to the images.
+
+        Args:
+            results (dict): Result dict.
+
+        Returns:
+            dict: Updated result dict.
+        """
+        if self._random_prob() > self.prob or len(self.bank) == 0:
+            return results
+
+        img, img2 = results['img'], results['img2']
+        img_h, img_w = img.shape[:2]
+        bboxes, labels = [], []
+        for index, scale, rotation, (pos_y, pos_x), poisson in zip(
+                *self._sample_pastes()):
+            patch, patch2, label = self.bank[index]
+            h, w = int(patch.shape[0] * scale), int(patch.shape[1] * scale)
+            if h == 0 or w == 0:
+                continue
+            patch = cv2.resize(patch, (w, h))
+            patch2 = cv2.resize(patch2, (w, h))
+            if rotation:
+                patch = np.ascontiguousarray(np.rot90(patch, rotation))
+                patch2 = np.ascontiguousarray(np.rot90(patch2, rotation))
+                h, w = patch.shape[:2]
+
+            free_h = img_h - h - 2 * self.margin
+            free_w = img_w - w - 2 * self.margin
+            if free_h < 0 or free_w < 0:
+                continue
+            y = self.margin + int(pos_y * free_h)
+            x = self.margin + int(pos_x * free_w)
+            alpha = self._feather_alpha(h, w) \
+                if self.blend == 'feather' and not poisson else None
+            img = self._paste(img, patch, x, y, poisson, alpha)
+            img2 = self._paste(img2, patch2, x, y, poisson, alpha)
+            bboxes.append([x, y, x + w, y + h])
+            labels.append(label)
+
+        results['img'] = img
+        results['img2'] = img2
+        if bboxes:
+            gt_bboxes = results['gt_bboxes']
+            bboxes = gt_bboxes.__class__(np.array(bboxes, dtype=np.float32))
+            labels = np.array(labels, dtype=np.int64)
+            results['gt_bboxes'] = gt_bboxes.cat([gt_bboxes, bboxes])
+            results['gt_bboxes_labels'] = np.concatenate(
+                [results['gt_bboxes_labels'], labels])
+            ignore_flags = np.zeros(len(labels), dtype=bool)
+            results['gt_ignore_flags'] = np.concatenate(
+                [results['gt_ignore_flags'], ignore_flags])
+        return results
+
+    def __repr__(self):
+        repr_str = self.__class__.__name__
+        repr_str += f'(bank_dir={self.bank.bank_dir}, '
+        repr_str += f'prob={self.prob}, '
+        repr_str += f'num_objects={self.num_objects}, '
+        repr_str += f'scale_range={self.scale_range}, '
+        repr_str += f'rotate={self.rotate}, '
+        repr_str += f'margin={self.margin}, '
+        repr_str += f'blend={self.blend}, '
+        repr_str += f'feather={self.feather}, '
+        repr_str += f'poisson_prob={self.poisson_prob})'
+        return repr_str
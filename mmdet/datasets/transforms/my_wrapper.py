@@ -1,58 +1,53 @@
 # Copyright (c) OpenMMLab. All rights reserved.
-import copy
-from typing import Callable, Dict, List, Optional, Union
+from contextlib import nullcontext
+from typing import Callable, List, Optional, Tuple, Union
 
-import cv2
-import numpy as np
 from mmcv.transforms import BaseTransform, Compose
-from mmcv.transforms.utils import cache_random_params, cache_randomness
+from mmcv.transforms.utils import cache_random_params
 
 from mmdet.registry import TRANSFORMS
 
-@TRANSFORMS.register_module()
-class Image2Broadcaster(BaseTransform):
-    """A transform wrapper to apply the wrapped transforms to process both
-    `gt_bboxes` and `proposals` without adding any codes. It will do the
-    following steps:
-
-        1. Scatter the broadcasting targets to a list of inputs of the wrapped
-           transforms. The type of the list should be list[dict, dict], which
-           the first is the original inputs, the second is the processing
-           results that `gt_bboxes` being rewritten by the `proposals`.
-        2. Apply ``self.transforms``, with same random parameters, which is
-           sharing with a context manager. The type of the outputs is a
-           list[dict, dict].
-        3. Gather the outputs, update the `proposals` in the first item of
-           the outputs with the `gt_bboxes` in the second .
+
+class MultiImageBroadcaster(BaseTransform):
+    """Base class of the wrappers applying the wrapped transforms to the
+    images of several streams, e.g. ``img`` and ``img2`` of a RGB/TIR pair.
+    It will do the following steps:
+
+        1. Scatter the streams to a list of inputs of the wrapped transforms.
+           The first input is the original results dict, which carries the
+           annotations. For every other stream a shallow view of the results
+           is made in which ``img``, ``img_shape``, ``img_path`` and
+           ``ori_shape`` are the items of this stream. The views share every
+           other item with the results dict, including the suffixed items of
+           all the streams, but leave out the instance annotations, since
+           only the image items of the extra streams are gathered back.
+           Nothing is deep copied.
+        2. Apply ``self.transforms`` to each input. If
+           ``share_random_params`` is True, the random parameters sampled for
+           the first stream are cached and replayed for the others.
+        3. Gather the image items of the extra streams back into the output
+           of the first stream, with their stream suffix.
 
     Args:
          transforms (list, optional): Sequence of transform
             object or config dict to be wrapped. Defaults to [].
-
-    Note: The `TransformBroadcaster` in MMCV can achieve the same operation as
-          `ProposalBroadcaster`, but need to set more complex parameters.
-
-    Examples:
-        >>> pipeline = [
-        >>>     dict(type='LoadImageFromFile'),
-        >>>     dict(type='LoadProposals', num_max_proposals=2000),
-        >>>     dict(type='LoadAnnotations', with_bbox=True),
-        >>>     dict(
-        >>>         type='ProposalBroadcaster',
-        >>>         transforms=[
-        >>>             dict(type='Resize', scale=(1333, 800),
-        >>>                  keep_ratio=True),
-        >>>             dict(type='RandomFlip', prob=0.5),
-        >>>         ]),
-        >>>     dict(type='PackDetInputs')]
     """
+    # suffixes of the keys of the extra streams, e.g. ``img2``
+    streams: Tuple[str, ...] = ('2', )
+    # whether to replay the random parameters of the first stream
+    share_random_params: bool = True
+    # image items swapped in the view of each stream
+    image_keys = ('img', 'img_shape', 'img_path', 'ori_shape')
+    # items only transformed with the first stream
+    instance_keys = ('gt_bboxes', 'gt_bboxes_labels', 'gt_ignore_flags',
+                     'gt_masks', 'gt_seg_map', 'gt_instances_ids', 'proposals')
 
     def __init__(self, transforms: List[Union[dict, Callable]] = []) -> None:
         self.transforms = Compose(transforms)
 
-    def transform(self, results: dict) -> dict:
-        """Apply wrapped transform functions to process both `gt_bboxes` and
-        `proposals`.
+    def transform(self, results: dict) -> Optional[dict]:
+        """Apply wrapped transform functions to process the images of all
+        streams.
 
         Args:
             results (dict): Result dict from loading pipeline.
@@ -60,19 +55,23 @@ class Image2Broadcaster(BaseTransform):
         Returns:
             dict: Updated result dict.
         """
-        assert results.get('img2', None) is not None, \
-            '`proposals` should be in the results, please delete ' \
-            '`ProposalBroadcaster` in your configs, or check whether ' \
-            'you have load proposals successfully.'
+        for stream in self.streams:
+            assert results.get(f'img{stream}', None) is not None, \
+                f'`img{stream}` should be in the results, please check ' \
+                f'whether you have load the images of all the streams of ' \
+                f'{self.__class__.__name__} successfully.'
 
         inputs = self._process_input(results)
         outputs = self._apply_transforms(inputs)
         outputs = self._process_output(outputs)
         return outputs
 
+    def _stream_key(self, key: str, stream: str, data: dict) -> str:
+        """Name of the item ``key`` of the given stream in the results."""
+        return f'{key}{stream}'
+
     def _process_input(self, data: dict) -> list:
-        """Scatter the broadcasting targets to a list of inputs of the wrapped
-        transforms.
+        """Scatter the streams to a list of inputs of the wrapped transforms.
 
         Args:
             data (dict): The original input data.
@@ -80,417 +79,156 @@ class Image2Broadcaster(BaseTransform):
         Returns:
             list[dict]: A list of input data.
         """
-        cp_data = copy.deepcopy(data)
-        cp_data['img'] = cp_data['img2']
-        cp_data['img_shape'] = cp_data['img_shape2']
-        cp_data['img_path'] = cp_data['img_path2']
-        cp_data['ori_shape'] = cp_data['ori_shape2']
-        scatters = [data, cp_data]
+        # the items of the other streams are kept in the views, e.g. for
+        # the transforms reading ``img2`` themselves
+        shared = {
+            key: value
+            for key, value in data.items()
+            if key not in self.image_keys and key not in self.instance_keys
+        }
+        scatters = [data]
+        for stream in self.streams:
+            view = shared.copy()
+            for key in self.image_keys:
+                view[key] = data[self._stream_key(key, stream, data)]
+            scatters.append(view)
         return scatters
 
     def _apply_transforms(self, inputs: list) -> list:
         """Apply ``self.transforms``.
 
         Args:
-            inputs (list[dict, dict]): list of input data.
+            inputs (list[dict]): list of input data.
 
         Returns:
             list[dict]: The output of the wrapped pipeline.
         """
-        assert len(inputs) == 2
-        ctx = cache_random_params
+        assert len(inputs) == len(self.streams) + 1
+        ctx = cache_random_params if self.share_random_params \
+            else nullcontext
         with ctx(self.transforms):
             output_scatters = [self.transforms(_input) for _input in inputs]
         return output_scatters
 
-    def _process_output(self, output_scatters: list) -> dict:
+    def _process_output(self, output_scatters: list) -> Optional[dict]:
         """Gathering and renaming data items.
 
         Args:
-            output_scatters (list[dict, dict]): The output of the wrapped
+            output_scatters (list[dict]): The output of the wrapped
                 pipeline.
 
         Returns:
             dict: Updated result dict.
         """
         assert isinstance(output_scatters, list) and \
-               isinstance(output_scatters[0], dict) and \
-               len(output_scatters) == 2
+               len(output_scatters) == len(self.streams) + 1
+        # the wrapped transforms may drop the sample, e.g. a crop without
+        # any gt-bbox
+        if any(output is None for output in output_scatters):
+            return None
         outputs = output_scatters[0]
-        outputs['img2'] = output_scatters[1]['img']
-        outputs['img_path2'] = output_scatters[1]['img_path']
-        outputs['img_shape2'] = output_scatters[1]['img_shape']
-        outputs['ori_shape2'] = output_scatters[1]['ori_shape']
+        for stream, output in zip(self.streams, output_scatters[1:]):
+            for key in self.image_keys:
+                outputs[f'{key}{stream}'] = output[key]
         return outputs
 
 
 @TRANSFORMS.register_module()
-class Branch(BaseTransform):
-    """A transform wrapper to apply the wrapped transforms to process both
-    `gt_bboxes` and `proposals` without adding any codes. It will do the
-    following steps:
-
-        1. Scatter the broadcasting targets to a list of inputs of the wrapped
-           transforms. The type of the list should be list[dict, dict], which
-           the first is the original inputs, the second is the processing
-           results that `gt_bboxes` being rewritten by the `proposals`.
-        2. Apply ``self.transforms``, with same random parameters, which is
-           sharing with a context manager. The type of the outputs is a
-           list[dict, dict].
-        3. Gather the outputs, update the `proposals` in the first item of
-           the outputs with the `gt_bboxes` in the second .
+class Image2Broadcaster(MultiImageBroadcaster):
+    """A transform wrapper to apply the wrapped transforms to both ``img`` and
+    ``img2`` with the same random parameters.
+
+    The annotations are only transformed once, with ``img``. See
+    :class:`MultiImageBroadcaster` for details.
 
     Args:
          transforms (list, optional): Sequence of transform
             object or config dict to be wrapped. Defaults to [].
 
-    Note: The `TransformBroadcaster` in MMCV can achieve the same operation as
-          `ProposalBroadcaster`, but need to set more complex parameters.
-
     Examples:
         >>> pipeline = [
         >>>     dict(type='LoadImageFromFile'),
-        >>>     dict(type='LoadProposals', num_max_proposals=2000),
+        >>>     dict(type='LoadImageFromFile2'),
         >>>     dict(type='LoadAnnotations', with_bbox=True),
         >>>     dict(
-        >>>         type='ProposalBroadcaster',
+        >>>         type='Image2Broadcaster',
         >>>         transforms=[
         >>>             dict(type='Resize', scale=(1333, 800),
         >>>                  keep_ratio=True),
         >>>             dict(type='RandomFlip', prob=0.5),
         >>>         ]),
-        >>>     dict(type='PackDetInputs')]
+        >>>     dict(type='DoublePackDetInputs')]
     """
-
-    def __init__(self, transforms: List[Union[dict, Callable]] = []) -> None:
-        self.transforms = Compose(transforms)
-
-    def transform(self, results: dict) -> dict:
-        """Apply wrapped transform functions to process both `gt_bboxes` and
-        `proposals`.
-
-        Args:
-            results (dict): Result dict from loading pipeline.
-
-        Returns:
-            dict: Updated result dict.
-        """
-        assert results.get('img2', None) is not None, \
-            '`proposals` should be in the results, please delete ' \
-            '`ProposalBroadcaster` in your configs, or check whether ' \
-            'you have load proposals successfully.'
-
-        inputs = self._process_input(results)
-        outputs = self._apply_transforms(inputs)
-        outputs = self._process_output(outputs)
-        return outputs
-
-    def _process_input(self, data: dict) -> list:
-        """Scatter the broadcasting targets to a list of inputs of the wrapped
-        transforms.
-
-        Args:
-            data (dict): The original input data.
-
-        Returns:
-            list[dict]: A list of input data.
-        """
-        
-        cp_data = copy.deepcopy(data)
-        cp_data['img'] = cp_data['img2']
-        cp_data['img_shape'] = cp_data['img_shape2']
-        cp_data['img_path'] = cp_data['img_path2']
-        cp_data['ori_shape'] = cp_data['ori_shape2']
-        scatters = [data, cp_data]
-        return scatters
-
-    def _apply_transforms(self, inputs: list) -> list:
-        """Apply ``self.transforms``.
-
-        Args:
-            inputs (list[dict, dict]): list of input data.
-
-        Returns:
-            list[dict]: The output of the wrapped pipeline.
-        """
-        assert len(inputs) == 2
-        output_scatters = [self.transforms(_input) for _input in inputs]
-        return output_scatters
-
-    def _process_output(self, output_scatters: list) -> dict:
-        """Gathering and renaming data items.
-
-        Args:
-            output_scatters (list[dict, dict]): The output of the wrapped
-                pipeline.
-
-        Returns:
-            dict: Updated result dict.
-        """
-        assert isinstance(output_scatters, list) and \
-               isinstance(output_scatters[0], dict) and \
-               len(output_scatters) == 2
-        outputs = output_scatters[0]
-        outputs['img2'] = output_scatters[1]['img']
-        outputs['img_path2'] = output_scatters[1]['img_path']
-        outputs['img_shape2'] = output_scatters[1]['img_shape']
-        outputs['ori_shape2'] = output_scatters[1]['ori_shape']
-
-        return outputs
-    
+    streams = ('2', )
+    share_random_params = True
 
 
 @TRANSFORMS.register_module()
-class Image3Broadcaster(BaseTransform):
-    """A transform wrapper to apply the wrapped transforms to process both
-    `gt_bboxes` and `proposals` without adding any codes. It will do the
-    following steps:
-
-        1. Scatter the broadcasting targets to a list of inputs of the wrapped
-           transforms. The type of the list should be list[dict, dict], which
-           the first is the original inputs, the second is the processing
-           results that `gt_bboxes` being rewritten by the `proposals`.
-        2. Apply ``self.transforms``, with same random parameters, which is
-           sharing with a context manager. The type of the outputs is a
-           list[dict, dict].
-        3. Gather the outputs, update the `proposals` in the first item of
-           the outputs with the `gt_bboxes` in the second .
+class Branch(MultiImageBroadcaster):
+    """A transform wrapper to apply the wrapped transforms to both ``img`` and
+    ``img2`` independently, i.e. the random parameters are sampled for each
+    image.
+
+    The annotations are only transformed once, with ``img``. See
+    :class:`MultiImageBroadcaster` for details.
 
     Args:
          transforms (list, optional): Sequence of transform
             object or config dict to be wrapped. Defaults to [].
 
-    Note: The `TransformBroadcaster` in MMCV can achieve the same operation as
-          `ProposalBroadcaster`, but need to set more complex parameters.
-
     Examples:
         >>> pipeline = [
         >>>     dict(type='LoadImageFromFile'),
-        >>>     dict(type='LoadProposals', num_max_proposals=2000),
+        >>>     dict(type='LoadImageFromFile2'),
         >>>     dict(type='LoadAnnotations', with_bbox=True),
         >>>     dict(
-        >>>         type='ProposalBroadcaster',
+        >>>         type='Branch',
         >>>         transforms=[
-        >>>             dict(type='Resize', scale=(1333, 800),
-        >>>                  keep_ratio=True),
-        >>>             dict(type='RandomFlip', prob=0.5),
+        >>>             dict(type='Pad', size=(1024, 1024)),
         >>>         ]),
-        >>>     dict(type='PackDetInputs')]
+        >>>     dict(type='DoublePackDetInputs')]
     """
+    streams = ('2', )
+    share_random_params = False
 
-    def __init__(self, transforms: List[Union[dict, Callable]] = []) -> None:
-        self.transforms = Compose(transforms)
-
-    def transform(self, results: dict) -> dict:
-        """Apply wrapped transform functions to process both `gt_bboxes` and
-        `proposals`.
-
-        Args:
-            results (dict): Result dict from loading pipeline.
-
-        Returns:
-            dict: Updated result dict.
-        """
-        assert results.get('img3', None) is not None, \
-            '`proposals` should be in the results, please delete ' \
-            '`ProposalBroadcaster` in your configs, or check whether ' \
-            'you have load proposals successfully.'
 
-        inputs = self._process_input(results)
-        outputs = self._apply_transforms(inputs)
-        outputs = self._process_output(outputs)
-        return outputs
+class _ThreeImageMixin:
+    """The third stream is loaded by ``LoadImageFromFile3`` from
+    ``img_path2``, fall back to it when there is no ``img_path3``."""
+    streams = ('2', '3')
 
-    def _process_input(self, data: dict) -> list:
-        """Scatter the broadcasting targets to a list of inputs of the wrapped
-        transforms.
-
-        Args:
-            data (dict): The original input data.
-
-        Returns:
-            list[dict]: A list of input data.
-        """
-        cp_data = copy.deepcopy(data)
-        
-        cp_data['img'] = cp_data['img2']
-        cp_data['img_shape'] = cp_data['img_shape2']
-        cp_data['img_path'] = cp_data['img_path2']
-        cp_data['ori_shape'] = cp_data['ori_shape2']
-        
-        cp_data3 = copy.deepcopy(data)
-        cp_data3['img'] = cp_data3['img3']
-        cp_data3['img_shape'] = cp_data3['img_shape3']
-        cp_data3['img_path'] = cp_data3['img_path2']
-        cp_data3['ori_shape'] = cp_data3['ori_shape3']
-        # scatters = [data, cp_data]
-        scatters = [data, cp_data, cp_data3]
-        return scatters
-
-    def _apply_transforms(self, inputs: list) -> list:
-        """Apply ``self.transforms``.
-
-        Args:
-            inputs (list[dict, dict]): list of input data.
-
-        Returns:
-            list[dict]: The output of the wrapped pipeline.
-        """
-        assert len(inputs) == 3
-        ctx = cache_random_params
-        with ctx(self.transforms):
-            output_scatters = [self.transforms(_input) for _input in inputs]
-        return output_scatters
-
-    def _process_output(self, output_scatters: list) -> dict:
-        """Gathering and renaming data items.
-
-        Args:
-            output_scatters (list[dict, dict]): The output of the wrapped
-                pipeline.
-
-        Returns:
-            dict: Updated result dict.
-        """
-        assert isinstance(output_scatters, list) and \
-               isinstance(output_scatters[0], dict) and \
-               len(output_scatters) == 3
-        outputs = output_scatters[0]
-        outputs['img2'] = output_scatters[1]['img']
-        outputs['img_path2'] = output_scatters[1]['img_path']
-        outputs['img_shape2'] = output_scatters[1]['img_shape']
-        outputs['ori_shape2'] = output_scatters[1]['ori_shape']
-        
-        outputs['img3'] = output_scatters[2]['img']
-        outputs['img_path3'] = output_scatters[2]['img_path']
-        outputs['img_shape3'] = output_scatters[2]['img_shape']
-        outputs['ori_shape3'] = output_scatters[2]['ori_shape']
-        
-        return outputs
+    def _stream_key(self, key: str, stream: str, data: dict) -> str:
+        if key == 'img_path' and f'img_path{stream}' not in data:
+            return 'img_path2'
+        return f'{key}{stream}'
 
 
 @TRANSFORMS.register_module()
-class Branch_three(BaseTransform):
-    """A transform wrapper to apply the wrapped transforms to process both
-    `gt_bboxes` and `proposals` without adding any codes. It will do the
-    following steps:
-
-        1. Scatter the broadcasting targets to a list of inputs of the wrapped
-           transforms. The type of the list should be list[dict, dict], which
-           the first is the original inputs, the second is the processing
-           results that `gt_bboxes` being rewritten by the `proposals`.
-        2. Apply ``self.transforms``, with same random parameters, which is
-           sharing with a context manager. The type of the outputs is a
-           list[dict, dict].
-        3. Gather the outputs, update the `proposals` in the first item of
-           the outputs with the `gt_bboxes` in the second .
+class Image3Broadcaster(_ThreeImageMixin, MultiImageBroadcaster):
+    """A transform wrapper to apply the wrapped transforms to ``img``,
+    ``img2`` and ``img3`` with the same random parameters.
+
+    The annotations are only transformed once, with ``img``. See
+    :class:`MultiImageBroadcaster` for details.
 
     Args:
          transforms (list, optional): Sequence of transform
             object or config dict to be wrapped. Defaults to [].
-
-    Note: The `TransformBroadcaster` in MMCV can achieve the same operation as
-          `ProposalBroadcaster`, but need to set more complex parameters.
-
-    Examples:
-        >>> pipeline = [
-        >>>     dict(type='LoadImageFromFile'),
-        >>>     dict(type='LoadProposals', num_max_proposals=2000),
-        >>>     dict(type='LoadAnnotations', with_bbox=True),
-        >>>     dict(
-        >>>         type='ProposalBroadcaster',
-        >>>         transforms=[
-        >>>             dict(type='Resize', scale=(1333, 800),
-        >>>                  keep_ratio=True),
-        >>>             dict(type='RandomFlip', prob=0.5),
-        >>>         ]),
-        >>>     dict(type='PackDetInputs')]
     """
+    share_random_params = True
 
-    def __init__(self, transforms: List[Union[dict, Callable]] = []) -> None:
-        self.transforms = Compose(transforms)
 
-    def transform(self, results: dict) -> dict:
-        """Apply wrapped transform functions to process both `gt_bboxes` and
-        `proposals`.
-
-        Args:
-            results (dict): Result dict from loading pipeline.
-
-        Returns:
-            dict: Updated result dict.
-        """
-        assert results.get('img3', None) is not None, \
-            '`proposals` should be in the results, please delete ' \
-            '`ProposalBroadcaster` in your configs, or check whether ' \
-            'you have load proposals successfully.'
-
-        inputs = self._process_input(results)
-        outputs = self._apply_transforms(inputs)
-        outputs = self._process_output(outputs)
-        return outputs
-
-    def _process_input(self, data: dict) -> list:
-        """Scatter the broadcasting targets to a list of inputs of the wrapped
-        transforms.
-
-        Args:
-            data (dict): The original input data.
-
-        Returns:
-            list[dict]: A list of input data.
-        """
-        
-        cp_data = copy.deepcopy(data)
-        cp_data['img'] = cp_data['img2']
-        cp_data['img_shape'] = cp_data['img_shape2']
-        cp_data['img_path'] = cp_data['img_path2']
-        cp_data['ori_shape'] = cp_data['ori_shape2']
-        
-        cp_data3 = copy.deepcopy(data)
-        cp_data3['img'] = cp_data3['img3']
-        cp_data3['img_shape'] = cp_data3['img_shape3']
-        cp_data3['img_path'] = cp_data3['img_path2']
-        cp_data3['ori_shape'] = cp_data3['ori_shape3']
-        # scatters = [data, cp_data]
-        scatters = [data, cp_data, cp_data3]
-        return scatters
-
-    def _apply_transforms(self, inputs: list) -> list:
-        """Apply ``self.transforms``.
-
-        Args:
-            inputs (list[dict, dict]): list of input data.
-
-        Returns:
-            list[dict]: The output of the wrapped pipeline.
-        """
-        assert len(inputs) == 3
-        output_scatters = [self.transforms(_input) for _input in inputs]
-        return output_scatters
-
-    def _process_output(self, output_scatters: list) -> dict:
-        """Gathering and renaming data items.
+@TRANSFORMS.register_module()
+class Branch_three(_ThreeImageMixin, MultiImageBroadcaster):
+    """A transform wrapper to apply the wrapped transforms to ``img``,
+    ``img2`` and ``img3`` independently, i.e. the random parameters are
+    sampled for each image.
 
-        Args:
-            output_scatters (list[dict, dict]): The output of the wrapped
-                pipeline.
+    The annotations are only transformed once, with ``img``. See
+    :class:`MultiImageBroadcaster` for details.
 
-        Returns:
-            dict: Updated result dict.
-        """
-        assert isinstance(output_scatters, list) and \
-               isinstance(output_scatters[0], dict) and \
-               len(output_scatters) == 3
-        outputs = output_scatters[0]
-        outputs['img2'] = output_scatters[1]['img']
-        outputs['img_path2'] = output_scatters[1]['img_path']
-        outputs['img_shape2'] = output_scatters[1]['img_shape']
-        outputs['ori_shape2'] = output_scatters[1]['ori_shape']
-        
-        outputs['img3'] = output_scatters[2]['img']
-        outputs['img_path3'] = output_scatters[2]['img_path']
-        outputs['img_shape3'] = output_scatters[2]['img_shape']
-        outputs['ori_shape3'] = output_scatters[2]['ori_shape']
-
-        return outputs
\ No newline at end of file
+    Args:
+         transforms (list, optional): Sequence of transform
+            object or config dict to be wrapped. Defaults to [].
+    """
+    share_random_params = False
@@ -0,0 +1,54 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import os.path as osp
+from typing import Optional
+
+from mmengine.hooks import Hook
+from mmengine.runner import Runner
+
+from mmdet.datasets.transforms.my_loading import SharedImageCache
+from mmdet.registry import HOOKS
+
+
+@HOOKS.register_module()
+class ImageCacheLoggerHook(Hook):
+    """Log the statistics of the :class:`SharedImageCache` used by the
+    loading transforms.
+
+    The hits and misses are counted in the arena shared by the dataloader
+    workers of all the ranks of the node, since the arena was created.
+
+    Args:
+        interval (int): Logging interval (every k iterations).
+            Defaults to 50.
+    """
+
+    priority = 'NORMAL'
+
+    def __init__(self, interval: int = 50) -> None:
+        self.interval = interval
+
+    def after_train_iter(self,
+                         runner: Runner,
+                         batch_idx: int,
+                         data_batch: Optional[dict] = None,
+                         outputs: Optional[dict] = None) -> None:
+        """Update the hit rate and the number of images of the caches in the
+        message hub every n iterations.
+
+        Args:
+            runner (:obj:`Runner`): The runner of the training process.
+            batch_idx (int): The index of the current batch in the train loop.
+            data_batch (dict, Optional): Data from dataloader.
+                Defaults to None.
+            outputs (dict, Optional): Outputs from model. Defaults to None.
+        """
+        if not self.every_n_train_iters(runner, self.interval):
+            return
+        for cache in SharedImageCache.instances():
+            stats = cache.stats()
+            name = osp.basename(cache.path)
+            accesses = max(stats['hits'] + stats['misses'], 1)
+            runner.message_hub.update_scalar(f'train/{name}_hit_rate',
+                                             stats['hits'] / accesses)
+            runner.message_hub.update_scalar(f'train/{name}_size',
+                                             stats['size'])
@@ -2,18 +2,18 @@
 import datetime
 import itertools
 import os.path as osp
-import tempfile
 from collections import OrderedDict
 from typing import Dict, List, Optional, Sequence, Union
 
 import numpy as np
 import torch
 from mmengine.evaluator import BaseMetric
-from mmengine.fileio import dump, get_local_path, load
+from mmengine.fileio import dump, get_local_path
 from mmengine.logging import MMLogger
 from terminaltables import AsciiTable
 
-from mmdet.datasets.api_wrappers import COCO, COCOeval, COCOevalMP
+from mmdet.datasets.api_wrappers import (COCO, COCOeval, COCOevalFast,
+                                         COCOevalMP)
 from mmdet.registry import METRICS
 from mmdet.structures.mask import encode_mask_results
 from ..functional import eval_recalls
@@ -63,7 +63,17 @@ class CocoMetric(BaseMetric):
             will be used instead. Defaults to None.
         sort_categories (bool): Whether sort categories in annotations. Only
             used for `Objects365V1Dataset`. Defaults to False.
-        use_mp_eval (bool): Whether to use mul-processing evaluation
+        use_mp_eval (bool | int): Whether to use mul-processing evaluation.
+            An int gives the number of the worker processes, and True uses
+            all the cores available. Defaults to False.
+        use_fast_eval (bool): Whether to use the array based evaluation for
+            the bbox and proposal metrics, which gives the same results as
+            COCOeval. The segm metric is not affected. Defaults to False.
+        incremental (bool): Whether to match the predictions to the ground
+            truths image by image in :meth:`process`, so that only the
+            compact match results are collected from the ranks instead of the
+            predictions. Only the bbox and proposal metrics are supported,
+            and only the processed images are evaluated. Defaults to False.
     """
     default_prefix: Optional[str] = 'coco'
 
@@ -81,7 +91,9 @@ class CocoMetric(BaseMetric):
                  collect_device: str = 'cpu',
                  prefix: Optional[str] = None,
                  sort_categories: bool = False,
-                 use_mp_eval: bool = False) -> None:
+                 use_mp_eval: Union[bool, int] = False,
+                 use_fast_eval: bool = False,
+                 incremental: bool = False) -> None:
         super().__init__(collect_device=collect_device, prefix=prefix)
         # coco evaluation metrics
         self.metrics = metric if isinstance(metric, list) else [metric]
@@ -96,6 +108,19 @@ class CocoMetric(BaseMetric):
         self.classwise = classwise
         # whether to use multi processing evaluation, default False
         self.use_mp_eval = use_mp_eval
+        # whether to use the array based bbox evaluation, default False
+        self.use_fast_eval = use_fast_eval
+        # whether to match the predictions in ``process``, default False
+        self.incremental = incremental
+        if incremental:
+            if not set(self.metrics) <= {'bbox', 'proposal'}:
+                raise ValueError(
+                    'The incremental evaluation only supports the bbox and '
+                    f'proposal metrics, but got {self.metrics}.')
+            if format_only:
+                raise ValueError('The predictions are not kept in the '
+                                 'incremental evaluation to be formatted.')
+        self._fast_evals = dict()
 
         # proposal_nums used to compute recall or precision.
         self.proposal_nums = list(proposal_nums)
@@ -207,41 +232,37 @@ class CocoMetric(BaseMetric):
             _bbox[3] - _bbox[1],
         ]
 
-    def results2json(self, results: Sequence[dict],
-                     outfile_prefix: str) -> dict:
-        """Dump the detection results to a COCO style json file.
-
-        There are 3 types of results: proposals, bbox predictions, mask
-        predictions, and they have different data types. This method will
-        automatically recognize the type, and dump them to json files.
+    def results2coco(self, results: Sequence[dict]) -> dict:
+        """Convert the detection results to COCO style results in memory.
 
         Args:
             results (Sequence[dict]): Testing results of the
                 dataset.
-            outfile_prefix (str): The filename prefix of the json files. If the
-                prefix is "somepath/xxx", the json files will be named
-                "somepath/xxx.bbox.json", "somepath/xxx.segm.json",
-                "somepath/xxx.proposal.json".
 
         Returns:
-            dict: Possible keys are "bbox", "segm", "proposal", and
-            values are corresponding filenames.
+            dict: Possible keys are "bbox", "segm", and "proposal", and
+            values are lists of COCO style results. "proposal" shares the
+            list of "bbox".
         """
         bbox_json_results = []
         segm_json_results = [] if 'masks' in results[0] else None
         for idx, result in enumerate(results):
             image_id = result.get('img_id', idx)
             labels = result['labels']
-            bboxes = result['bboxes']
+            # compute in float64, as ``xyxy2xywh`` does
+            bboxes = result['bboxes'].astype(np.float64)
+            bboxes[:, 2:] -= bboxes[:, :2]
+            bboxes = bboxes.tolist()
             scores = result['scores']
+            category_ids = [self.cat_ids[label] for label in labels]
             # bbox results
-            for i, label in enumerate(labels):
-                data = dict()
-                data['image_id'] = image_id
-                data['bbox'] = self.xyxy2xywh(bboxes[i])
-                data['score'] = float(scores[i])
-                data['category_id'] = self.cat_ids[label]
-                bbox_json_results.append(data)
+            bbox_json_results.extend(
+                dict(
+                    image_id=image_id,
+                    bbox=bbox,
+                    score=score,
+                    category_id=category_id) for bbox, score, category_id in
+                zip(bboxes, scores.tolist(), category_ids))
 
             if segm_json_results is None:
                 continue
@@ -249,39 +270,69 @@ class CocoMetric(BaseMetric):
             # segm results
             masks = result['masks']
             mask_scores = result.get('mask_scores', scores)
-            for i, label in enumerate(labels):
-                data = dict()
-                data['image_id'] = image_id
-                data['bbox'] = self.xyxy2xywh(bboxes[i])
-                data['score'] = float(mask_scores[i])
-                data['category_id'] = self.cat_ids[label]
-                if isinstance(masks[i]['counts'], bytes):
-                    masks[i]['counts'] = masks[i]['counts'].decode()
-                data['segmentation'] = masks[i]
-                segm_json_results.append(data)
+            for mask in masks:
+                if isinstance(mask['counts'], bytes):
+                    mask['counts'] = mask['counts'].decode()
+            segm_json_results.extend(
+                dict(
+                    image_id=image_id,
+                    bbox=bbox,
+                    score=score,
+                    category_id=category_id,
+                    segmentation=mask) for bbox, score, category_id, mask in
+                zip(bboxes, mask_scores.tolist(), category_ids, masks))
+
+        coco_results = dict()
+        coco_results['bbox'] = bbox_json_results
+        coco_results['proposal'] = bbox_json_results
+        if segm_json_results is not None:
+            coco_results['segm'] = segm_json_results
+        return coco_results
+
+    def results2json(self, results: Sequence[dict],
+                     outfile_prefix: str) -> dict:
+        """Dump the detection results to a COCO style json file.
 
+        There are 3 types of results: proposals, bbox predictions, mask
+        predictions, and they have different data types. This method will
+        automatically recognize the type, and dump them to json files.
+
+        Args:
+            results (Sequence[dict]): Testing results of the
+                dataset.
+            outfile_prefix (str): The filename prefix of the json files. If the
+                prefix is "somepath/xxx", the json files will be named
+                "somepath/xxx.bbox.json", "somepath/xxx.segm.json",
+                "somepath/xxx.proposal.json".
+
+        Returns:
+            dict: Possible keys are "bbox", "segm", "proposal", and
+            values are corresponding filenames.
+        """
+        return self._dump_coco_results(
+            self.results2coco(results), outfile_prefix)
+
+    def _dump_coco_results(self, coco_results: dict,
+                           outfile_prefix: str) -> dict:
+        """Dump the results of :meth:`results2coco` to json files."""
         result_files = dict()
         result_files['bbox'] = f'{outfile_prefix}.bbox.json'
         result_files['proposal'] = f'{outfile_prefix}.bbox.json'
-        dump(bbox_json_results, result_files['bbox'])
+        dump(coco_results['bbox'], result_files['bbox'])
 
-        if segm_json_results is not None:
+        if 'segm' in coco_results:
             result_files['segm'] = f'{outfile_prefix}.segm.json'
-            dump(segm_json_results, result_files['segm'])
+            dump(coco_results['segm'], result_files['segm'])
 
         return result_files
 
-    def gt_to_coco_json(self, gt_dicts: Sequence[dict],
-                        outfile_prefix: str) -> str:
-        """Convert ground truth to coco format json file.
+    def gt_to_coco(self, gt_dicts: Sequence[dict]) -> dict:
+        """Convert ground truth to a coco format dict.
 
         Args:
             gt_dicts (Sequence[dict]): Ground truth of the dataset.
-            outfile_prefix (str): The filename prefix of the json files. If the
-                prefix is "somepath/xxx", the json file will be named
-                "somepath/xxx.gt.json".
         Returns:
-            str: The filename of the json file.
+            dict: The coco format dataset.
         """
         categories = [
             dict(id=id, name=name)
@@ -337,10 +388,114 @@ class CocoMetric(BaseMetric):
         )
         if len(annotations) > 0:
             coco_json['annotations'] = annotations
+        return coco_json
+
+    def gt_to_coco_json(self, gt_dicts: Sequence[dict],
+                        outfile_prefix: str) -> str:
+        """Convert ground truth to coco format json file.
+
+        Args:
+            gt_dicts (Sequence[dict]): Ground truth of the dataset.
+            outfile_prefix (str): The filename prefix of the json files. If the
+                prefix is "somepath/xxx", the json file will be named
+                "somepath/xxx.gt.json".
+        Returns:
+            str: The filename of the json file.
+        """
         converted_json_path = f'{outfile_prefix}.gt.json'
-        dump(coco_json, converted_json_path)
+        dump(self.gt_to_coco(gt_dicts), converted_json_path)
         return converted_json_path
 
+    def _get_fast_eval(self, metric: str) -> COCOevalFast:
+        """The evaluator of the metric in the incremental evaluation."""
+        if metric not in self._fast_evals:
+            if self.cat_ids is None:
+                classes = self.dataset_meta['classes']
+                self.cat_ids = list(range(len(classes))) \
+                    if self._coco_api is None \
+                    else self._coco_api.get_cat_ids(cat_names=classes)
+            coco_eval = COCOevalFast()
+            # the params are set in the same way as ``COCOeval.evaluate``
+            coco_eval.params.useCats = int(metric != 'proposal')
+            coco_eval.params.catIds = sorted(set(self.cat_ids)) \
+                if coco_eval.params.useCats else list(self.cat_ids)
+            coco_eval.params.maxDets = list(self.proposal_nums)
+            coco_eval.params.iouThrs = self.iou_thrs
+            self._fast_evals[metric] = coco_eval
+        return self._fast_evals[metric]
+
+    def _match_sample(self, data_sample: dict) -> dict:
+        """Match the predicted bboxes of an image to the ground truths.
+
+        Args:
+            data_sample (dict): The data sample with the predictions.
+
+        Returns:
+            dict: The image id, the scores of the detections and the matches
+            of each metric, see :meth:`COCOevalFast.matchAnns`. The image ids
+            and the scores are kept once for all the metrics, and the
+            matches refer to the detections by their indices.
+        """
+        img_id = data_sample['img_id']
+        if self._coco_api is not None:
+            anns = self._coco_api.load_anns(
+                self._coco_api.get_ann_ids(img_ids=[img_id]))
+        else:
+            assert 'instances' in data_sample, \
+                'ground truth is required for evaluation when ' \
+                '`ann_file` is not provided'
+            # converted in the same way as ``gt_to_coco``
+            anns = []
+            for ann in data_sample['instances']:
+                bbox = ann['bbox']
+                coco_bbox = [
+                    bbox[0], bbox[1], bbox[2] - bbox[0], bbox[3] - bbox[1]
+                ]
+                anns.append(
+                    dict(
+                        image_id=img_id,
+                        bbox=coco_bbox,
+                        iscrowd=ann.get('ignore_flag', 0),
+                        category_id=int(ann['bbox_label']),
+                        area=coco_bbox[2] * coco_bbox[3]))
+
+        pred = data_sample['pred_instances']
+        bboxes = pred['bboxes'].cpu().numpy().astype(np.float64)
+        bboxes[:, 2:] -= bboxes[:, :2]
+        labels = pred['labels'].cpu().numpy()
+        scores = pred['scores'].cpu().numpy().astype(np.float32)
+        dts = dict(
+            img=np.full(len(bboxes), img_id, dtype=np.int64),
+            bbox=bboxes,
+            area=bboxes[:, 2] * bboxes[:, 3],
+            crowd=np.zeros(len(bboxes), dtype=bool),
+            score=scores)
+
+        matches = dict(img_id=img_id, scores=scores)
+        for metric in self.metrics:
+            coco_eval = self._get_fast_eval(metric)
+            cats = coco_eval.catInds([self.cat_ids[label] for label in labels])
+            gt_matches, dt_matches = coco_eval.matchAnns(
+                coco_eval.annsToArrays(anns), dict(dts, cat=cats))
+            # restored from the shared arrays by ``_load_matches``
+            del dt_matches['img'], dt_matches['score']
+            matches[metric] = (gt_matches, dt_matches)
+        return matches
+
+    @staticmethod
+    def _load_matches(results: list, metric: str) -> list:
+        """Restore the image ids and the scores of the detections matched by
+        :meth:`_match_sample` for :meth:`COCOevalFast.loadMatches`."""
+        matches = []
+        for result in results:
+            gt_matches, dt_matches = result[metric]
+            inds = dt_matches['ind']
+            img = np.full(len(inds), result['img_id'], dtype=np.int32)
+            dt_matches = dict(
+                dt_matches, img=img, score=result['scores'][inds])
+            matches.append((gt_matches, dt_matches))
+        return matches
+
     # TODO: data_batch is no longer needed, consider adjusting the
     #  parameter position
     def process(self, data_batch: dict, data_samples: Sequence[dict]) -> None:
@@ -354,6 +509,10 @@ class CocoMetric(BaseMetric):
                 contain annotations and predictions.
         """
         for data_sample in data_samples:
+            if self.incremental:
+                self.results.append(self._match_sample(data_sample))
+                continue
+
             result = dict()
             pred = data_sample['pred_instances']
             result['img_id'] = data_sample['img_id']
@@ -395,32 +554,46 @@ class CocoMetric(BaseMetric):
         """
         logger: MMLogger = MMLogger.get_current_instance()
 
-        # split gt and prediction list
-        gts, preds = zip(*results)
-
-        tmp_dir = None
-        if self.outfile_prefix is None:
-            tmp_dir = tempfile.TemporaryDirectory()
-            outfile_prefix = osp.join(tmp_dir.name, 'results')
+        # the results are evaluated in memory, and only dumped to json files
+        # if ``outfile_prefix`` is given
+        outfile_prefix = self.outfile_prefix
+
+        if self.incremental:
+            # the predictions have been matched in ``process``, and only the
+            # categories are needed to log the results
+            coco_api = self._coco_api
+            if coco_api is None:
+                coco_api = COCO()
+                coco_api.dataset = self.gt_to_coco([])
+                coco_api.createIndex()
         else:
-            outfile_prefix = self.outfile_prefix
+            # split gt and prediction list
+            gts, preds = zip(*results)
 
-        if self._coco_api is None:
-            # use converted gt json file to initialize coco api
-            logger.info('Converting ground truth to coco format...')
-            coco_json_path = self.gt_to_coco_json(
-                gt_dicts=gts, outfile_prefix=outfile_prefix)
-            self._coco_api = COCO(coco_json_path)
+            if self._coco_api is None:
+                # use converted gt to initialize coco api
+                logger.info('Converting ground truth to coco format...')
+                coco_json = self.gt_to_coco(gts)
+                if outfile_prefix is not None:
+                    dump(coco_json, f'{outfile_prefix}.gt.json')
+                self._coco_api = COCO()
+                self._coco_api.dataset = coco_json
+                self._coco_api.createIndex()
+            coco_api = self._coco_api
 
         # handle lazy init
         if self.cat_ids is None:
-            self.cat_ids = self._coco_api.get_cat_ids(
+            self.cat_ids = coco_api.get_cat_ids(
                 cat_names=self.dataset_meta['classes'])
         if self.img_ids is None:
-            self.img_ids = self._coco_api.get_img_ids()
+            self.img_ids = coco_api.get_img_ids()
 
         # convert predictions to coco format and dump to json file
-        result_files = self.results2json(preds, outfile_prefix)
+        coco_results = dict()
+        if not self.incremental:
+            coco_results = self.results2coco(preds)
+            if outfile_prefix is not None:
+                self._dump_coco_results(coco_results, outfile_prefix)
 
         eval_results = OrderedDict()
         if self.format_only:
@@ -446,35 +619,44 @@ class CocoMetric(BaseMetric):
 
             # evaluate proposal, bbox and segm
             iou_type = 'bbox' if metric == 'proposal' else metric
-            if metric not in result_files:
-                raise KeyError(f'{metric} is not in results')
-            try:
-                predictions = load(result_files[metric])
-                if iou_type == 'segm':
-                    # Refer to https://github.com/cocodataset/cocoapi/blob/master/PythonAPI/pycocotools/coco.py#L331  # noqa
-                    # When evaluating mask AP, if the results contain bbox,
-                    # cocoapi will use the box area instead of the mask area
-                    # for calculating the instance area. Though the overall AP
-                    # is not affected, this leads to different
-                    # small/medium/large mask AP results.
-                    for x in predictions:
-                        x.pop('bbox')
-                coco_dt = self._coco_api.loadRes(predictions)
-
-            except IndexError:
-                logger.error(
-                    'The testing results of the whole dataset is empty.')
-                break
-
-            if self.use_mp_eval:
-                coco_eval = COCOevalMP(self._coco_api, coco_dt, iou_type)
+            if self.incremental:
+                coco_eval = self._get_fast_eval(metric)
+                coco_eval.loadMatches(self._load_matches(results, metric))
             else:
-                coco_eval = COCOeval(self._coco_api, coco_dt, iou_type)
-
-            coco_eval.params.catIds = self.cat_ids
-            coco_eval.params.imgIds = self.img_ids
-            coco_eval.params.maxDets = list(self.proposal_nums)
-            coco_eval.params.iouThrs = self.iou_thrs
+                if metric not in coco_results:
+                    raise KeyError(f'{metric} is not in results')
+                try:
+                    predictions = coco_results[metric]
+                    if iou_type == 'segm':
+                        # Refer to https://github.com/cocodataset/cocoapi/blob/master/PythonAPI/pycocotools/coco.py#L331  # noqa
+                        # When evaluating mask AP, if the results contain
+                        # bbox, cocoapi will use the box area instead of the
+                        # mask area for calculating the instance area. Though
+                        # the overall AP is not affected, this leads to
+                        # different small/medium/large mask AP results.
+                        for x in predictions:
+                            x.pop('bbox')
+                    coco_dt = self._coco_api.loadRes(predictions)
+
+                except IndexError:
+                    logger.error(
+                        'The testing results of the whole dataset is empty.')
+                    break
+
+                if self.use_fast_eval and iou_type == 'bbox':
+                    coco_eval = COCOevalFast(self._coco_api, coco_dt, iou_type)
+                elif self.use_mp_eval:
+                    nproc = None if self.use_mp_eval is True \
+                        else self.use_mp_eval
+                    coco_eval = COCOevalMP(
+                        self._coco_api, coco_dt, iou_type, nproc=nproc)
+                else:
+                    coco_eval = COCOeval(self._coco_api, coco_dt, iou_type)
+
+                coco_eval.params.catIds = self.cat_ids
+                coco_eval.params.imgIds = self.img_ids
+                coco_eval.params.maxDets = list(self.proposal_nums)
+                coco_eval.params.iouThrs = self.iou_thrs
 
             # mapping of cocoEval.stats
             coco_metric_names = {
@@ -500,7 +682,8 @@ class CocoMetric(BaseMetric):
 
             if metric == 'proposal':
                 coco_eval.params.useCats = 0
-                coco_eval.evaluate()
+                if not self.incremental:
+                    coco_eval.evaluate()
                 coco_eval.accumulate()
                 coco_eval.summarize()
                 if metric_items is None:
@@ -514,7 +697,8 @@ class CocoMetric(BaseMetric):
                         f'{coco_eval.stats[coco_metric_names[item]]:.3f}')
                     eval_results[item] = val
             else:
-                coco_eval.evaluate()
+                if not self.incremental:
+                    coco_eval.evaluate()
                 coco_eval.accumulate()
                 coco_eval.summarize()
                 if self.classwise:  # Compute per-category AP
@@ -529,7 +713,7 @@ class CocoMetric(BaseMetric):
                         t = []
                         # area range index 0: all area ranges
                         # max dets index -1: typically 100 per image
-                        nm = self._coco_api.loadCats(cat_id)[0]
+                        nm = coco_api.loadCats(cat_id)[0]
                         precision = precisions[:, :, idx, 0, -1]
                         precision = precision[precision > -1]
                         if precision.size:
@@ -592,6 +776,4 @@ class CocoMetric(BaseMetric):
                             f'{ap[1]:.3f} {ap[2]:.3f} {ap[3]:.3f} '
                             f'{ap[4]:.3f} {ap[5]:.3f}')
 
-        if tmp_dir is not None:
-            tmp_dir.cleanup()
         return eval_results
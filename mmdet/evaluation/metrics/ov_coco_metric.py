@@ -10,7 +10,8 @@ from mmengine.fileio import load
 from mmengine.logging import MMLogger
 from terminaltables import AsciiTable
 
-from mmdet.datasets.api_wrappers import COCO, COCOeval, COCOevalMP
+from mmdet.datasets.api_wrappers import (COCO, COCOeval, COCOevalFast,
+                                         COCOevalMP)
 from mmdet.registry import METRICS
 from .coco_metric import CocoMetric
 
@@ -106,8 +107,13 @@ class OVCocoMetric(CocoMetric):
                     'The testing results of the whole dataset is empty.')
                 break
 
-            if self.use_mp_eval:
-                coco_eval = COCOevalMP(self._coco_api, coco_dt, iou_type)
+            if self.use_fast_eval and iou_type == 'bbox':
+                coco_eval = COCOevalFast(self._coco_api, coco_dt, iou_type)
+            elif self.use_mp_eval:
+                nproc = None if self.use_mp_eval is True \
+                    else self.use_mp_eval
+                coco_eval = COCOevalMP(
+                    self._coco_api, coco_dt, iou_type, nproc=nproc)
             else:
                 coco_eval = COCOeval(self._coco_api, coco_dt, iou_type)
 
@@ -1,6 +1,8 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 import warnings
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from copy import deepcopy
 
 import torch
@@ -8,7 +10,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 import torch.utils.checkpoint as cp
 from mmcv.cnn import build_norm_layer
-from mmcv.cnn.bricks.transformer import FFN, build_dropout
+from mmcv.cnn.bricks.transformer import FFN
 from mmengine.logging import MMLogger
 from mmengine.model import BaseModule, ModuleList
 from mmengine.model.weight_init import (constant_init, trunc_normal_,
@@ -18,274 +20,9 @@ from mmengine.utils import to_2tuple
 
 from mmdet.registry import MODELS
 from ..layers import PatchEmbed, PatchMerging
+from .swin import ShiftWindowMSA
 from .own import DCNV4_YOLO, DCNV4_CSP, PKIOwn, DCNV3_CSP
 from ..layers.pkinet import Stem_Pki, PKIStage
-class WindowMSA(BaseModule):
-    """Window based multi-head self-attention (W-MSA) module with relative
-    position bias.
-
-    Args:
-        embed_dims (int): Number of input channels.
-        num_heads (int): Number of attention heads.
-        window_size (tuple[int]): The height and width of the window.
-        qkv_bias (bool, optional):  If True, add a learnable bias to q, k, v.
-            Default: True.
-        qk_scale (float | None, optional): Override default qk scale of
-            head_dim ** -0.5 if set. Default: None.
-        attn_drop_rate (float, optional): Dropout ratio of attention weight.
-            Default: 0.0
-        proj_drop_rate (float, optional): Dropout ratio of output. Default: 0.
-        init_cfg (dict | None, optional): The Config for initialization.
-            Default: None.
-    """
-
-    def __init__(self,
-                 embed_dims,
-                 num_heads,
-                 window_size,
-                 qkv_bias=True,
-                 qk_scale=None,
-                 attn_drop_rate=0.,
-                 proj_drop_rate=0.,
-                 init_cfg=None):
-
-        super().__init__()
-        self.embed_dims = embed_dims
-        self.window_size = window_size  # Wh, Ww
-        self.num_heads = num_heads
-        head_embed_dims = embed_dims // num_heads
-        self.scale = qk_scale or head_embed_dims**-0.5
-        self.init_cfg = init_cfg
-
-        # define a parameter table of relative position bias
-        self.relative_position_bias_table = nn.Parameter(
-            torch.zeros((2 * window_size[0] - 1) * (2 * window_size[1] - 1),
-                        num_heads))  # 2*Wh-1 * 2*Ww-1, nH
-
-        # About 2x faster than original impl
-        Wh, Ww = self.window_size
-        rel_index_coords = self.double_step_seq(2 * Ww - 1, Wh, 1, Ww)
-        rel_position_index = rel_index_coords + rel_index_coords.T
-        rel_position_index = rel_position_index.flip(1).contiguous()
-        self.register_buffer('relative_position_index', rel_position_index)
-
-        self.qkv = nn.Linear(embed_dims, embed_dims * 3, bias=qkv_bias)
-        self.attn_drop = nn.Dropout(attn_drop_rate)
-        self.proj = nn.Linear(embed_dims, embed_dims)
-        self.proj_drop = nn.Dropout(proj_drop_rate)
-
-        self.softmax = nn.Softmax(dim=-1)
-
-    def init_weights(self):
-        trunc_normal_(self.relative_position_bias_table, std=0.02)
-
-    def forward(self, x, mask=None):
-        """
-        Args:
-
-            x (tensor): input features with shape of (num_windows*B, N, C)
-            mask (tensor | None, Optional): mask with shape of (num_windows,
-                Wh*Ww, Wh*Ww), value should be between (-inf, 0].
-        """
-        B, N, C = x.shape
-        qkv = self.qkv(x).reshape(B, N, 3, self.num_heads,
-                                  C // self.num_heads).permute(2, 0, 3, 1, 4)
-        # make torchscript happy (cannot use tensor as tuple)
-        q, k, v = qkv[0], qkv[1], qkv[2]
-
-        q = q * self.scale
-        attn = (q @ k.transpose(-2, -1))
-
-        relative_position_bias = self.relative_position_bias_table[
-            self.relative_position_index.view(-1)].view(
-                self.window_size[0] * self.window_size[1],
-                self.window_size[0] * self.window_size[1],
-                -1)  # Wh*Ww,Wh*Ww,nH
-        relative_position_bias = relative_position_bias.permute(
-            2, 0, 1).contiguous()  # nH, Wh*Ww, Wh*Ww
-        attn = attn + relative_position_bias.unsqueeze(0)
-
-        if mask is not None:
-            nW = mask.shape[0]
-            attn = attn.view(B // nW, nW, self.num_heads, N,
-                             N) + mask.unsqueeze(1).unsqueeze(0)
-            attn = attn.view(-1, self.num_heads, N, N)
-        attn = self.softmax(attn)
-
-        attn = self.attn_drop(attn)
-
-        x = (attn @ v).transpose(1, 2).reshape(B, N, C)
-        x = self.proj(x)
-        x = self.proj_drop(x)
-        return x
-
-    @staticmethod
-    def double_step_seq(step1, len1, step2, len2):
-        seq1 = torch.arange(0, step1 * len1, step1)
-        seq2 = torch.arange(0, step2 * len2, step2)
-        return (seq1[:, None] + seq2[None, :]).reshape(1, -1)
-
-
-class ShiftWindowMSA(BaseModule):
-    """Shifted Window Multihead Self-Attention Module.
-
-    Args:
-        embed_dims (int): Number of input channels.
-        num_heads (int): Number of attention heads.
-        window_size (int): The height and width of the window.
-        shift_size (int, optional): The shift step of each window towards
-            right-bottom. If zero, act as regular window-msa. Defaults to 0.
-        qkv_bias (bool, optional): If True, add a learnable bias to q, k, v.
-            Default: True
-        qk_scale (float | None, optional): Override default qk scale of
-            head_dim ** -0.5 if set. Defaults: None.
-        attn_drop_rate (float, optional): Dropout ratio of attention weight.
-            Defaults: 0.
-        proj_drop_rate (float, optional): Dropout ratio of output.
-            Defaults: 0.
-        dropout_layer (dict, optional): The dropout_layer used before output.
-            Defaults: dict(type='DropPath', drop_prob=0.).
-        init_cfg (dict, optional): The extra config for initialization.
-            Default: None.
-    """
-
-    def __init__(self,
-                 embed_dims,
-                 num_heads,
-                 window_size,
-                 shift_size=0,
-                 qkv_bias=True,
-                 qk_scale=None,
-                 attn_drop_rate=0,
-                 proj_drop_rate=0,
-                 dropout_layer=dict(type='DropPath', drop_prob=0.),
-                 init_cfg=None):
-        super().__init__(init_cfg)
-
-        self.window_size = window_size
-        self.shift_size = shift_size
-        assert 0 <= self.shift_size < self.window_size
-
-        self.w_msa = WindowMSA(
-            embed_dims=embed_dims,
-            num_heads=num_heads,
-            window_size=to_2tuple(window_size),
-            qkv_bias=qkv_bias,
-            qk_scale=qk_scale,
-            attn_drop_rate=attn_drop_rate,
-            proj_drop_rate=proj_drop_rate,
-            init_cfg=None)
-
-        self.drop = build_dropout(dropout_layer)
-
-    def forward(self, query, hw_shape):
-        B, L, C = query.shape
-        H, W = hw_shape
-        assert L == H * W, 'input feature has wrong size'
-        query = query.view(B, H, W, C)
-
-        # pad feature maps to multiples of window size
-        pad_r = (self.window_size - W % self.window_size) % self.window_size
-        pad_b = (self.window_size - H % self.window_size) % self.window_size
-        query = F.pad(query, (0, 0, 0, pad_r, 0, pad_b))
-        H_pad, W_pad = query.shape[1], query.shape[2]
-
-        # cyclic shift
-        if self.shift_size > 0:
-            shifted_query = torch.roll(
-                query,
-                shifts=(-self.shift_size, -self.shift_size),
-                dims=(1, 2))
-
-            # calculate attention mask for SW-MSA
-            img_mask = torch.zeros((1, H_pad, W_pad, 1), device=query.device)
-            h_slices = (slice(0, -self.window_size),
-                        slice(-self.window_size,
-                              -self.shift_size), slice(-self.shift_size, None))
-            w_slices = (slice(0, -self.window_size),
-                        slice(-self.window_size,
-                              -self.shift_size), slice(-self.shift_size, None))
-            cnt = 0
-            for h in h_slices:
-                for w in w_slices:
-                    img_mask[:, h, w, :] = cnt
-                    cnt += 1
-
-            # nW, window_size, window_size, 1
-            mask_windows = self.window_partition(img_mask)
-            mask_windows = mask_windows.view(
-                -1, self.window_size * self.window_size)
-            attn_mask = mask_windows.unsqueeze(1) - mask_windows.unsqueeze(2)
-            attn_mask = attn_mask.masked_fill(attn_mask != 0,
-                                              float(-100.0)).masked_fill(
-                                                  attn_mask == 0, float(0.0))
-        else:
-            shifted_query = query
-            attn_mask = None
-
-        # nW*B, window_size, window_size, C
-        query_windows = self.window_partition(shifted_query)
-        # nW*B, window_size*window_size, C
-        query_windows = query_windows.view(-1, self.window_size**2, C)
-
-        # W-MSA/SW-MSA (nW*B, window_size*window_size, C)
-        attn_windows = self.w_msa(query_windows, mask=attn_mask)
-
-        # merge windows
-        attn_windows = attn_windows.view(-1, self.window_size,
-                                         self.window_size, C)
-
-        # B H' W' C
-        shifted_x = self.window_reverse(attn_windows, H_pad, W_pad)
-        # reverse cyclic shift
-        if self.shift_size > 0:
-            x = torch.roll(
-                shifted_x,
-                shifts=(self.shift_size, self.shift_size),
-                dims=(1, 2))
-        else:
-            x = shifted_x
-
-        if pad_r > 0 or pad_b:
-            x = x[:, :H, :W, :].contiguous()
-
-        x = x.view(B, H * W, C)
-
-        x = self.drop(x)
-        return x
-
-    def window_reverse(self, windows, H, W):
-        """
-        Args:
-            windows: (num_windows*B, window_size, window_size, C)
-            H (int): Height of image
-            W (int): Width of image
-        Returns:
-            x: (B, H, W, C)
-        """
-        window_size = self.window_size
-        B = int(windows.shape[0] / (H * W / window_size / window_size))
-        x = windows.view(B, H // window_size, W // window_size, window_size,
-                         window_size, -1)
-        x = x.permute(0, 1, 3, 2, 4, 5).contiguous().view(B, H, W, -1)
-        return x
-
-    def window_partition(self, x):
-        """
-        Args:
-            x: (B, H, W, C)
-        Returns:
-            windows: (num_windows*B, window_size, window_size, C)
-        """
-        B, H, W, C = x.shape
-        window_size = self.window_size
-        x = x.view(B, H // window_size, window_size, W // window_size,
-                   window_size, C)
-        windows = x.permute(0, 1, 3, 2, 4, 5).contiguous()
-        windows = windows.view(-1, window_size, window_size, C)
-        return windows
-
-
 class SwinBlock(BaseModule):
     """"
     Args:
@@ -464,6 +201,107 @@ class SwinBlockSequence(BaseModule):
             return x, hw_shape, x, hw_shape
 
 
+# the thread pool and the CUDA streams of the branches run in parallel, which
+# are shared by the backbones and are not attributes so that the backbones can
+# be deep copied
+_BRANCH_EXECUTOR = None
+_BRANCH_STREAMS = {}
+
+
+def _iter_tensors(outputs):
+    if isinstance(outputs, torch.Tensor):
+        yield outputs
+    elif isinstance(outputs, (tuple, list)):
+        for output in outputs:
+            yield from _iter_tensors(output)
+
+
+def _get_autocast_states():
+    """The ``(device_type, dtype)`` of the autocast regions enabled in the
+    current thread."""
+    states = []
+    if torch.is_autocast_enabled():
+        # the CUDA autocast is always in half before PyTorch 1.10, which
+        # adds the CPU autocast
+        dtype = torch.get_autocast_gpu_dtype() if hasattr(
+            torch, 'get_autocast_gpu_dtype') else torch.half
+        states.append(('cuda', dtype))
+    if hasattr(torch, 'is_autocast_cpu_enabled') and \
+            torch.is_autocast_cpu_enabled():
+        states.append(('cpu', torch.get_autocast_cpu_dtype()))
+    return states
+
+
+def _run_with_caller_state(grad_enabled, autocast_states, func, *args):
+    """Run ``func`` with the grad mode and the autocast regions of the
+    caller, which are local to its thread."""
+    with ExitStack() as stack:
+        stack.enter_context(torch.set_grad_enabled(grad_enabled))
+        for device_type, dtype in autocast_states:
+            if hasattr(torch, 'autocast'):
+                stack.enter_context(torch.autocast(device_type, dtype=dtype))
+            else:
+                stack.enter_context(torch.cuda.amp.autocast())
+        return func(*args)
+
+
+def _run_branches(branches, parallel=False):
+    """Run independent branches, concurrently if ``parallel``.
+
+    On GPU, each branch but the first one is launched on a side CUDA stream,
+    so that the kernels of the branches overlap. On CPU, the branches but the
+    first one run in a thread pool, the PyTorch operators releasing the GIL,
+    with the grad mode and the autocast regions of the caller.
+
+    Args:
+        branches (list[tuple]): The ``(func, args)`` of the branches.
+        parallel (bool): Whether to run the branches concurrently.
+            Defaults to False.
+
+    Returns:
+        list: The outputs of the branches.
+    """
+    global _BRANCH_EXECUTOR
+    if not parallel or len(branches) < 2:
+        return [func(*args) for func, args in branches]
+
+    first_tensor = next(_iter_tensors([args for _, args in branches]))
+    if first_tensor.is_cuda:
+        device = first_tensor.device
+        streams = _BRANCH_STREAMS.setdefault(device, [])
+        while len(streams) < len(branches) - 1:
+            streams.append(torch.cuda.Stream(device))
+        current_stream = torch.cuda.current_stream(device)
+        outputs = [None] * len(branches)
+        for i, (func, args) in enumerate(branches[1:]):
+            streams[i].wait_stream(current_stream)
+            with torch.cuda.stream(streams[i]):
+                outputs[i + 1] = func(*args)
+        func, args = branches[0]
+        outputs[0] = func(*args)
+        for stream, output in zip(streams, outputs[1:]):
+            current_stream.wait_stream(stream)
+            # the outputs are allocated on the side streams
+            for tensor in _iter_tensors(output):
+                tensor.record_stream(current_stream)
+        return outputs
+
+    if _BRANCH_EXECUTOR is None:
+        _BRANCH_EXECUTOR = ThreadPoolExecutor(
+            2, thread_name_prefix='dual_swin_branch')
+    grad_enabled = torch.is_grad_enabled()
+    autocast_states = _get_autocast_states()
+    futures = [
+        _BRANCH_EXECUTOR.submit(_run_with_caller_state, grad_enabled,
+                                autocast_states, func, *args)
+        for func, args in branches[1:]
+    ]
+    func, args = branches[0]
+    outputs = [func(*args)]
+    outputs.extend(future.result() for future in futures)
+    return outputs
+
+
 @MODELS.register_module()
 class Dual_SwinTransformer_CBPki(BaseModule):
     """ Swin Transformer
@@ -520,6 +358,9 @@ class Dual_SwinTransformer_CBPki(BaseModule):
             Default: -1 (-1 means not freezing any parameters).
         init_cfg (dict, optional): The Config for initialization.
             Defaults to None.
+        parallel_branches (bool): Whether to run the RGB, TIR and PKI
+            branches of each stage concurrently, on CUDA streams on GPU and
+            on threads on CPU, see :func:`_run_branches`. Default: False.
     """
 
     def __init__(self,
@@ -548,8 +389,10 @@ class Dual_SwinTransformer_CBPki(BaseModule):
                  frozen_stages=-1,
                  init_cfg=None,
                  norm_cfg_pki = dict(type='BN', momentum=0.03, eps=0.001),
-                 act_cfg_pki = dict(type='SiLU'),):
+                 act_cfg_pki = dict(type='SiLU'),
+                 parallel_branches=False):
         self.convert_weights = convert_weights
+        self.parallel_branches = parallel_branches
         self.frozen_stages = frozen_stages
         if isinstance(pretrain_img_size, int):
             pretrain_img_size = to_2tuple(pretrain_img_size)
@@ -834,9 +677,11 @@ class Dual_SwinTransformer_CBPki(BaseModule):
         x_rgb = x[0]
         x_tir = x[1]
         x_tir_pki = x[1]
-        x_tir_pki = self.stem_pki(x_tir_pki)
-        x_rgb, hw_shape_rgb = self.patch_embed(x_rgb)
-        x_tir, hw_shape_tir = self.patch_embed1(x_tir)
+        (x_rgb, hw_shape_rgb), (x_tir, hw_shape_tir), x_tir_pki = \
+            _run_branches([(self.patch_embed, (x_rgb, )),
+                           (self.patch_embed1, (x_tir, )),
+                           (self.stem_pki, (x_tir_pki, ))],
+                          self.parallel_branches)
 
         if self.use_abs_pos_embed:
             x_rgb = x_rgb + self.absolute_pos_embed
@@ -850,9 +695,12 @@ class Dual_SwinTransformer_CBPki(BaseModule):
         for i, stage in enumerate(self.stages):
             stage1 = self.stages1[i]
             stage_pki = self.pki_stages[i]
-            x_rgb, hw_shape_rgb, out_rgb, out_hw_shape_rgb = stage(x_rgb, hw_shape_rgb)
-            x_tir, hw_shape_tir, out_tir, out_hw_shape_tir = stage1(x_tir, hw_shape_tir)
-            x_tir_pki = stage_pki(x_tir_pki)
+            (x_rgb, hw_shape_rgb, out_rgb, out_hw_shape_rgb), \
+                (x_tir, hw_shape_tir, out_tir, out_hw_shape_tir), \
+                x_tir_pki = _run_branches(
+                    [(stage, (x_rgb, hw_shape_rgb)),
+                     (stage1, (x_tir, hw_shape_tir)),
+                     (stage_pki, (x_tir_pki, ))], self.parallel_branches)
 
 
             if i in self.out_indices:
@@ -2,6 +2,7 @@
 import warnings
 from collections import OrderedDict
 from copy import deepcopy
+from functools import lru_cache
 
 import torch
 import torch.nn as nn
@@ -14,11 +15,15 @@ from mmengine.model import BaseModule, ModuleList
 from mmengine.model.weight_init import (constant_init, trunc_normal_,
                                         trunc_normal_init)
 from mmengine.runner.checkpoint import CheckpointLoader
-from mmengine.utils import to_2tuple
+from mmengine.utils import digit_version, to_2tuple
 
 from mmdet.registry import MODELS
 from ..layers import PatchEmbed, PatchMerging
 
+# the `scale` argument of `F.scaled_dot_product_attention` is added in
+# PyTorch 2.1
+HAS_SDPA = digit_version(torch.__version__) >= digit_version('2.1.0')
+
 
 class WindowMSA(BaseModule):
     """Window based multi-head self-attention (W-MSA) module with relative
@@ -35,6 +40,9 @@ class WindowMSA(BaseModule):
         attn_drop_rate (float, optional): Dropout ratio of attention weight.
             Default: 0.0
         proj_drop_rate (float, optional): Dropout ratio of output. Default: 0.
+        use_sdpa (bool, optional): Whether to compute the attention with
+            ``F.scaled_dot_product_attention``, which uses the fused kernels,
+            if it is available. Default: True.
         init_cfg (dict | None, optional): The Config for initialization.
             Default: None.
     """
@@ -47,6 +55,7 @@ class WindowMSA(BaseModule):
                  qk_scale=None,
                  attn_drop_rate=0.,
                  proj_drop_rate=0.,
+                 use_sdpa=True,
                  init_cfg=None):
 
         super().__init__()
@@ -76,9 +85,43 @@ class WindowMSA(BaseModule):
 
         self.softmax = nn.Softmax(dim=-1)
 
+        self.use_sdpa = use_sdpa and HAS_SDPA
+        # the relative position bias computed from the current table without
+        # grad, see `get_relative_position_bias`
+        self._bias_cache = None
+
     def init_weights(self):
         trunc_normal_(self.relative_position_bias_table, std=0.02)
 
+    def get_relative_position_bias(self):
+        """Get the relative position bias of the heads.
+
+        The bias only changes with the table, so it is cached when no grad
+        is needed, e.g. at inference, until the table is updated or moved.
+
+        Returns:
+            Tensor: The bias with shape of (nH, Wh*Ww, Wh*Ww).
+        """
+        table = self.relative_position_bias_table
+        if torch.is_grad_enabled() and table.requires_grad:
+            self._bias_cache = None
+            return self._compute_relative_position_bias()
+        key = (table.data_ptr(), table._version)
+        if self._bias_cache is None or self._bias_cache[0] != key:
+            with torch.no_grad():
+                self._bias_cache = (key,
+                                    self._compute_relative_position_bias())
+        return self._bias_cache[1]
+
+    def _compute_relative_position_bias(self):
+        relative_position_bias = self.relative_position_bias_table[
+            self.relative_position_index.view(-1)].view(
+                self.window_size[0] * self.window_size[1],
+                self.window_size[0] * self.window_size[1],
+                -1)  # Wh*Ww,Wh*Ww,nH
+        return relative_position_bias.permute(
+            2, 0, 1).contiguous()  # nH, Wh*Ww, Wh*Ww
+
     def forward(self, x, mask=None):
         """
         Args:
@@ -92,32 +135,57 @@ class WindowMSA(BaseModule):
                                   C // self.num_heads).permute(2, 0, 3, 1, 4)
         # make torchscript happy (cannot use tensor as tuple)
         q, k, v = qkv[0], qkv[1], qkv[2]
+        relative_position_bias = self.get_relative_position_bias()
 
+        if self.use_sdpa:
+            x = self._sdpa_forward(q, k, v, relative_position_bias, mask)
+        else:
+            x = self._explicit_forward(q, k, v, relative_position_bias, mask)
+
+        x = x.transpose(1, 2).reshape(B, N, C)
+        x = self.proj(x)
+        x = self.proj_drop(x)
+        return x
+
+    def _sdpa_forward(self, q, k, v, relative_position_bias, mask=None):
+        """Attention of the fused kernels, with the bias and the mask added
+        to the attention weights as ``attn_mask``."""
+        B, nH, N, head_dims = q.shape
+        if mask is None:
+            attn_mask = relative_position_bias.unsqueeze(0)
+        else:
+            # the windows are folded into the heads, so that the masks of the
+            # windows are broadcast over the images by a 4D `attn_mask`,
+            # which the fused kernels need
+            nW = mask.shape[0]
+            attn_mask = relative_position_bias + mask.unsqueeze(1)
+            attn_mask = attn_mask.view(1, nW * nH, N, N)
+            q, k, v = (
+                t.reshape(B // nW, nW * nH, N, head_dims) for t in (q, k, v))
+        x = F.scaled_dot_product_attention(
+            q,
+            k,
+            v,
+            attn_mask=attn_mask.to(q.dtype),
+            dropout_p=self.attn_drop.p if self.training else 0.,
+            scale=self.scale)
+        return x.view(B, nH, N, head_dims)
+
+    def _explicit_forward(self, q, k, v, relative_position_bias, mask=None):
+        B, nH, N, _ = q.shape
         q = q * self.scale
         attn = (q @ k.transpose(-2, -1))
-
-        relative_position_bias = self.relative_position_bias_table[
-            self.relative_position_index.view(-1)].view(
-                self.window_size[0] * self.window_size[1],
-                self.window_size[0] * self.window_size[1],
-                -1)  # Wh*Ww,Wh*Ww,nH
-        relative_position_bias = relative_position_bias.permute(
-            2, 0, 1).contiguous()  # nH, Wh*Ww, Wh*Ww
         attn = attn + relative_position_bias.unsqueeze(0)
 
         if mask is not None:
             nW = mask.shape[0]
-            attn = attn.view(B // nW, nW, self.num_heads, N,
+            attn = attn.view(B // nW, nW, nH, N,
                              N) + mask.unsqueeze(1).unsqueeze(0)
-            attn = attn.view(-1, self.num_heads, N, N)
+            attn = attn.view(-1, nH, N, N)
         attn = self.softmax(attn)
 
         attn = self.attn_drop(attn)
-
-        x = (attn @ v).transpose(1, 2).reshape(B, N, C)
-        x = self.proj(x)
-        x = self.proj_drop(x)
-        return x
+        return attn @ v
 
     @staticmethod
     def double_step_seq(step1, len1, step2, len2):
@@ -126,6 +194,88 @@ class WindowMSA(BaseModule):
         return (seq1[:, None] + seq2[None, :]).reshape(1, -1)
 
 
+@lru_cache(maxsize=16)
+def get_shift_attn_mask(window_size, shift_size, H_pad, W_pad, device):
+    """Get the attention mask of the shifted windows.
+
+    The mask only depends on the shapes, so it is cached and shared by all
+    the blocks with the same window and feature map, e.g. the blocks of a
+    stage. It must not be modified in place.
+
+    Args:
+        window_size (int): The height and width of the window.
+        shift_size (int): The shift step of the windows.
+        H_pad (int): The height of the padded feature map.
+        W_pad (int): The width of the padded feature map.
+        device (torch.device): The device of the mask.
+
+    Returns:
+        Tensor: The mask with shape of (nW, window_size**2, window_size**2),
+        whose values are 0 or -100.
+    """
+    img_mask = torch.zeros((1, H_pad, W_pad, 1), device=device)
+    h_slices = (slice(0, -window_size), slice(-window_size, -shift_size),
+                slice(-shift_size, None))
+    w_slices = (slice(0, -window_size), slice(-window_size, -shift_size),
+                slice(-shift_size, None))
+    cnt = 0
+    for h in h_slices:
+        for w in w_slices:
+            img_mask[:, h, w, :] = cnt
+            cnt += 1
+
+    # nW, window_size*window_size
+    mask_windows = img_mask.view(H_pad // window_size, window_size,
+                                 W_pad // window_size, window_size).permute(
+                                     0, 2, 1, 3).reshape(-1, window_size**2)
+    attn_mask = mask_windows.unsqueeze(1) - mask_windows.unsqueeze(2)
+    attn_mask = attn_mask.masked_fill(attn_mask != 0,
+                                      float(-100.0)).masked_fill(
+                                          attn_mask == 0, float(0.0))
+    return attn_mask
+
+
+@lru_cache(maxsize=16)
+def get_window_indices(window_size, shift_size, H, W, device):
+    """Get the indices which partition a feature map into shifted windows.
+
+    The feature map is padded to multiples of the window size, cyclically
+    shifted by ``-shift_size`` and partitioned into windows, which is a
+    permutation of the tokens of the padded map. The indices are cached and
+    shared by all the blocks with the same window and feature map.
+
+    Args:
+        window_size (int): The height and width of the window.
+        shift_size (int): The shift step of the windows.
+        H (int): The height of the feature map.
+        W (int): The width of the feature map.
+        device (torch.device): The device of the indices.
+
+    Returns:
+        tuple[Tensor, Tensor, int, int]:
+
+        - window_inds (Tensor): The index in the flattened feature map of each
+          token of the windows, ``H * W`` for the padding, with shape of
+          (nW*window_size*window_size, ).
+        - reverse_inds (Tensor): The index in the windows of each token of
+          the flattened feature map, with shape of (H*W, ).
+        - H_pad (int): The height of the padded feature map.
+        - W_pad (int): The width of the padded feature map.
+    """
+    H_pad = H + (window_size - H % window_size) % window_size
+    W_pad = W + (window_size - W % window_size) % window_size
+    inds = torch.full((H_pad, W_pad), H * W, dtype=torch.long, device=device)
+    inds[:H, :W] = torch.arange(H * W, device=device).view(H, W)
+    if shift_size > 0:
+        inds = torch.roll(inds, shifts=(-shift_size, -shift_size), dims=(0, 1))
+    window_inds = inds.view(H_pad // window_size, window_size,
+                            W_pad // window_size,
+                            window_size).permute(0, 2, 1, 3).reshape(-1)
+    # the token indices are unique and the padding sorts last
+    reverse_inds = window_inds.argsort()[:H * W]
+    return window_inds, reverse_inds, H_pad, W_pad
+
+
 class ShiftWindowMSA(BaseModule):
     """Shifted Window Multihead Self-Attention Module.
 
@@ -182,74 +332,28 @@ class ShiftWindowMSA(BaseModule):
         B, L, C = query.shape
         H, W = hw_shape
         assert L == H * W, 'input feature has wrong size'
-        query = query.view(B, H, W, C)
 
-        # pad feature maps to multiples of window size
-        pad_r = (self.window_size - W % self.window_size) % self.window_size
-        pad_b = (self.window_size - H % self.window_size) % self.window_size
-        query = F.pad(query, (0, 0, 0, pad_r, 0, pad_b))
-        H_pad, W_pad = query.shape[1], query.shape[2]
-
-        # cyclic shift
+        # the padding, the cyclic shift and the partition are done by a
+        # gather, the padding being an extra zero token
+        window_inds, reverse_inds, H_pad, W_pad = get_window_indices(
+            self.window_size, self.shift_size, H, W, query.device)
+        if H_pad > H or W_pad > W:
+            query = F.pad(query, (0, 0, 0, 1))
         if self.shift_size > 0:
-            shifted_query = torch.roll(
-                query,
-                shifts=(-self.shift_size, -self.shift_size),
-                dims=(1, 2))
-
-            # calculate attention mask for SW-MSA
-            img_mask = torch.zeros((1, H_pad, W_pad, 1), device=query.device)
-            h_slices = (slice(0, -self.window_size),
-                        slice(-self.window_size,
-                              -self.shift_size), slice(-self.shift_size, None))
-            w_slices = (slice(0, -self.window_size),
-                        slice(-self.window_size,
-                              -self.shift_size), slice(-self.shift_size, None))
-            cnt = 0
-            for h in h_slices:
-                for w in w_slices:
-                    img_mask[:, h, w, :] = cnt
-                    cnt += 1
-
-            # nW, window_size, window_size, 1
-            mask_windows = self.window_partition(img_mask)
-            mask_windows = mask_windows.view(
-                -1, self.window_size * self.window_size)
-            attn_mask = mask_windows.unsqueeze(1) - mask_windows.unsqueeze(2)
-            attn_mask = attn_mask.masked_fill(attn_mask != 0,
-                                              float(-100.0)).masked_fill(
-                                                  attn_mask == 0, float(0.0))
+            attn_mask = get_shift_attn_mask(self.window_size, self.shift_size,
+                                            H_pad, W_pad, query.device)
         else:
-            shifted_query = query
             attn_mask = None
 
-        # nW*B, window_size, window_size, C
-        query_windows = self.window_partition(shifted_query)
         # nW*B, window_size*window_size, C
-        query_windows = query_windows.view(-1, self.window_size**2, C)
+        query_windows = query.index_select(1, window_inds).view(
+            -1, self.window_size**2, C)
 
         # W-MSA/SW-MSA (nW*B, window_size*window_size, C)
         attn_windows = self.w_msa(query_windows, mask=attn_mask)
 
-        # merge windows
-        attn_windows = attn_windows.view(-1, self.window_size,
-                                         self.window_size, C)
-
-        # B H' W' C
-        shifted_x = self.window_reverse(attn_windows, H_pad, W_pad)
-        # reverse cyclic shift
-        if self.shift_size > 0:
-            x = torch.roll(
-                shifted_x,
-                shifts=(self.shift_size, self.shift_size),
-                dims=(1, 2))
-        else:
-            x = shifted_x
-
-        if pad_r > 0 or pad_b:
-            x = x[:, :H, :W, :].contiguous()
-
-        x = x.view(B, H * W, C)
+        # merge windows, reverse cyclic shift and remove the padding
+        x = attn_windows.view(B, -1, C).index_select(1, reverse_inds)
 
         x = self.drop(x)
         return x
@@ -1,5 +1,6 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 from copy import deepcopy
+import itertools
 import math
 import random
 from numbers import Number
@@ -31,8 +32,134 @@ except ImportError:
 
 from mmengine.model.utils import stack_batch
 
+
+class FusedStackMixin:
+    """Fused normalization and padding of the image streams of a
+    multi-stream data preprocessor.
+
+    With ``pseudo_collate``, the images of all the streams are copied into
+    one preallocated buffer of their original dtype, e.g. uint8, which is
+    moved to the device in one transfer. The buffer is pinned when
+    ``non_blocking`` is True and the device is a GPU, the pinned buffer of
+    each dtype is then reused by the next batches it is large enough for.
+    The channel
+    conversion, the normalization and the padding are then applied to the
+    whole buffer on the device, instead of to each image of each stream
+    before :func:`stack_batch`. The outputs are the same as those of the
+    unfused path.
+
+    The host class should set ``fused``, ``channels_last``, ``fp16`` and
+    ``_pinned_buffers`` to an empty dict.
+    """
+
+    def _fused_forward(self, data: dict, keys: Sequence[str]) -> dict:
+        """Stack the streams ``keys`` of ``data`` and move the other items
+        to the device."""
+        data = dict(data)
+        streams = [data.pop(key) for key in keys]
+        data = self.cast_data(data)  # type: ignore
+
+        # like the unfused path, the extra streams are normalized only if
+        # they have 3 channels as the mean
+        normalize = [self._enable_normalize]
+        if self._enable_normalize and self.mean.shape[0] == 3:
+            assert streams[0][0].dim() == 3 and streams[0][0].shape[0] == 3, (
+                'If the mean has 3 values, the input tensor should in shape '
+                f'of (3, H, W), but got the tensor with shape '
+                f'{streams[0][0].shape}')
+            normalize += [imgs[0].shape[0] == 3 for imgs in streams[1:]]
+        else:
+            normalize += [False] * (len(streams) - 1)
+
+        # streams of different padded shapes are stacked separately
+        groups = {}
+        for i, imgs in enumerate(streams):
+            groups.setdefault(self._fused_pad_shape(imgs), []).append(i)
+        for shape, inds in groups.items():
+            batches = self._fused_stack([streams[i] for i in inds], shape,
+                                        [normalize[i] for i in inds])
+            for i, batch in zip(inds, batches):
+                data[keys[i]] = batch
+        data.setdefault('data_samples', None)
+        return data
+
+    def _fused_pad_shape(self, imgs: List[Tensor]) -> Tuple[int, ...]:
+        """Channels and padded height and width of a stream."""
+        h = max(img.shape[1] for img in imgs)
+        w = max(img.shape[2] for img in imgs)
+        h = math.ceil(h / self.pad_size_divisor) * self.pad_size_divisor
+        w = math.ceil(w / self.pad_size_divisor) * self.pad_size_divisor
+        return imgs[0].shape[0], h, w
+
+    def _get_pinned_buffer(self, size: Tuple[int, ...],
+                           dtype: torch.dtype) -> Tensor:
+        """Get a pinned host buffer, the buffer of the previous batches of
+        the same dtype is reused if it is large enough."""
+        numel = int(np.prod(size))
+        buffer, event = self._pinned_buffers.get(dtype, (None, None))
+        if event is not None:
+            # the buffer may still be copied to the device
+            event.synchronize()
+        if buffer is None or buffer.numel() < numel:
+            buffer = torch.empty(numel, dtype=dtype, pin_memory=True)
+        self._pinned_buffers[dtype] = (buffer, None)
+        return buffer[:numel].view(size)
+
+    def _fused_stack(self, streams: List[List[Tensor]], shape: Tuple[int, ...],
+                     normalize: List[bool]) -> List[Tensor]:
+        num_streams, num_imgs = len(streams), len(streams[0])
+        c, h, w = shape
+        dtype = streams[0][0].dtype
+        for img in itertools.chain(*streams):
+            dtype = torch.promote_types(dtype, img.dtype)
+        # the padding is left uninitialized as it is filled on the device
+        size = (num_streams * num_imgs, c, h, w)
+        pin_memory = self._non_blocking and self.device.type == 'cuda'
+        if pin_memory:
+            buffer = self._get_pinned_buffer(size, dtype)
+        else:
+            buffer = torch.empty(size, dtype=dtype)
+        img_shapes = []
+        for i, img in enumerate(itertools.chain(*streams)):
+            buffer[i, :, :img.shape[1], :img.shape[2]] = img
+            img_shapes.append(img.shape[1:])
+        batch = buffer.to(self.device, non_blocking=self._non_blocking)
+        if pin_memory:
+            event = torch.cuda.Event()
+            event.record()
+            self._pinned_buffers[dtype] = (self._pinned_buffers[dtype][0],
+                                           event)
+
+        if self._channel_conversion:
+            batch = batch[:, [2, 1, 0], ...]
+        batch = batch.float()
+        if all(normalize):
+            batch = (batch - self.mean) / self.std
+        elif any(normalize):
+            for imgs_i, is_normalized in enumerate(normalize):
+                if is_normalized:
+                    inds = slice(imgs_i * num_imgs, (imgs_i + 1) * num_imgs)
+                    batch[inds] = (batch[inds] - self.mean) / self.std
+
+        if any(img_shape != (h, w) for img_shape in img_shapes):
+            img_shapes = torch.tensor(img_shapes, device=batch.device)
+            pad_mask = (torch.arange(h, device=batch.device)[None, :, None]
+                        >= img_shapes[:, 0, None, None]) | (
+                            torch.arange(w, device=batch.device)[None, None]
+                            >= img_shapes[:, 1, None, None])
+            batch.masked_fill_(pad_mask[:, None], self.pad_value)
+
+        if self.fp16:
+            batch = batch.half()
+        if self.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        return [
+            batch[i * num_imgs:(i + 1) * num_imgs] for i in range(num_streams)
+        ]
+
+
 @MODELS.register_module()
-class DoubleInputDetDataPreprocessor(ImgDataPreprocessor):
+class DoubleInputDetDataPreprocessor(FusedStackMixin, ImgDataPreprocessor):
     """Image pre-processor for detection tasks.
 
     Comparing with the :class:`mmengine.ImgDataPreprocessor`,
@@ -76,6 +203,13 @@ class DoubleInputDetDataPreprocessor(ImgDataPreprocessor):
         non_blocking (bool): Whether block current process
             when transferring data to device. Defaults to False.
         batch_augments (list[dict], optional): Batch-level augmentations
+        fused (bool): Whether to stack the streams with the fused path of
+            :class:`FusedStackMixin` when ``pseudo_collate`` is used.
+            Defaults to False.
+        channels_last (bool): Whether to return the inputs of the fused path
+            in channels_last memory format. Defaults to False.
+        fp16 (bool): Whether to return the inputs of the fused path in
+            float16, for models running in half precision. Defaults to False.
     """
 
     def __init__(self,
@@ -91,7 +225,10 @@ class DoubleInputDetDataPreprocessor(ImgDataPreprocessor):
                  rgb_to_bgr: bool = False,
                  boxtype2tensor: bool = True,
                  non_blocking: Optional[bool] = False,
-                 batch_augments: Optional[List[dict]] = None):
+                 batch_augments: Optional[List[dict]] = None,
+                 fused: bool = False,
+                 channels_last: bool = False,
+                 fp16: bool = False):
         super().__init__(
             mean=mean,
             std=std,
@@ -110,6 +247,10 @@ class DoubleInputDetDataPreprocessor(ImgDataPreprocessor):
         self.pad_seg = pad_seg
         self.seg_pad_value = seg_pad_value
         self.boxtype2tensor = boxtype2tensor
+        self.fused = fused
+        self.channels_last = channels_last
+        self.fp16 = fp16
+        self._pinned_buffers = {}
 
     def __forward(self, data: dict, training: bool = False) -> Union[dict, list]:
         """Performs normalization、padding and bgr2rgb conversion based on
@@ -129,6 +270,8 @@ class DoubleInputDetDataPreprocessor(ImgDataPreprocessor):
         Returns:
             dict or list: Data in the same format as the model input.
         """
+        if self.fused and is_seq_of(data['inputs'], torch.Tensor):
+            return self._fused_forward(data, ('inputs', 'inputs2'))
         data = self.cast_data(data)  # type: ignore
         _batch_inputs = data['inputs']
         _batch_inputs2 = data['inputs2']
@@ -271,7 +414,8 @@ class DoubleInputDetDataPreprocessor(ImgDataPreprocessor):
         if training and self.batch_augments is not None:
             # raise RuntimeError("Batch augments disabled for double input preprocess.")
             for batch_aug in self.batch_augments:
-                inputs2, _ = batch_aug(inputs2, data_samples)
+                if not getattr(batch_aug, 'main_input_only', False):
+                    inputs2, _ = batch_aug(inputs2, data_samples)
                 inputs, data_samples = batch_aug(inputs, data_samples)
                 
         return {'inputs': inputs, 'inputs2': inputs2, 'data_samples': data_samples}
@@ -338,7 +482,7 @@ class DoubleInputDetDataPreprocessor(ImgDataPreprocessor):
 
 
 @MODELS.register_module()
-class ThreeInputDetDataPreprocessor(ImgDataPreprocessor):
+class ThreeInputDetDataPreprocessor(FusedStackMixin, ImgDataPreprocessor):
     """Image pre-processor for detection tasks.
 
     Comparing with the :class:`mmengine.ImgDataPreprocessor`,
@@ -382,6 +526,13 @@ class ThreeInputDetDataPreprocessor(ImgDataPreprocessor):
         non_blocking (bool): Whether block current process
             when transferring data to device. Defaults to False.
         batch_augments (list[dict], optional): Batch-level augmentations
+        fused (bool): Whether to stack the streams with the fused path of
+            :class:`FusedStackMixin` when ``pseudo_collate`` is used.
+            Defaults to False.
+        channels_last (bool): Whether to return the inputs of the fused path
+            in channels_last memory format. Defaults to False.
+        fp16 (bool): Whether to return the inputs of the fused path in
+            float16, for models running in half precision. Defaults to False.
     """
 
     def __init__(self,
@@ -397,7 +548,10 @@ class ThreeInputDetDataPreprocessor(ImgDataPreprocessor):
                  rgb_to_bgr: bool = False,
                  boxtype2tensor: bool = True,
                  non_blocking: Optional[bool] = False,
-                 batch_augments: Optional[List[dict]] = None):
+                 batch_augments: Optional[List[dict]] = None,
+                 fused: bool = False,
+                 channels_last: bool = False,
+                 fp16: bool = False):
         super().__init__(
             mean=mean,
             std=std,
@@ -416,6 +570,10 @@ class ThreeInputDetDataPreprocessor(ImgDataPreprocessor):
         self.pad_seg = pad_seg
         self.seg_pad_value = seg_pad_value
         self.boxtype2tensor = boxtype2tensor
+        self.fused = fused
+        self.channels_last = channels_last
+        self.fp16 = fp16
+        self._pinned_buffers = {}
 
     def __forward(self, data: dict, training: bool = False) -> Union[dict, list]:
         """Performs normalization、padding and bgr2rgb conversion based on
@@ -435,6 +593,8 @@ class ThreeInputDetDataPreprocessor(ImgDataPreprocessor):
         Returns:
             dict or list: Data in the same format as the model input.
         """
+        if self.fused and is_seq_of(data['inputs'], torch.Tensor):
+            return self._fused_forward(data, ('inputs', 'inputs2', 'inputs3'))
         data = self.cast_data(data)  # type: ignore
         _batch_inputs = data['inputs']
         _batch_inputs2 = data['inputs2']
@@ -620,8 +780,9 @@ class ThreeInputDetDataPreprocessor(ImgDataPreprocessor):
         if training and self.batch_augments is not None:
             # raise RuntimeError("Batch augments disabled for double input preprocess.")
             for batch_aug in self.batch_augments:
-                inputs2, _ = batch_aug(inputs2, data_samples)
-                inputs3, _ = batch_aug(inputs3, data_samples)
+                if not getattr(batch_aug, 'main_input_only', False):
+                    inputs2, _ = batch_aug(inputs2, data_samples)
+                    inputs3, _ = batch_aug(inputs3, data_samples)
                 inputs, data_samples = batch_aug(inputs, data_samples)
                 
         return {'inputs': inputs, 'inputs2': inputs2, 'inputs3': inputs3, 'data_samples': data_samples}
@@ -683,4 +844,176 @@ class ThreeInputDetDataPreprocessor(ImgDataPreprocessor):
                     pad=(0, max(pad_w - w, 0), 0, max(pad_h - h, 0)),
                     mode='constant',
                     value=self.seg_pad_value)
-                data_samples.gt_sem_seg = PixelData(sem_seg=gt_sem_seg)
\ No newline at end of file
+                data_samples.gt_sem_seg = PixelData(sem_seg=gt_sem_seg)
+
+
+@MODELS.register_module()
+class BatchDarkChannelEnhance(nn.Module):
+    """Batched dark channel prior enhancement of night images.
+
+    The batch augmentation counterpart of the dark channel branch of
+    ``RandDarkMask``, which runs on the device of the inputs instead of in
+    the dataloader workers. The normalized inputs are mapped back to pixel
+    values with ``mean`` and ``std``, the night images are enhanced with
+    probability ``prob``, stretched to [0, 255] and normalized again. An
+    image is a night image if at least ``night_ratio`` of its gray levels
+    are lower than ``night_thr``.
+
+    Only the valid region ``img_shape`` of each image is enhanced, the
+    images with the same ``img_shape`` are processed as a batch. Like
+    ``RandDarkMask``, only the ``inputs`` of the first stream are enhanced.
+
+    Args:
+        mean (Sequence[Number]): The pixel mean of the data preprocessor.
+        std (Sequence[Number]): The pixel std of the data preprocessor.
+        prob (float): Probability to enhance a night image.
+            Defaults to 0.05.
+        size (int): Size of the erosion kernel of the dark channel.
+            Defaults to 15.
+        radius (int): Window size of the guided filter. Defaults to 60.
+        eps (float): Regularization of the guided filter. Defaults to 1e-4.
+        omega (float): Amount of haze removed. Defaults to 0.95.
+        t0 (float): Lower bound of the transmission. Defaults to 0.1.
+        night_thr (float): Gray level under which a pixel is dark.
+            Defaults to 15.
+        night_ratio (float): Ratio of dark pixels of a night image.
+            Defaults to 0.5.
+        bgr_to_rgb (bool): Whether the data preprocessor converts the inputs
+            from BGR to RGB. Defaults to True.
+    """
+    # ``DoubleInputDetDataPreprocessor`` does not apply it to ``inputs2``
+    main_input_only = True
+
+    def __init__(self,
+                 mean: Sequence[Number],
+                 std: Sequence[Number],
+                 prob: float = 0.05,
+                 size: int = 15,
+                 radius: int = 60,
+                 eps: float = 1e-4,
+                 omega: float = 0.95,
+                 t0: float = 0.1,
+                 night_thr: float = 15,
+                 night_ratio: float = 0.5,
+                 bgr_to_rgb: bool = True) -> None:
+        super().__init__()
+        self.prob = prob
+        self.size = size
+        self.radius = radius
+        self.eps = eps
+        self.omega = omega
+        self.t0 = t0
+        self.night_thr = night_thr
+        self.night_ratio = night_ratio
+        gray_weights = [0.114, 0.587, 0.299]
+        if bgr_to_rgb:
+            gray_weights = gray_weights[::-1]
+        self.register_buffer('mean',
+                             torch.tensor(mean).view(1, -1, 1, 1), False)
+        self.register_buffer('std', torch.tensor(std).view(1, -1, 1, 1), False)
+        self.register_buffer('gray_weights',
+                             torch.tensor(gray_weights).view(1, -1, 1, 1),
+                             False)
+
+    def _dark_channel(self, imgs: Tensor) -> Tensor:
+        """Channel minimum eroded with a ``size`` x ``size`` window, the
+        border is ignored like in ``cv2.erode``."""
+        dark = imgs.amin(dim=1, keepdim=True)
+        left = self.size // 2
+        right = self.size - 1 - left
+        dark = F.pad(-dark, (left, right, left, right), value=-float('inf'))
+        # the rectangular window is separable
+        dark = F.max_pool2d(dark, (self.size, 1), stride=1)
+        return -F.max_pool2d(dark, (1, self.size), stride=1)
+
+    def _atm_light(self, imgs: Tensor, dark: Tensor) -> Tensor:
+        """Mean color of the 0.1% pixels with the brightest dark channel."""
+        num_channels = imgs.size(1)
+        imsz = dark[0].numel()
+        numpx = max(imsz // 1000, 1)
+        indices = dark.flatten(1).topk(numpx, dim=1, sorted=False)[1]
+        brightest = imgs.flatten(2).gather(
+            2, indices[:, None].expand(-1, num_channels, -1))
+        return brightest.mean(dim=2)[..., None, None]
+
+    def _box_filter(self, x: Tensor) -> Tensor:
+        """Mean over a ``radius`` x ``radius`` window with reflected
+        borders, same as ``cv2.boxFilter``.
+
+        The window sums are differences of cumulative sums along each axis in
+        turn, which keeps the cost independent of ``radius`` and the float32
+        cumulative sums small.
+        """
+        r = self.radius
+        left = r // 2
+        x = F.pad(x, (left, r - 1 - left, left, r - 1 - left), mode='reflect')
+        for dim in (2, 3):
+            csum = F.pad(x.cumsum(dim), (1, 0) if dim == 3 else (0, 0, 1, 0))
+            length = csum.size(dim) - r
+            x = csum.narrow(dim, r, length) - csum.narrow(dim, 0, length)
+        return x / (r * r)
+
+    def _guided_filter(self, guide: Tensor, src: Tensor) -> Tensor:
+        mean_I = self._box_filter(guide)
+        mean_p = self._box_filter(src)
+        cov_Ip = self._box_filter(guide * src) - mean_I * mean_p
+        var_I = self._box_filter(guide * guide) - mean_I * mean_I
+
+        a = cov_Ip / (var_I + self.eps)
+        b = mean_p - a * mean_I
+        return self._box_filter(a) * guide + self._box_filter(b)
+
+    def enhance(self, imgs: Tensor) -> Tensor:
+        """Enhance a batch of images in pixel values, same as
+        ``DarkChannel.run``.
+
+        Args:
+            imgs (Tensor): Images in shape (N, 3, H, W) in [0, 255].
+
+        Returns:
+            Tensor: The enhanced images, not clipped to [0, 255].
+        """
+        rever = (255 - imgs) / 255
+        A = self._atm_light(rever, self._dark_channel(rever))
+        te = 1 - self.omega * self._dark_channel(rever / A)
+        gray = (imgs * self.gray_weights).sum(dim=1, keepdim=True) / 255
+        t = self._guided_filter(gray, te).clamp(min=self.t0)
+        J = (rever - A) / t + A
+        return (1 - J) * 255
+
+    def forward(
+        self,
+        inputs: Tensor,
+        data_samples: Optional[List[DetDataSample]] = None
+    ) -> Tuple[Tensor, Optional[List[DetDataSample]]]:
+        """Enhance the night images of the batch."""
+        num_imgs = inputs.size(0)
+        selected = (torch.rand(num_imgs) < self.prob).tolist()
+        if not any(selected):
+            return inputs, data_samples
+
+        groups = {}
+        for i, is_selected in enumerate(selected):
+            if not is_selected:
+                continue
+            if data_samples is not None:
+                img_shape = tuple(data_samples[i].img_shape[:2])
+            else:
+                img_shape = tuple(inputs.shape[-2:])
+            groups.setdefault(img_shape, []).append(i)
+
+        for (h, w), inds in groups.items():
+            inds = inputs.new_tensor(inds, dtype=torch.long)
+            imgs = inputs[inds, :, :h, :w] * self.std + self.mean
+            gray = (imgs * self.gray_weights).sum(dim=1)
+            is_night = (gray < self.night_thr).flatten(1).float().mean(
+                dim=1) >= self.night_ratio
+            if not is_night.any():
+                continue
+            inds, imgs = inds[is_night], imgs[is_night]
+            res = self.enhance(imgs)
+            res_min = res.amin(dim=(1, 2, 3), keepdim=True)
+            res_max = res.amax(dim=(1, 2, 3), keepdim=True)
+            res = (res - res_min) / (res_max - res_min) * 255
+            inputs[inds, :, :h, :w] = (res - self.mean) / self.std
+        return inputs, data_samples
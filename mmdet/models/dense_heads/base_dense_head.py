@@ -2,7 +2,7 @@
 import copy
 from abc import ABCMeta, abstractmethod
 from inspect import signature
-from typing import List, Optional, Tuple
+from typing import Callable, List, Optional, Tuple
 
 import torch
 from mmcv.ops import batched_nms
@@ -20,6 +20,40 @@ from ..utils import (filter_scores_and_topk, select_single_mlvl,
                      unpack_gt_instances)
 
 
+def _group_by_image(img_inds: Tensor) -> Tensor:
+    """Get the permutation which groups the items by image and keeps their
+    order within each image.
+
+    The keys are unique, so that the sort needs not be stable.
+    """
+    key = img_inds * img_inds.numel() + torch.arange(
+        img_inds.numel(), device=img_inds.device)
+    return key.argsort()
+
+
+def _rank_in_image(img_inds: Tensor, num_imgs: int) -> Tensor:
+    """Get the rank of each item within its image, for items grouped by
+    image."""
+    counts = torch.bincount(img_inds, minlength=num_imgs)
+    starts = counts.cumsum(0) - counts
+    return torch.arange(
+        img_inds.numel(), device=img_inds.device) - starts[img_inds]
+
+
+def _activate_by_image(activation: Callable, preds: Tensor,
+                       num_imgs: int) -> Tensor:
+    """Apply an activation to the flat predictions of a batch of images.
+
+    The vectorized CPU kernels compute the last elements of a tensor with the
+    scalar code, which may round differently, so that on CPU the activation
+    is applied image by image as in the per-image path.
+    """
+    if preds.is_cuda:
+        return activation(preds)
+    return torch.cat(
+        [activation(img_preds) for img_preds in preds.chunk(num_imgs)])
+
+
 class BaseDenseHead(BaseModule, metaclass=ABCMeta):
     """Base class for DenseHeads.
 
@@ -57,6 +91,10 @@ class BaseDenseHead(BaseModule, metaclass=ABCMeta):
     loss_and_predict(): forward() -> loss_by_feat() -> predict_by_feat()
     """
 
+    # the coders of the heads whose predictions of a batch of images are
+    # post-processed together, see `_predict_by_feat_batched`
+    BATCHED_CODERS = ('DeltaXYWHBBoxCoder', 'DistancePointBBoxCoder')
+
     def __init__(self, init_cfg: OptMultiConfig = None) -> None:
         super().__init__(init_cfg=init_cfg)
         # `_raw_positive_infos` will be used in `get_positive_infos`, which
@@ -262,6 +300,17 @@ class BaseDenseHead(BaseModule, metaclass=ABCMeta):
             dtype=cls_scores[0].dtype,
             device=cls_scores[0].device)
 
+        if self._can_predict_batched(mlvl_priors, batch_img_metas):
+            return self._predict_by_feat_batched(
+                cls_scores=cls_scores,
+                bbox_preds=bbox_preds,
+                score_factors=score_factors,
+                mlvl_priors=mlvl_priors,
+                batch_img_metas=batch_img_metas,
+                cfg=cfg,
+                rescale=rescale,
+                with_nms=with_nms)
+
         result_list = []
 
         for img_id in range(len(batch_img_metas)):
@@ -427,6 +476,182 @@ class BaseDenseHead(BaseModule, metaclass=ABCMeta):
             with_nms=with_nms,
             img_meta=img_meta)
 
+    def _can_predict_batched(self, mlvl_priors: List[Tensor],
+                             batch_img_metas: List[dict]) -> bool:
+        """Whether :meth:`_predict_by_feat_batched` gives the same results as
+        :meth:`_predict_by_feat_single` for this head, up to the order of the
+        tied scores.
+
+        It is the case if the head uses the post-processing of
+        :class:`BaseDenseHead` and a coder whose ``max_shape`` only clips the
+        boxes to the image, so that they can be decoded at once and clipped
+        image by image afterwards.
+        """
+        head_type = type(self)
+        return (len(batch_img_metas) > 1 and head_type._predict_by_feat_single
+                is BaseDenseHead._predict_by_feat_single
+                and head_type._bbox_post_process
+                is BaseDenseHead._bbox_post_process
+                and type(self.bbox_coder).__name__ in self.BATCHED_CODERS
+                and not getattr(self.bbox_coder, 'use_box_type', False)
+                and isinstance(mlvl_priors[0], Tensor))
+
+    def _predict_by_feat_batched(self,
+                                 cls_scores: List[Tensor],
+                                 bbox_preds: List[Tensor],
+                                 score_factors: Optional[List[Tensor]],
+                                 mlvl_priors: List[Tensor],
+                                 batch_img_metas: List[dict],
+                                 cfg: Optional[ConfigDict] = None,
+                                 rescale: bool = False,
+                                 with_nms: bool = True) -> InstanceList:
+        """Batched version of :meth:`_predict_by_feat_single`.
+
+        The candidates of all the images and levels are selected, decoded and
+        rescaled together on flat tensors, with the index of their image. The
+        ``nms_pre`` candidates of each image are preselected by the threshold
+        of a batched top-k. The candidates are then split by image and
+        suppressed by :meth:`_bbox_post_process`, so that the offsets of
+        :func:`batched_nms` and its fallback to a loop over the classes are
+        the same as in the per-image path.
+
+        Args:
+            cls_scores (list[Tensor]): Classification scores for all
+                scale levels, each is a 4D-tensor, has shape
+                (batch_size, num_priors * num_classes, H, W).
+            bbox_preds (list[Tensor]): Box energies / deltas for all
+                scale levels, each is a 4D-tensor, has shape
+                (batch_size, num_priors * 4, H, W).
+            score_factors (list[Tensor], optional): Score factor for
+                all scale level, each is a 4D-tensor, has shape
+                (batch_size, num_priors * 1, H, W).
+            mlvl_priors (list[Tensor]): The priors of each level.
+            batch_img_metas (list[dict]): Batch image meta info.
+            cfg (ConfigDict, optional): Test / postprocessing
+                configuration, if None, test_cfg would be used.
+                Defaults to None.
+            rescale (bool): If True, return boxes in original image space.
+                Defaults to False.
+            with_nms (bool): If True, do nms before return boxes.
+                Defaults to True.
+
+        Returns:
+            list[:obj:`InstanceData`]: Object detection results of each image
+            after the post process.
+        """
+        cfg = self.test_cfg if cfg is None else cfg
+        cfg = copy.deepcopy(cfg)
+        nms_pre = cfg.get('nms_pre', -1)
+        score_thr = cfg.get('score_thr', 0)
+        num_imgs = len(batch_img_metas)
+        dim = self.bbox_coder.encode_size
+        with_score_factors = score_factors is not None
+
+        def activate_cls_score(cls_score: Tensor) -> Tensor:
+            if getattr(self.loss_cls, 'custom_cls_channels', False):
+                return self.loss_cls.get_activation(cls_score)
+            elif self.use_sigmoid_cls:
+                return cls_score.sigmoid()
+            else:
+                return cls_score.softmax(-1)[:, :-1]
+
+        mlvl_img_inds = []
+        mlvl_bbox_preds = []
+        mlvl_valid_priors = []
+        mlvl_scores = []
+        mlvl_labels = []
+        mlvl_score_factors = []
+        for level_idx, (cls_score, bbox_pred, priors) in enumerate(
+                zip(cls_scores, bbox_preds, mlvl_priors)):
+            assert cls_score.size()[-2:] == bbox_pred.size()[-2:]
+            num_priors = priors.size(0)
+            bbox_pred = bbox_pred.detach().permute(0, 2, 3, 1).reshape(-1, dim)
+            cls_score = cls_score.detach().permute(0, 2, 3, 1).reshape(
+                -1, self.cls_out_channels)
+            scores = _activate_by_image(activate_cls_score, cls_score,
+                                        num_imgs)
+            num_classes = scores.size(-1)
+
+            # `filter_scores_and_topk` on all the images
+            scores = scores.reshape(num_imgs, -1)
+            valid_mask = scores > score_thr
+            if 0 < nms_pre < scores.size(1):
+                # keep the candidates above the `nms_pre`-th score of each
+                # image and as many of the ones equal to it as needed
+                kth_scores = scores.topk(nms_pre, dim=1)[0][:, -1:]
+                above = scores > kth_scores
+                tied = scores == kth_scores
+                num_tied = nms_pre - above.sum(1, keepdim=True)
+                if (tied.sum(1, keepdim=True) > num_tied).any():
+                    tied &= tied.cumsum(1) <= num_tied
+                valid_mask &= above | tied
+            img_inds, flat_inds = torch.nonzero(valid_mask, as_tuple=True)
+            scores = scores[img_inds, flat_inds]
+            order = scores.sort(descending=True)[1]
+            order = order[_group_by_image(img_inds[order])]
+            img_inds, flat_inds = img_inds[order], flat_inds[order]
+            scores = scores[order]
+            if nms_pre < 0:
+                # the candidates of each image are `[:nms_pre]`
+                keep = _rank_in_image(img_inds, num_imgs) < torch.bincount(
+                    img_inds, minlength=num_imgs)[img_inds] + nms_pre
+                img_inds, flat_inds = img_inds[keep], flat_inds[keep]
+                scores = scores[keep]
+            prior_inds = torch.div(
+                flat_inds, num_classes, rounding_mode='floor')
+            inds = img_inds * num_priors + prior_inds
+
+            mlvl_img_inds.append(img_inds)
+            mlvl_scores.append(scores)
+            mlvl_labels.append(flat_inds % num_classes)
+            mlvl_bbox_preds.append(bbox_pred[inds])
+            mlvl_valid_priors.append(priors[prior_inds])
+            if with_score_factors:
+                score_factor = score_factors[level_idx].detach().permute(
+                    0, 2, 3, 1).reshape(-1)
+                score_factor = _activate_by_image(torch.sigmoid, score_factor,
+                                                  num_imgs)
+                mlvl_score_factors.append(score_factor[inds])
+
+        # group the candidates by image, in the order of the levels
+        img_inds = torch.cat(mlvl_img_inds)
+        order = _group_by_image(img_inds)
+        img_inds = img_inds[order]
+        bboxes = self.bbox_coder.decode(
+            torch.cat(mlvl_valid_priors)[order],
+            torch.cat(mlvl_bbox_preds)[order])
+        scores = torch.cat(mlvl_scores)[order]
+        labels = torch.cat(mlvl_labels)[order]
+        if getattr(self.bbox_coder, 'clip_border', True):
+            max_xy = bboxes.new_tensor(
+                [meta['img_shape'][:2] for meta in batch_img_metas])
+            bboxes = torch.minimum(
+                bboxes.clamp(min=0), max_xy[img_inds][:, [1, 0, 1, 0]])
+
+        if rescale:
+            scale_factors = bboxes.new_tensor(
+                [[1 / s for s in meta['scale_factor']]
+                 for meta in batch_img_metas])
+            bboxes = bboxes * scale_factors[img_inds].repeat(1, 2)
+        if with_score_factors:
+            scores = scores * torch.cat(mlvl_score_factors)[order]
+
+        counts = torch.bincount(img_inds, minlength=num_imgs).tolist()
+        result_list = []
+        for img_bboxes, img_scores, img_labels, img_meta in zip(
+                bboxes.split(counts), scores.split(counts),
+                labels.split(counts), batch_img_metas):
+            results = InstanceData(
+                bboxes=img_bboxes, scores=img_scores, labels=img_labels)
+            result_list.append(
+                self._bbox_post_process(
+                    results=results,
+                    cfg=cfg,
+                    rescale=False,
+                    with_nms=with_nms,
+                    img_meta=img_meta))
+        return result_list
+
     def _bbox_post_process(self,
                            results: InstanceData,
                            cfg: ConfigDict,
@@ -1,5 +1,5 @@
 # Copyright (c) OpenMMLab. All rights reserved.
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import torch
@@ -18,6 +18,7 @@ from mmdet.structures.bbox import (bbox_cxcywh_to_xyxy, bbox_overlaps,
 from mmdet.utils import (ConfigType, InstanceList, OptInstanceList,
                          OptMultiConfig, reduce_mean)
 from ..losses import QualityFocalLoss
+from ..task_modules.assigners import AssignResult
 from ..utils import multi_apply
 
 
@@ -375,19 +376,73 @@ class DETRHead(BaseModule):
             - num_total_pos (int): Number of positive samples in all images.
             - num_total_neg (int): Number of negative samples in all images.
         """
-        (labels_list, label_weights_list, bbox_targets_list, bbox_weights_list,
-         pos_inds_list,
-         neg_inds_list) = multi_apply(self._get_targets_single,
-                                      cls_scores_list, bbox_preds_list,
-                                      batch_gt_instances, batch_img_metas)
+        if hasattr(self.assigner, 'batch_assign'):
+            # match the queries of all the images together
+            assign_results = self._batch_assign(cls_scores_list,
+                                                bbox_preds_list,
+                                                batch_gt_instances,
+                                                batch_img_metas)
+            (labels_list, label_weights_list, bbox_targets_list,
+             bbox_weights_list, pos_inds_list, neg_inds_list) = multi_apply(
+                 self._get_targets_single, cls_scores_list, bbox_preds_list,
+                 batch_gt_instances, batch_img_metas, assign_results)
+        else:
+            (labels_list, label_weights_list, bbox_targets_list,
+             bbox_weights_list, pos_inds_list,
+             neg_inds_list) = multi_apply(self._get_targets_single,
+                                          cls_scores_list, bbox_preds_list,
+                                          batch_gt_instances, batch_img_metas)
         num_total_pos = sum((inds.numel() for inds in pos_inds_list))
         num_total_neg = sum((inds.numel() for inds in neg_inds_list))
         return (labels_list, label_weights_list, bbox_targets_list,
                 bbox_weights_list, num_total_pos, num_total_neg)
 
-    def _get_targets_single(self, cls_score: Tensor, bbox_pred: Tensor,
-                            gt_instances: InstanceData,
-                            img_meta: dict) -> tuple:
+    def _batch_assign(self, cls_scores_list: List[Tensor],
+                      bbox_preds_list: List[Tensor],
+                      batch_gt_instances: InstanceList,
+                      batch_img_metas: List[dict]) -> List[AssignResult]:
+        """Match the queries of a batch of images with ``batch_assign`` of
+        the assigner.
+
+        Args:
+            cls_scores_list (list[Tensor]): Box score logits from a single
+                decoder layer for each image, has shape [num_queries,
+                cls_out_channels].
+            bbox_preds_list (list[Tensor]): Sigmoid outputs from a single
+                decoder layer for each image, with normalized coordinate
+                (cx, cy, w, h) and shape [num_queries, 4].
+            batch_gt_instances (list[:obj:`InstanceData`]): Batch of
+                gt_instance. It usually includes ``bboxes`` and ``labels``
+                attributes.
+            batch_img_metas (list[dict]): Meta information of each image, e.g.,
+                image size, scaling factor, etc.
+
+        Returns:
+            list[:obj:`AssignResult`]: The assigned result of each image.
+        """
+        pred_instances_list = []
+        for cls_score, bbox_pred, img_meta in zip(cls_scores_list,
+                                                  bbox_preds_list,
+                                                  batch_img_metas):
+            img_h, img_w = img_meta['img_shape']
+            factor = bbox_pred.new_tensor([img_w, img_h, img_w,
+                                           img_h]).unsqueeze(0)
+            # convert bbox_pred from xywh, normalized to xyxy, unnormalized
+            bbox_pred = bbox_cxcywh_to_xyxy(bbox_pred) * factor
+            pred_instances_list.append(
+                InstanceData(scores=cls_score, bboxes=bbox_pred))
+        return self.assigner.batch_assign(
+            pred_instances_list=pred_instances_list,
+            gt_instances_list=batch_gt_instances,
+            img_metas=batch_img_metas)
+
+    def _get_targets_single(
+            self,
+            cls_score: Tensor,
+            bbox_pred: Tensor,
+            gt_instances: InstanceData,
+            img_meta: dict,
+            assign_result: Optional[AssignResult] = None) -> tuple:
         """Compute regression and classification targets for one image.
 
         Outputs from a single decoder layer of a single feature level are used.
@@ -402,6 +457,9 @@ class DETRHead(BaseModule):
                 annotations. It should includes ``bboxes`` and ``labels``
                 attributes.
             img_meta (dict): Meta information for one image.
+            assign_result (:obj:`AssignResult`, optional): The assigned result
+                computed with the other images of the batch. The assigner is
+                called if it is not given. Defaults to None.
 
         Returns:
             tuple[Tensor]: a tuple containing the following for one image.
@@ -421,12 +479,13 @@ class DETRHead(BaseModule):
         bbox_pred = bbox_cxcywh_to_xyxy(bbox_pred)
         bbox_pred = bbox_pred * factor
 
-        pred_instances = InstanceData(scores=cls_score, bboxes=bbox_pred)
-        # assigner and sampler
-        assign_result = self.assigner.assign(
-            pred_instances=pred_instances,
-            gt_instances=gt_instances,
-            img_meta=img_meta)
+        if assign_result is None:
+            pred_instances = InstanceData(scores=cls_score, bboxes=bbox_pred)
+            # assigner and sampler
+            assign_result = self.assigner.assign(
+                pred_instances=pred_instances,
+                gt_instances=gt_instances,
+                img_meta=img_meta)
 
         gt_bboxes = gt_instances.bboxes
         gt_labels = gt_instances.labels
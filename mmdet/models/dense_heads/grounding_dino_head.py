@@ -16,6 +16,7 @@ from mmdet.structures import SampleList
 from mmdet.structures.bbox import bbox_cxcywh_to_xyxy, bbox_xyxy_to_cxcywh
 from mmdet.utils import InstanceList, reduce_mean
 from ..layers import inverse_sigmoid
+from ..task_modules.assigners import AssignResult
 from .atss_vlfusion_head import convert_grounding_to_cls_scores
 from .dino_head import DINOHead
 
@@ -137,9 +138,13 @@ class GroundingDINOHead(DINOHead):
             for m in self.reg_branches:
                 nn.init.constant_(m[-1].bias.data[2:], 0.0)
 
-    def _get_targets_single(self, cls_score: Tensor, bbox_pred: Tensor,
-                            gt_instances: InstanceData,
-                            img_meta: dict) -> tuple:
+    def _get_targets_single(
+            self,
+            cls_score: Tensor,
+            bbox_pred: Tensor,
+            gt_instances: InstanceData,
+            img_meta: dict,
+            assign_result: Optional[AssignResult] = None) -> tuple:
         """Compute regression and classification targets for one image.
 
         Outputs from a single decoder layer of a single feature level are used.
@@ -154,6 +159,9 @@ class GroundingDINOHead(DINOHead):
                 annotations. It should includes ``bboxes`` and ``labels``
                 attributes.
             img_meta (dict): Meta information for one image.
+            assign_result (:obj:`AssignResult`, optional): The assigned result
+                computed with the other images of the batch. The assigner is
+                called if it is not given. Defaults to None.
 
         Returns:
             tuple[Tensor]: a tuple containing the following for one image.
@@ -173,12 +181,13 @@ class GroundingDINOHead(DINOHead):
         bbox_pred = bbox_cxcywh_to_xyxy(bbox_pred)
         bbox_pred = bbox_pred * factor
 
-        pred_instances = InstanceData(scores=cls_score, bboxes=bbox_pred)
-        # assigner and sampler
-        assign_result = self.assigner.assign(
-            pred_instances=pred_instances,
-            gt_instances=gt_instances,
-            img_meta=img_meta)
+        if assign_result is None:
+            pred_instances = InstanceData(scores=cls_score, bboxes=bbox_pred)
+            # assigner and sampler
+            assign_result = self.assigner.assign(
+                pred_instances=pred_instances,
+                gt_instances=gt_instances,
+                img_meta=img_meta)
         gt_bboxes = gt_instances.bboxes
 
         pos_inds = torch.nonzero(
@@ -1,6 +1,9 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import List, Optional, Union
 
+import numpy as np
 import torch
 from mmengine import ConfigDict
 from mmengine.structures import InstanceData
@@ -12,6 +15,12 @@ from .assign_result import AssignResult
 from .base_assigner import BaseAssigner
 
 
+@lru_cache()
+def _get_executor(num_workers: int) -> ThreadPoolExecutor:
+    """Get the thread pool shared by the assigners with ``num_workers``."""
+    return ThreadPoolExecutor(num_workers)
+
+
 @TASK_UTILS.register_module()
 class HungarianAssigner(BaseAssigner):
     """Computes one-to-one matching between predictions and ground truth.
@@ -28,15 +37,23 @@ class HungarianAssigner(BaseAssigner):
     - 0: negative sample, no assigned gt
     - positive integer: positive sample, index (1-based) of assigned gt
 
+    The matchings of a batch of images can be computed together with
+    :meth:`batch_assign`, which moves all the cost matrices to CPU at once and
+    optionally solves them in a thread pool.
+
     Args:
         match_costs (:obj:`ConfigDict` or dict or \
             List[Union[:obj:`ConfigDict`, dict]]): Match cost configs.
+        num_workers (int): Number of threads solving the matchings of a batch
+            in :meth:`batch_assign`. ``linear_sum_assignment`` releases the
+            GIL, so the images are solved concurrently when it is larger than
+            1. Defaults to 0, i.e. the images are solved one by one.
     """
 
-    def __init__(
-        self, match_costs: Union[List[Union[dict, ConfigDict]], dict,
-                                 ConfigDict]
-    ) -> None:
+    def __init__(self,
+                 match_costs: Union[List[Union[dict, ConfigDict]], dict,
+                                    ConfigDict],
+                 num_workers: int = 0) -> None:
 
         if isinstance(match_costs, dict):
             match_costs = [match_costs]
@@ -47,6 +64,7 @@ class HungarianAssigner(BaseAssigner):
         self.match_costs = [
             TASK_UTILS.build(match_cost) for match_cost in match_costs
         ]
+        self.num_workers = num_workers
 
     def assign(self,
                pred_instances: InstanceData,
@@ -88,10 +106,141 @@ class HungarianAssigner(BaseAssigner):
         """
         assert isinstance(gt_instances.labels, Tensor)
         num_gts, num_preds = len(gt_instances), len(pred_instances)
+        if num_gts == 0 or num_preds == 0:
+            return self._get_assign_result(gt_instances, num_preds)
+
+        # 2. compute weighted cost
+        cost = self._get_cost(pred_instances, gt_instances, img_meta)
+
+        # 3. do Hungarian matching on CPU using linear_sum_assignment
+        cost = cost.detach().cpu()
+        if linear_sum_assignment is None:
+            raise ImportError('Please run "pip install scipy" '
+                              'to install scipy first.')
+
+        matched_row_inds, matched_col_inds = linear_sum_assignment(cost)
+        device = gt_instances.labels.device
+        matched_row_inds = torch.from_numpy(matched_row_inds).to(device)
+        matched_col_inds = torch.from_numpy(matched_col_inds).to(device)
+        return self._get_assign_result(gt_instances, num_preds,
+                                       matched_row_inds, matched_col_inds)
+
+    def batch_assign(self,
+                     pred_instances_list: List[InstanceData],
+                     gt_instances_list: List[InstanceData],
+                     img_metas: Optional[List[dict]] = None,
+                     **kwargs) -> List[AssignResult]:
+        """Computes the one-to-one matchings of a batch of images.
+
+        The results are the same as calling :meth:`assign` on each image, but
+        the cost matrices of all the images are padded into one tensor and
+        moved to CPU with a single transfer, and the matched indices are moved
+        back to the device with another one.
+
+        Args:
+            pred_instances_list (list[:obj:`InstanceData`]): Instances of
+                model predictions of each image, see :meth:`assign`.
+            gt_instances_list (list[:obj:`InstanceData`]): Ground truth of
+                instance annotations of each image, see :meth:`assign`.
+            img_metas (list[dict], optional): Image information of each
+                image.
+
+        Returns:
+            list[:obj:`AssignResult`]: The assigned result of each image.
+        """
+        if img_metas is None:
+            img_metas = [None] * len(gt_instances_list)
+        assert len(pred_instances_list) == len(gt_instances_list) == \
+            len(img_metas)
+
+        # 1. compute the weighted costs of the images with gts and preds
+        costs, valid_inds = [], []
+        for i, (pred_instances, gt_instances, img_meta) in enumerate(
+                zip(pred_instances_list, gt_instances_list, img_metas)):
+            assert isinstance(gt_instances.labels, Tensor)
+            if len(gt_instances) > 0 and len(pred_instances) > 0:
+                costs.append(
+                    self._get_cost(pred_instances, gt_instances, img_meta))
+                valid_inds.append(i)
+
+        matched_inds = [None] * len(gt_instances_list)
+        if len(costs) > 0:
+            # 2. pad the costs to move them to CPU at once
+            shapes = [cost.shape for cost in costs]
+            max_preds = max(shape[0] for shape in shapes)
+            max_gts = max(shape[1] for shape in shapes)
+            padded_costs = costs[0].new_zeros((len(costs), max_preds, max_gts))
+            for i, cost in enumerate(costs):
+                padded_costs[i, :cost.size(0), :cost.size(1)] = cost.detach()
+            padded_costs = padded_costs.cpu().numpy()
+            cost_list = [
+                padded_cost[:num_preds, :num_gts]
+                for padded_cost, (num_preds,
+                                  num_gts) in zip(padded_costs, shapes)
+            ]
+
+            # 3. do Hungarian matching on CPU using linear_sum_assignment
+            if linear_sum_assignment is None:
+                raise ImportError('Please run "pip install scipy" '
+                                  'to install scipy first.')
+            if self.num_workers > 1 and len(cost_list) > 1:
+                executor = _get_executor(self.num_workers)
+                matchings = list(
+                    executor.map(linear_sum_assignment, cost_list))
+            else:
+                matchings = [linear_sum_assignment(cost) for cost in cost_list]
+
+            # 4. move the matched indices back to the device at once
+            num_matched = [len(row_inds) for row_inds, _ in matchings]
+            device = gt_instances_list[valid_inds[0]].labels.device
+            row_inds = torch.from_numpy(
+                np.concatenate([row_inds for row_inds, _ in matchings]))
+            col_inds = torch.from_numpy(
+                np.concatenate([col_inds for _, col_inds in matchings]))
+            matched = torch.stack([row_inds, col_inds]).to(device)
+            for i, inds in zip(valid_inds, matched.split(num_matched, dim=1)):
+                matched_inds[i] = inds
+
+        assign_results = []
+        for pred_instances, gt_instances, inds in zip(pred_instances_list,
+                                                      gt_instances_list,
+                                                      matched_inds):
+            if inds is None:
+                assign_results.append(
+                    self._get_assign_result(gt_instances, len(pred_instances)))
+            else:
+                assign_results.append(
+                    self._get_assign_result(gt_instances, len(pred_instances),
+                                            inds[0], inds[1]))
+        return assign_results
+
+    def _get_cost(self, pred_instances: InstanceData,
+                  gt_instances: InstanceData,
+                  img_meta: Optional[dict]) -> Tensor:
+        """Compute the weighted sum of the match costs, has shape
+        (num_preds, num_gts)."""
+        cost_list = []
+        for match_cost in self.match_costs:
+            cost = match_cost(
+                pred_instances=pred_instances,
+                gt_instances=gt_instances,
+                img_meta=img_meta)
+            cost_list.append(cost)
+        return torch.stack(cost_list).sum(dim=0)
+
+    def _get_assign_result(
+            self,
+            gt_instances: InstanceData,
+            num_preds: int,
+            matched_row_inds: Optional[Tensor] = None,
+            matched_col_inds: Optional[Tensor] = None) -> AssignResult:
+        """Build the assigned result from the matched indices, or the empty
+        assignment if there are no matched indices."""
+        num_gts = len(gt_instances)
         gt_labels = gt_instances.labels
         device = gt_labels.device
 
-        # 1. assign -1 by default
+        # assign -1 by default
         assigned_gt_inds = torch.full((num_preds, ),
                                       -1,
                                       dtype=torch.long,
@@ -101,7 +250,7 @@ class HungarianAssigner(BaseAssigner):
                                      dtype=torch.long,
                                      device=device)
 
-        if num_gts == 0 or num_preds == 0:
+        if matched_row_inds is None:
             # No ground truth or boxes, return empty assignment
             if num_gts == 0:
                 # No ground truth, assign all to background
@@ -112,27 +261,6 @@ class HungarianAssigner(BaseAssigner):
                 max_overlaps=None,
                 labels=assigned_labels)
 
-        # 2. compute weighted cost
-        cost_list = []
-        for match_cost in self.match_costs:
-            cost = match_cost(
-                pred_instances=pred_instances,
-                gt_instances=gt_instances,
-                img_meta=img_meta)
-            cost_list.append(cost)
-        cost = torch.stack(cost_list).sum(dim=0)
-
-        # 3. do Hungarian matching on CPU using linear_sum_assignment
-        cost = cost.detach().cpu()
-        if linear_sum_assignment is None:
-            raise ImportError('Please run "pip install scipy" '
-                              'to install scipy first.')
-
-        matched_row_inds, matched_col_inds = linear_sum_assignment(cost)
-        matched_row_inds = torch.from_numpy(matched_row_inds).to(device)
-        matched_col_inds = torch.from_numpy(matched_col_inds).to(device)
-
-        # 4. assign backgrounds and foregrounds
         # assign all indices to backgrounds first
         assigned_gt_inds[:] = 0
         # assign foregrounds based on matching results
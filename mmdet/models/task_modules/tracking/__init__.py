@@ -2,10 +2,10 @@
 from .aflink import AppearanceFreeLink
 from .camera_motion_compensation import CameraMotionCompensation
 from .interpolation import InterpolateTracklets
-from .kalman_filter import KalmanFilter
+from .kalman_filter import KalmanFilter, TrackStates
 from .similarity import embed_similarity
 
 __all__ = [
     'KalmanFilter', 'InterpolateTracklets', 'embed_similarity',
-    'AppearanceFreeLink', 'CameraMotionCompensation'
+    'AppearanceFreeLink', 'CameraMotionCompensation', 'TrackStates'
 ]
@@ -1,4 +1,6 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+from typing import Optional
+
 import cv2
 import numpy as np
 import torch
@@ -6,6 +8,7 @@ from torch import Tensor
 
 from mmdet.registry import TASK_UTILS
 from mmdet.structures.bbox import bbox_cxcyah_to_xyxy, bbox_xyxy_to_cxcyah
+from .kalman_filter import TrackStates
 
 
 @TASK_UTILS.register_module()
@@ -62,9 +65,19 @@ class CameraMotionCompensation:
         means[:, :4] = warped_cxcyah
         return means
 
-    def track(self, img: Tensor, ref_img: Tensor, tracks: dict,
-              num_samples: int, frame_id: int, metainfo: dict) -> dict:
-        """Tracking forward."""
+    def track(self,
+              img: Tensor,
+              ref_img: Tensor,
+              tracks: dict,
+              num_samples: int,
+              frame_id: int,
+              metainfo: dict,
+              states: Optional[TrackStates] = None) -> dict:
+        """Tracking forward.
+
+        The means of ``states``, the Kalman filter states of the tracks kept
+        by the tracker, are warped in place.
+        """
         img = img.squeeze(0).cpu().numpy().transpose((1, 2, 0))
         ref_img = ref_img.squeeze(0).cpu().numpy().transpose((1, 2, 0))
         warp_matrix = self.get_warp_matrix(img, ref_img)
@@ -95,6 +108,9 @@ class CameraMotionCompensation:
             b = torch.split(b, [1] * _num)
             tracks[k].bboxes[-_num:] = b
 
+        if states is not None and len(states) > 0:
+            self.warp_means(states.means, warp_matrix)
+
         if means:
             means = np.asarray(means)
             warped_means = self.warp_means(means, warp_matrix)
@@ -1,17 +1,19 @@
 # Copyright (c) OpenMMLab. All rights reserved.
-from typing import Tuple
+from typing import Optional, Sequence, Tuple, Union
 
 import numpy as np
 import torch
 
-try:
-    import scipy.linalg
-    HAS_SCIPY = True
-except ImportError:
-    HAS_SCIPY = False
-
 from mmdet.registry import TASK_UTILS
 
+ScoreType = Union[float, np.ndarray]
+
+
+def _diag(std: np.ndarray) -> np.ndarray:
+    """Diagonal covariance matrices (..., n, n) from the standard deviations
+    (..., n)."""
+    return np.square(std)[..., None] * np.eye(std.shape[-1])
+
 
 @TASK_UTILS.register_module()
 class KalmanFilter:
@@ -19,6 +21,13 @@ class KalmanFilter:
 
     The implementation is referred to https://github.com/nwojke/deep_sort.
 
+    All the methods accept a batch of tracks, i.e. means of shape (N, 8) and
+    covariances of shape (N, 8, 8), besides a single track, so that the
+    states of all the tracks of a frame are processed by a few batched
+    matrix products instead of a Python loop over the tracks. The trackers
+    keep the states in a :class:`TrackStates`, which the ``*_tracks``
+    methods update in place.
+
     Args:
         center_only (bool): If True, distance computation is done with
             respect to the bounding box center position only.
@@ -41,9 +50,6 @@ class KalmanFilter:
     }
 
     def __init__(self, center_only: bool = False, use_nsa: bool = False):
-        if not HAS_SCIPY:
-            raise RuntimeError('sscikit-learn is not installed,\
-                 please install it by: pip install scikit-learn')
         self.center_only = center_only
         if self.center_only:
             self.gating_threshold = self.chi2inv95[2]
@@ -70,7 +76,8 @@ class KalmanFilter:
 
         Args:
             measurement (ndarray):  Bounding box coordinates (x, y, a, h) with
-            center position (x, y), aspect ratio a, and height h.
+            center position (x, y), aspect ratio a, and height h, or (N, 4)
+            bounding boxes.
 
         Returns:
              (ndarray, ndarray): Returns the mean vector (8 dimensional) and
@@ -79,17 +86,19 @@ class KalmanFilter:
         """
         mean_pos = measurement
         mean_vel = np.zeros_like(mean_pos)
-        mean = np.r_[mean_pos, mean_vel]
-
-        std = [
-            2 * self._std_weight_position * measurement[3],
-            2 * self._std_weight_position * measurement[3], 1e-2,
-            2 * self._std_weight_position * measurement[3],
-            10 * self._std_weight_velocity * measurement[3],
-            10 * self._std_weight_velocity * measurement[3], 1e-5,
-            10 * self._std_weight_velocity * measurement[3]
-        ]
-        covariance = np.diag(np.square(std))
+        mean = np.concatenate((mean_pos, mean_vel), axis=-1)
+
+        height = measurement[..., 3]
+        std = np.stack([
+            2 * self._std_weight_position * height,
+            2 * self._std_weight_position * height,
+            np.full(height.shape, 1e-2), 2 * self._std_weight_position *
+            height, 10 * self._std_weight_velocity * height,
+            10 * self._std_weight_velocity * height,
+            np.full(height.shape,
+                    1e-5), 10 * self._std_weight_velocity * height
+        ], -1)
+        covariance = _diag(std)
         return mean, covariance
 
     def predict(self, mean: np.array,
@@ -98,83 +107,84 @@ class KalmanFilter:
 
         Args:
             mean (ndarray): The 8 dimensional mean vector of the object
-                state at the previous time step.
+                state at the previous time step, or (N, 8) mean vectors.
 
             covariance (ndarray): The 8x8 dimensional covariance matrix
-                of the object state at the previous time step.
+                of the object state at the previous time step, or (N, 8, 8)
+                covariance matrices.
 
         Returns:
             (ndarray, ndarray): Returns the mean vector and covariance
                 matrix of the predicted state. Unobserved velocities are
                 initialized to 0 mean.
         """
-        std_pos = [
-            self._std_weight_position * mean[3],
-            self._std_weight_position * mean[3], 1e-2,
-            self._std_weight_position * mean[3]
-        ]
-        std_vel = [
-            self._std_weight_velocity * mean[3],
-            self._std_weight_velocity * mean[3], 1e-5,
-            self._std_weight_velocity * mean[3]
-        ]
-        motion_cov = np.diag(np.square(np.r_[std_pos, std_vel]))
-
-        mean = np.dot(self._motion_mat, mean)
-        covariance = np.linalg.multi_dot(
-            (self._motion_mat, covariance, self._motion_mat.T)) + motion_cov
-
-        return mean, covariance
+        height = mean[..., 3]
+        std = np.stack([
+            self._std_weight_position * height,
+            self._std_weight_position * height,
+            np.full(height.shape, 1e-2), self._std_weight_position * height,
+            self._std_weight_velocity * height,
+            self._std_weight_velocity * height,
+            np.full(height.shape, 1e-5), self._std_weight_velocity * height
+        ], -1)
+        motion_cov = _diag(std)
+
+        mean = mean @ self._motion_mat.T
+        covariance = self._motion_mat @ covariance @ self._motion_mat.T
+        return mean, covariance + motion_cov
 
     def project(self,
                 mean: np.array,
                 covariance: np.array,
-                bbox_score: float = 0.) -> Tuple[np.array, np.array]:
+                bbox_score: ScoreType = 0.) -> Tuple[np.array, np.array]:
         """Project state distribution to measurement space.
 
         Args:
-            mean (ndarray): The state's mean vector (8 dimensional array).
+            mean (ndarray): The state's mean vector (8 dimensional array), or
+                (N, 8) mean vectors.
             covariance (ndarray): The state's covariance matrix (8x8
-                dimensional).
-            bbox_score (float): The confidence score of the bbox.
-                Defaults to 0.
+                dimensional), or (N, 8, 8) covariance matrices.
+            bbox_score (float | ndarray): The confidence score of the bbox,
+                or (N, ) scores. Defaults to 0.
 
         Returns:
             (ndarray, ndarray):  Returns the projected mean and covariance
             matrix of the given state estimate.
         """
-        std = [
-            self._std_weight_position * mean[3],
-            self._std_weight_position * mean[3], 1e-1,
-            self._std_weight_position * mean[3]
-        ]
+        height = mean[..., 3]
+        std = np.stack([
+            self._std_weight_position * height,
+            self._std_weight_position * height,
+            np.full(height.shape, 1e-1), self._std_weight_position * height
+        ], -1)
 
         if self.use_nsa:
-            std = [(1 - bbox_score) * x for x in std]
+            std = (1 - np.asarray(bbox_score))[..., None] * std
 
-        innovation_cov = np.diag(np.square(std))
+        innovation_cov = _diag(std)
 
-        mean = np.dot(self._update_mat, mean)
-        covariance = np.linalg.multi_dot(
-            (self._update_mat, covariance, self._update_mat.T))
+        mean = mean @ self._update_mat.T
+        covariance = self._update_mat @ covariance @ self._update_mat.T
         return mean, covariance + innovation_cov
 
     def update(self,
                mean: np.array,
                covariance: np.array,
                measurement: np.array,
-               bbox_score: float = 0.) -> Tuple[np.array, np.array]:
+               bbox_score: ScoreType = 0.) -> Tuple[np.array, np.array]:
         """Run Kalman filter correction step.
 
         Args:
-            mean (ndarray): The predicted state's mean vector (8 dimensional).
+            mean (ndarray): The predicted state's mean vector (8 dimensional),
+                or (N, 8) mean vectors.
             covariance (ndarray): The state's covariance matrix (8x8
-                dimensional).
+                dimensional), or (N, 8, 8) covariance matrices.
             measurement (ndarray): The 4 dimensional measurement vector
                 (x, y, a, h), where (x, y) is the center position, a the
-                aspect ratio, and h the height of the bounding box.
-            bbox_score (float): The confidence score of the bbox.
-                Defaults to 0.
+                aspect ratio, and h the height of the bounding box, or (N, 4)
+                measurements.
+            bbox_score (float | ndarray): The confidence score of the bbox,
+                or (N, ) scores. Defaults to 0.
 
         Returns:
              (ndarray, ndarray): Returns the measurement-corrected state
@@ -183,17 +193,15 @@ class KalmanFilter:
         projected_mean, projected_cov = \
             self.project(mean, covariance, bbox_score)
 
-        chol_factor, lower = scipy.linalg.cho_factor(
-            projected_cov, lower=True, check_finite=False)
-        kalman_gain = scipy.linalg.cho_solve((chol_factor, lower),
-                                             np.dot(covariance,
-                                                    self._update_mat.T).T,
-                                             check_finite=False).T
+        cross_cov = np.swapaxes(covariance @ self._update_mat.T, -1, -2)
+        kalman_gain = np.swapaxes(
+            np.linalg.solve(projected_cov, cross_cov), -1, -2)
         innovation = measurement - projected_mean
 
-        new_mean = mean + np.dot(innovation, kalman_gain.T)
-        new_covariance = covariance - np.linalg.multi_dot(
-            (kalman_gain, projected_cov, kalman_gain.T))
+        new_mean = mean + np.einsum('...ij,...j->...i', kalman_gain,
+                                    innovation)
+        new_covariance = covariance - kalman_gain @ projected_cov @ \
+            np.swapaxes(kalman_gain, -1, -2)
         return new_mean, new_covariance
 
     def gating_distance(self,
@@ -209,9 +217,9 @@ class KalmanFilter:
 
         Args:
             mean (ndarray): Mean vector over the state distribution (8
-                dimensional).
+                dimensional), or (K, 8) mean vectors.
             covariance (ndarray): Covariance of the state distribution (8x8
-                dimensional).
+                dimensional), or (K, 8, 8) covariance matrices.
             measurements (ndarray): An Nx4 dimensional matrix of N
                 measurements, each in format (x, y, a, h) where (x, y) is the
                 bounding box center position, a the aspect ratio, and h the
@@ -223,45 +231,178 @@ class KalmanFilter:
         Returns:
             ndarray: Returns an array of length N, where the i-th element
             contains the squared Mahalanobis distance between
-            (mean, covariance) and `measurements[i]`.
+            (mean, covariance) and `measurements[i]`, or a (K, N) array for
+            K states.
         """
         mean, covariance = self.project(mean, covariance)
         if only_position:
-            mean, covariance = mean[:2], covariance[:2, :2]
+            mean, covariance = mean[..., :2], covariance[..., :2, :2]
             measurements = measurements[:, :2]
 
-        cholesky_factor = np.linalg.cholesky(covariance)
-        d = measurements - mean
-        z = scipy.linalg.solve_triangular(
-            cholesky_factor,
-            d.T,
-            lower=True,
-            check_finite=False,
-            overwrite_b=True)
-        squared_maha = np.sum(z * z, axis=0)
+        # (x - m)^T S^-1 (x - m) is expanded into matrix products between
+        # all the states and all the measurements, instead of building the
+        # (K, N, 4) differences
+        inv_cov = np.linalg.inv(covariance)
+        outer = measurements[:, :, None] * measurements[:, None, :]
+        quadratic = inv_cov.reshape(*inv_cov.shape[:-2], -1) @ \
+            outer.reshape(len(measurements), -1).T
+        inv_cov_mean = np.einsum('...ij,...j->...i', inv_cov, mean)
+        squared_maha = quadratic - 2 * inv_cov_mean @ measurements.T + \
+            np.sum(mean * inv_cov_mean, axis=-1)[..., None]
         return squared_maha
 
-    def track(self, tracks: dict,
-              bboxes: torch.Tensor) -> Tuple[dict, np.array]:
+    def predict_tracks(self,
+                       states: 'TrackStates',
+                       ids: Optional[Sequence[int]] = None) -> None:
+        """Run the prediction step on the states of some tracks in a batch,
+        in place.
+
+        Args:
+            states (:obj:`TrackStates`): The states of the tracks.
+            ids (Sequence[int], optional): The ids of the tracks to predict.
+                Defaults to None, which means all the tracks.
+        """
+        if ids is None:
+            rows = slice(0, len(states))
+        elif len(ids) == 0:
+            return
+        else:
+            rows = states.rows(ids)
+        means, covariances = states.means, states.covariances
+        means[rows], covariances[rows] = self.predict(means[rows],
+                                                      covariances[rows])
+
+    def update_tracks(self,
+                      states: 'TrackStates',
+                      ids: Sequence[int],
+                      measurements: np.ndarray,
+                      bbox_scores: ScoreType = 0.) -> None:
+        """Run the correction step on the states of some tracks in a batch,
+        in place.
+
+        Args:
+            states (:obj:`TrackStates`): The states of the tracks.
+            ids (Sequence[int]): The ids of the tracks to update.
+            measurements (ndarray): The (N, 4) measurements of the tracks.
+            bbox_scores (float | ndarray): The confidence scores of the
+                bboxes. Defaults to 0.
+        """
+        if len(ids) == 0:
+            return
+        rows = states.rows(ids)
+        means, covariances = states.means, states.covariances
+        means[rows], covariances[rows] = self.update(means[rows],
+                                                     covariances[rows],
+                                                     measurements, bbox_scores)
+
+    def track(self, states: 'TrackStates',
+              bboxes: torch.Tensor) -> Tuple['TrackStates', np.ndarray]:
         """Track forward.
 
         Args:
-            tracks (dict[int:dict]): Track buffer.
+            states (:obj:`TrackStates`): The states of the tracks.
             bboxes (Tensor): Detected bounding boxes.
 
         Returns:
-            (dict[int:dict], ndarray): Updated tracks and bboxes.
+            (:obj:`TrackStates`, ndarray): Updated states and the gating
+            distances between the tracks, in the order of the rows of the
+            states, and the bboxes.
         """
-        costs = []
-        for id, track in tracks.items():
-            track.mean, track.covariance = self.predict(
-                track.mean, track.covariance)
-            gating_distance = self.gating_distance(track.mean,
-                                                   track.covariance,
-                                                   bboxes.cpu().numpy(),
-                                                   self.center_only)
-            costs.append(gating_distance)
-
-        costs = np.stack(costs, 0)
+        self.predict_tracks(states)
+        if len(states) == 0:
+            return states, np.zeros((0, len(bboxes)))
+        costs = self.gating_distance(states.means, states.covariances,
+                                     bboxes.cpu().numpy(), self.center_only)
         costs[costs > self.gating_threshold] = np.nan
-        return tracks, costs
+        return states, costs
+
+
+class TrackStates:
+    """The Kalman filter states of a set of tracks, stored as a struct of
+    arrays.
+
+    The means and the covariances of the N tracks are the first N rows of
+    contiguous (capacity, 8) and (capacity, 8, 8) arrays, and a dict maps the
+    id of each track to its row, so that the batched steps of
+    :class:`KalmanFilter` update the states in place instead of stacking and
+    scattering per-track arrays. Removing a track moves the state of the last
+    row to its row, so that the rows of the tracks stay contiguous.
+
+    Args:
+        capacity (int): The initial number of rows, which is doubled when
+            more tracks are added. Defaults to 64.
+        ndim (int): The dimension of the states. Defaults to 8.
+    """
+
+    def __init__(self, capacity: int = 64, ndim: int = 8) -> None:
+        self._means = np.zeros((capacity, ndim))
+        self._covariances = np.zeros((capacity, ndim, ndim))
+        self._ids = []
+        self.id2row = dict()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, id: int) -> bool:
+        return id in self.id2row
+
+    @property
+    def ids(self) -> list:
+        """The ids of the tracks, in the order of their rows."""
+        return list(self._ids)
+
+    @property
+    def means(self) -> np.ndarray:
+        """The (N, 8) means of the tracks, a view of the storage."""
+        return self._means[:len(self)]
+
+    @property
+    def covariances(self) -> np.ndarray:
+        """The (N, 8, 8) covariances of the tracks, a view of the storage."""
+        return self._covariances[:len(self)]
+
+    def rows(self, ids: Sequence[int]) -> np.ndarray:
+        """The rows of some tracks."""
+        return np.array([self.id2row[id] for id in ids], dtype=np.int64)
+
+    def add(self, ids: Sequence[int], means: np.ndarray,
+            covariances: np.ndarray) -> None:
+        """Add the states of some new tracks.
+
+        Args:
+            ids (Sequence[int]): The ids of the tracks.
+            means (ndarray): The (N, 8) means of the tracks.
+            covariances (ndarray): The (N, 8, 8) covariances of the tracks.
+        """
+        start, end = len(self), len(self) + len(ids)
+        if end > len(self._means):
+            capacity = max(2 * len(self._means), end)
+            self._means = np.concatenate(
+                [self._means,
+                 np.zeros((capacity - len(self._means), ) +
+                          self._means.shape[1:])])
+            self._covariances = np.concatenate([
+                self._covariances,
+                np.zeros((capacity - len(self._covariances), ) +
+                         self._covariances.shape[1:])
+            ])
+        self._means[start:end] = means
+        self._covariances[start:end] = covariances
+        for row, id in enumerate(ids, start):
+            assert id not in self.id2row, f'The track {id} already exists.'
+            self.id2row[id] = row
+            self._ids.append(id)
+
+    def remove(self, ids: Sequence[int]) -> None:
+        """Remove the states of some tracks, the unknown ids are ignored."""
+        for id in ids:
+            row = self.id2row.pop(id, None)
+            if row is None:
+                continue
+            last_row = len(self._ids) - 1
+            last_id = self._ids.pop()
+            if row != last_row:
+                self._means[row] = self._means[last_row]
+                self._covariances[row] = self._covariances[last_row]
+                self._ids[row] = last_id
+                self.id2row[last_id] = row
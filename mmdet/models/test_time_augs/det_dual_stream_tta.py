@@ -9,7 +9,6 @@ from mmengine.structures import InstanceData
 from torch import Tensor
 
 from mmdet.structures import DetDataSample
-from mmdet.structures.bbox import bbox_flip
 
 
 @MODELS.register_module()
@@ -17,9 +16,19 @@ class DetDSTTAModel(BaseTTAModel):
     """Merge augmented detection results, only bboxes corresponding score under
     flipping and multi-scale resizing can be processed now.
 
+    Args:
+        tta_cfg (dict, optional): Config of the merging, with ``nms`` and
+            ``max_per_img``. Defaults to None.
+        views_per_batch (int, optional): Maximum number of augmented views
+            forwarded in one batch. The views whose inputs have the same
+            shapes are concatenated into one batch, so the memory grows with
+            it. 1 forwards the views one by one and None forwards all the
+            views of the same shapes at once. Defaults to 1.
+
     Examples:
         >>> tta_model = dict(
-        >>>     type='DetTTAModel',
+        >>>     type='DetDSTTAModel',
+        >>>     views_per_batch=4,
         >>>     tta_cfg=dict(nms=dict(
         >>>                     type='nms',
         >>>                     iou_threshold=0.5),
@@ -46,15 +55,18 @@ class DetDSTTAModel(BaseTTAModel):
         >>>         ]])]
     """
 
-    def __init__(self, tta_cfg=None, **kwargs):
+    def __init__(self, tta_cfg=None, views_per_batch=1, **kwargs):
         super().__init__(**kwargs)
         self.tta_cfg = tta_cfg
+        self.views_per_batch = views_per_batch
 
     def merge_aug_bboxes(self, aug_bboxes: List[Tensor],
                          aug_scores: List[Tensor],
                          img_metas: List[str]) -> Tuple[Tensor, Tensor]:
         """Merge augmented detection bboxes and scores.
 
+        The bboxes of all the views are flipped back at once.
+
         Args:
             aug_bboxes (list[Tensor]): shape (n, 4*#class)
             aug_scores (list[Tensor] or None): shape (n, #class)
@@ -63,18 +75,30 @@ class DetDSTTAModel(BaseTTAModel):
             4 represent (tl_x, tl_y, br_x, br_y)
             and ``scores`` with shape (n,).
         """
-        recovered_bboxes = []
-        for bboxes, img_info in zip(aug_bboxes, img_metas):
-            ori_shape = img_info['ori_shape']
-            flip = img_info['flip']
-            flip_direction = img_info['flip_direction']
-            if flip:
-                bboxes = bbox_flip(
-                    bboxes=bboxes,
-                    img_shape=ori_shape,
-                    direction=flip_direction)
-            recovered_bboxes.append(bboxes)
-        bboxes = torch.cat(recovered_bboxes, dim=0)
+        bboxes = torch.cat(aug_bboxes, dim=0)
+        directions = [
+            img_info['flip_direction'] if img_info['flip'] else None
+            for img_info in img_metas
+        ]
+        if any(directions) and bboxes.numel() > 0:
+            num_bboxes = bboxes.new_tensor([len(b) for b in aug_bboxes],
+                                           dtype=torch.long)
+            ori_shapes = bboxes.new_tensor(
+                [img_info['ori_shape'][:2] for img_info in img_metas])
+            ori_shapes = ori_shapes.repeat_interleave(num_bboxes, dim=0)
+            flipped = bboxes.clone()
+            for dim, flip_directions in ((1, ('horizontal', 'diagonal')),
+                                         (0, ('vertical', 'diagonal'))):
+                is_flipped = bboxes.new_tensor(
+                    [direction in flip_directions for direction in directions],
+                    dtype=torch.bool).repeat_interleave(num_bboxes)
+                # x1, x2 = w - x2, w - x1 and likewise for y
+                coords = slice(1 - dim, None, 2)
+                flipped[:, coords] = torch.where(
+                    is_flipped[:, None],
+                    ori_shapes[:, dim, None] - bboxes[:, coords].flip(1),
+                    bboxes[:, coords])
+            bboxes = flipped
         if aug_scores is None:
             return bboxes
         else:
@@ -84,6 +108,10 @@ class DetDSTTAModel(BaseTTAModel):
     def merge_preds(self, data_samples_list: List[List[DetDataSample]]):
         """Merge batch predictions of enhanced data.
 
+        The merged predictions of all the images go through a single
+        ``batched_nms``, in which the boxes of different images never
+        suppress each other.
+
         Args:
             data_samples_list (List[List[DetDataSample]]): List of predictions
                 of all enhanced data. The outer list indicates images, and the
@@ -92,11 +120,71 @@ class DetDSTTAModel(BaseTTAModel):
         Returns:
             List[DetDataSample]: Merged batch prediction.
         """
+        merged = [
+            self._merge_views(data_samples)
+            for data_samples in data_samples_list
+        ]
+        merged_bboxes, merged_scores, merged_labels = [
+            torch.cat(items) for items in zip(*merged)
+        ]
+        if merged_bboxes.numel() == 0:
+            return [data_samples[0] for data_samples in data_samples_list]
+
+        device = merged_bboxes.device
+        num_bboxes = torch.tensor([len(bboxes) for bboxes, _, _ in merged],
+                                  device=device)
+        img_inds = torch.arange(len(merged), device=device)
+        img_inds = img_inds.repeat_interleave(num_bboxes)
+        nms_cfg = self.tta_cfg.nms.copy()
+        if nms_cfg.pop('class_agnostic', False):
+            idxs = img_inds
+        else:
+            idxs = img_inds * (int(merged_labels.max()) + 1) + merged_labels
+        det_bboxes, keep_idxs = batched_nms(merged_bboxes, merged_scores, idxs,
+                                            nms_cfg)
+
+        # ``keep_idxs`` is sorted by score, sorting by image and then by
+        # position keeps this order inside each image
+        num_keeps = len(keep_idxs)
+        order = (img_inds[keep_idxs] * num_keeps +
+                 torch.arange(num_keeps, device=device)).argsort()
+        det_bboxes, keep_idxs = det_bboxes[order], keep_idxs[order]
+        keep_img_inds = img_inds[keep_idxs]
+        num_dets = torch.bincount(keep_img_inds, minlength=len(merged))
+        first = torch.cumsum(num_dets, 0) - num_dets
+        ranks = torch.arange(num_keeps, device=device)
+        ranks = ranks - first[keep_img_inds]
+        topk = ranks < self.tta_cfg.max_per_img
+        num_dets = num_dets.clamp(max=self.tta_cfg.max_per_img).tolist()
+        det_bboxes = det_bboxes[topk].split(num_dets)
+        det_labels = merged_labels[keep_idxs[topk]].split(num_dets)
+
         merged_data_samples = []
-        for data_samples in data_samples_list:
-            merged_data_samples.append(self._merge_single_sample(data_samples))
+        for data_samples, (bboxes, _, _), _det_bboxes, _det_labels in zip(
+                data_samples_list, merged, det_bboxes, det_labels):
+            det_results = data_samples[0]
+            if bboxes.numel() > 0:
+                results = InstanceData()
+                results.bboxes = _det_bboxes[:, :-1]
+                results.scores = _det_bboxes[:, -1]
+                results.labels = _det_labels
+                det_results.pred_instances = results
+            merged_data_samples.append(det_results)
         return merged_data_samples
 
+    def _merge_views(self, data_samples: List[DetDataSample]) -> tuple:
+        """Gather the bboxes, scores and labels of the different views of one
+        image, with the bboxes flipped back."""
+        # TODO: support instance segmentation TTA
+        assert data_samples[0].pred_instances.get('masks', None) is None, \
+            'TTA of instance segmentation does not support now.'
+        preds = [data_sample.pred_instances for data_sample in data_samples]
+        merged_bboxes, merged_scores = self.merge_aug_bboxes(
+            [pred.bboxes for pred in preds], [pred.scores for pred in preds],
+            [data_sample.metainfo for data_sample in data_samples])
+        merged_labels = torch.cat([pred.labels for pred in preds])
+        return merged_bboxes, merged_scores, merged_labels
+
     def _merge_single_sample(
             self, data_samples: List[DetDataSample]) -> DetDataSample:
         """Merge predictions which come form the different views of one image
@@ -108,44 +196,34 @@ class DetDSTTAModel(BaseTTAModel):
         Returns:
             List[DetDataSample]: Merged prediction.
         """
-        aug_bboxes = []
-        aug_scores = []
-        aug_labels = []
-        img_metas = []
-        # TODO: support instance segmentation TTA
-        assert data_samples[0].pred_instances.get('masks', None) is None, \
-            'TTA of instance segmentation does not support now.'
-        for data_sample in data_samples:
-            aug_bboxes.append(data_sample.pred_instances.bboxes)
-            aug_scores.append(data_sample.pred_instances.scores)
-            aug_labels.append(data_sample.pred_instances.labels)
-            img_metas.append(data_sample.metainfo)
+        return self.merge_preds([data_samples])[0]
 
-        merged_bboxes, merged_scores = self.merge_aug_bboxes(
-            aug_bboxes, aug_scores, img_metas)
-        merged_labels = torch.cat(aug_labels, dim=0)
+    def _batch_views(self, data_list: list) -> List[List[int]]:
+        """Group the views whose inputs have the same shapes, at most
+        ``views_per_batch`` in a group."""
+        groups = {}
+        for idx, data in enumerate(data_list):
+            if isinstance(data, dict):
+                inputs = [v for k, v in data.items() if k != 'data_samples']
+            else:
+                inputs = data[:-1]
+            shape = tuple(
+                tuple(tuple(img.shape) for img in imgs) for imgs in inputs)
+            groups.setdefault(shape, []).append(idx)
+        batches = []
+        for inds in groups.values():
+            size = self.views_per_batch or len(inds)
+            batches.extend(inds[i:i + size] for i in range(0, len(inds), size))
+        return batches
 
-        if merged_bboxes.numel() == 0:
-            return data_samples[0]
-
-        det_bboxes, keep_idxs = batched_nms(merged_bboxes, merged_scores,
-                                            merged_labels, self.tta_cfg.nms)
-
-        det_bboxes = det_bboxes[:self.tta_cfg.max_per_img]
-        det_labels = merged_labels[keep_idxs][:self.tta_cfg.max_per_img]
-
-        results = InstanceData()
-        _det_bboxes = det_bboxes.clone()
-        results.bboxes = _det_bboxes[:, :-1]
-        results.scores = _det_bboxes[:, -1]
-        results.labels = det_labels
-        det_results = data_samples[0]
-        det_results.pred_instances = results
-        return det_results
-    
     def test_step(self, data):
         """Get predictions of each enhanced data, a multiple predictions.
 
+        The views with inputs of the same shapes, e.g. the flipped and the
+        original view of one scale, are concatenated into one batch of
+        ``self.module.test_step``, at most ``views_per_batch`` views in a
+        batch.
+
         Args:
             data (DataBatch): Enhanced data batch sampled from dataloader.
 
@@ -165,8 +243,25 @@ class DetDSTTAModel(BaseTTAModel):
         else:
             raise TypeError('data given by dataLoader should be a dict, '
                             f'tuple or a list, but got {type(data)}')
-        print(data_list)
-        predictions = []
-        for data in data_list:  # type: ignore
-            predictions.append(self.module.test_step(data))
-        return self.merge_preds(list(zip(*predictions)))  # type: ignore
\ No newline at end of file
+        if self.views_per_batch == 1:
+            predictions = []
+            for data in data_list:  # type: ignore
+                predictions.append(self.module.test_step(data))
+            return self.merge_preds(list(zip(*predictions)))  # type: ignore
+
+        predictions = [None] * num_augs
+        for inds in self._batch_views(data_list):
+            views = [data_list[idx] for idx in inds]
+            if isinstance(views[0], dict):
+                batch = {
+                    key: [item for view in views for item in view[key]]
+                    for key in views[0]
+                }
+            else:
+                batch = [[item for view in views for item in items]
+                         for items in zip(*views)]
+            outputs = self.module.test_step(batch)
+            num_imgs = len(outputs) // len(inds)
+            for i, idx in enumerate(inds):
+                predictions[idx] = outputs[i * num_imgs:(i + 1) * num_imgs]
+        return self.merge_preds(list(zip(*predictions)))  # type: ignore
@@ -13,6 +13,7 @@ from mmdet.registry import MODELS, TASK_UTILS
 from mmdet.structures import DetDataSample
 from mmdet.structures.bbox import (bbox_cxcyah_to_xyxy, bbox_overlaps,
                                    bbox_xyxy_to_cxcyah)
+from ..task_modules.tracking import TrackStates
 from .base_tracker import BaseTracker
 
 
@@ -63,6 +64,11 @@ class ByteTracker(BaseTracker):
 
         self.num_tentatives = num_tentatives
 
+    def reset(self) -> None:
+        """Reset the buffer of the tracker and the Kalman filter states."""
+        super().reset()
+        self.kf_states = TrackStates()
+
     @property
     def confirmed_ids(self) -> List:
         """Confirmed ids in the tracker."""
@@ -82,11 +88,8 @@ class ByteTracker(BaseTracker):
             self.tracks[id].tentative = False
         else:
             self.tracks[id].tentative = True
-        bbox = bbox_xyxy_to_cxcyah(self.tracks[id].bboxes[-1])  # size = (1, 4)
-        assert bbox.ndim == 2 and bbox.shape[0] == 1
-        bbox = bbox.squeeze(0).cpu().numpy()
-        self.tracks[id].mean, self.tracks[id].covariance = self.kf.initiate(
-            bbox)
+        # the Kalman filter states are initialized in a batch in `update`
+        self.new_ids.append(id)
 
     def update_track(self, id: int, obj: Tuple[torch.Tensor]) -> None:
         """Update a track."""
@@ -94,15 +97,38 @@ class ByteTracker(BaseTracker):
         if self.tracks[id].tentative:
             if len(self.tracks[id]['bboxes']) >= self.num_tentatives:
                 self.tracks[id].tentative = False
-        bbox = bbox_xyxy_to_cxcyah(self.tracks[id].bboxes[-1])  # size = (1, 4)
-        assert bbox.ndim == 2 and bbox.shape[0] == 1
-        bbox = bbox.squeeze(0).cpu().numpy()
         track_label = self.tracks[id]['labels'][-1]
         label_idx = self.memo_items.index('labels')
         obj_label = obj[label_idx]
         assert obj_label == track_label
-        self.tracks[id].mean, self.tracks[id].covariance = self.kf.update(
-            self.tracks[id].mean, self.tracks[id].covariance, bbox)
+        # the Kalman filter states are corrected in a batch in `update`
+        self.updated_ids.append(id)
+
+    def update(self, **kwargs) -> None:
+        """Update the tracker, the Kalman filter states of the new and the
+        updated tracks are initialized and corrected in batches."""
+        self.new_ids, self.updated_ids = [], []
+        super().update(**kwargs)
+        new_ids = [id for id in self.new_ids if id in self.tracks]
+        if len(new_ids) > 0:
+            self.kf_states.add(new_ids,
+                               *self.kf.initiate(
+                                   self.last_measurements(new_ids)))
+        self.update_kf_states(
+            [id for id in self.updated_ids if id in self.tracks])
+
+    def last_measurements(self, ids: List[int]) -> np.ndarray:
+        """The last bboxes of some tracks in the (cx, cy, a, h) format of the
+        Kalman filter."""
+        bboxes = torch.cat([self.tracks[id].bboxes[-1] for id in ids])
+        return bbox_xyxy_to_cxcyah(bboxes).cpu().numpy()
+
+    def update_kf_states(self, ids: List[int]) -> None:
+        """Correct the Kalman filter states of some tracks with their last
+        bboxes."""
+        if len(ids) > 0:
+            self.kf.update_tracks(self.kf_states, ids,
+                                  self.last_measurements(ids))
 
     def pop_invalid_tracks(self, frame_id: int) -> None:
         """Pop out invalid tracks."""
@@ -116,6 +142,7 @@ class ByteTracker(BaseTracker):
                 invalid_ids.append(k)
         for invalid_id in invalid_ids:
             self.tracks.pop(invalid_id)
+        self.kf_states.remove(invalid_ids)
 
     def assign_ids(
             self,
@@ -143,10 +170,7 @@ class ByteTracker(BaseTracker):
             tuple(np.ndarray, np.ndarray): The assigning ids.
         """
         # get track_bboxes
-        track_bboxes = np.zeros((0, 4))
-        for id in ids:
-            track_bboxes = np.concatenate(
-                (track_bboxes, self.tracks[id].mean[:4][None]), axis=0)
+        track_bboxes = self.kf_states.means[self.kf_states.rows(ids), :4]
         track_bboxes = torch.from_numpy(track_bboxes).to(det_bboxes)
         track_bboxes = bbox_cxcyah_to_xyxy(track_bboxes)
 
@@ -230,13 +254,14 @@ class ByteTracker(BaseTracker):
             second_det_ids = ids[second_det_inds]
 
             # 1. use Kalman Filter to predict current location
-            for id in self.confirmed_ids:
-                # track is lost in previous frame
-                if self.tracks[id].frame_ids[-1] != frame_id - 1:
-                    self.tracks[id].mean[7] = 0
-                (self.tracks[id].mean,
-                 self.tracks[id].covariance) = self.kf.predict(
-                     self.tracks[id].mean, self.tracks[id].covariance)
+            confirmed_ids = self.confirmed_ids
+            # track is lost in previous frame
+            lost_ids = [
+                id for id in confirmed_ids
+                if self.tracks[id].frame_ids[-1] != frame_id - 1
+            ]
+            self.kf_states.means[self.kf_states.rows(lost_ids), 7] = 0
+            self.kf.predict_tracks(self.kf_states, confirmed_ids)
 
             # 2. first match
             first_match_track_inds, first_match_det_inds = self.assign_ids(
@@ -78,11 +78,6 @@ class OCSORTTracker(SORTTracker):
             self.tracks[id].tentative = False
         else:
             self.tracks[id].tentative = True
-        bbox = bbox_xyxy_to_cxcyah(self.tracks[id].bboxes[-1])  # size = (1, 4)
-        assert bbox.ndim == 2 and bbox.shape[0] == 1
-        bbox = bbox.squeeze(0).cpu().numpy()
-        self.tracks[id].mean, self.tracks[id].covariance = self.kf.initiate(
-            bbox)
         # track.obs maintains the history associated detections to this track
         self.tracks[id].obs = []
         bbox_id = self.memo_items.index('bboxes')
@@ -97,14 +92,6 @@ class OCSORTTracker(SORTTracker):
     def update_track(self, id: int, obj: Tuple[torch.Tensor]):
         """Update a track."""
         super().update_track(id, obj)
-        if self.tracks[id].tentative:
-            if len(self.tracks[id]['bboxes']) >= self.num_tentatives:
-                self.tracks[id].tentative = False
-        bbox = bbox_xyxy_to_cxcyah(self.tracks[id].bboxes[-1])  # size = (1, 4)
-        assert bbox.ndim == 2 and bbox.shape[0] == 1
-        bbox = bbox.squeeze(0).cpu().numpy()
-        self.tracks[id].mean, self.tracks[id].covariance = self.kf.update(
-            self.tracks[id].mean, self.tracks[id].covariance, bbox)
         self.tracks[id].tracked = True
         bbox_id = self.memo_items.index('bboxes')
         self.tracks[id].obs.append(obj[bbox_id])
@@ -114,6 +101,17 @@ class OCSORTTracker(SORTTracker):
         self.tracks[id].velocity = self.vel_direction(bbox1, bbox2).to(
             obj[bbox_id].device)
 
+    def update_kf_states(self, ids: List[int]) -> None:
+        """Correct the Kalman filter states of some tracks with their last
+        bboxes.
+
+        The states of OC-SORT are corrected twice with the same bboxes, once
+        for :class:`SORTTracker` and once for OC-SORT, as when they were
+        corrected track by track in ``update_track``.
+        """
+        super().update_kf_states(ids)
+        super().update_kf_states(ids)
+
     def vel_direction(self, bbox1: torch.Tensor, bbox2: torch.Tensor):
         """Estimate the direction vector between two boxes."""
         if bbox1.sum() < 0 or bbox2.sum() < 0:
@@ -184,10 +182,7 @@ class OCSORTTracker(SORTTracker):
         OC-SORT uses velocity consistency besides IoU for association
         """
         # get track_bboxes
-        track_bboxes = np.zeros((0, 4))
-        for id in ids:
-            track_bboxes = np.concatenate(
-                (track_bboxes, self.tracks[id].mean[:4][None]), axis=0)
+        track_bboxes = self.kf_states.means[self.kf_states.rows(ids), :4]
         track_bboxes = torch.from_numpy(track_bboxes).to(det_bboxes)
         track_bboxes = bbox_cxcyah_to_xyxy(track_bboxes)
 
@@ -297,13 +292,14 @@ class OCSORTTracker(SORTTracker):
             col = np.zeros(len(det_bboxes)).astype(np.int32) - 1
         return row, col
 
-    def online_smooth(self, track: Dict, obj: torch.Tensor):
+    def online_smooth(self, id: int, obj: torch.Tensor):
         """Once a track is recovered from being lost, online smooth its
         parameters to fix the error accumulated during being lost.
 
         NOTE: you can use different virtual trajectory generation
         strategies, we adopt the naive linear interpolation as default
         """
+        track = self.tracks[id]
         last_match_bbox = self.last_obs(track)
         new_match_bbox = obj
         unmatch_len = 0
@@ -314,14 +310,16 @@ class OCSORTTracker(SORTTracker):
                 break
         bbox_shift_per_step = (new_match_bbox - last_match_bbox) / (
             unmatch_len + 1)
-        track.mean = track.saved_attr.mean
-        track.covariance = track.saved_attr.covariance
+        mean = track.saved_attr.mean
+        covariance = track.saved_attr.covariance
         for i in range(unmatch_len):
             virtual_bbox = last_match_bbox + (i + 1) * bbox_shift_per_step
             virtual_bbox = bbox_xyxy_to_cxcyah(virtual_bbox[None, :])
             virtual_bbox = virtual_bbox.squeeze(0).cpu().numpy()
-            track.mean, track.covariance = self.kf.update(
-                track.mean, track.covariance, virtual_bbox)
+            mean, covariance = self.kf.update(mean, covariance, virtual_bbox)
+        row = self.kf_states.id2row[id]
+        self.kf_states.means[row] = mean
+        self.kf_states.covariances[row] = covariance
 
     def track(self, data_sample: DetDataSample, **kwargs) -> InstanceData:
         """Tracking forward function.
@@ -373,17 +371,23 @@ class OCSORTTracker(SORTTracker):
             det_ids = ids[det_inds]
 
             # 1. predict by Kalman Filter
-            for id in self.confirmed_ids:
-                # track is lost in previous frame
-                if self.tracks[id].frame_ids[-1] != frame_id - 1:
-                    self.tracks[id].mean[7] = 0
-                if self.tracks[id].tracked:
-                    self.tracks[id].saved_attr.mean = self.tracks[id].mean
-                    self.tracks[id].saved_attr.covariance = self.tracks[
-                        id].covariance
-                (self.tracks[id].mean,
-                 self.tracks[id].covariance) = self.kf.predict(
-                     self.tracks[id].mean, self.tracks[id].covariance)
+            confirmed_ids = self.confirmed_ids
+            # track is lost in previous frame
+            lost_ids = [
+                id for id in confirmed_ids
+                if self.tracks[id].frame_ids[-1] != frame_id - 1
+            ]
+            self.kf_states.means[self.kf_states.rows(lost_ids), 7] = 0
+            tracked_ids = [
+                id for id in confirmed_ids if self.tracks[id].tracked
+            ]
+            rows = self.kf_states.rows(tracked_ids)
+            for id, mean, covariance in zip(tracked_ids,
+                                            self.kf_states.means[rows],
+                                            self.kf_states.covariances[rows]):
+                self.tracks[id].saved_attr.mean = mean
+                self.tracks[id].saved_attr.covariance = covariance
+            self.kf.predict_tracks(self.kf_states, confirmed_ids)
 
             # 2. match detections and tracks' predicted locations
             match_track_inds, raw_match_det_inds = self.ocm_assign_ids(
@@ -496,7 +500,7 @@ class OCSORTTracker(SORTTracker):
                 track_id = match_det_ids[i].item()
                 if not self.tracks[track_id].tracked:
                     # the track is lost before this step
-                    self.online_smooth(self.tracks[track_id], det_bbox)
+                    self.online_smooth(track_id, det_bbox)
 
             for track_id in all_track_ids:
                 if track_id not in match_det_ids:
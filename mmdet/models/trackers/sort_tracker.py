@@ -16,6 +16,7 @@ from mmdet.registry import MODELS, TASK_UTILS
 from mmdet.structures import DetDataSample
 from mmdet.structures.bbox import bbox_overlaps, bbox_xyxy_to_cxcyah
 from mmdet.utils import OptConfigType
+from ..task_modules.tracking import TrackStates
 from ..utils import imrenormalize
 from .base_tracker import BaseTracker
 
@@ -66,6 +67,11 @@ class SORTTracker(BaseTracker):
         self.match_iou_thr = match_iou_thr
         self.num_tentatives = num_tentatives
 
+    def reset(self) -> None:
+        """Reset the buffer of the tracker and the Kalman filter states."""
+        super().reset()
+        self.kf_states = TrackStates()
+
     @property
     def confirmed_ids(self) -> List:
         """Confirmed ids in the tracker."""
@@ -76,11 +82,8 @@ class SORTTracker(BaseTracker):
         """Initialize a track."""
         super().init_track(id, obj)
         self.tracks[id].tentative = True
-        bbox = bbox_xyxy_to_cxcyah(self.tracks[id].bboxes[-1])  # size = (1, 4)
-        assert bbox.ndim == 2 and bbox.shape[0] == 1
-        bbox = bbox.squeeze(0).cpu().numpy()
-        self.tracks[id].mean, self.tracks[id].covariance = self.kf.initiate(
-            bbox)
+        # the Kalman filter states are initialized in a batch in `update`
+        self.new_ids.append(id)
 
     def update_track(self, id: int, obj: Tuple[Tensor]) -> None:
         """Update a track."""
@@ -88,11 +91,34 @@ class SORTTracker(BaseTracker):
         if self.tracks[id].tentative:
             if len(self.tracks[id]['bboxes']) >= self.num_tentatives:
                 self.tracks[id].tentative = False
-        bbox = bbox_xyxy_to_cxcyah(self.tracks[id].bboxes[-1])  # size = (1, 4)
-        assert bbox.ndim == 2 and bbox.shape[0] == 1
-        bbox = bbox.squeeze(0).cpu().numpy()
-        self.tracks[id].mean, self.tracks[id].covariance = self.kf.update(
-            self.tracks[id].mean, self.tracks[id].covariance, bbox)
+        # the Kalman filter states are corrected in a batch in `update`
+        self.updated_ids.append(id)
+
+    def update(self, **kwargs) -> None:
+        """Update the tracker, the Kalman filter states of the new and the
+        updated tracks are initialized and corrected in batches."""
+        self.new_ids, self.updated_ids = [], []
+        super().update(**kwargs)
+        new_ids = [id for id in self.new_ids if id in self.tracks]
+        if len(new_ids) > 0:
+            self.kf_states.add(new_ids,
+                               *self.kf.initiate(
+                                   self.last_measurements(new_ids)))
+        self.update_kf_states(
+            [id for id in self.updated_ids if id in self.tracks])
+
+    def last_measurements(self, ids: List[int]) -> np.ndarray:
+        """The last bboxes of some tracks in the (cx, cy, a, h) format of the
+        Kalman filter."""
+        bboxes = torch.cat([self.tracks[id].bboxes[-1] for id in ids])
+        return bbox_xyxy_to_cxcyah(bboxes).cpu().numpy()
+
+    def update_kf_states(self, ids: List[int]) -> None:
+        """Correct the Kalman filter states of some tracks with their last
+        bboxes."""
+        if len(ids) > 0:
+            self.kf.update_tracks(self.kf_states, ids,
+                                  self.last_measurements(ids))
 
     def pop_invalid_tracks(self, frame_id: int) -> None:
         """Pop out invalid tracks."""
@@ -106,6 +132,7 @@ class SORTTracker(BaseTracker):
                 invalid_ids.append(k)
         for invalid_id in invalid_ids:
             self.tracks.pop(invalid_id)
+        self.kf_states.remove(invalid_ids)
 
     def track(self,
               model: torch.nn.Module,
@@ -182,8 +209,8 @@ class SORTTracker(BaseTracker):
                              dtype=torch.long).to(bboxes.device)
 
             # motion
-            self.tracks, costs = self.motion.track(self.tracks,
-                                                   bbox_xyxy_to_cxcyah(bboxes))
+            self.kf_states, costs = self.motion.track(
+                self.kf_states, bbox_xyxy_to_cxcyah(bboxes))
 
             active_ids = self.confirmed_ids
             if self.with_reid:
@@ -208,7 +235,7 @@ class SORTTracker(BaseTracker):
                     cate_cost = (1 - cate_match.int()) * 1e6
                     reid_dists = (reid_dists + cate_cost).cpu().numpy()
 
-                    valid_inds = [list(self.ids).index(_) for _ in active_ids]
+                    valid_inds = self.kf_states.rows(active_ids)
                     reid_dists[~np.isfinite(costs[valid_inds, :])] = np.nan
 
                     row, col = linear_sum_assignment(reid_dists)
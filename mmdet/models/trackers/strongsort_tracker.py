@@ -1,5 +1,5 @@
 # Copyright (c) OpenMMLab. All rights reserved.
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 
 import numpy as np
 import torch
@@ -94,12 +94,17 @@ class StrongSORTTracker(SORTTracker):
         if self.tracks[id].tentative:
             if len(self.tracks[id]['bboxes']) >= self.num_tentatives:
                 self.tracks[id].tentative = False
-        bbox = bbox_xyxy_to_cxcyah(self.tracks[id].bboxes[-1])  # size = (1, 4)
-        assert bbox.ndim == 2 and bbox.shape[0] == 1
-        bbox = bbox.squeeze(0).cpu().numpy()
-        score = float(self.tracks[id].scores[-1].cpu())
-        self.tracks[id].mean, self.tracks[id].covariance = self.kf.update(
-            self.tracks[id].mean, self.tracks[id].covariance, bbox, score)
+        # the Kalman filter states are corrected in a batch in `update`
+        self.updated_ids.append(id)
+
+    def update_kf_states(self, ids: List[int]) -> None:
+        """Correct the Kalman filter states of some tracks with their last
+        bboxes, weighted by their scores."""
+        if len(ids) > 0:
+            scores = torch.cat([self.tracks[id].scores[-1] for id in ids])
+            self.kf.update_tracks(self.kf_states, ids,
+                                  self.last_measurements(ids),
+                                  scores.float().cpu().numpy())
 
     def track(self,
               model: torch.nn.Module,
@@ -179,11 +184,17 @@ class StrongSORTTracker(SORTTracker):
             # motion
             if model.with_cmc:
                 num_samples = 1
-                self.tracks = model.cmc.track(self.last_img, img, self.tracks,
-                                              num_samples, frame_id, metainfo)
-
-            self.tracks, motion_dists = self.motion.track(
-                self.tracks, bbox_xyxy_to_cxcyah(bboxes))
+                self.tracks = model.cmc.track(
+                    self.last_img,
+                    img,
+                    self.tracks,
+                    num_samples,
+                    frame_id,
+                    metainfo,
+                    states=self.kf_states)
+
+            self.kf_states, motion_dists = self.motion.track(
+                self.kf_states, bbox_xyxy_to_cxcyah(bboxes))
 
             active_ids = self.confirmed_ids
             if self.with_reid:
@@ -199,7 +210,7 @@ class StrongSORTTracker(SORTTracker):
                         self.reid.get('num_samples', None),
                         behavior='mean')
                     reid_dists = cosine_distance(track_embeds, embeds)
-                    valid_inds = [list(self.ids).index(_) for _ in active_ids]
+                    valid_inds = self.kf_states.rows(active_ids)
                     reid_dists[~np.isfinite(motion_dists[
                         valid_inds, :])] = np.nan
 
@@ -1,7 +1,7 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 
 import warnings
-from typing import Tuple
+from typing import Optional, Sequence, Tuple
 
 import numpy as np
 import torch
@@ -248,3 +248,450 @@ def find_matching_box_fast(boxes_list, new_box, match_iou):
         best_idx = -1
 
     return best_idx, best_iou
+
+
+WBF_CONF_TYPES = ('avg', 'max', 'box_and_model_avg', 'absent_model_aware_avg')
+
+
+def fast_weighted_boxes_fusion(
+        bboxes_list: list,
+        scores_list: list,
+        labels_list: list,
+        weights: list = None,
+        iou_thr: float = 0.55,
+        skip_box_thr: float = 0.0,
+        conf_type: str = 'avg',
+        allows_overflow: bool = False) -> Tuple[Tensor, Tensor, Tensor]:
+    """Vectorized version of :func:`weighted_boxes_fusion`.
+
+    The outputs are the same as :func:`weighted_boxes_fusion`, but the
+    prefiltering is done on whole arrays, the fused boxes of each label are
+    kept in preallocated arrays with running sums instead of being recomputed
+    from every clustered box, and the final confidences are obtained by
+    segment reductions over the cluster assignment.
+
+    Note:
+        A box is matched against the *current* fused boxes, which move as
+        boxes are merged into them, so the assignment of the boxes of one
+        label is still sequential in score order. Each step only costs one
+        vectorized IoU against the existing clusters.
+
+    Args:
+        bboxes_list (list): list of boxes predictions from each model,
+            each box is 4 numbers (x1, y1, x2, y2).
+        scores_list (list): list of scores for each model.
+        labels_list (list): list of labels for each model.
+        weights (list, optional): list of weights for each model.
+            Defaults to None, which means weight == 1 for each model.
+        iou_thr (float): IoU value for boxes to be a match.
+            Defaults to 0.55.
+        skip_box_thr (float): exclude boxes with score lower than this
+            variable. Defaults to 0.0.
+        conf_type (str): how to calculate confidence in weighted boxes,
+            see :func:`weighted_boxes_fusion`. Defaults to 'avg'.
+        allows_overflow (bool): false if we want confidence score not
+            exceed 1.0. Defaults to False.
+
+    Returns:
+        bboxes(Tensor): boxes coordinates (Order of boxes: x1, y1, x2, y2).
+        scores(Tensor): confidence scores
+        labels(Tensor): boxes labels
+    """
+    assert conf_type in WBF_CONF_TYPES, \
+        f'Unknown conf_type: {conf_type}. Must be one of {WBF_CONF_TYPES}'
+    weights = _check_weights(weights, len(bboxes_list))
+
+    filtered_boxes = prefilter_boxes_array(bboxes_list, scores_list,
+                                           labels_list, weights, skip_box_thr)
+    if len(filtered_boxes) == 0:
+        return torch.Tensor(), torch.Tensor(), torch.Tensor()
+
+    overall_boxes = []
+    for label, boxes in filtered_boxes.items():
+        cluster_inds = _cluster_sorted_boxes(boxes[:, 4:], boxes[:, 1],
+                                             iou_thr)
+        num_clusters = int(cluster_inds.max()) + 1
+
+        # segment reductions over the clusters
+        counts = np.bincount(cluster_inds, minlength=num_clusters)
+        conf_sums = np.bincount(
+            cluster_inds, weights=boxes[:, 1], minlength=num_clusters)
+        weight_sums = np.bincount(
+            cluster_inds, weights=boxes[:, 2], minlength=num_clusters)
+        coords = np.stack([
+            np.bincount(
+                cluster_inds,
+                weights=boxes[:, 1] * boxes[:, 4 + i],
+                minlength=num_clusters) for i in range(4)
+        ],
+                          axis=1) / conf_sums[:, None]
+        conf_maxs = np.full(num_clusters, -np.inf)
+        np.maximum.at(conf_maxs, cluster_inds, boxes[:, 1])
+        presence = np.zeros((num_clusters, len(weights)))
+        presence[cluster_inds, boxes[:, 3].astype(np.int64)] = 1
+
+        fused_scores = rescale_fused_scores(conf_sums / counts, conf_maxs,
+                                            counts, weight_sums, presence,
+                                            weights, conf_type,
+                                            allows_overflow)
+
+        fused = np.empty((num_clusters, 8))
+        fused[:, 0] = label
+        fused[:, 1] = fused_scores
+        fused[:, 2] = weight_sums
+        fused[:, 3] = -1
+        fused[:, 4:] = coords
+        overall_boxes.append(fused)
+    overall_boxes = np.concatenate(overall_boxes, axis=0)
+    overall_boxes = overall_boxes[overall_boxes[:, 1].argsort()[::-1]]
+
+    bboxes = torch.Tensor(overall_boxes[:, 4:])
+    scores = torch.Tensor(overall_boxes[:, 1])
+    labels = torch.Tensor(overall_boxes[:, 0]).int()
+
+    return bboxes, scores, labels
+
+
+def batched_weighted_boxes_fusion(
+        bboxes: Tensor,
+        scores: Tensor,
+        labels: Tensor,
+        model_inds: Tensor,
+        batch_inds: Optional[Tensor] = None,
+        weights: Optional[Sequence[float]] = None,
+        num_models: Optional[int] = None,
+        iou_thr: float = 0.55,
+        skip_box_thr: float = 0.0,
+        conf_type: str = 'avg',
+        allows_overflow: bool = False
+) -> Tuple[Tensor, Tensor, Tensor, Tensor]:
+    """Weighted boxes fusion on a whole batch of images in PyTorch.
+
+    All the predictions of a batch are given as flat tensors, the model and
+    the image each box comes from are given by ``model_inds`` and
+    ``batch_inds``, in the same way as the ``idxs`` of
+    :func:`mmcv.ops.batched_nms`. Every (image, label) pair is clustered
+    independently with the same rules as :func:`weighted_boxes_fusion`; the
+    k-th box of all the pairs is processed in the same step, so the number of
+    steps is the size of the largest group instead of the number of boxes,
+    and everything stays on the device of the inputs.
+
+    Args:
+        bboxes (Tensor): boxes in shape (N, 4), (x1, y1, x2, y2) format.
+        scores (Tensor): scores in shape (N, ).
+        labels (Tensor): labels in shape (N, ).
+        model_inds (Tensor): index of the model of each box in shape (N, ).
+        batch_inds (Tensor, optional): index of the image of each box in
+            shape (N, ). Defaults to None, which means a single image.
+        weights (Sequence[float], optional): weights for each model.
+            Defaults to None, which means weight == 1 for each model.
+        num_models (int, optional): number of fused models. Defaults to None,
+            which means ``len(weights)`` or ``model_inds.max() + 1``.
+        iou_thr (float): IoU value for boxes to be a match.
+            Defaults to 0.55.
+        skip_box_thr (float): exclude boxes with score lower than this
+            variable. Defaults to 0.0.
+        conf_type (str): how to calculate confidence in weighted boxes,
+            see :func:`weighted_boxes_fusion`. Defaults to 'avg'.
+        allows_overflow (bool): false if we want confidence score not
+            exceed 1.0. Defaults to False.
+
+    Returns:
+        tuple[Tensor]: fused boxes in shape (M, 4), scores in shape (M, ),
+        labels in shape (M, ) and image indices in shape (M, ). The results
+        are sorted by image index, then by descending score.
+    """
+    assert conf_type in WBF_CONF_TYPES, \
+        f'Unknown conf_type: {conf_type}. Must be one of {WBF_CONF_TYPES}'
+    device = bboxes.device
+    if batch_inds is None:
+        batch_inds = model_inds.new_zeros(model_inds.shape)
+    if num_models is None:
+        num_models = len(weights) if weights is not None else \
+            int(model_inds.max()) + 1 if model_inds.numel() else 1
+    weights = bboxes.new_tensor(_check_weights(weights, num_models))
+
+    bboxes = bboxes.reshape(-1, 4)
+    model_inds = model_inds.long()
+    batch_inds = batch_inds.long()
+    labels = labels.long()
+    x1y1 = torch.minimum(bboxes[:, :2], bboxes[:, 2:])
+    x2y2 = torch.maximum(bboxes[:, :2], bboxes[:, 2:])
+    bboxes = torch.cat([x1y1, x2y2], dim=1)
+    wh = x2y2 - x1y1
+    keep = (scores >= skip_box_thr) & (wh[:, 0] * wh[:, 1] != 0)
+    bboxes, scores, labels, model_inds, batch_inds = (bboxes[keep],
+                                                      scores[keep],
+                                                      labels[keep],
+                                                      model_inds[keep],
+                                                      batch_inds[keep])
+    if bboxes.numel() == 0:
+        return (bboxes.new_zeros((0, 4)), scores.new_zeros(
+            (0, )), labels.new_zeros((0, )).int(), batch_inds.new_zeros((0, )))
+
+    confs = scores.to(bboxes.dtype) * weights[model_inds]
+    # every (image, label) pair is a group, boxes are sorted by descending
+    # confidence inside their group
+    num_labels = int(labels.max()) + 1
+    group_keys, groups = torch.unique(
+        batch_inds * num_labels + labels, return_inverse=True)
+    order = _stable_argsort(confs, descending=True)
+    order = order[_stable_argsort(groups[order])]
+    bboxes, confs, model_inds, groups = (bboxes[order], confs[order],
+                                         model_inds[order], groups[order])
+
+    num_groups = len(group_keys)
+    group_sizes = torch.bincount(groups, minlength=num_groups)
+    group_starts = group_sizes.cumsum(0) - group_sizes
+    ranks = torch.arange(len(groups), device=device) - group_starts[groups]
+    rank_order = _stable_argsort(ranks)
+    steps = torch.bincount(ranks).tolist()
+
+    max_clusters = len(steps)
+    cluster_sums = bboxes.new_zeros((num_groups, max_clusters, 4))
+    cluster_confs = bboxes.new_zeros((num_groups, max_clusters))
+    num_clusters = groups.new_zeros(num_groups)
+    cluster_inds = groups.new_empty(len(groups))
+    slots = torch.arange(max_clusters, device=device)
+    for step, inds in enumerate(torch.split(rank_order, steps)):
+        # at most ``step`` clusters exist in each group before this step
+        group = groups[inds]
+        box = bboxes[inds]
+        conf = confs[inds]
+        if step > 0:
+            fused = cluster_sums[group, :step] / cluster_confs[
+                group, :step, None].clamp(min=torch.finfo(bboxes.dtype).tiny)
+            ious = _box_iou_one_to_many(box, fused)
+            ious = ious.masked_fill(
+                slots[None, :step] >= num_clusters[group, None], -1)
+            best = ious.argmax(dim=1)
+            best_iou = ious.gather(1, best[:, None])[:, 0]
+            matched = best_iou > iou_thr
+            slot = torch.where(matched, best, num_clusters[group])
+            num_clusters[group] += (~matched).long()
+        else:
+            slot = torch.zeros_like(group)
+            num_clusters[group] = 1
+        cluster_sums[group, slot] += conf[:, None] * box
+        cluster_confs[group, slot] += conf
+        cluster_inds[inds] = slot
+
+    # segment reductions over the clusters
+    cluster_keys, cluster_inds = torch.unique(
+        groups * max_clusters + cluster_inds, return_inverse=True)
+    num_fused = len(cluster_keys)
+    cluster_sizes = torch.bincount(cluster_inds, minlength=num_fused)
+    counts = cluster_sizes.to(confs.dtype)
+    conf_sums = confs.new_zeros(num_fused).index_add_(0, cluster_inds, confs)
+    weight_sums = confs.new_zeros(num_fused).index_add_(
+        0, cluster_inds, weights[model_inds])
+    # the boxes are sorted by descending confidence inside their group, so
+    # the first box of each cluster has its maximum confidence
+    cluster_starts = cluster_sizes.cumsum(0) - cluster_sizes
+    conf_maxs = confs[_stable_argsort(cluster_inds)[cluster_starts]]
+    coords = bboxes.new_zeros((num_fused, 4)).index_add_(
+        0, cluster_inds, confs[:, None] * bboxes) / conf_sums[:, None]
+    presence = confs.new_zeros((num_fused, num_models))
+    presence[cluster_inds, model_inds] = 1
+
+    fused_scores = rescale_fused_scores(conf_sums / counts, conf_maxs, counts,
+                                        weight_sums, presence, weights,
+                                        conf_type, allows_overflow)
+    fused_keys = group_keys[cluster_keys // max_clusters]
+    fused_batch_inds = fused_keys // num_labels
+    fused_labels = fused_keys % num_labels
+
+    order = _stable_argsort(fused_scores, descending=True)
+    order = order[_stable_argsort(fused_batch_inds[order])]
+    return (coords[order], fused_scores[order], fused_labels[order].int(),
+            fused_batch_inds[order])
+
+
+def rescale_fused_scores(conf_avgs, conf_maxs, counts, weight_sums, presence,
+                         weights, conf_type: str, allows_overflow: bool):
+    """Rescale the confidence of fused boxes based on the number of models
+    and boxes in each cluster.
+
+    Works with both numpy arrays and tensors.
+
+    Args:
+        conf_avgs (np.ndarray | Tensor): average confidence of each cluster.
+        conf_maxs (np.ndarray | Tensor): maximum confidence of each cluster.
+        counts (np.ndarray | Tensor): number of boxes in each cluster.
+        weight_sums (np.ndarray | Tensor): sum of the model weights of the
+            boxes in each cluster.
+        presence (np.ndarray | Tensor): float mask in shape
+            (num_clusters, num_models), whether a model has a box in the
+            cluster.
+        weights (np.ndarray | Tensor): weights for each model.
+        conf_type (str): how to calculate confidence in weighted boxes.
+        allows_overflow (bool): false if we want confidence score not
+            exceed 1.0.
+
+    Returns:
+        np.ndarray | Tensor: the rescaled confidence of each cluster.
+    """
+    if conf_type == 'box_and_model_avg':
+        # weighted average for boxes, rescaled by unique model weights
+        return conf_avgs * counts / weight_sums * (
+            presence @ weights) / weights.sum()
+    elif conf_type == 'absent_model_aware_avg':
+        # absent model aware weighted average
+        return conf_avgs * counts / (weight_sums + (1 - presence) @ weights)
+    elif conf_type == 'max':
+        return conf_maxs / weights.max()
+    elif not allows_overflow:
+        return conf_avgs * counts.clip(max=len(weights)) / weights.sum()
+    else:
+        return conf_avgs * counts / weights.sum()
+
+
+def prefilter_boxes_array(boxes, scores, labels, weights, thr) -> dict:
+    """Vectorized version of :func:`prefilter_boxes`.
+
+    Returns:
+        dict: boxes of each label in shape (n, 8), each row is [label,
+        score * weight, weight, model index, x1, y1, x2, y2], sorted by
+        descending weighted score in the same order as
+        :func:`prefilter_boxes`.
+    """
+    all_boxes = []
+    for t in range(len(boxes)):
+        if len(boxes[t]) != len(scores[t]):
+            raise ValueError('Length of boxes arrays not equal to length of '
+                             f'scores array: {len(boxes[t])} != '
+                             f'{len(scores[t])}')
+        if len(boxes[t]) != len(labels[t]):
+            raise ValueError('Length of boxes arrays not equal to length of '
+                             f'labels array: {len(boxes[t])} != '
+                             f'{len(labels[t])}')
+        if len(boxes[t]) == 0:
+            continue
+        score = np.asarray(scores[t], dtype=np.float64).reshape(-1)
+        b = np.empty((len(score), 8))
+        b[:, 0] = np.asarray(labels[t]).reshape(-1).astype(np.int64)
+        b[:, 1] = score * weights[t]
+        b[:, 2] = weights[t]
+        b[:, 3] = t
+        b[:, 4:] = np.asarray(boxes[t], dtype=np.float64).reshape(-1, 4)
+        all_boxes.append(b[score >= thr])
+    if len(all_boxes) == 0:
+        return dict()
+    all_boxes = np.concatenate(all_boxes, axis=0)
+
+    # Box data checks
+    x1, y1, x2, y2 = all_boxes[:, 4:].T
+    if (x2 < x1).any():
+        warnings.warn('X2 < X1 value in box. Swap them.')
+    if (y2 < y1).any():
+        warnings.warn('Y2 < Y1 value in box. Swap them.')
+    all_boxes[:, 4:6], all_boxes[:, 6:] = (np.minimum(all_boxes[:, 4:6],
+                                                      all_boxes[:, 6:]),
+                                           np.maximum(all_boxes[:, 4:6],
+                                                      all_boxes[:, 6:]))
+    wh = all_boxes[:, 6:] - all_boxes[:, 4:6]
+    zero_area = wh[:, 0] * wh[:, 1] == 0.0
+    if zero_area.any():
+        warnings.warn(f'{zero_area.sum()} zero area boxes skipped.')
+        all_boxes = all_boxes[~zero_area]
+
+    # Group by label in order of first appearance and sort each group by
+    # score with the same expression as ``prefilter_boxes``
+    _, first_inds, label_inds = np.unique(
+        all_boxes[:, 0], return_index=True, return_inverse=True)
+    new_boxes = dict()
+    for i in np.argsort(first_inds):
+        current_boxes = all_boxes[label_inds == i]
+        new_boxes[int(current_boxes[0, 0])] = current_boxes[
+            current_boxes[:, 1].argsort()[::-1]]
+    return new_boxes
+
+
+def _check_weights(weights, num_models: int) -> np.ndarray:
+    """Check the model weights, fall back to ones like
+    :func:`weighted_boxes_fusion` when they are missing or invalid."""
+    if weights is None:
+        return np.ones(num_models)
+    if len(weights) != num_models:
+        warnings.warn(f'Incorrect number of weights {len(weights)}. Must be: '
+                      f'{num_models}. Set weights equal to 1.')
+        return np.ones(num_models)
+    return np.asarray(weights, dtype=np.float64)
+
+
+def _cluster_sorted_boxes(coords: np.ndarray, confs: np.ndarray,
+                          iou_thr: float) -> np.ndarray:
+    """Assign boxes sorted by descending confidence to clusters.
+
+    A box joins the fused box with the highest IoU if that IoU is larger than
+    ``iou_thr``, otherwise it starts a new cluster. The fused boxes are kept
+    as running confidence-weighted sums in preallocated arrays.
+
+    Returns:
+        np.ndarray: cluster index of each box, clusters are numbered in
+        creation order.
+    """
+    num_boxes = len(coords)
+    sums = np.empty((num_boxes, 4))
+    conf_sums = np.empty(num_boxes)
+    fused = np.empty((num_boxes, 4))
+    areas = np.empty(num_boxes)
+    cluster_inds = np.empty(num_boxes, dtype=np.int64)
+    box_areas = (coords[:, 2] - coords[:, 0]) * (coords[:, 3] - coords[:, 1])
+    num_clusters = 0
+    for i in range(num_boxes):
+        box = coords[i]
+        conf = confs[i]
+        if num_clusters > 0:
+            f = fused[:num_clusters]
+            w = np.minimum(f[:, 2], box[2]) - np.maximum(f[:, 0], box[0])
+            h = np.minimum(f[:, 3], box[3]) - np.maximum(f[:, 1], box[1])
+            inter = np.maximum(w, 0) * np.maximum(h, 0)
+            ious = inter / (areas[:num_clusters] + box_areas[i] - inter)
+            best = ious.argmax()
+            if ious[best] > iou_thr:
+                sums[best] += conf * box
+                conf_sums[best] += conf
+                fused[best] = sums[best] / conf_sums[best]
+                areas[best] = (fused[best, 2] - fused[best, 0]) * (
+                    fused[best, 3] - fused[best, 1])
+                cluster_inds[i] = best
+                continue
+        sums[num_clusters] = conf * box
+        conf_sums[num_clusters] = conf
+        fused[num_clusters] = box
+        areas[num_clusters] = box_areas[i]
+        cluster_inds[i] = num_clusters
+        num_clusters += 1
+    return cluster_inds
+
+
+def _box_iou_one_to_many(boxes: Tensor, candidates: Tensor) -> Tensor:
+    """IoU between each box in shape (A, 4) and its candidates in shape
+    (A, K, 4)."""
+    boxes = boxes[:, None]
+    lt = torch.maximum(boxes[..., :2], candidates[..., :2])
+    rb = torch.minimum(boxes[..., 2:], candidates[..., 2:])
+    wh = (rb - lt).clamp(min=0)
+    inter = wh[..., 0] * wh[..., 1]
+    area1 = (boxes[..., 2] - boxes[..., 0]) * (boxes[..., 3] - boxes[..., 1])
+    area2 = (candidates[..., 2] - candidates[..., 0]) * (
+        candidates[..., 3] - candidates[..., 1])
+    return inter / (area1 + area2 - inter)
+
+
+def _stable_argsort(values: Tensor, descending: bool = False) -> Tensor:
+    """Stable argsort of a 1-D tensor.
+
+    ``argsort(stable=True)`` needs torch >= 1.13, so the values are replaced
+    by their rank among the unique values and the index of the element is
+    used to break the ties, which gives unique keys.
+    """
+    if values.numel() == 0:
+        return values.new_zeros((0, ), dtype=torch.long)
+    _, ranks = torch.unique(values, return_inverse=True)
+    if descending:
+        ranks = ranks.max() - ranks
+    keys = ranks * values.numel() + torch.arange(
+        values.numel(), device=values.device)
+    return keys.argsort()
@@ -1,12 +1,64 @@
 # Copyright (c) OpenMMLab. All rights reserved.
-from typing import Sequence, Tuple
+from typing import List, Sequence, Tuple
 
+import numpy as np
 import torch
 from mmcv.ops import batched_nms
 from mmengine.structures import InstanceData
 
 from mmdet.structures import DetDataSample, SampleList
 
+MERGE_TYPES = ('nms', 'soft_nms', 'wbf', 'edge_nms')
+
+
+def get_slice_offsets(image_shape: Tuple[int, int],
+                      patch_size: int,
+                      overlap_ratio: float = 0.25) -> List[Tuple[int, int]]:
+    """Get the positions of the left top points of overlapping patches.
+
+    The patches are placed every ``patch_size * (1 - overlap_ratio)`` pixels
+    and the last patch of a row or a column is aligned with the border of the
+    image, so that every patch lies inside the image if it is larger than
+    the patches.
+
+    Args:
+        image_shape (Tuple[int, int]): A (height, width) tuple of the image.
+        patch_size (int): The size of the patches.
+        overlap_ratio (float): Ratio of overlap between two patches.
+            Defaults to 0.25.
+
+    Returns:
+        List[Tuple[int, int]]: The (x, y) offsets of the patches.
+    """
+    assert 0 <= overlap_ratio < 1, 'overlap_ratio should be in [0, 1).'
+    step = max(int(patch_size * (1 - overlap_ratio)), 1)
+
+    def starts(size):
+        last = max(size - patch_size, 0)
+        return sorted(set(list(range(0, last, step)) + [last]))
+
+    height, width = image_shape
+    return [(x, y) for y in starts(height) for x in starts(width)]
+
+
+def slice_image(img: np.ndarray, offsets: Sequence[Tuple[int, int]],
+                patch_size: int) -> List[np.ndarray]:
+    """Crop the patches at ``offsets`` from ``img`` without copy."""
+    return [img[y:y + patch_size, x:x + patch_size] for x, y in offsets]
+
+
+def shift_bboxes(bboxes: torch.Tensor, offset: Sequence[int]):
+    """Shift horizontal bboxes with offset.
+
+    Args:
+        bboxes (Tensor): The bboxes need to be translated. With shape (n, 4),
+            which means (x1, y1, x2, y2).
+        offset (Sequence[int]): The translation offsets with shape of (2, ).
+    Returns:
+        Tensor: Shifted bboxes.
+    """
+    return bboxes + bboxes.new_tensor(offset).repeat(2)
+
 
 def shift_rbboxes(bboxes: torch.Tensor, offset: Sequence[int]):
     """Shift rotated bboxes with offset.
@@ -24,11 +76,35 @@ def shift_rbboxes(bboxes: torch.Tensor, offset: Sequence[int]):
     return shifted_bboxes
 
 
+def shift_masks(masks: torch.Tensor, offset: Sequence[int],
+                src_image_shape: Tuple[int, int]) -> torch.Tensor:
+    """Paste the masks of a patch into masks of the whole image.
+
+    Args:
+        masks (Tensor): The masks of the patch with shape (n, h, w).
+        offset (Sequence[int]): The (x, y) position of the patch.
+        src_image_shape (Tuple[int, int]): A (height, width) tuple of the
+            whole image.
+    Returns:
+        Tensor: The masks with shape (n, height, width).
+    """
+    x, y = offset
+    height, width = src_image_shape
+    h = min(masks.size(1), height - y)
+    w = min(masks.size(2), width - x)
+    shifted_masks = masks.new_zeros((masks.size(0), height, width))
+    shifted_masks[:, y:y + h, x:x + w] = masks[:, :h, :w]
+    return shifted_masks
+
+
 def shift_predictions(det_data_samples: SampleList,
                       offsets: Sequence[Tuple[int, int]],
-                      src_image_shape: Tuple[int, int]) -> SampleList:
+                      src_image_shape: Tuple[int, int]) -> InstanceData:
     """Shift predictions to the original image.
 
+    The predictions of all the patches are concatenated once and shifted by
+    the offset of their patch, repeated for each of its instances.
+
     Args:
         det_data_samples (List[:obj:`DetDataSample`]): A list of patch results.
         offsets (Sequence[Tuple[int, int]]): Positions of the left top points
@@ -36,43 +112,140 @@ def shift_predictions(det_data_samples: SampleList,
         src_image_shape (Tuple[int, int]): A (height, width) tuple of the large
             image's width and height.
     Returns:
-        (List[:obj:`DetDataSample`]): shifted results.
+        :obj:`InstanceData`: shifted results.
     """
-    try:
-        from sahi.slicing import shift_bboxes, shift_masks
-    except ImportError:
-        raise ImportError('Please run "pip install -U sahi" '
-                          'to install sahi first for large image inference.')
-
     assert len(det_data_samples) == len(
         offsets), 'The `results` should has the ' 'same length with `offsets`.'
-    shifted_predictions = []
-    for det_data_sample, offset in zip(det_data_samples, offsets):
-        pred_inst = det_data_sample.pred_instances.clone()
-
-        # Check bbox type
-        if pred_inst.bboxes.size(-1) == 4:
-            # Horizontal bboxes
-            shifted_bboxes = shift_bboxes(pred_inst.bboxes, offset)
-        elif pred_inst.bboxes.size(-1) == 5:
-            # Rotated bboxes
-            shifted_bboxes = shift_rbboxes(pred_inst.bboxes, offset)
-        else:
-            raise NotImplementedError
+    pred_instances = [
+        det_data_sample.pred_instances for det_data_sample in det_data_samples
+    ]
+    num_insts = [len(pred_inst) for pred_inst in pred_instances]
+    shifted_predictions = InstanceData.cat(pred_instances)
+    if len(pred_instances) == 1:
+        # `InstanceData.cat` returns the instances of a single patch as is
+        shifted_predictions = shifted_predictions.clone()
 
-        # shift bboxes and masks
-        pred_inst.bboxes = shifted_bboxes
-        if 'masks' in det_data_sample:
-            pred_inst.masks = shift_masks(pred_inst.masks, offset,
-                                          src_image_shape)
+    bboxes = shifted_predictions.bboxes
+    inst_offsets = bboxes.new_tensor(offsets).repeat_interleave(
+        torch.tensor(num_insts, device=bboxes.device), dim=0)
+    # Check bbox type
+    if bboxes.size(-1) == 4:
+        # Horizontal bboxes
+        shifted_predictions.bboxes = bboxes + inst_offsets.repeat(1, 2)
+    elif bboxes.size(-1) == 5:
+        # Rotated bboxes
+        shifted_bboxes = bboxes.clone()
+        shifted_bboxes[:, 0:2] = shifted_bboxes[:, 0:2] + inst_offsets
+        shifted_predictions.bboxes = shifted_bboxes
+    else:
+        raise NotImplementedError
 
-        shifted_predictions.append(pred_inst.clone())
-
-    shifted_predictions = InstanceData.cat(shifted_predictions)
+    if 'masks' in shifted_predictions:
+        shifted_predictions.masks = torch.cat([
+            shift_masks(masks, offset, src_image_shape) for masks, offset in
+            zip(shifted_predictions.masks.split(num_insts), offsets)
+        ])
 
     return shifted_predictions
 
 
+def _truncated_by_patch(bboxes: torch.Tensor, patch_boxes: torch.Tensor,
+                        src_image_shape: Tuple[int, int],
+                        margin: float) -> torch.Tensor:
+    """Whether the boxes touch a border of their patch which is not a border
+    of the image, i.e. whether the objects may be cut by the patch."""
+    height, width = src_image_shape
+    image_border = bboxes.new_tensor([0, 0, width, height])
+    inner = patch_boxes != image_border
+    near_start = bboxes[:, :2] <= patch_boxes[:, :2] + margin
+    near_end = bboxes[:, 2:] >= patch_boxes[:, 2:] - margin
+    return ((near_start & inner[:, :2]) | (near_end & inner[:, 2:])).any(1)
+
+
+def merge_results(results: SampleList, offsets: Sequence[Tuple[int, int]],
+                  src_image_shape: Tuple[int, int],
+                  merge_cfg: dict) -> DetDataSample:
+    """Merge patch results.
+
+    The type of ``merge_cfg`` selects how the overlapping predictions of the
+    patches are merged:
+
+    - ``'nms'`` or ``'soft_nms'``: :func:`mmcv.ops.batched_nms` with the
+      other arguments of ``merge_cfg``, e.g. ``iou_threshold``. Soft-NMS
+      returns the decayed scores.
+    - ``'wbf'``: :func:`batched_weighted_boxes_fusion` with the other
+      arguments of ``merge_cfg``, e.g. ``iou_thr``. The masks are dropped.
+    - ``'edge_nms'``: NMS where the scores of the boxes touching an inner
+      border of their patch, within ``edge_margin`` pixels, are multiplied by
+      ``edge_factor`` so that the objects cut by a patch are suppressed by
+      the complete objects of the overlapping patches. The merged boxes keep
+      their original scores.
+
+    Args:
+        results (List[:obj:`DetDataSample`]): A list of patch results.
+        offsets (Sequence[Tuple[int, int]]): Positions of the left top points
+            of patches.
+        src_image_shape (Tuple[int, int]): A (height, width) tuple of the large
+            image's width and height.
+        merge_cfg (dict): The merge type and its parameters.
+    Returns:
+        :obj:`DetDataSample`: merged results.
+    """
+    merge_cfg = dict(merge_cfg)
+    merge_type = merge_cfg.pop('type', 'nms')
+    assert merge_type in MERGE_TYPES, \
+        f'Unknown merge type {merge_type}, must be one of {MERGE_TYPES}.'
+    shifted_instances = shift_predictions(results, offsets, src_image_shape)
+
+    if merge_type == 'wbf':
+        from mmdet.models.utils import batched_weighted_boxes_fusion
+        bboxes, scores, labels, _ = batched_weighted_boxes_fusion(
+            shifted_instances.bboxes,
+            shifted_instances.scores,
+            shifted_instances.labels,
+            shifted_instances.labels.new_zeros(len(shifted_instances)),
+            num_models=1,
+            **merge_cfg)
+        merged_instances = InstanceData(
+            bboxes=bboxes, scores=scores, labels=labels.long())
+    else:
+        scores = shifted_instances.scores
+        if merge_type == 'edge_nms':
+            margin = merge_cfg.pop('edge_margin', 2)
+            factor = merge_cfg.pop('edge_factor', 0.5)
+            bboxes = shifted_instances.bboxes
+            patch_boxes = torch.stack([
+                shift_bboxes(
+                    bboxes.new_tensor([0, 0, r.ori_shape[1], r.ori_shape[0]]),
+                    offset) for r, offset in zip(results, offsets)
+            ])
+            num_insts = [len(r.pred_instances) for r in results]
+            patch_boxes = patch_boxes.repeat_interleave(
+                bboxes.new_tensor(num_insts, dtype=torch.long), dim=0)
+            truncated = _truncated_by_patch(bboxes, patch_boxes,
+                                            src_image_shape, margin)
+            scores = torch.where(truncated, scores * factor, scores)
+            merge_cfg['type'] = 'nms'
+        else:
+            merge_cfg['type'] = merge_type
+
+        dets, keeps = batched_nms(
+            boxes=shifted_instances.bboxes,
+            scores=scores,
+            idxs=shifted_instances.labels,
+            nms_cfg=merge_cfg)
+        merged_instances = shifted_instances[keeps]
+        if merge_type == 'soft_nms':
+            # soft nms decays the scores of the overlapping boxes
+            merged_instances.scores = dets[:, -1]
+
+    merged_result = results[0].clone()
+    merged_result.set_metainfo(
+        dict(img_shape=src_image_shape, ori_shape=src_image_shape))
+    merged_result.pred_instances = merged_instances
+    return merged_result
+
+
 def merge_results_by_nms(results: SampleList, offsets: Sequence[Tuple[int,
                                                                       int]],
                          src_image_shape: Tuple[int, int],
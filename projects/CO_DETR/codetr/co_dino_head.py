@@ -510,116 +510,104 @@ class CoDINOHead(DINOHead):
         coords, labels, targets = pos_coords[:3]
         head_name = pos_coords[-1]
         bs, c = len(coords), mlvl_feats[0].shape[1]
-        max_num_coords = 0
-        all_feats = []
-        for i in range(bs):
-            label = labels[i]
-            feats = [
-                feat[i].reshape(c, -1).transpose(1, 0) for feat in mlvl_feats
-            ]
-            feats = torch.cat(feats, dim=0)
-            bg_class_ind = self.num_classes
-            pos_inds = ((label >= 0)
-                        & (label < bg_class_ind)).nonzero().squeeze(1)
-            max_num_coords = max(max_num_coords, len(pos_inds))
-            all_feats.append(feats)
-        max_num_coords = min(self.max_pos_coords, max_num_coords)
-        max_num_coords = max(9, max_num_coords)
-
-        if self.use_zero_padding:
-            attn_masks = []
-            label_weights = coords[0].new_zeros([bs, max_num_coords])
-        else:
-            attn_masks = None
-            label_weights = coords[0].new_ones([bs, max_num_coords])
-        bbox_weights = coords[0].new_zeros([bs, max_num_coords, 4])
+        bg_class_ind = self.num_classes
 
-        aux_coords, aux_labels, aux_targets, aux_feats = [], [], [], []
+        # concatenate the coords of all the images, the coords of an image
+        # start at its offset
+        num_coords = [len(label) for label in labels]
+        all_coords = torch.cat(list(coords), dim=0)
+        all_labels = torch.cat(list(labels), dim=0)
+        all_targets = torch.cat(list(targets), dim=0)
+        device = all_labels.device
+        coord_offsets = all_labels.new_tensor([0] + num_coords[:-1]).cumsum(0)
+        coord_img_ids = torch.arange(
+            bs, device=device).repeat_interleave(
+                all_labels.new_tensor(num_coords))
+        pos_mask = (all_labels >= 0) & (all_labels < bg_class_ind)
+        neg_mask = all_labels == bg_class_ind
+        num_pos, num_neg = torch.stack([
+            torch.bincount(coord_img_ids[pos_mask], minlength=bs),
+            torch.bincount(coord_img_ids[neg_mask], minlength=bs)
+        ]).tolist()
+        max_num_coords = min(self.max_pos_coords, max(num_pos))
+        max_num_coords = max(9, max_num_coords)
 
+        # sample the positives of each image, which are padded with sampled
+        # negatives if zero padding is not used
+        pos_inds_list = pos_mask.nonzero().squeeze(1).split(num_pos)
+        neg_inds_list = neg_mask.nonzero().squeeze(1).split(num_neg)
+        inds_list, num_valid = [], []
         for i in range(bs):
-            coord, label, target = coords[i], labels[i], targets[i]
-            feats = all_feats[i]
-            if 'rcnn' in head_name:
-                feats = pos_coords[-2][i]
-                num_coords_per_point = 1
-            else:
-                num_coords_per_point = coord.shape[0] // feats.shape[0]
-            feats = feats.unsqueeze(1).repeat(1, num_coords_per_point, 1)
-            feats = feats.reshape(feats.shape[0] * num_coords_per_point,
-                                  feats.shape[-1])
-            img_meta = img_metas[i]
-            img_h, img_w = img_meta['img_shape']
-            factor = coord.new_tensor([img_w, img_h, img_w,
-                                       img_h]).unsqueeze(0)
-            bg_class_ind = self.num_classes
-            pos_inds = ((label >= 0)
-                        & (label < bg_class_ind)).nonzero().squeeze(1)
-            neg_inds = (label == bg_class_ind).nonzero().squeeze(1)
+            pos_inds = pos_inds_list[i]
             if pos_inds.shape[0] > max_num_coords:
-                indices = torch.randperm(
-                    pos_inds.shape[0])[:max_num_coords].cuda()
-                pos_inds = pos_inds[indices]
-
-            coord = bbox_xyxy_to_cxcywh(coord[pos_inds] / factor)
-            label = label[pos_inds]
-            target = bbox_xyxy_to_cxcywh(target[pos_inds] / factor)
-            feat = feats[pos_inds]
-
-            if self.use_zero_padding:
-                label_weights[i][:len(label)] = 1
-                bbox_weights[i][:len(label)] = 1
-                attn_mask = torch.zeros([
-                    max_num_coords,
-                    max_num_coords,
-                ]).bool().to(coord.device)
-            else:
-                bbox_weights[i][:len(label)] = 1
-
-            if coord.shape[0] < max_num_coords:
-                padding_shape = max_num_coords - coord.shape[0]
-                if self.use_zero_padding:
-                    padding_coord = coord.new_zeros([padding_shape, 4])
-                    padding_label = label.new_ones([padding_shape
-                                                    ]) * self.num_classes
-                    padding_target = target.new_zeros([padding_shape, 4])
-                    padding_feat = feat.new_zeros([padding_shape, c])
-                    attn_mask[coord.shape[0]:, 0:coord.shape[0], ] = True
-                    attn_mask[:, coord.shape[0]:, ] = True
-                else:
-                    indices = torch.randperm(
-                        neg_inds.shape[0])[:padding_shape].cuda()
-                    neg_inds = neg_inds[indices]
-                    padding_coord = bbox_xyxy_to_cxcywh(coords[i][neg_inds] /
-                                                        factor)
-                    padding_label = labels[i][neg_inds]
-                    padding_target = bbox_xyxy_to_cxcywh(targets[i][neg_inds] /
-                                                         factor)
-                    padding_feat = feats[neg_inds]
-                coord = torch.cat((coord, padding_coord), dim=0)
-                label = torch.cat((label, padding_label), dim=0)
-                target = torch.cat((target, padding_target), dim=0)
-                feat = torch.cat((feat, padding_feat), dim=0)
-            if self.use_zero_padding:
-                attn_masks.append(attn_mask.unsqueeze(0))
-            aux_coords.append(coord.unsqueeze(0))
-            aux_labels.append(label.unsqueeze(0))
-            aux_targets.append(target.unsqueeze(0))
-            aux_feats.append(feat.unsqueeze(0))
+                indices = torch.randperm(pos_inds.shape[0])[:max_num_coords]
+                pos_inds = pos_inds[indices.to(device)]
+            num_pos[i] = num_valid_i = pos_inds.shape[0]
+            inds_list.append(pos_inds)
+            if num_pos[i] < max_num_coords and not self.use_zero_padding:
+                padding_shape = max_num_coords - num_pos[i]
+                neg_inds = neg_inds_list[i]
+                indices = torch.randperm(neg_inds.shape[0])[:padding_shape]
+                inds_list.append(neg_inds[indices.to(device)])
+                num_valid_i += inds_list[-1].shape[0]
+            num_valid.append(num_valid_i)
+        inds = torch.cat(inds_list)
+        img_ids = coord_img_ids[inds]
+        slots = torch.arange(max_num_coords, device=device)
+        valid_mask = slots < all_labels.new_tensor(num_valid)[:, None]
+        pos_valid_mask = slots < all_labels.new_tensor(num_pos)[:, None]
+
+        if 'rcnn' in head_name:
+            feats = torch.cat(list(pos_coords[-2]), dim=0)[inds]
+        else:
+            # each point has the same number of coords in an image
+            num_points = sum(feat.shape[2:].numel() for feat in mlvl_feats)
+            num_coords_per_point = all_labels.new_tensor(
+                num_coords) // num_points
+            point_inds = (
+                inds - coord_offsets[img_ids]) // num_coords_per_point[img_ids]
+            # gather the sampled points from the features of each level
+            # instead of flattening all the features
+            feats, start = None, 0
+            for feat in mlvl_feats:
+                feat = feat.flatten(2)
+                end = start + feat.shape[2]
+                level_inds = (point_inds - start).clamp(0, end - start - 1)
+                level_feats = feat[img_ids, :, level_inds]
+                feats = level_feats if feats is None else torch.where(
+                    (point_inds >= start)[:, None], level_feats, feats)
+                start = end
+
+        factors = all_coords.new_tensor([[
+            img_meta['img_shape'][1], img_meta['img_shape'][0],
+            img_meta['img_shape'][1], img_meta['img_shape'][0]
+        ] for img_meta in img_metas])[img_ids]
+
+        # gather the sampled coords into the padded targets of the batch
+        aux_coords = all_coords.new_zeros([bs, max_num_coords, 4])
+        aux_coords[valid_mask] = bbox_xyxy_to_cxcywh(all_coords[inds] /
+                                                     factors)
+        aux_labels = all_labels.new_full([bs, max_num_coords], bg_class_ind)
+        aux_labels[valid_mask] = all_labels[inds]
+        aux_targets = all_targets.new_zeros([bs, max_num_coords, 4])
+        aux_targets[valid_mask] = bbox_xyxy_to_cxcywh(all_targets[inds] /
+                                                      factors)
+        aux_feats = feats.new_zeros([bs, max_num_coords, c])
+        aux_feats[valid_mask] = feats
 
         if self.use_zero_padding:
-            attn_masks = torch.cat(
-                attn_masks, dim=0).unsqueeze(1).repeat(1, 8, 1, 1)
+            aux_label_weights = pos_valid_mask.to(all_coords.dtype)
+            # the padded coords neither attend nor are attended to
+            invalid_mask = ~pos_valid_mask
+            attn_masks = invalid_mask[:, :, None] | invalid_mask[:, None, :]
+            attn_masks = attn_masks.unsqueeze(1).repeat(1, 8, 1, 1)
             attn_masks = attn_masks.reshape(bs * 8, max_num_coords,
                                             max_num_coords)
         else:
+            aux_label_weights = all_coords.new_ones([bs, max_num_coords])
             attn_masks = None
-
-        aux_coords = torch.cat(aux_coords, dim=0)
-        aux_labels = torch.cat(aux_labels, dim=0)
-        aux_targets = torch.cat(aux_targets, dim=0)
-        aux_feats = torch.cat(aux_feats, dim=0)
-        aux_label_weights = label_weights
-        aux_bbox_weights = bbox_weights
+        aux_bbox_weights = pos_valid_mask.unsqueeze(-1).repeat(1, 1, 4).to(
+            all_coords.dtype)
         return (aux_coords, aux_labels, aux_targets, aux_label_weights,
                 aux_bbox_weights, aux_feats, attn_masks)
 
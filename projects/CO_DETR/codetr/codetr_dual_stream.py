@@ -1,6 +1,6 @@
 import copy
 from turtle import forward
-from typing import Any, Mapping, Tuple, Union
+from typing import Any, List, Mapping, Tuple, Union
 
 import cv2
 from mmengine.optim import OptimWrapper
@@ -13,10 +13,25 @@ from mmdet.models.detectors.base import BaseDetector
 from mmdet.registry import MODELS
 from mmdet.structures import OptSampleList, SampleList
 from mmdet.utils import InstanceList, OptConfigType, OptMultiConfig
+from .dual_stream_fusion import (FUSION_MODES, disable_stages, forward_stage,
+                                 forward_stem, fuse_states, num_stages)
 # from .dual_resnet import Dual_ResNet
 
 @MODELS.register_module()
 class CoDETR_Dual(BaseDetector):
+    """CoDETR with an RGB and a TIR stream.
+
+    The streams are fused in the backbone according to ``fusion``:
+
+    - ``dict(mode='late')``: two backbones and the features of each level
+      are summed, which is the default.
+    - ``dict(mode='shared')``: a single backbone, the two streams are run in
+      one batch of 2N images and the features are summed.
+    - ``dict(mode='early', stage=k)``: the streams have their own stem and
+      first ``k`` stages, then their features are summed and the stages from
+      ``k`` on of ``backbone1`` continue as a single trunk. Only ResNet and
+      SwinTransformer are supported.
+    """
 
     def __init__(
             self,
@@ -35,6 +50,7 @@ class CoDETR_Dual(BaseDetector):
             eval_module='detr',
             # Evaluate the Nth head.
             eval_index=0,
+            fusion: OptConfigType = None,
             data_preprocessor: OptConfigType = None,
             init_cfg: OptMultiConfig = None):
         super(CoDETR_Dual, self).__init__(
@@ -45,8 +61,22 @@ class CoDETR_Dual(BaseDetector):
         assert eval_module in ['detr', 'one-stage', 'two-stage']
         self.eval_module = eval_module
 
+        fusion = dict(mode='late') if fusion is None else fusion
+        self.fusion_mode = fusion.get('mode', 'late')
+        assert self.fusion_mode in FUSION_MODES, \
+            f'fusion mode should be one of {FUSION_MODES}, ' \
+            f'but got {self.fusion_mode}'
+        self.fusion_stage = fusion.get('stage', None)
+
         self.backbone1 = MODELS.build(backbone)
-        self.backbone2 = MODELS.build(backbone)
+        if self.fusion_mode != 'shared':
+            self.backbone2 = MODELS.build(backbone)
+        if self.fusion_mode == 'early':
+            assert 0 < self.fusion_stage < num_stages(self.backbone1), \
+                'the streams should be fused after one of the stages but ' \
+                'the last one'
+            # the trunk after the fusion is the one of ``backbone1``
+            disable_stages(self.backbone2, self.fusion_stage)
         
         if neck is not None:
             self.neck = MODELS.build(neck)
@@ -122,7 +152,9 @@ class CoDETR_Dual(BaseDetector):
         if copy_ori:
             for k, v in zip(ori_backbone_key, ori_backbone_params):
                 state_dict[k.replace("backbone", "backbone1")] = v
-                state_dict[k.replace("backbone", "backbone2")] = copy.deepcopy(v)
+                if hasattr(self, 'backbone2'):
+                    state_dict[k.replace("backbone", "backbone2")] = \
+                        copy.deepcopy(v)
                 # state_dict[k.replace("neck", "neck1")] = v
                 # state_dict[k.replace("neck", "neck2")] = copy.deepcopy(v)
                 del state_dict[k]
@@ -228,12 +260,21 @@ class CoDETR_Dual(BaseDetector):
             tuple[Tensor]: Tuple of feature maps from neck. Each feature map
             has shape (bs, dim, H, W).
         """
-                
-        x = list(self.backbone1(batch_inputs))
-        y = list(self.backbone2(batch_inputs2))
-        # z = x
-        
-        z = [i + j for i, j in zip(x, y)]
+        if self.fusion_mode == 'early':
+            z = self._early_fusion(batch_inputs, batch_inputs2)
+        elif self.fusion_mode == 'shared' and \
+                batch_inputs.shape == batch_inputs2.shape:
+            num_imgs = batch_inputs.size(0)
+            feats = self.backbone1(torch.cat([batch_inputs, batch_inputs2]))
+            z = [feat[:num_imgs] + feat[num_imgs:] for feat in feats]
+        else:
+            backbone2 = self.backbone1 if self.fusion_mode == 'shared' \
+                else self.backbone2
+            x = list(self.backbone1(batch_inputs))
+            y = list(backbone2(batch_inputs2))
+            # z = x
+
+            z = [i + j for i, j in zip(x, y)]
 
 
         if self.with_neck:
@@ -244,11 +285,36 @@ class CoDETR_Dual(BaseDetector):
   
         return z
 
+    def _early_fusion(self, batch_inputs: Tensor,
+                      batch_inputs2: Tensor) -> List[Tensor]:
+        """Run the first ``fusion_stage`` stages of each stream, then the
+        remaining stages of ``backbone1`` on the sum of the streams."""
+        state1 = forward_stem(self.backbone1, batch_inputs)
+        state2 = forward_stem(self.backbone2, batch_inputs2)
+        outs = []
+        for i in range(self.fusion_stage):
+            state1, out1 = forward_stage(self.backbone1, i, state1)
+            state2, out2 = forward_stage(self.backbone2, i, state2)
+            if out1 is not None:
+                outs.append(out1 + out2)
+        state = fuse_states(state1, state2)
+        for i in range(self.fusion_stage, num_stages(self.backbone1)):
+            state, out = forward_stage(self.backbone1, i, state)
+            if out is not None:
+                outs.append(out)
+        return outs
+
     def _forward(self,
                  batch_inputs: Tensor,
                  batch_inputs2: Tensor,
                  batch_data_samples: OptSampleList = None):
-        pass
+        """Network forward process, only the fused features are returned,
+        e.g. to count the FLOPs of the backbones and the neck.
+
+        Returns:
+            tuple[Tensor]: Multi-level features from the neck.
+        """
+        return tuple(self.extract_feat(batch_inputs, batch_inputs2))
 
     # def forward():
     #     pass
@@ -0,0 +1,96 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""Run a backbone stage by stage, so that the RGB and TIR streams of a dual-
+stream detector can be fused after any stage.
+
+The stem and the stages of :class:`ResNet` and :class:`SwinTransformer` are
+exposed with a common interface. The state passed between the stages is a
+tensor for ResNet and a tuple of the tokens and their spatial shape for Swin.
+"""
+from typing import Optional, Tuple, Union
+
+import torch.nn as nn
+from torch import Tensor
+
+from mmdet.models.backbones import ResNet, SwinTransformer
+
+FUSION_MODES = ('late', 'shared', 'early')
+
+State = Union[Tensor, Tuple[Tensor, Tuple[int, int]]]
+
+
+def _check_backbone(backbone: nn.Module) -> None:
+    if not isinstance(backbone, (ResNet, SwinTransformer)):
+        raise NotImplementedError(
+            'The early fusion only supports ResNet and SwinTransformer, '
+            f'but got {backbone.__class__.__name__}')
+
+
+def num_stages(backbone: nn.Module) -> int:
+    """Number of the stages of the backbone."""
+    _check_backbone(backbone)
+    if isinstance(backbone, ResNet):
+        return len(backbone.res_layers)
+    return len(backbone.stages)
+
+
+def forward_stem(backbone: nn.Module, x: Tensor) -> State:
+    """Forward the layers before the first stage."""
+    _check_backbone(backbone)
+    if isinstance(backbone, ResNet):
+        if backbone.deep_stem:
+            x = backbone.stem(x)
+        else:
+            x = backbone.relu(backbone.norm1(backbone.conv1(x)))
+        return backbone.maxpool(x)
+
+    x, hw_shape = backbone.patch_embed(x)
+    if backbone.use_abs_pos_embed:
+        x = x + backbone.absolute_pos_embed
+    return backbone.drop_after_pos(x), hw_shape
+
+
+def forward_stage(backbone: nn.Module, i: int,
+                  state: State) -> Tuple[State, Optional[Tensor]]:
+    """Forward the i-th stage.
+
+    Returns:
+        tuple: The state passed to the next stage, and the output feature map
+        of this stage, which is None if ``i`` is not in the ``out_indices`` of
+        the backbone.
+    """
+    if isinstance(backbone, ResNet):
+        x = getattr(backbone, backbone.res_layers[i])(state)
+        return x, x if i in backbone.out_indices else None
+
+    x, hw_shape, out, out_hw_shape = backbone.stages[i](*state)
+    if i not in backbone.out_indices:
+        return (x, hw_shape), None
+    out = getattr(backbone, f'norm{i}')(out)
+    out = out.view(-1, *out_hw_shape,
+                   backbone.num_features[i]).permute(0, 3, 1, 2).contiguous()
+    return (x, hw_shape), out
+
+
+def fuse_states(state1: State, state2: State) -> State:
+    """Sum the states of two streams."""
+    if isinstance(state1, Tensor):
+        return state1 + state2
+    assert state1[1] == state2[1], \
+        'The streams should have the same shape to be fused.'
+    return state1[0] + state2[0], state1[1]
+
+
+def disable_stages(backbone: nn.Module, start: int) -> None:
+    """Stop the gradients of the stages from ``start`` on, which are not used
+    once the streams have been fused into another trunk.
+
+    The modules are kept so that the pretrained weights can still be loaded.
+    """
+    num = num_stages(backbone)
+    for i in range(start, num):
+        if isinstance(backbone, ResNet):
+            getattr(backbone, backbone.res_layers[i]).requires_grad_(False)
+        else:
+            backbone.stages[i].requires_grad_(False)
+            if i in backbone.out_indices:
+                getattr(backbone, f'norm{i}').requires_grad_(False)
@@ -0,0 +1,10 @@
+_base_ = ['co_dino_5scale_swin_l_16xb1_16e_gaiic_dual_stream.py']
+
+# The RGB and TIR streams have their own patch embedding and first two Swin-L
+# stages, then they are summed and the last two stages of ``backbone1``
+# continue as a single trunk. Compare with the late fusion of the base config
+# by:
+#   python tools/analysis_tools/get_flops.py ${CONFIG}
+#   python tools/analysis_tools/benchmark.py ${CONFIG} --checkpoint ${CKPT} \
+#       --task inference
+model = dict(fusion=dict(mode='early', stage=2))
@@ -0,0 +1,8 @@
+_base_ = ['co_dino_5scale_swin_l_16xb1_16e_gaiic_dual_stream.py']
+
+# A single Swin-L shared by the RGB and TIR streams, which are run in one
+# batch of 2N images. Compare with the late fusion of the base config by:
+#   python tools/analysis_tools/get_flops.py ${CONFIG}
+#   python tools/analysis_tools/benchmark.py ${CONFIG} --checkpoint ${CKPT} \
+#       --task inference
+model = dict(fusion=dict(mode='shared'))
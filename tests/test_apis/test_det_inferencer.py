@@ -85,6 +85,13 @@ class TestDetInferencer(TestCase):
         res_bs3 = inferencer(img_dir, batch_size=3, return_vis=True)
         self.assert_predictions_equal(res_bs1['predictions'],
                                       res_bs3['predictions'])
+        # pipelined loading and dumping
+        res_workers = inferencer(
+            img_dir, batch_size=3, return_vis=True, num_workers=2)
+        self.assert_predictions_equal(res_bs1['predictions'],
+                                      res_workers['predictions'])
+        self.assertEqual(
+            len(res_workers['visualization']), len(res_bs1['visualization']))
 
         # There is a jitter operation when the mask is drawn,
         # so it cannot be asserted.
@@ -93,6 +100,35 @@ class TestDetInferencer(TestCase):
                                                 res_bs3['visualization']):
                 self.assertTrue(np.allclose(res_bs1_vis, res_bs3_vis))
 
+    @mock.patch('mmengine.infer.infer._load_checkpoint', return_value=None)
+    def test_pair_inputs(self, mock):
+        inferencer = DetInferencer('rtmdet-t', pair_rule=('/rgb/', '/tir/'))
+        self.assertEqual(
+            inferencer._inputs_to_list('data/rgb/1.jpg'),
+            [dict(img_path='data/rgb/1.jpg', img_path2='data/tir/1.jpg')])
+        # two images of a single-stream model
+        inferencer.pair_rule = None
+        self.assertFalse(inferencer.with_img2)
+        self.assertEqual(
+            inferencer._inputs_to_list(('a.jpg', 'b.jpg')), ['a.jpg', 'b.jpg'])
+        # explicit pairs when the pipeline loads a second stream
+        inferencer.with_img2 = True
+        self.assertEqual(
+            inferencer._inputs_to_list(('a.jpg', 'b.jpg')),
+            [dict(img_path='a.jpg', img_path2='b.jpg')])
+        img, img2 = np.zeros((4, 4, 3)), np.ones((4, 4, 3))
+        inputs = inferencer._inputs_to_list([(img, img2), (img2, img)])
+        self.assertEqual(len(inputs), 2)
+        self.assertIs(inputs[1]['img'], img2)
+        self.assertIs(inputs[1]['img2'], img)
+        # a tuple of more images is a batch
+        self.assertEqual(
+            inferencer._inputs_to_list(('a.jpg', 'b.jpg', 'c.jpg')),
+            ['a.jpg', 'b.jpg', 'c.jpg'])
+        inferencer.pair_rule = lambda path: path.replace('.jpg', '_ir.jpg')
+        self.assertEqual(
+            inferencer._inputs_to_list(['a.jpg'])[0]['img_path2'], 'a_ir.jpg')
+
     @parameterized.expand([
         'rtmdet-t', 'mask-rcnn_r50_fpn_1x_coco', 'panoptic_fpn_r50_fpn_1x_coco'
     ])
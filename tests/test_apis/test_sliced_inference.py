@@ -0,0 +1,87 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+from unittest import TestCase
+
+import cv2
+import numpy as np
+import torch
+from mmcv.transforms import Compose
+from mmengine.structures import InstanceData
+
+from mmdet.apis import sliced_inference_detector
+from mmdet.datasets.transforms.my_formatting import DoublePackDetInputs
+
+
+class FakeDetector:
+    """Detect the bright squares of the patches, and record the batch
+    sizes."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def test_step(self, data):
+        self.batch_sizes.append(len(data['inputs']))
+        results = []
+        for img, img2, data_sample in zip(data['inputs'], data['inputs2'],
+                                          data['data_samples']):
+            # the streams are cut into the same patches
+            assert torch.equal(img2, 255 - img)
+            mask = (img[0] > 0).numpy().astype(np.uint8)
+            _, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+            x, y, w, h = torch.from_numpy(stats[1:, :4]).float().T
+            data_sample = data_sample.clone()
+            data_sample.pred_instances = InstanceData(
+                bboxes=torch.stack([x, y, x + w, y + h], dim=1),
+                scores=torch.full((len(x), ), 0.9),
+                labels=torch.zeros(len(x), dtype=torch.long))
+            results.append(data_sample)
+        return results
+
+
+class TestSlicedInference(TestCase):
+
+    def test_sliced_inference_detector(self):
+        bboxes = np.array([[10, 10, 50, 40], [90, 30, 130, 60],
+                           [155, 140, 190, 170], [240, 120, 280, 150]])
+        imgs = []
+        for shape in ((200, 300), (180, 250)):
+            img = np.zeros(shape + (3, ), dtype=np.uint8)
+            for x1, y1, x2, y2 in bboxes:
+                img[y1:y2, x1:x2] = 255
+            imgs.append(img)
+        imgs2 = [255 - img for img in imgs]
+
+        detector = FakeDetector()
+        results = sliced_inference_detector(
+            detector,
+            imgs,
+            imgs2,
+            patch_size=100,
+            overlap_ratio=0.25,
+            batch_size=4,
+            merge_cfg=dict(type='edge_nms', iou_threshold=0.1),
+            test_pipeline=Compose([DoublePackDetInputs()]))
+        # 12 and 9 patches in full batches
+        self.assertEqual(detector.batch_sizes, [4] * 5 + [1])
+
+        for img, result in zip(imgs, results):
+            self.assertEqual(result.ori_shape, img.shape[:2])
+            h, w = img.shape[:2]
+            expected = bboxes.copy()
+            expected[:, 0::2] = expected[:, 0::2].clip(0, w)
+            expected = expected[expected[:, 2] > expected[:, 0]]
+            pred = result.pred_instances.bboxes.numpy()
+            pred = pred[np.lexsort(pred.T[::-1])]
+            np.testing.assert_array_equal(pred, expected)
+
+        # the results of the patches
+        result, patch_results, offsets = sliced_inference_detector(
+            FakeDetector(),
+            imgs[0],
+            imgs2[0],
+            patch_size=100,
+            overlap_ratio=0.25,
+            test_pipeline=Compose([DoublePackDetInputs()]),
+            return_patch_results=True)
+        self.assertEqual(result.ori_shape, (200, 300))
+        self.assertEqual(len(patch_results), len(offsets))
+        self.assertEqual(len(offsets), 12)
@@ -1,5 +1,7 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+import tempfile
 import unittest
+from unittest.mock import patch
 
 from mmdet.datasets import CocoDataset
 
@@ -46,3 +48,50 @@ class TestCocoDataset(unittest.TestCase):
                 ann_file='tests/data/coco_wrong_format_sample.json',
                 metainfo=metainfo,
                 pipeline=[])
+
+    def test_coco_dataset_cache(self):
+        cfg = dict(
+            data_prefix=dict(img='imgs'),
+            ann_file='tests/data/coco_sample.json',
+            metainfo=dict(classes=('bus', 'car')),
+            filter_cfg=dict(filter_empty_gt=True, min_size=32),
+            pipeline=[])
+        dataset = CocoDataset(**cfg)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cached = CocoDataset(cache_dir=tmp_dir, **cfg)
+            self.assertEqual(len(cached), len(dataset))
+            self.assertEqual(cached.cat_ids, dataset.cat_ids)
+            for i in range(len(dataset)):
+                self.assertEqual(
+                    cached.get_data_info(i), dataset.get_data_info(i))
+
+            # the annotations are not parsed again
+            with patch.object(CocoDataset, 'load_data_list') as mock:
+                cached = CocoDataset(cache_dir=tmp_dir, indices=[1, 0], **cfg)
+                mock.assert_not_called()
+            self.assertEqual(cached.cat_ids, dataset.cat_ids)
+            self.assertEqual(cached.cat2label, dataset.cat2label)
+            self.assertEqual(len(cached), 2)
+            data_info = dataset.get_data_info(0)
+            data_info['sample_idx'] = 1
+            self.assertEqual(cached.get_data_info(1), data_info)
+            self.assertEqual(cached.get_data_info(-1), data_info)
+            self.assertListEqual(cached.get_cat_ids(0), dataset.get_cat_ids(1))
+
+            # subsets share the annotation cache
+            subset = cached.get_subset([1])
+            self.assertIs(subset.ann_cache, cached.ann_cache)
+            self.assertEqual(len(subset), 1)
+            self.assertEqual(
+                subset.get_data_info(0)['img_path'],
+                dataset.get_data_info(0)['img_path'])
+            cached.get_subset_(-1)
+            self.assertEqual(len(cached), 1)
+            self.assertEqual(
+                cached.get_data_info(0)['img_path'],
+                dataset.get_data_info(0)['img_path'])
+
+            # another filter_cfg has another cache
+            cached = CocoDataset(
+                cache_dir=tmp_dir, **dict(cfg, filter_cfg=None))
+            self.assertEqual(len(cached), 4)
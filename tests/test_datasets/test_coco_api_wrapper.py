@@ -2,9 +2,11 @@ import os.path as osp
 import tempfile
 import unittest
 
+import numpy as np
 from mmengine.fileio import dump
 
-from mmdet.datasets.api_wrappers import COCOPanoptic
+from mmdet.datasets.api_wrappers import (COCO, COCOeval, COCOevalFast,
+                                         COCOevalMP, COCOPanoptic)
 
 
 class TestCOCOPanoptic(unittest.TestCase):
@@ -65,3 +67,93 @@ class TestCOCOPanoptic(unittest.TestCase):
         api.load_anns(1)
 
         self.assertIsNone(api.load_anns(0.1))
+
+
+def _create_coco():
+    rng = np.random.RandomState(0)
+    images, annotations, results = [], [], []
+    for img_id in range(20):
+        images.append(dict(id=img_id, width=200, height=200))
+        for _ in range(rng.randint(0, 6)):
+            x, y = rng.rand(2) * 150
+            w, h = rng.rand(2) * 50 + 2
+            category_id = int(rng.randint(1, 4))
+            annotations.append(
+                dict(
+                    id=len(annotations) + 1,
+                    image_id=img_id,
+                    category_id=category_id,
+                    bbox=[x, y, w, h],
+                    area=w * h,
+                    iscrowd=int(rng.rand() < 0.1)))
+            # a jittered detection of each ground truth, and a false one
+            results.append(
+                dict(
+                    image_id=img_id,
+                    category_id=category_id,
+                    bbox=[x + rng.randn(), y + rng.randn(), w, h],
+                    score=float(rng.rand())))
+            results.append(
+                dict(
+                    image_id=img_id,
+                    category_id=int(rng.randint(1, 4)),
+                    bbox=(rng.rand(4) * 100 + 2).tolist(),
+                    score=float(rng.rand())))
+    coco = COCO()
+    coco.dataset = dict(
+        images=images,
+        annotations=annotations,
+        categories=[dict(id=i, name=str(i)) for i in range(1, 4)])
+    coco.createIndex()
+    return coco, results
+
+
+class TestCOCOevalMP(unittest.TestCase):
+
+    def test_evaluate(self):
+        coco, results = _create_coco()
+        coco_eval = COCOeval(coco, coco.loadRes(results), 'bbox')
+        coco_eval.evaluate()
+        coco_eval.accumulate()
+        coco_eval.summarize()
+
+        for nproc in (1, 2):
+            coco_eval_mp = COCOevalMP(
+                coco, coco.loadRes(results), 'bbox', nproc=nproc)
+            coco_eval_mp.evaluate()
+            coco_eval_mp.accumulate()
+            coco_eval_mp.summarize()
+            np.testing.assert_allclose(coco_eval_mp.stats, coco_eval.stats)
+
+
+class TestCOCOevalFast(unittest.TestCase):
+
+    def test_evaluate(self):
+        coco, results = _create_coco()
+        # the ties of the scores and a duplicated ground truth
+        for result in results[::3]:
+            result['score'] = 0.5
+        annotation = dict(coco.dataset['annotations'][0])
+        annotation['id'] = len(coco.dataset['annotations']) + 1
+        coco.dataset['annotations'].append(annotation)
+        coco.createIndex()
+
+        for use_cats, max_dets in ((1, [1, 10, 100]), (0, [2, 5, 10])):
+            coco_evals = []
+            for evaluator in (COCOeval, COCOevalFast):
+                coco_eval = evaluator(coco, coco.loadRes(results), 'bbox')
+                coco_eval.params.useCats = use_cats
+                coco_eval.params.maxDets = max_dets
+                coco_eval.evaluate()
+                coco_eval.accumulate()
+                coco_eval.summarize()
+                coco_evals.append(coco_eval)
+            for key in ('precision', 'recall', 'scores'):
+                np.testing.assert_allclose(
+                    coco_evals[1].eval[key], coco_evals[0].eval[key],
+                    atol=1e-4)
+            np.testing.assert_allclose(
+                coco_evals[1].stats, coco_evals[0].stats, atol=1e-4)
+
+        with self.assertRaises(NotImplementedError):
+            COCOevalFast(coco, coco.loadRes(results), 'segm')
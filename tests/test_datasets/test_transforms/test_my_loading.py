@@ -0,0 +1,192 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import multiprocessing
+import os
+import os.path as osp
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+from mmcv.transforms import LoadImageFromFile
+from mmengine.fileio import get
+
+from mmdet.datasets.transforms.my_loading import (
+    InferencerLoader2, LoadImageFromFile2, LoadImageFromFileCached,
+    LoadPairedImagesFromShards, PairedImageShards, SharedImageCache)
+
+
+class TestLoadPairedImagesFromShards(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_root = self.tmp_dir.name
+        rng = np.random.RandomState(0)
+        self.results = []
+        for stream in ('rgb', 'tir'):
+            os.makedirs(osp.join(self.data_root, stream))
+        for i in range(3):
+            paths = [
+                osp.join(self.data_root, stream, f'{i}.png')
+                for stream in ('rgb', 'tir')
+            ]
+            for path in paths:
+                cv2.imwrite(path, rng.randint(0, 256, (40, 50 + i, 3)))
+            self.results.append(dict(img_path=paths[0], img_path2=paths[1]))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _build(self, **kwargs):
+        shard_dir = osp.join(self.data_root, 'shards')
+        pairs = []
+        for results in self.results:
+            key = osp.relpath(results['img_path'], self.data_root)
+            pairs.append(
+                (key, get(results['img_path']), get(results['img_path2'])))
+        self.assertEqual(
+            PairedImageShards.build(pairs, shard_dir, **kwargs), 3)
+        return shard_dir
+
+    def test_transform(self):
+        load = LoadImageFromFile()
+        load2 = LoadImageFromFile2()
+        # encoded, decoded and a shard per pair
+        for kwargs in (dict(), dict(decode=True), dict(shard_size=1)):
+            shard_dir = self._build(**kwargs)
+            transform = LoadPairedImagesFromShards(
+                shard_dir, data_root=self.data_root)
+            for results in self.results:
+                expected = load2(load(dict(results)))
+                out = transform(dict(results))
+                for key in ('img', 'img2'):
+                    self.assertTrue(np.array_equal(out[key], expected[key]))
+                    self.assertEqual(out[f'img_shape{key[3:]}'],
+                                     expected[f'img_shape{key[3:]}'])
+            if kwargs.get('shard_size'):
+                self.assertTrue(
+                    osp.exists(osp.join(shard_dir, 'shard_00002.bin')))
+
+        transform = LoadPairedImagesFromShards(
+            shard_dir, data_root=self.data_root, to_float32=True)
+        self.assertEqual(
+            transform(dict(self.results[0]))['img2'].dtype, np.float32)
+        self.assertIn('rgb/0.png', transform.shards)
+        self.assertEqual(len(transform.shards), 3)
+
+
+def _insert(cache_dir, key):
+    cache = SharedImageCache(
+        'cache', max_bytes=3000, slot_bytes=1000, cache_dir=cache_dir)
+    cache.insert(key, np.full((10, 10), len(key), dtype=np.uint8))
+
+
+class TestSharedImageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_cache(self):
+        cache = SharedImageCache(
+            'cache',
+            max_bytes=3000,
+            slot_bytes=1000,
+            cache_dir=self.tmp_dir.name)
+        img = np.arange(300, dtype=np.uint8).reshape(10, 10, 3)
+        self.assertIsNone(cache.lookup('a'))
+        self.assertTrue(cache.insert('a', img))
+        out = cache.lookup('a')
+        self.assertTrue(np.array_equal(out, img))
+        self.assertFalse(out.flags.writeable)
+        self.assertTrue(cache.lookup('a', copy=True).flags.writeable)
+        # too large or unsupported
+        self.assertFalse(cache.insert('b', np.zeros((20, 20, 3), np.uint8)))
+        self.assertFalse(cache.insert('b', np.zeros((2, 2), np.int64)))
+
+        img16 = np.arange(400, dtype=np.uint16).reshape(20, 20)
+        cache.insert('b', img16)
+        cache.insert('c', img)
+        # CLOCK: the referenced slots get a second chance, then 'a' is the
+        # oldest one
+        cache.insert('d', img)
+        self.assertIsNone(cache.lookup('a'))
+        self.assertTrue(np.array_equal(cache.lookup('b'), img16))
+        # 'b' has been referenced again
+        cache.insert('e', img)
+        self.assertIsNotNone(cache.lookup('b'))
+        self.assertIsNone(cache.lookup('c'))
+        self.assertEqual(cache.stats(),
+                         dict(hits=4, misses=3, evictions=2, size=3))
+
+        # another arena shape under the same name
+        with self.assertRaisesRegex(ValueError, 'not an image cache'):
+            SharedImageCache(
+                'cache',
+                max_bytes=4000,
+                slot_bytes=1000,
+                cache_dir=self.tmp_dir.name).lookup('a')
+
+    def test_processes(self):
+        ctx = multiprocessing.get_context('fork')
+        with ctx.Pool(2) as pool:
+            pool.starmap(_insert, [(self.tmp_dir.name, key)
+                                   for key in ('a', 'bb', 'ccc')])
+        cache = SharedImageCache(
+            'cache',
+            max_bytes=3000,
+            slot_bytes=1000,
+            cache_dir=self.tmp_dir.name)
+        for key in ('a', 'bb', 'ccc'):
+            self.assertTrue(np.all(cache.lookup(key) == len(key)))
+
+
+class TestLoadImageFromFileCached(unittest.TestCase):
+
+    def test_transform(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = osp.join(tmp_dir, 'img.png')
+            img = np.random.randint(0, 256, (30, 40, 3)).astype(np.uint8)
+            cv2.imwrite(path, img)
+            cache = dict(name='cache', cache_dir=tmp_dir)
+            for suffix in ('', '2'):
+                transform = LoadImageFromFileCached(
+                    cache=cache, suffix=suffix, to_float32=True)
+                for _ in range(2):
+                    results = transform({f'img_path{suffix}': path})
+                    self.assertTrue(
+                        np.array_equal(results[f'img{suffix}'], img))
+                    self.assertEqual(results[f'img{suffix}'].dtype, np.float32)
+                    self.assertEqual(results[f'img_shape{suffix}'], (30, 40))
+            self.assertEqual(transform.cache.stats()['hits'], 3)
+
+            # the decoding arguments are part of the key
+            transform = LoadImageFromFileCached(
+                cache=cache, color_type='grayscale')
+            self.assertEqual(transform({'img_path': path})['img'].ndim, 2)
+
+            # the cached images are writable copies by default
+            transform = LoadImageFromFileCached(cache=cache)
+            for _ in range(2):
+                results = transform({'img_path': path})
+                results['img'][:] = 0
+            results = transform({'img_path': path})
+            self.assertTrue(np.array_equal(results['img'], img))
+            transform = LoadImageFromFileCached(cache=cache, copy=False)
+            self.assertFalse(
+                transform({'img_path': path})['img'].flags.writeable)
+
+
+class TestInferencerLoader2(unittest.TestCase):
+
+    def test_transform(self):
+        transform = InferencerLoader2(to_float32=True)
+        img = np.zeros((20, 30, 3), dtype=np.uint8)
+        results = transform(dict(img2=img))
+        self.assertEqual(results['img2'].dtype, np.float32)
+        self.assertEqual(results['img_shape2'], (20, 30))
+        self.assertEqual(results['ori_shape2'], (20, 30))
+
+        results = transform(dict(img_path2='tests/data/color.jpg'))
+        self.assertEqual(results['img2'].shape[:2], results['ori_shape2'])
@@ -0,0 +1,114 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import copy
+import unittest
+
+import numpy as np
+from mmcv.transforms import Compose
+
+from mmdet.datasets.transforms.my_wrapper import Image2Broadcaster
+from mmdet.structures.bbox import HorizontalBoxes
+from mmdet.utils import register_all_modules
+
+register_all_modules()
+
+
+class TestMultiImageTransforms(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        bboxes = rng.rand(20, 4) * 200
+        bboxes[:, 2:] += bboxes[:, :2]
+        self.results = {
+            'img_path': 'rgb/1.jpg',
+            'img_path2': 'tir/1.jpg',
+            'img_path3': 'tir/1.jpg',
+            'gt_bboxes': HorizontalBoxes(bboxes.astype(np.float32)),
+            'gt_bboxes_labels': np.arange(20),
+            'gt_ignore_flags': np.zeros(20, dtype=bool)
+        }
+        for stream in ('', '2', '3'):
+            img = rng.randint(0, 255, (256, 320, 3), dtype=np.uint8)
+            self.results[f'img{stream}'] = img
+            self.results[f'img_shape{stream}'] = img.shape[:2]
+            self.results[f'ori_shape{stream}'] = img.shape[:2]
+
+    def test_same_as_broadcaster(self):
+        image_size = (300, 300)
+        multi_image = Compose([
+            dict(
+                type='MultiImageRandomResize',
+                scale=image_size,
+                ratio_range=(0.5, 2.0),
+                keep_ratio=True),
+            dict(
+                type='MultiImageRandomCropX',
+                crop_type='absolute_range',
+                crop_size=image_size,
+                allow_negative_crop=True),
+            dict(type='MultiImageRandomFlip', prob=0.5),
+            dict(type='MultiImageRandomFlip', prob=0.5, direction='vertical'),
+            dict(type='MultiImagePad', size=image_size),
+        ])
+        broadcaster = Compose([
+            Image2Broadcaster(transforms=[
+                dict(
+                    type='RandomResize',
+                    scale=image_size,
+                    ratio_range=(0.5, 2.0),
+                    keep_ratio=True),
+                dict(
+                    type='RandomCropX',
+                    crop_type='absolute_range',
+                    crop_size=image_size,
+                    allow_negative_crop=True),
+                dict(type='RandomFlip', prob=0.5),
+                dict(type='RandomFlip', prob=0.5, direction='vertical'),
+            ]),
+            dict(
+                type='Branch', transforms=[dict(type='Pad', size=image_size)])
+        ])
+        for seed in range(10):
+            np.random.seed(seed)
+            results = multi_image(copy.deepcopy(self.results))
+            np.random.seed(seed)
+            expected = broadcaster(copy.deepcopy(self.results))
+            for key in ('img', 'img2', 'img_shape', 'img_shape2',
+                        'scale_factor', 'homography_matrix'):
+                np.testing.assert_allclose(results[key], expected[key])
+            np.testing.assert_allclose(results['gt_bboxes'].numpy(),
+                                       expected['gt_bboxes'].numpy())
+            np.testing.assert_array_equal(results['gt_bboxes_labels'],
+                                          expected['gt_bboxes_labels'])
+            # the third image is not touched
+            np.testing.assert_array_equal(results['img3'],
+                                          self.results['img3'])
+
+    def test_three_images(self):
+        transform = Compose([
+            dict(
+                type='MultiImageResize',
+                scale=(160, 128),
+                img_keys=('img', 'img2', 'img3')),
+            dict(
+                type='MultiImageRandomFlip',
+                prob=1.,
+                img_keys=('img', 'img2', 'img3')),
+            dict(
+                type='MultiImagePad',
+                size=(192, 160),
+                img_keys=('img', 'img2', 'img3')),
+        ])
+        results = transform(copy.deepcopy(self.results))
+        for stream in ('', '2', '3'):
+            self.assertEqual(results[f'img{stream}'].shape, (160, 192, 3))
+            self.assertEqual(results[f'img_shape{stream}'], (160, 192))
+        # boxes are only resized and flipped once
+        expected = self.results['gt_bboxes'].clone()
+        expected.rescale_((0.5, 0.5))
+        expected.clip_((128, 160))
+        expected.flip_((128, 160), 'horizontal')
+        np.testing.assert_allclose(results['gt_bboxes'].numpy(),
+                                   expected.numpy())
+
+        with self.assertRaises(AssertionError):
+            Compose([dict(type='MultiImagePad', img_keys=('img2', 'img'))])
@@ -0,0 +1,95 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import tempfile
+import unittest
+
+import numpy as np
+
+from mmdet.datasets.transforms.my_transforms_possion import (
+    CopyPasteObjectBank, ObjectBank)
+from mmdet.structures.bbox import HorizontalBoxes
+
+
+def _get_sample(seed=0):
+    rng = np.random.RandomState(seed)
+    img = rng.randint(64, 256, (120, 160, 3)).astype(np.uint8)
+    img2 = rng.randint(64, 256, (120, 160, 3)).astype(np.uint8)
+    # a black object
+    img[60:90, 100:140] = 0
+    return {
+        'img':
+        img,
+        'img2':
+        img2,
+        'gt_bboxes':
+        HorizontalBoxes(
+            np.array([[10, 20, 40, 50], [100, 60, 140, 90], [0, 0, 2, 2],
+                      [50, 5, 70, 30]],
+                     dtype=np.float32)),
+        'gt_bboxes_labels':
+        np.array([0, 1, 2, 3], dtype=np.int64),
+        'gt_ignore_flags':
+        np.array([False, False, False, True]),
+    }
+
+
+class TestCopyPasteObjectBank(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.sample = _get_sample()
+        ObjectBank.build([self.sample], self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_object_bank(self):
+        bank = ObjectBank(self.tmp_dir.name)
+        # the black, the too small and the ignored objects are skipped
+        self.assertEqual(len(bank), 1)
+        self.assertEqual(bank.labels.tolist(), [0])
+        patch, patch2, label = bank[0]
+        self.assertEqual(label, 0)
+        np.testing.assert_array_equal(patch, self.sample['img'][20:50, 10:40])
+        np.testing.assert_array_equal(patch2, self.sample['img2'][20:50,
+                                                                  10:40])
+
+    def test_transform(self):
+        patch, patch2, _ = ObjectBank(self.tmp_dir.name)[0]
+        for blend in ('copy', 'feather', 'poisson'):
+            transform = CopyPasteObjectBank(
+                self.tmp_dir.name,
+                prob=1.,
+                num_objects=(2, 2),
+                scale_range=(1., 1.),
+                rotate=False,
+                blend=blend)
+            results = transform(_get_sample(1))
+            self.assertEqual(len(results['gt_bboxes']), 6)
+            self.assertEqual(results['gt_bboxes_labels'][4:].tolist(), [0, 0])
+            self.assertFalse(results['gt_ignore_flags'][4:].any())
+            if blend == 'poisson':
+                continue
+            x1, y1, x2, y2 = results['gt_bboxes'].numpy()[-1].astype(int)
+            self.assertEqual((y2 - y1, x2 - x1), patch.shape[:2])
+            inner = slice(transform.feather, -transform.feather)
+            np.testing.assert_array_equal(
+                results['img'][y1:y2, x1:x2][inner, inner], patch[inner,
+                                                                  inner])
+            np.testing.assert_array_equal(
+                results['img2'][y1:y2, x1:x2][inner, inner], patch2[inner,
+                                                                    inner])
+
+        transform = CopyPasteObjectBank(self.tmp_dir.name, prob=0.)
+        results = transform(_get_sample(1))
+        self.assertEqual(len(results['gt_bboxes']), 4)
+
+    def test_empty_bank(self):
+        # no object can be extracted
+        sample = _get_sample()
+        sample['gt_ignore_flags'][:] = True
+        with tempfile.TemporaryDirectory() as bank_dir:
+            self.assertEqual(ObjectBank.build([sample], bank_dir), 0)
+            self.assertEqual(len(ObjectBank(bank_dir)), 0)
+            transform = CopyPasteObjectBank(bank_dir, prob=1.)
+            results = transform(_get_sample(1))
+            self.assertEqual(len(results['gt_bboxes']), 4)
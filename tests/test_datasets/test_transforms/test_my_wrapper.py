@@ -0,0 +1,110 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import unittest
+
+import numpy as np
+
+from mmdet.datasets.transforms.my_transforms_possion import CLAHE
+from mmdet.datasets.transforms.my_wrapper import (Branch, Branch_three,
+                                                  Image2Broadcaster,
+                                                  Image3Broadcaster)
+from mmdet.structures.bbox import HorizontalBoxes
+from mmdet.utils import register_all_modules
+
+register_all_modules()
+
+
+class TestImageBroadcaster(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.results = {
+            'img_path':
+            'rgb/1.jpg',
+            'img_path2':
+            'tir/1.jpg',
+            'gt_bboxes':
+            HorizontalBoxes(np.array([[10, 20, 30, 60]], dtype=np.float32)),
+            'gt_bboxes_labels':
+            np.array([1], dtype=np.int64),
+            'gt_ignore_flags':
+            np.array([False])
+        }
+        for stream in ('', '2', '3'):
+            img = rng.randint(0, 255, (80, 100, 3), dtype=np.uint8)
+            self.results[f'img{stream}'] = img
+            self.results[f'img_shape{stream}'] = img.shape[:2]
+            self.results[f'ori_shape{stream}'] = img.shape[:2]
+
+    def _get_results(self):
+        # the wrapped transforms update the boxes in place
+        results = self.results.copy()
+        results['gt_bboxes'] = results['gt_bboxes'].clone()
+        return results
+
+    def test_image2_broadcaster(self):
+        transform = Image2Broadcaster(transforms=[
+            dict(type='Resize', scale=(50, 40), keep_ratio=False),
+            dict(type='RandomFlip', prob=0.5)
+        ])
+        resize = Image2Broadcaster(
+            transforms=[dict(type='Resize', scale=(50, 40), keep_ratio=False)])
+        resized = resize(self._get_results())
+        for _ in range(5):
+            results = transform(self._get_results())
+            flip = results['flip']
+            self.assertEqual(results['img_shape2'], (40, 50))
+            self.assertEqual(results['img_path2'], 'tir/1.jpg')
+            # both images are flipped together
+            for key in ('img', 'img2'):
+                expected = resized[key][:, ::-1] if flip else resized[key]
+                np.testing.assert_array_equal(results[key], expected)
+            # the boxes are transformed only once
+            expected_bbox = [[35, 10, 45, 30]] if flip else [[5, 10, 15, 30]]
+            np.testing.assert_allclose(results['gt_bboxes'].numpy(),
+                                       expected_bbox)
+
+    def test_branch(self):
+        transform = Branch(transforms=[dict(type='Pad', size=(128, 96))])
+        results = transform(self._get_results())
+        self.assertEqual(results['img'].shape, (96, 128, 3))
+        self.assertEqual(results['img2'].shape, (96, 128, 3))
+        self.assertEqual(results['img_shape2'], (96, 128))
+        np.testing.assert_array_equal(results['img2'][:80, :100],
+                                      self.results['img2'])
+        self.assertEqual(len(results['gt_bboxes']), 1)
+
+    def test_branch_reading_stream_items(self):
+        # CLAHE reads ``img2`` from the results itself, the views keep it
+        transform = Branch(transforms=[CLAHE(prob=1)])
+        results = transform(self._get_results())
+        np.testing.assert_array_equal(results['img'], self.results['img'])
+        self.assertEqual(results['img2'].shape, self.results['img2'].shape)
+        self.assertEqual(results['img_shape2'], (80, 100))
+
+    def test_three_streams(self):
+        for transform_type in (Image3Broadcaster, Branch_three):
+            transform = transform_type(
+                transforms=[dict(type='RandomFlip', prob=1.)])
+            results = transform(self._get_results())
+            for stream in ('2', '3'):
+                np.testing.assert_array_equal(
+                    results[f'img{stream}'],
+                    self.results[f'img{stream}'][:, ::-1])
+            # the third stream is loaded from ``img_path2``
+            self.assertEqual(results['img_path3'], 'tir/1.jpg')
+            np.testing.assert_allclose(results['gt_bboxes'].numpy(),
+                                       [[70, 20, 90, 60]])
+
+    def test_dropped_sample(self):
+        transform = Image2Broadcaster(transforms=[
+            dict(
+                type='RandomCrop',
+                crop_size=(10, 10),
+                allow_negative_crop=False)
+        ])
+        results = self._get_results()
+        results['gt_bboxes'] = HorizontalBoxes(
+            np.zeros((0, 4), dtype=np.float32))
+        results['gt_bboxes_labels'] = np.zeros((0, ), dtype=np.int64)
+        results['gt_ignore_flags'] = np.zeros((0, ), dtype=bool)
+        self.assertIsNone(transform(results))
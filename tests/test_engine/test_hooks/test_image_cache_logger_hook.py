@@ -0,0 +1,34 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import tempfile
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+import numpy as np
+
+from mmdet.datasets.transforms.my_loading import SharedImageCache
+from mmdet.engine.hooks import ImageCacheLoggerHook
+
+
+class TestImageCacheLoggerHook(TestCase):
+
+    def test_after_train_iter(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                patch.dict(SharedImageCache._instances, clear=True):
+            cache = SharedImageCache(
+                'test_cache', max_bytes=2**20, cache_dir=tmp_dir)
+            cache.lookup('a')
+            cache.insert('a', np.zeros((10, 10), dtype=np.uint8))
+            cache.lookup('a')
+
+            hook = ImageCacheLoggerHook(interval=2)
+            runner = Mock()
+            runner.iter = 0
+            hook.after_train_iter(runner, 0)
+            runner.message_hub.update_scalar.assert_not_called()
+
+            runner.iter = 1
+            hook.after_train_iter(runner, 1)
+            runner.message_hub.update_scalar.assert_any_call(
+                'train/test_cache_hit_rate', 0.5)
+            runner.message_hub.update_scalar.assert_any_call(
+                'train/test_cache_size', 1)
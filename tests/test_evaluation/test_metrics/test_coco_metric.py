@@ -1,3 +1,4 @@
+import os
 import os.path as osp
 import tempfile
 from unittest import TestCase
@@ -373,6 +374,110 @@ class TestCocoMetric(TestCase):
         self.assertTrue(
             osp.isfile(osp.join(self.tmp_dir.name, 'test.gt.json')))
 
+    def test_evaluate_in_memory(self):
+        fake_json_file = osp.join(self.tmp_dir.name, 'fake_data.json')
+        self._create_dummy_coco_json(fake_json_file)
+        dummy_pred = self._create_dummy_results()
+
+        eval_results = []
+        for outfile_prefix in (None, f'{self.tmp_dir.name}/test'):
+            coco_metric = CocoMetric(
+                ann_file=fake_json_file,
+                metric=['bbox', 'segm'],
+                outfile_prefix=outfile_prefix)
+            coco_metric.dataset_meta = dict(classes=['car', 'bicycle'])
+            coco_metric.process({}, [
+                dict(
+                    pred_instances=dummy_pred, img_id=0, ori_shape=(640, 640))
+            ])
+            eval_results.append(coco_metric.evaluate(size=1))
+            if outfile_prefix is None:
+                # nothing is dumped without ``outfile_prefix``
+                self.assertEqual(
+                    os.listdir(self.tmp_dir.name), ['fake_data.json'])
+        self.assertDictEqual(eval_results[0], eval_results[1])
+
+    def test_fast_eval(self):
+        fake_json_file = osp.join(self.tmp_dir.name, 'fake_data.json')
+        self._create_dummy_coco_json(fake_json_file)
+        dummy_pred = self._create_dummy_results()
+
+        eval_results = []
+        for use_fast_eval in (False, True):
+            coco_metric = CocoMetric(
+                ann_file=fake_json_file,
+                metric=['bbox', 'segm', 'proposal'],
+                use_fast_eval=use_fast_eval)
+            coco_metric.dataset_meta = dict(classes=['car', 'bicycle'])
+            coco_metric.process({}, [
+                dict(
+                    pred_instances=dummy_pred, img_id=0, ori_shape=(640, 640))
+            ])
+            eval_results.append(coco_metric.evaluate(size=1))
+        self.assertDictEqual(eval_results[0], eval_results[1])
+
+    def test_incremental(self):
+        fake_json_file = osp.join(self.tmp_dir.name, 'fake_data.json')
+        self._create_dummy_coco_json(fake_json_file)
+        dummy_pred = self._create_dummy_results()
+        # a shifted prediction and a false one
+        dummy_pred['bboxes'] = torch.cat([
+            dummy_pred['bboxes'] + torch.tensor([[0, 0, 0, 10]]),
+            torch.tensor([[0, 0, 20, 20]])
+        ])
+        dummy_pred['scores'] = torch.cat(
+            [dummy_pred['scores'],
+             torch.tensor([0.99], dtype=torch.float64)])
+        dummy_pred['labels'] = torch.cat(
+            [dummy_pred['labels'], torch.tensor([1])])
+        instances = [{
+            'bbox_label': label,
+            'bbox': bbox,
+            'ignore_flag': ignore_flag
+        } for label, bbox, ignore_flag in (
+            (0, [50, 60, 70, 80], 0), (0, [100, 120, 130, 150], 0),
+            (1, [150, 160, 190, 200], 0), (0, [250, 260, 350, 360], 1))]
+
+        # unsorted proposal_nums are sorted in both modes
+        cases = [(fake_json_file, (1, 10, 100)), (None, (1, 10, 100)),
+                 (fake_json_file, (10, 1, 100))]
+        for ann_file, proposal_nums in cases:
+            eval_results = []
+            for incremental in (False, True):
+                coco_metric = CocoMetric(
+                    ann_file=ann_file,
+                    metric=['bbox', 'proposal'],
+                    classwise=True,
+                    proposal_nums=proposal_nums,
+                    incremental=incremental)
+                coco_metric.dataset_meta = dict(classes=['car', 'bicycle'])
+                coco_metric.process({}, [
+                    dict(
+                        pred_instances=dummy_pred,
+                        img_id=0,
+                        ori_shape=(640, 640),
+                        instances=instances)
+                ])
+                if incremental:
+                    # only the matches are kept, with the image id and the
+                    # scores shared by the metrics
+                    result = coco_metric.results[0]
+                    self.assertEqual(
+                        set(result), {'img_id', 'scores', 'bbox', 'proposal'})
+                    self.assertEqual(result['scores'].dtype, np.float32)
+                    for metric in ('bbox', 'proposal'):
+                        gt_matches, dt_matches = result[metric]
+                        self.assertNotIn('score', dt_matches)
+                        self.assertNotIn('img', dt_matches)
+                        self.assertEqual(gt_matches['cat'].dtype, np.int16)
+                        for key in ('cat', 'ind', 'rank'):
+                            self.assertEqual(dt_matches[key].dtype, np.int16)
+                eval_results.append(coco_metric.evaluate(size=1))
+            self.assertDictEqual(eval_results[0], eval_results[1])
+
+        with self.assertRaisesRegex(ValueError, 'only supports'):
+            CocoMetric(metric=['bbox', 'segm'], incremental=True)
+
     def test_format_only(self):
         # create dummy data
         fake_json_file = osp.join(self.tmp_dir.name, 'fake_data.json')
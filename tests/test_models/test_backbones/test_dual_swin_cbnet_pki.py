@@ -0,0 +1,70 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import pytest
+import torch
+
+from mmdet.models.backbones import Dual_SwinTransformer_CBPki
+from mmdet.models.backbones.dual_swin_cbnet_pki import _run_branches
+
+
+def _build_model():
+    torch.manual_seed(0)
+    model = Dual_SwinTransformer_CBPki(
+        embed_dims=32,
+        depths=(2, 2, 2, 2),
+        num_heads=(1, 2, 4, 8),
+        window_size=7,
+        drop_path_rate=0.)
+    model.init_weights()
+    return model
+
+
+def test_dual_swin_cbpki_parallel_branches():
+    model = _build_model()
+    inputs = (torch.randn(1, 3, 64, 96), torch.randn(1, 3, 64, 96))
+
+    model.eval()
+    with torch.no_grad():
+        expected = model(inputs)
+        model.parallel_branches = True
+        outs = model(inputs)
+    assert len(outs) == len(expected) == 4
+    for out, expected_out in zip(outs, expected):
+        assert torch.allclose(out, expected_out)
+        assert not out.requires_grad
+
+    # the branches in the threads keep the grad mode of the caller
+    model.train()
+    grads = []
+    for parallel_branches in (False, True):
+        model.parallel_branches = parallel_branches
+        model.zero_grad()
+        sum(out.sum() for out in model(inputs)).backward()
+        grads.append(model.stages1[0].blocks[0].attn.w_msa.qkv.weight.grad)
+    assert torch.allclose(grads[0], grads[1], atol=1e-5)
+
+
+@pytest.mark.skipif(
+    not hasattr(torch, 'autocast'), reason='requires torch.autocast')
+def test_dual_swin_cbpki_parallel_branches_autocast():
+    # the branches in the threads keep the autocast of the caller
+    x = torch.randn(8, 8)
+    branches = [(torch.mm, (x, x))] * 3
+    with torch.autocast('cpu', dtype=torch.bfloat16):
+        expected = _run_branches(branches)
+        outs = _run_branches(branches, parallel=True)
+    for out, expected_out in zip(outs, expected):
+        assert out.dtype == expected_out.dtype == torch.bfloat16
+        assert torch.equal(out, expected_out)
+
+    model = _build_model()
+    model.eval()
+    inputs = (torch.randn(1, 3, 64, 96), torch.randn(1, 3, 64, 96))
+    outs = []
+    with torch.no_grad(), torch.autocast('cpu', dtype=torch.bfloat16):
+        for parallel_branches in (False, True):
+            model.parallel_branches = parallel_branches
+            outs.append(model(inputs))
+    for out, expected_out in zip(*outs):
+        assert out.dtype == expected_out.dtype
+        assert torch.allclose(
+            out.float(), expected_out.float(), rtol=1e-2, atol=1e-2)
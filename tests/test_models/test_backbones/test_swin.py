@@ -1,7 +1,11 @@
+from functools import partial
+
 import pytest
 import torch
+import torch.nn.functional as F
 
-from mmdet.models.backbones.swin import SwinBlock, SwinTransformer
+from mmdet.models.backbones.swin import (HAS_SDPA, ShiftWindowMSA, SwinBlock,
+                                         SwinTransformer, get_shift_attn_mask)
 
 
 def test_swin_block():
@@ -23,6 +27,81 @@ def test_swin_block():
     assert x_out.shape == torch.Size([1, 56 * 56, 64])
 
 
+@pytest.mark.skipif(
+    not HAS_SDPA, reason='requires F.scaled_dot_product_attention')
+@pytest.mark.parametrize('embed_dims,num_heads,shift_size,batch_size',
+                         [(192, 6, 6, 2), (768, 24, 0, 1), (768, 24, 6, 1)])
+def test_window_msa_sdpa(embed_dims, num_heads, shift_size, batch_size):
+    # the stages of Swin-L, with a feature map which is padded
+    attn = ShiftWindowMSA(
+        embed_dims=embed_dims,
+        num_heads=num_heads,
+        window_size=12,
+        shift_size=shift_size)
+    attn.init_weights()
+    hw_shape = (30, 40)
+    x = torch.randn(batch_size, hw_shape[0] * hw_shape[1], embed_dims)
+
+    def forward(use_sdpa):
+        attn.w_msa.use_sdpa = use_sdpa
+        x_ = x.clone().requires_grad_()
+        out = attn(x_, hw_shape)
+        out.sum().backward()
+        grad = attn.w_msa.relative_position_bias_table.grad.clone()
+        attn.zero_grad()
+        with torch.no_grad():
+            assert torch.allclose(attn(x, hw_shape), out, atol=1e-5)
+        return out, x_.grad, grad
+
+    for expected, result in zip(forward(False), forward(True)):
+        assert torch.allclose(result, expected, atol=1e-4)
+
+    # the cached bias is updated with the table
+    with torch.no_grad():
+        out = attn(x, hw_shape)
+        attn.w_msa.relative_position_bias_table.mul_(100.)
+        assert not torch.allclose(attn(x, hw_shape), out)
+
+
+def _shift_window_msa_by_copies(attn, query, hw_shape):
+    """The padding, the cyclic shift and the partition by copies."""
+    B, L, C = query.shape
+    H, W = hw_shape
+    window_size, shift_size = attn.window_size, attn.shift_size
+    query = query.view(B, H, W, C)
+    pad_r = (window_size - W % window_size) % window_size
+    pad_b = (window_size - H % window_size) % window_size
+    query = F.pad(query, (0, 0, 0, pad_r, 0, pad_b))
+    H_pad, W_pad = query.shape[1], query.shape[2]
+    query = torch.roll(query, (-shift_size, -shift_size), dims=(1, 2))
+    attn_mask = get_shift_attn_mask(window_size, shift_size, H_pad, W_pad,
+                                    query.device) if shift_size else None
+    query_windows = attn.window_partition(query).view(-1, window_size**2, C)
+    attn_windows = attn.w_msa(query_windows, mask=attn_mask)
+    x = attn.window_reverse(
+        attn_windows.view(-1, window_size, window_size, C), H_pad, W_pad)
+    x = torch.roll(x, (shift_size, shift_size), dims=(1, 2))
+    return x[:, :H, :W, :].reshape(B, H * W, C)
+
+
+@pytest.mark.parametrize('shift_size', [0, 3])
+@pytest.mark.parametrize('hw_shape', [(14, 21), (13, 20)])
+def test_shift_window_msa_gather(shift_size, hw_shape):
+    attn = ShiftWindowMSA(
+        embed_dims=32, num_heads=4, window_size=7, shift_size=shift_size)
+    attn.init_weights()
+    x = torch.randn(2, hw_shape[0] * hw_shape[1], 32)
+    outs, grads = [], []
+    for forward in (attn.forward, partial(_shift_window_msa_by_copies, attn)):
+        x_ = x.clone().requires_grad_()
+        out = forward(x_, hw_shape)
+        out.square().sum().backward()
+        outs.append(out)
+        grads.append(x_.grad)
+    assert torch.allclose(outs[0], outs[1], atol=1e-6)
+    assert torch.allclose(grads[0], grads[1], atol=1e-5)
+
+
 def test_swin_transformer():
     """Test Swin Transformer backbone."""
 
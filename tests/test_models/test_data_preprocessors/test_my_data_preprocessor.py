@@ -0,0 +1,159 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+from unittest import TestCase
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+import torch
+
+from mmdet.datasets.transforms.my_transforms import DarkChannel
+from mmdet.models.data_preprocessors.my_data_preprocessor import (
+    BatchDarkChannelEnhance, DoubleInputDetDataPreprocessor,
+    ThreeInputDetDataPreprocessor)
+from mmdet.structures import DetDataSample
+
+
+def _night_image(h, w, seed=0):
+    rng = np.random.RandomState(seed)
+    img = (rng.rand(h, w, 3)**4 * 60).astype(np.uint8)
+    img = cv2.GaussianBlur(img, (7, 7), 0)
+    # a black block sets the atmospheric light without ties between pixels
+    img[10:40, 10:40] = 0
+    return img
+
+
+class TestBatchDarkChannelEnhance(TestCase):
+
+    def test_enhance(self):
+        img = _night_image(128, 160)
+        enhance = BatchDarkChannelEnhance(
+            mean=[0, 0, 0], std=[1, 1, 1], bgr_to_rgb=False)
+        res = enhance.enhance(
+            torch.from_numpy(img).permute(2, 0, 1)[None].float())
+        expected = DarkChannel().run(img)
+        # the gray image of ``DarkChannel`` is rounded to uint8
+        np.testing.assert_allclose(
+            res[0].permute(1, 2, 0).numpy(), expected, atol=2)
+
+    def test_forward(self):
+        mean = [123.675, 116.28, 103.53]
+        std = [58.395, 57.12, 57.375]
+        processor = DoubleInputDetDataPreprocessor(
+            mean=mean,
+            std=std,
+            bgr_to_rgb=True,
+            pad_size_divisor=32,
+            batch_augments=[
+                dict(
+                    type='BatchDarkChannelEnhance',
+                    mean=mean,
+                    std=std,
+                    prob=1.)
+            ])
+        night = _night_image(100, 150)
+        day = np.full((90, 120, 3), 200, dtype=np.uint8)
+        inputs = [
+            torch.from_numpy(img).permute(2, 0, 1) for img in (night, day)
+        ]
+        data_samples = [
+            DetDataSample(metainfo=dict(img_shape=img.shape[:2]))
+            for img in (night, day)
+        ]
+        data = dict(inputs=inputs, inputs2=inputs, data_samples=data_samples)
+        out = processor(data, training=True)
+        ref = processor(data, training=False)
+
+        # the second stream and the day image are not enhanced
+        self.assertTrue(torch.equal(out['inputs2'], ref['inputs2']))
+        self.assertTrue(torch.equal(out['inputs'][1], ref['inputs'][1]))
+        # the padding is not touched
+        self.assertTrue(
+            torch.equal(out['inputs'][0, :, 100:], ref['inputs'][0, :, 100:]))
+        self.assertTrue(
+            torch.equal(out['inputs'][0, :, :, 150:], ref['inputs'][0, :, :,
+                                                                    150:]))
+
+        res = DarkChannel().run(night)
+        res = (res - res.min()) / (res.max() - res.min()) * 255
+        res = torch.from_numpy(res[..., ::-1].copy()).permute(2, 0, 1)
+        res = (res - torch.tensor(mean).view(
+            -1, 1, 1)) / torch.tensor(std).view(-1, 1, 1)
+        self.assertTrue(
+            torch.allclose(out['inputs'][0, :, :100, :150], res, atol=0.05))
+
+
+class TestFusedStack(TestCase):
+
+    def test_same_as_unfused(self):
+        cfg = dict(
+            mean=[123.675, 116.28, 103.53],
+            std=[58.395, 57.12, 57.375],
+            bgr_to_rgb=True,
+            pad_size_divisor=32,
+            pad_value=1)
+        for preprocessor, keys in ((DoubleInputDetDataPreprocessor,
+                                    ('inputs', 'inputs2')),
+                                   (ThreeInputDetDataPreprocessor,
+                                    ('inputs', 'inputs2', 'inputs3'))):
+            shapes = [(3, 100, 130), (3, 90, 150)]
+            data = {
+                key: [torch.randint(0, 256, shape) for shape in shapes]
+                for key in keys
+            }
+            # a stream of another size is stacked separately
+            data['inputs2'][0] = torch.randint(0, 256, (3, 200, 10))
+            data['data_samples'] = [DetDataSample() for _ in shapes]
+
+            ref = preprocessor(**cfg)(data)
+            out = preprocessor(fused=True, **cfg)(data)
+            for key in keys:
+                self.assertTrue(torch.equal(out[key], ref[key]))
+
+            out = preprocessor(
+                fused=True, channels_last=True, fp16=True, **cfg)(
+                    data)
+            for key in keys:
+                self.assertEqual(out[key].dtype, torch.float16)
+                self.assertTrue(
+                    out[key].is_contiguous(memory_format=torch.channels_last))
+                self.assertTrue(
+                    torch.allclose(out[key].float(), ref[key], atol=1e-2))
+
+    def test_mixed_dtypes(self):
+        cfg = dict(mean=[0, 0, 0], std=[1, 1, 1], pad_size_divisor=32)
+        shapes = [(3, 100, 130), (3, 90, 150)]
+        data = {
+            'inputs': [torch.randint(0, 256, s).byte() for s in shapes],
+            'inputs2': [torch.rand(s) * 255 for s in shapes],
+            'data_samples': [DetDataSample() for _ in shapes]
+        }
+        ref = DoubleInputDetDataPreprocessor(**cfg)(data)
+        out = DoubleInputDetDataPreprocessor(fused=True, **cfg)(data)
+        for key in ('inputs', 'inputs2'):
+            self.assertTrue(torch.equal(out[key], ref[key]))
+
+    def test_pinned_buffer_reuse(self):
+        preprocessor = DoubleInputDetDataPreprocessor(fused=True)
+        empty = torch.empty
+
+        def unpinned_empty(*args, pin_memory=False, **kwargs):
+            return empty(*args, **kwargs)
+
+        with patch('torch.empty', side_effect=unpinned_empty) as mock:
+            buffer = preprocessor._get_pinned_buffer((2, 3, 32, 32),
+                                                     torch.uint8)
+            self.assertEqual(buffer.shape, (2, 3, 32, 32))
+            # a smaller or equal batch of the same dtype reuses the buffer
+            small = preprocessor._get_pinned_buffer((2, 3, 16, 32),
+                                                    torch.uint8)
+            self.assertEqual(small.shape, (2, 3, 16, 32))
+            self.assertEqual(small.data_ptr(), buffer.data_ptr())
+            self.assertEqual(mock.call_count, 1)
+            # another dtype or a larger batch gets a new buffer
+            preprocessor._get_pinned_buffer((2, 3, 32, 32), torch.float32)
+            self.assertEqual(mock.call_count, 2)
+            preprocessor._get_pinned_buffer((2, 3, 64, 32), torch.uint8)
+            self.assertEqual(mock.call_count, 3)
+            self.assertEqual(
+                preprocessor._pinned_buffers[torch.uint8][0].numel(),
+                2 * 3 * 64 * 32)
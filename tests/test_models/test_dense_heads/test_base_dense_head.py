@@ -0,0 +1,103 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+from unittest import TestCase
+from unittest.mock import patch
+
+import torch
+from mmengine.config import ConfigDict
+
+from mmdet.models.dense_heads import FCOSHead, RetinaHead
+from mmdet.models.dense_heads.base_dense_head import BaseDenseHead
+
+
+def _distinct_cls_scores(cls_scores):
+    """Random classification scores without ties, so that the order of the
+    candidates is the same in both paths."""
+    numels = [cls_score.numel() for cls_score in cls_scores]
+    values = torch.randperm(sum(numels)).float() * (8 / sum(numels)) - 4
+    return [
+        value.reshape(cls_score.shape)
+        for value, cls_score in zip(values.split(numels), cls_scores)
+    ]
+
+
+class TestBaseDenseHead(TestCase):
+
+    def _assert_batched_equal(self, head, outs, cfg, rescale=True):
+        img_metas = [{
+            'img_shape': (s, s + 16, 3),
+            'scale_factor': (0.5 + i, 1.5 - i / 4)
+        } for i, s in enumerate((128, 112, 96))]
+        head._can_predict_batched = lambda *args: False
+        expected = head.predict_by_feat(
+            *outs, batch_img_metas=img_metas, cfg=cfg, rescale=rescale)
+        del head._can_predict_batched
+        with patch.object(
+                BaseDenseHead,
+                '_predict_by_feat_batched',
+                wraps=head._predict_by_feat_batched) as batched:
+            results = head.predict_by_feat(
+                *outs, batch_img_metas=img_metas, cfg=cfg, rescale=rescale)
+            batched.assert_called_once()
+        self.assertEqual(len(results), len(expected))
+        for result, expected_result in zip(results, expected):
+            self.assertEqual(result.keys(), expected_result.keys())
+            self.assertTrue(torch.equal(result.labels, expected_result.labels))
+            self.assertTrue(torch.equal(result.scores, expected_result.scores))
+            self.assertTrue(torch.equal(result.bboxes, expected_result.bboxes))
+
+    def test_predict_by_feat_batched(self):
+        torch.manual_seed(0)
+        s = 128
+        cfg = ConfigDict(
+            nms_pre=50,
+            min_bbox_size=0,
+            score_thr=0.3,
+            nms=dict(type='nms', iou_threshold=0.5),
+            max_per_img=20)
+        for use_sigmoid in (True, False):
+            head = RetinaHead(
+                num_classes=4,
+                in_channels=1,
+                stacked_convs=1,
+                feat_channels=1,
+                loss_cls=dict(
+                    type='FocalLoss' if use_sigmoid else 'CrossEntropyLoss',
+                    use_sigmoid=use_sigmoid))
+            feats = [
+                torch.rand(3, 1, s // stride[1], s // stride[0])
+                for stride in head.prior_generator.strides
+            ]
+            cls_scores, bbox_preds = head.forward(feats)
+            cls_scores = _distinct_cls_scores(cls_scores)
+            self._assert_batched_equal(head, (cls_scores, bbox_preds), cfg)
+            self._assert_batched_equal(
+                head, (cls_scores, bbox_preds),
+                ConfigDict(cfg, nms_pre=-1, min_bbox_size=2),
+                rescale=False)
+        # more than the 10000 boxes of `split_thr` in each image
+        self._assert_batched_equal(
+            head, (cls_scores, bbox_preds),
+            ConfigDict(cfg, nms_pre=-1, score_thr=0, max_per_img=1000))
+
+        head = FCOSHead(
+            num_classes=4,
+            in_channels=1,
+            feat_channels=1,
+            stacked_convs=1,
+            norm_cfg=None)
+        feats = [
+            torch.rand(3, 1, s // stride[1], s // stride[0])
+            for stride in head.prior_generator.strides
+        ]
+        cls_scores, bbox_preds, centernesses = head.forward(feats)
+        outs = (_distinct_cls_scores(cls_scores), bbox_preds, centernesses)
+        self._assert_batched_equal(head, outs, cfg)
+        # no candidate in an image
+        outs[0][0][1] = -10
+        self._assert_batched_equal(head, outs, cfg)
+        # the boxes of different images do not suppress each other
+        self._assert_batched_equal(
+            head, outs,
+            ConfigDict(
+                cfg,
+                nms=dict(type='nms', iou_threshold=0.5, class_agnostic=True)))
@@ -0,0 +1,193 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+from types import SimpleNamespace
+from unittest import TestCase
+
+import torch
+from projects.CO_DETR.codetr import CoDINOHead
+
+from mmdet.structures.bbox import bbox_xyxy_to_cxcywh
+
+
+def _get_aux_targets_loop(self, pos_coords, img_metas, mlvl_feats):
+    """The previous per-image implementation of
+    :meth:`CoDINOHead.get_aux_targets`, without the ``.cuda()`` calls."""
+    coords, labels, targets = pos_coords[:3]
+    head_name = pos_coords[-1]
+    bs, c = len(coords), mlvl_feats[0].shape[1]
+    max_num_coords = 0
+    all_feats = []
+    for i in range(bs):
+        label = labels[i]
+        feats = [
+            feat[i].reshape(c, -1).transpose(1, 0) for feat in mlvl_feats
+        ]
+        feats = torch.cat(feats, dim=0)
+        bg_class_ind = self.num_classes
+        pos_inds = ((label >= 0)
+                    & (label < bg_class_ind)).nonzero().squeeze(1)
+        max_num_coords = max(max_num_coords, len(pos_inds))
+        all_feats.append(feats)
+    max_num_coords = min(self.max_pos_coords, max_num_coords)
+    max_num_coords = max(9, max_num_coords)
+
+    if self.use_zero_padding:
+        attn_masks = []
+        label_weights = coords[0].new_zeros([bs, max_num_coords])
+    else:
+        attn_masks = None
+        label_weights = coords[0].new_ones([bs, max_num_coords])
+    bbox_weights = coords[0].new_zeros([bs, max_num_coords, 4])
+
+    aux_coords, aux_labels, aux_targets, aux_feats = [], [], [], []
+
+    for i in range(bs):
+        coord, label, target = coords[i], labels[i], targets[i]
+        feats = all_feats[i]
+        if 'rcnn' in head_name:
+            feats = pos_coords[-2][i]
+            num_coords_per_point = 1
+        else:
+            num_coords_per_point = coord.shape[0] // feats.shape[0]
+        feats = feats.unsqueeze(1).repeat(1, num_coords_per_point, 1)
+        feats = feats.reshape(feats.shape[0] * num_coords_per_point,
+                              feats.shape[-1])
+        img_meta = img_metas[i]
+        img_h, img_w = img_meta['img_shape']
+        factor = coord.new_tensor([img_w, img_h, img_w, img_h]).unsqueeze(0)
+        bg_class_ind = self.num_classes
+        pos_inds = ((label >= 0)
+                    & (label < bg_class_ind)).nonzero().squeeze(1)
+        neg_inds = (label == bg_class_ind).nonzero().squeeze(1)
+        if pos_inds.shape[0] > max_num_coords:
+            indices = torch.randperm(pos_inds.shape[0])[:max_num_coords]
+            pos_inds = pos_inds[indices]
+
+        coord = bbox_xyxy_to_cxcywh(coord[pos_inds] / factor)
+        label = label[pos_inds]
+        target = bbox_xyxy_to_cxcywh(target[pos_inds] / factor)
+        feat = feats[pos_inds]
+
+        if self.use_zero_padding:
+            label_weights[i][:len(label)] = 1
+            bbox_weights[i][:len(label)] = 1
+            attn_mask = torch.zeros([max_num_coords, max_num_coords]).bool()
+        else:
+            bbox_weights[i][:len(label)] = 1
+
+        if coord.shape[0] < max_num_coords:
+            padding_shape = max_num_coords - coord.shape[0]
+            if self.use_zero_padding:
+                padding_coord = coord.new_zeros([padding_shape, 4])
+                padding_label = label.new_ones([padding_shape
+                                                ]) * self.num_classes
+                padding_target = target.new_zeros([padding_shape, 4])
+                padding_feat = feat.new_zeros([padding_shape, c])
+                attn_mask[coord.shape[0]:, 0:coord.shape[0], ] = True
+                attn_mask[:, coord.shape[0]:, ] = True
+            else:
+                indices = torch.randperm(neg_inds.shape[0])[:padding_shape]
+                neg_inds = neg_inds[indices]
+                padding_coord = bbox_xyxy_to_cxcywh(coords[i][neg_inds] /
+                                                    factor)
+                padding_label = labels[i][neg_inds]
+                padding_target = bbox_xyxy_to_cxcywh(targets[i][neg_inds] /
+                                                     factor)
+                padding_feat = feats[neg_inds]
+            coord = torch.cat((coord, padding_coord), dim=0)
+            label = torch.cat((label, padding_label), dim=0)
+            target = torch.cat((target, padding_target), dim=0)
+            feat = torch.cat((feat, padding_feat), dim=0)
+        if self.use_zero_padding:
+            attn_masks.append(attn_mask.unsqueeze(0))
+        aux_coords.append(coord.unsqueeze(0))
+        aux_labels.append(label.unsqueeze(0))
+        aux_targets.append(target.unsqueeze(0))
+        aux_feats.append(feat.unsqueeze(0))
+
+    if self.use_zero_padding:
+        attn_masks = torch.cat(
+            attn_masks, dim=0).unsqueeze(1).repeat(1, 8, 1, 1)
+        attn_masks = attn_masks.reshape(bs * 8, max_num_coords,
+                                        max_num_coords)
+    else:
+        attn_masks = None
+
+    aux_coords = torch.cat(aux_coords, dim=0)
+    aux_labels = torch.cat(aux_labels, dim=0)
+    aux_targets = torch.cat(aux_targets, dim=0)
+    aux_feats = torch.cat(aux_feats, dim=0)
+    return (aux_coords, aux_labels, aux_targets, label_weights, bbox_weights,
+            aux_feats, attn_masks)
+
+
+def _random_boxes(*shape):
+    xy = torch.rand(*shape, 2) * 100
+    wh = torch.rand(*shape, 2) * 50 + 1
+    return torch.cat([xy, xy + wh], dim=-1)
+
+
+def _random_labels(num_pos, num_coords, num_classes):
+    """Labels with ``num_pos`` positives at random positions, and negatives
+    or ignored coords otherwise."""
+    labels = torch.full((num_coords, ), num_classes, dtype=torch.long)
+    labels[torch.rand(num_coords) < 0.1] = -1
+    pos_inds = torch.randperm(num_coords)[:num_pos]
+    labels[pos_inds] = torch.randint(num_classes, (num_pos, ))
+    return labels
+
+
+class TestCoDINOHead(TestCase):
+
+    def test_get_aux_targets(self):
+        torch.manual_seed(0)
+        num_classes, c = 5, 8
+        img_metas = [
+            dict(img_shape=(120, 160)),
+            dict(img_shape=(96, 128)),
+            dict(img_shape=(128, 128))
+        ]
+        mlvl_feats = [
+            torch.rand(3, c, 8, 10),
+            torch.rand(3, c, 4, 5),
+            torch.rand(3, c, 2, 3)
+        ]
+        num_points = sum(feat.shape[2:].numel() for feat in mlvl_feats)
+        # the second image has more positives than `max_pos_coords`, the
+        # last one less than 9
+        num_pos = [10, 30, 3]
+
+        # two anchors per point for atss
+        num_coords = 2 * num_points
+        atss_coords = (
+            [_random_boxes(num_coords) for _ in num_pos],
+            [_random_labels(n, num_coords, num_classes) for n in num_pos],
+            [_random_boxes(num_coords) for _ in num_pos], 'atss')
+        num_rois = 40
+        rcnn_coords = (_random_boxes(3, num_rois),
+                       torch.stack([
+                           _random_labels(n, num_rois, num_classes)
+                           for n in num_pos
+                       ]), _random_boxes(3, num_rois),
+                       torch.rand(3, num_rois, c), 'rcnn')
+
+        for pos_coords in (atss_coords, rcnn_coords):
+            for use_zero_padding in (False, True):
+                head = SimpleNamespace(
+                    num_classes=num_classes,
+                    max_pos_coords=20,
+                    use_zero_padding=use_zero_padding)
+                torch.manual_seed(1)
+                expected = _get_aux_targets_loop(head, pos_coords, img_metas,
+                                                 mlvl_feats)
+                torch.manual_seed(1)
+                results = CoDINOHead.get_aux_targets(head, pos_coords,
+                                                     img_metas, mlvl_feats, 0)
+                self.assertEqual(len(results), len(expected))
+                # coords, labels, targets, label and bbox weights, feats and
+                # attention masks
+                for result, expected_result in zip(results, expected):
+                    if expected_result is None:
+                        self.assertIsNone(result)
+                    else:
+                        self.assertEqual(result.dtype, expected_result.dtype)
+                        self.assertTrue(torch.equal(result, expected_result))
@@ -146,3 +146,42 @@ class TestHungarianAssigner(TestCase):
                          gt_instances.masks.size(0))
         self.assertEqual((assign_result.labels > -1).sum(),
                          gt_instances.masks.size(0))
+
+    def test_batch_assign(self):
+        pred_instances_list, gt_instances_list, img_metas = [], [], []
+        # an image without gts, an image with more gts than preds and
+        # images with ties between the costs
+        for num_preds, num_gts in ((30, 0), (6, 8), (30, 5), (40, 12)):
+            gt_instances = InstanceData()
+            gt_instances.bboxes = (torch.rand((num_gts, 4)) * 10).round()
+            gt_instances.bboxes[:, 2:] += gt_instances.bboxes[:, :2] + 1
+            gt_instances.labels = torch.randint(0, 4, (num_gts, ))
+            pred_instances = InstanceData()
+            pred_instances.scores = (torch.rand((num_preds, 4)) * 4).round()
+            pred_instances.bboxes = gt_instances.bboxes.new_tensor(
+                [0, 0, 5, 7]).repeat(num_preds, 1)
+            pred_instances_list.append(pred_instances)
+            gt_instances_list.append(gt_instances)
+            img_metas.append(dict(img_shape=(20, 20)))
+
+        match_costs = [
+            dict(type='FocalLossCost', weight=2.),
+            dict(type='BBoxL1Cost', weight=5.0, box_format='xywh'),
+            dict(type='IoUCost', iou_mode='giou', weight=2.0)
+        ]
+        for num_workers in (0, 2):
+            assigner = HungarianAssigner(match_costs, num_workers=num_workers)
+            assign_results = assigner.batch_assign(pred_instances_list,
+                                                   gt_instances_list,
+                                                   img_metas)
+            self.assertEqual(len(assign_results), 4)
+            for assign_result, pred_instances, gt_instances, img_meta in zip(
+                    assign_results, pred_instances_list, gt_instances_list,
+                    img_metas):
+                expected = assigner.assign(pred_instances, gt_instances,
+                                           img_meta)
+                self.assertEqual(assign_result.num_gts, expected.num_gts)
+                self.assertTrue(
+                    torch.equal(assign_result.gt_inds, expected.gt_inds))
+                self.assertTrue(
+                    torch.equal(assign_result.labels, expected.labels))
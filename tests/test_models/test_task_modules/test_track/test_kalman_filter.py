@@ -1,8 +1,10 @@
 from unittest import TestCase
 
 import numpy as np
+import torch
 from mmengine.registry import init_default_scope
 
+from mmdet.models.task_modules.tracking import TrackStates
 from mmdet.registry import TASK_UTILS
 
 
@@ -35,3 +37,54 @@ class TestKalmanFilter(TestCase):
         mean, covariance = self.kf.update(mean, covariance, measurement, score)
         assert len(mean) == 8
         assert covariance.shape == (8, 8)
+
+    def test_batch(self):
+        rng = np.random.RandomState(0)
+        measurements = rng.rand(5, 4) * np.array([100, 100, 1, 50]) + 1
+        means, covariances = self.kf.initiate(measurements)
+        assert means.shape == (5, 8)
+        assert covariances.shape == (5, 8, 8)
+        means, covariances = self.kf.predict(means, covariances)
+        scores = rng.rand(5)
+        new_means, new_covariances = self.kf.update(means, covariances,
+                                                    measurements + 1, scores)
+        dists = self.kf.gating_distance(means, covariances, measurements)
+        assert dists.shape == (5, 5)
+        for i in range(5):
+            mean, covariance = self.kf.initiate(measurements[i])
+            mean, covariance = self.kf.predict(mean, covariance)
+            assert np.allclose(mean, means[i])
+            assert np.allclose(covariance, covariances[i])
+            mean, covariance = self.kf.update(mean, covariance,
+                                              measurements[i] + 1, scores[i])
+            assert np.allclose(mean, new_means[i])
+            assert np.allclose(covariance, new_covariances[i])
+            assert np.allclose(
+                self.kf.gating_distance(means[i], covariances[i],
+                                        measurements), dists[i])
+
+    def test_track_states(self):
+        rng = np.random.RandomState(0)
+        measurements = rng.rand(5, 4) * np.array([100, 100, 1, 50]) + 1
+        states = TrackStates(capacity=2)
+        states.add([3, 1, 4, 5, 9], *self.kf.initiate(measurements))
+        assert len(states) == 5 and 4 in states
+        means, covariances = states.means.copy(), states.covariances.copy()
+
+        # the states are updated in place
+        self.kf.predict_tracks(states, [1, 5])
+        self.kf.update_tracks(states, [5], measurements[3:4] + 1)
+        mean, covariance = self.kf.predict(means[3], covariances[3])
+        mean, covariance = self.kf.update(mean, covariance,
+                                          measurements[3] + 1)
+        row = states.rows([5])[0]
+        assert np.allclose(states.means[row], mean)
+        assert np.allclose(states.covariances[row], covariance)
+        assert np.allclose(states.means[states.rows([3, 4])], means[[0, 2]])
+
+        # the last row is moved to the removed rows
+        states.remove([3, 4, 7])
+        assert states.ids == [9, 1, 5]
+        assert np.allclose(states.means[0], means[4])
+        states, costs = self.kf.track(states, torch.from_numpy(measurements))
+        assert costs.shape == (3, 5)
@@ -0,0 +1,138 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+from unittest import TestCase
+
+import torch
+from mmcv.ops import batched_nms
+from mmengine import ConfigDict
+from mmengine.structures import InstanceData
+from torch import nn
+
+from mmdet.models.test_time_augs.det_dual_stream_tta import DetDSTTAModel
+from mmdet.structures import DetDataSample
+from mmdet.structures.bbox import bbox_flip
+
+
+class FakeDetector(nn.Module):
+    """Predict random bboxes seeded by the inputs, and record the batch
+    sizes."""
+
+    def __init__(self):
+        super().__init__()
+        self.batch_sizes = []
+
+    def test_step(self, data):
+        self.batch_sizes.append(len(data['inputs']))
+        for img, img2 in zip(data['inputs'], data['inputs2']):
+            assert img.shape == data['inputs'][0].shape
+            assert img2.shape == data['inputs2'][0].shape
+        results = []
+        for img, data_sample in zip(data['inputs'], data['data_samples']):
+            generator = torch.Generator().manual_seed(int(img.sum()))
+            xy = torch.rand(30, 2, generator=generator) * 80
+            wh = torch.rand(30, 2, generator=generator) * 20 + 1
+            pred_instances = InstanceData()
+            pred_instances.bboxes = torch.cat([xy, xy + wh], dim=1)
+            pred_instances.scores = torch.rand(30, generator=generator)
+            pred_instances.labels = torch.randint(
+                3, (30, ), generator=generator)
+            data_sample = data_sample.clone()
+            data_sample.pred_instances = pred_instances
+            results.append(data_sample)
+        return results
+
+
+def _get_data(num_imgs=2):
+    """Two scales, each with the original and three flipped views."""
+    data = dict(inputs=[], inputs2=[], data_samples=[])
+    for scale in (100, 120):
+        for direction in (None, 'horizontal', 'vertical', 'diagonal'):
+            data['inputs'].append([
+                torch.full((3, scale, scale), i * 10 + scale)
+                for i in range(num_imgs)
+            ])
+            data['inputs2'].append(
+                [torch.full((3, scale, scale), i) for i in range(num_imgs)])
+            data['data_samples'].append([
+                DetDataSample(
+                    metainfo=dict(
+                        ori_shape=(90, 100),
+                        img_shape=(scale, scale),
+                        flip=direction is not None,
+                        flip_direction=direction)) for _ in range(num_imgs)
+            ])
+    return data
+
+
+class TestDetDSTTAModel(TestCase):
+
+    def setUp(self):
+        self.tta_cfg = ConfigDict(
+            nms=dict(type='nms', iou_threshold=0.5), max_per_img=20)
+
+    def test_merge_aug_bboxes(self):
+        model = DetDSTTAModel(module=FakeDetector(), tta_cfg=self.tta_cfg)
+        aug_bboxes = [torch.rand(5, 4) * 50 for _ in range(4)]
+        aug_scores = [torch.rand(5) for _ in range(4)]
+        img_metas = [
+            dict(
+                ori_shape=(90, 100),
+                flip=direction is not None,
+                flip_direction=direction)
+            for direction in (None, 'horizontal', 'vertical', 'diagonal')
+        ]
+        bboxes, scores = model.merge_aug_bboxes(aug_bboxes, aug_scores,
+                                                img_metas)
+        expected = [
+            bbox_flip(b, img_info['ori_shape'], img_info['flip_direction'])
+            if img_info['flip'] else b
+            for b, img_info in zip(aug_bboxes, img_metas)
+        ]
+        self.assertTrue(torch.allclose(bboxes, torch.cat(expected)))
+        self.assertTrue(torch.equal(scores, torch.cat(aug_scores)))
+
+    def test_test_step(self):
+        data = _get_data()
+        detector = FakeDetector()
+        model = DetDSTTAModel(module=detector, tta_cfg=self.tta_cfg)
+        expected = model.test_step(data)
+        self.assertEqual(detector.batch_sizes, [2] * 8)
+
+        for views_per_batch, batch_sizes in ((None, [8, 8]), (3, [6, 2, 6,
+                                                                  2])):
+            data = _get_data()
+            detector = FakeDetector()
+            model = DetDSTTAModel(
+                module=detector,
+                tta_cfg=self.tta_cfg,
+                views_per_batch=views_per_batch)
+            results = model.test_step(data)
+            self.assertEqual(detector.batch_sizes, batch_sizes)
+            for result, expected_result in zip(results, expected):
+                self.assertTrue(
+                    torch.equal(result.pred_instances.bboxes,
+                                expected_result.pred_instances.bboxes))
+                self.assertTrue(
+                    torch.equal(result.pred_instances.labels,
+                                expected_result.pred_instances.labels))
+
+        # same as the nms of each image
+        for i, result in enumerate(expected):
+            views = [
+                FakeDetector().test_step({
+                    key: value[v][i:i + 1]
+                    for key, value in data.items()
+                })[0] for v in range(8)
+            ]
+            bboxes, scores = model.merge_aug_bboxes(
+                [view.pred_instances.bboxes for view in views],
+                [view.pred_instances.scores
+                 for view in views], [view.metainfo for view in views])
+            labels = torch.cat([view.pred_instances.labels for view in views])
+            det_bboxes, keep = batched_nms(bboxes, scores, labels,
+                                           self.tta_cfg.nms)
+            self.assertEqual(len(result.pred_instances), 20)
+            self.assertTrue(
+                torch.allclose(result.pred_instances.bboxes,
+                               det_bboxes[:20, :4]))
+            self.assertTrue(
+                torch.equal(result.pred_instances.labels, labels[keep][:20]))
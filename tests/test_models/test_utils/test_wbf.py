@@ -0,0 +1,112 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import numpy as np
+import pytest
+import torch
+
+from mmdet.models.utils import (batched_weighted_boxes_fusion,
+                                fast_weighted_boxes_fusion,
+                                weighted_boxes_fusion)
+
+
+def _random_predictions(rng, num_models=3, num_objects=60, num_classes=3):
+    base = rng.rand(num_objects, 4) * 400
+    base[:, 2:] = base[:, :2] + rng.rand(num_objects, 2) * 60 + 5
+    bboxes_list, scores_list, labels_list = [], [], []
+    for _ in range(num_models):
+        num = rng.randint(num_objects // 2, num_objects)
+        inds = rng.choice(num_objects, num, replace=False)
+        bboxes_list.append((base[inds] + rng.randn(num, 4) * 3) / 512)
+        scores_list.append(rng.rand(num))
+        labels_list.append(rng.randint(0, num_classes, num))
+    return bboxes_list, scores_list, labels_list
+
+
+def _assert_same_fusion(results, expected):
+    bboxes, scores, labels = (x.float() for x in results)
+    exp_bboxes, exp_scores, exp_labels = (x.float() for x in expected)
+    assert len(bboxes) == len(exp_bboxes)
+    # scores of different fused boxes may tie, compare in a canonical order
+    inds = np.lexsort((bboxes[:, 0].numpy(), scores.numpy()))
+    exp_inds = np.lexsort((exp_bboxes[:, 0].numpy(), exp_scores.numpy()))
+    assert torch.allclose(bboxes[inds], exp_bboxes[exp_inds], atol=1e-5)
+    assert torch.allclose(scores[inds], exp_scores[exp_inds], atol=1e-5)
+    assert torch.equal(labels[inds].int(), exp_labels[exp_inds].int())
+
+
+@pytest.mark.parametrize(
+    'conf_type', ['avg', 'max', 'box_and_model_avg', 'absent_model_aware_avg'])
+@pytest.mark.parametrize('allows_overflow', [False, True])
+def test_fast_weighted_boxes_fusion(conf_type, allows_overflow):
+    rng = np.random.RandomState(0)
+    for _ in range(3):
+        bboxes_list, scores_list, labels_list = _random_predictions(rng)
+        kwargs = dict(
+            weights=[2, 1, 1.5],
+            iou_thr=0.55,
+            skip_box_thr=0.1,
+            conf_type=conf_type,
+            allows_overflow=allows_overflow)
+        expected = weighted_boxes_fusion(bboxes_list, scores_list, labels_list,
+                                         **kwargs)
+        results = fast_weighted_boxes_fusion(bboxes_list, scores_list,
+                                             labels_list, **kwargs)
+        _assert_same_fusion(results, expected)
+
+        model_inds = torch.cat([
+            torch.full((len(scores), ), i)
+            for i, scores in enumerate(scores_list)
+        ])
+        bboxes, scores, labels, batch_inds = batched_weighted_boxes_fusion(
+            torch.from_numpy(np.concatenate(bboxes_list)),
+            torch.from_numpy(np.concatenate(scores_list)),
+            torch.from_numpy(np.concatenate(labels_list)), model_inds,
+            **kwargs)
+        assert (batch_inds == 0).all()
+        _assert_same_fusion((bboxes, scores, labels), expected)
+
+    # empty inputs
+    bboxes, scores, labels = fast_weighted_boxes_fusion([[], []], [[], []],
+                                                        [[], []])
+    assert len(bboxes) == len(scores) == len(labels) == 0
+
+
+def test_batched_weighted_boxes_fusion():
+    rng = np.random.RandomState(1)
+    num_images, num_models = 4, 3
+    predictions = [
+        _random_predictions(rng, num_models) for _ in range(num_images)
+    ]
+    bboxes, scores, labels, model_inds, batch_inds = [], [], [], [], []
+    for img_id, (bboxes_list, scores_list, labels_list) in \
+            enumerate(predictions):
+        for model_id in range(num_models):
+            num = len(scores_list[model_id])
+            bboxes.append(torch.from_numpy(bboxes_list[model_id]))
+            scores.append(torch.from_numpy(scores_list[model_id]))
+            labels.append(torch.from_numpy(labels_list[model_id]))
+            model_inds.append(torch.full((num, ), model_id))
+            batch_inds.append(torch.full((num, ), img_id))
+    results = batched_weighted_boxes_fusion(
+        torch.cat(bboxes), torch.cat(scores), torch.cat(labels),
+        torch.cat(model_inds), torch.cat(batch_inds))
+    fused_bboxes, fused_scores, fused_labels, fused_batch_inds = results
+
+    # sorted by image, then by descending score
+    assert (fused_batch_inds.diff() >= 0).all()
+    for img_id, (bboxes_list, scores_list, labels_list) in \
+            enumerate(predictions):
+        expected = weighted_boxes_fusion(bboxes_list, scores_list, labels_list)
+        inds = fused_batch_inds == img_id
+        assert (fused_scores[inds].diff() <= 0).all()
+        _assert_same_fusion(
+            (fused_bboxes[inds], fused_scores[inds], fused_labels[inds]),
+            expected)
+
+    # everything filtered
+    results = batched_weighted_boxes_fusion(
+        torch.cat(bboxes),
+        torch.cat(scores),
+        torch.cat(labels),
+        torch.cat(model_inds),
+        skip_box_thr=2.)
+    assert all(len(res) == 0 for res in results)
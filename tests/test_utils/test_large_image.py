@@ -0,0 +1,105 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+from unittest import TestCase
+
+import numpy as np
+import torch
+from mmengine.structures import InstanceData
+
+from mmdet.structures import DetDataSample
+from mmdet.utils.large_image import (get_slice_offsets, merge_results,
+                                     shift_predictions)
+
+
+def _patch_result(bboxes, scores, patch_shape=(100, 100), masks=None):
+    pred_instances = InstanceData(
+        bboxes=torch.tensor(bboxes, dtype=torch.float32).reshape(-1, 4),
+        scores=torch.tensor(scores, dtype=torch.float32),
+        labels=torch.zeros(len(scores), dtype=torch.long))
+    if masks is not None:
+        pred_instances.masks = masks
+    return DetDataSample(
+        metainfo=dict(ori_shape=patch_shape, img_shape=patch_shape),
+        pred_instances=pred_instances)
+
+
+class TestLargeImage(TestCase):
+
+    def test_get_slice_offsets(self):
+        offsets = get_slice_offsets((250, 300), 100, 0.25)
+        xs = sorted({x for x, _ in offsets})
+        ys = sorted({y for _, y in offsets})
+        self.assertEqual(xs, [0, 75, 150, 200])
+        self.assertEqual(ys, [0, 75, 150])
+        self.assertEqual(len(offsets), 12)
+        # a patch larger than the image
+        self.assertEqual(get_slice_offsets((50, 60), 100), [(0, 0)])
+
+    def test_shift_predictions(self):
+        masks = torch.ones(1, 100, 100, dtype=torch.bool)
+        results = [
+            _patch_result([[10, 20, 30, 40]], [0.9], masks=masks),
+            _patch_result([[0, 0, 5, 5]], [0.8],
+                          masks=torch.zeros(1, 100, 100, dtype=torch.bool))
+        ]
+        instances = shift_predictions(results, [(0, 0), (150, 50)], (120, 200))
+        self.assertTrue(
+            torch.equal(instances.bboxes,
+                        torch.tensor([[10., 20, 30, 40], [150, 50, 155, 55]])))
+        self.assertEqual(instances.masks.shape, (2, 120, 200))
+        self.assertEqual(int(instances.masks[0].sum()), 100 * 100)
+        self.assertTrue(instances.masks[0, :100, :100].all())
+
+    def test_merge_results(self):
+        # an object at x in [90, 130] is cut by the first patch
+        results = [
+            _patch_result([[90, 10, 100, 30]], [0.9]),
+            _patch_result([[15, 10, 55, 30]], [0.8])
+        ]
+        offsets = [(0, 0), (75, 0)]
+        merged = merge_results(results, offsets, (100, 175),
+                               dict(type='nms', iou_threshold=0.1))
+        self.assertTrue(
+            torch.equal(merged.pred_instances.bboxes,
+                        torch.tensor([[90., 10, 100, 30]])))
+        self.assertEqual(merged.ori_shape, (100, 175))
+        # the complete object is kept with its score
+        merged = merge_results(results, offsets, (100, 175),
+                               dict(type='edge_nms', iou_threshold=0.1))
+        self.assertTrue(
+            torch.equal(merged.pred_instances.bboxes,
+                        torch.tensor([[90., 10, 130, 30]])))
+        self.assertTrue(
+            torch.allclose(merged.pred_instances.scores, torch.tensor([0.8])))
+        # soft nms keeps the overlapping box with a decayed score
+        results = [
+            _patch_result([[90, 10, 100, 30]], [0.9]),
+            _patch_result([[5, 10, 55, 30]], [0.8])
+        ]
+        merged = merge_results(
+            results, offsets, (100, 175),
+            dict(type='soft_nms', iou_threshold=0.1, min_score=0.01))
+        self.assertEqual(len(merged.pred_instances), 2)
+        self.assertTrue(
+            torch.allclose(merged.pred_instances.scores[0],
+                           torch.tensor(0.9)))
+        self.assertLess(float(merged.pred_instances.scores[1]), 0.8)
+
+        # the border of the image is not a cut
+        results = [
+            _patch_result([[0, 10, 20, 30]], [0.9]),
+            _patch_result([[0, 10, 20, 30]], [0.8])
+        ]
+        merged = merge_results(results, [(0, 0), (1, 0)], (100, 101),
+                               dict(type='edge_nms', iou_threshold=0.5))
+        self.assertTrue(
+            torch.allclose(merged.pred_instances.scores, torch.tensor([0.9])))
+
+        results = [
+            _patch_result([[10, 10, 30, 30]], [0.9]),
+            _patch_result([[0, 10, 20, 30]], [0.5])
+        ]
+        merged = merge_results(results, [(0, 0), (10, 0)], (100, 110),
+                               dict(type='wbf', iou_thr=0.5))
+        bboxes = merged.pred_instances.bboxes.numpy()
+        np.testing.assert_allclose(bboxes, [[10, 10, 30, 30]])
+        np.testing.assert_allclose(merged.pred_instances.scores.numpy(), [0.7])
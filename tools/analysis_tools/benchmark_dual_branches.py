@@ -0,0 +1,91 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""Benchmark the sequential and parallel branches of a dual backbone.
+
+The latency of ``Dual_SwinTransformer_CBPki`` is measured with its RGB, TIR
+and PKI branches run one after another and concurrently, e.g.::
+
+    python tools/analysis_tools/benchmark_dual_branches.py \
+        --img-shape 512 640 --device cuda:0
+
+The backbone of a config can be used instead of the default Swin-L sized
+one with ``--config``.
+"""
+import argparse
+import time
+
+import torch
+from mmengine.config import Config
+from mmengine.logging import print_log
+from mmengine.registry import init_default_scope
+
+from mmdet.registry import MODELS
+
+SWIN_L_BACKBONE = dict(
+    type='Dual_SwinTransformer_CBPki',
+    embed_dims=192,
+    depths=(2, 2, 18, 2),
+    num_heads=(6, 12, 24, 48),
+    window_size=12,
+    drop_path_rate=0.)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the branches of a dual backbone.')
+    parser.add_argument(
+        '--config', help='config whose `model.backbone` is benchmarked.')
+    parser.add_argument(
+        '--img-shape',
+        type=int,
+        nargs=2,
+        default=[512, 640],
+        help='height and width of the input images.')
+    parser.add_argument(
+        '--batch-size', type=int, default=1, help='number of images.')
+    parser.add_argument(
+        '--repeat', type=int, default=10, help='number of timed runs.')
+    parser.add_argument(
+        '--num-threads',
+        type=int,
+        default=None,
+        help='number of intra-op threads on CPU.')
+    parser.add_argument('--device', default='cpu', help='device to use.')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    init_default_scope('mmdet')
+    if args.config:
+        backbone_cfg = Config.fromfile(args.config).model.backbone
+    else:
+        backbone_cfg = SWIN_L_BACKBONE
+    if args.num_threads:
+        torch.set_num_threads(args.num_threads)
+    model = MODELS.build(backbone_cfg).to(args.device)
+    model.eval()
+    inputs = tuple(
+        torch.randn(args.batch_size, 3, *args.img_shape, device=args.device)
+        for _ in range(2))
+
+    def synchronize():
+        if args.device.startswith('cuda'):
+            torch.cuda.synchronize()
+
+    with torch.no_grad():
+        for parallel_branches in (False, True):
+            model.parallel_branches = parallel_branches
+            model(inputs)
+            synchronize()
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                model(inputs)
+            synchronize()
+            elapsed = (time.perf_counter() - start) / args.repeat * 1000
+            mode = 'parallel' if parallel_branches else 'sequential'
+            print_log(f'{mode}: {elapsed:.1f} ms / batch of '
+                      f'{args.batch_size}')
+
+
+if __name__ == '__main__':
+    main()
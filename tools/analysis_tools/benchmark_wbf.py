@@ -0,0 +1,166 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""Benchmark the implementations of Weighted Boxes Fusion.
+
+Either random predictions or COCO-format prediction files of several models
+can be used, e.g.::
+
+    python tools/analysis_tools/benchmark_wbf.py \
+        --pred-results model1.bbox.json model2.bbox.json --num-images 500
+"""
+import argparse
+import time
+from collections import defaultdict
+
+import numpy as np
+import torch
+from mmengine.fileio import load
+from mmengine.logging import print_log
+
+from mmdet.models.utils import (batched_weighted_boxes_fusion,
+                                fast_weighted_boxes_fusion,
+                                weighted_boxes_fusion)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark Weighted Boxes Fusion implementations.')
+    parser.add_argument(
+        '--pred-results',
+        type=str,
+        nargs='*',
+        default=None,
+        help='prediction results of multiple models in COCO json format, '
+        'random predictions are used if not given.')
+    parser.add_argument(
+        '--num-models',
+        type=int,
+        default=3,
+        help='number of models of the random predictions.')
+    parser.add_argument(
+        '--num-images', type=int, default=200, help='number of images.')
+    parser.add_argument(
+        '--num-boxes',
+        type=int,
+        default=300,
+        help='number of boxes per model and image of random predictions.')
+    parser.add_argument(
+        '--num-classes',
+        type=int,
+        default=5,
+        help='number of classes of random predictions.')
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=16,
+        help='number of images fused at once by the batched implementation.')
+    parser.add_argument(
+        '--iou-thr', type=float, default=0.55, help='IoU threshold of wbf.')
+    parser.add_argument(
+        '--skip-box-thr',
+        type=float,
+        default=0.0,
+        help='exclude boxes with score lower than this variable in wbf.')
+    parser.add_argument(
+        '--conf-type',
+        type=str,
+        default='avg',
+        help='how to calculate confidence in weighted boxes in wbf.')
+    parser.add_argument(
+        '--device', default='cpu', help='device of the batched fusion.')
+    parser.add_argument(
+        '--skip-legacy',
+        action='store_true',
+        help='do not run the reference implementation.')
+    return parser.parse_args()
+
+
+def random_predictions(num_images, num_models, num_boxes, num_classes):
+    rng = np.random.RandomState(0)
+    predictions = []
+    for _ in range(num_images):
+        base = rng.rand(num_boxes, 4) * 1000
+        base[:, 2:] = base[:, :2] + rng.rand(num_boxes, 2) * 60 + 5
+        bboxes_list, scores_list, labels_list = [], [], []
+        for _ in range(num_models):
+            bboxes_list.append(base + rng.randn(num_boxes, 4) * 3)
+            scores_list.append(rng.rand(num_boxes))
+            labels_list.append(rng.randint(0, num_classes, num_boxes))
+        predictions.append((bboxes_list, scores_list, labels_list))
+    return predictions
+
+
+def load_predictions(pred_results, num_images):
+    num_models = len(pred_results)
+    predict = defaultdict(
+        lambda: tuple([[] for _ in range(num_models)] for _ in range(3)))
+    for i, path in enumerate(pred_results):
+        for pred in load(path):
+            x, y, w, h = pred['bbox']
+            bboxes_list, scores_list, labels_list = predict[pred['image_id']]
+            bboxes_list[i].append([x, y, x + w, y + h])
+            scores_list[i].append(pred['score'])
+            labels_list[i].append(pred['category_id'])
+    return list(predict.values())[:num_images]
+
+
+def run_batched(predictions, batch_size, device, **kwargs):
+    for start in range(0, len(predictions), batch_size):
+        bboxes, scores, labels, model_inds, batch_inds = [], [], [], [], []
+        for img_id, (bboxes_list, scores_list, labels_list) in enumerate(
+                predictions[start:start + batch_size]):
+            for model_id, scores_ in enumerate(scores_list):
+                bboxes.append(np.asarray(bboxes_list[model_id]).reshape(-1, 4))
+                scores.append(np.asarray(scores_))
+                labels.append(np.asarray(labels_list[model_id]))
+                model_inds.append(np.full(len(scores_), model_id))
+                batch_inds.append(np.full(len(scores_), img_id))
+        inputs = [
+            torch.from_numpy(np.concatenate(x)).to(device)
+            for x in (bboxes, scores, labels, model_inds, batch_inds)
+        ]
+        batched_weighted_boxes_fusion(
+            inputs[0].float(),
+            inputs[1].float(),
+            *inputs[2:],
+            num_models=len(predictions[0][1]),
+            **kwargs)
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+
+
+def main():
+    args = parse_args()
+    if args.pred_results:
+        predictions = load_predictions(args.pred_results, args.num_images)
+    else:
+        predictions = random_predictions(args.num_images, args.num_models,
+                                         args.num_boxes, args.num_classes)
+    kwargs = dict(
+        iou_thr=args.iou_thr,
+        skip_box_thr=args.skip_box_thr,
+        conf_type=args.conf_type)
+
+    funcs = dict(fast=fast_weighted_boxes_fusion)
+    if not args.skip_legacy:
+        funcs['legacy'] = weighted_boxes_fusion
+    for name, func in funcs.items():
+        start = time.perf_counter()
+        for pred in predictions:
+            func(*pred, **kwargs)
+        elapsed = time.perf_counter() - start
+        print_log(f'{name}: {elapsed:.3f} s, '
+                  f'{elapsed / len(predictions) * 1000:.2f} ms / img')
+
+    # warmup
+    run_batched(predictions[:args.batch_size], args.batch_size, args.device,
+                **kwargs)
+    start = time.perf_counter()
+    run_batched(predictions, args.batch_size, args.device, **kwargs)
+    elapsed = time.perf_counter() - start
+    print_log(f'batched ({args.device}, batch size {args.batch_size}): '
+              f'{elapsed:.3f} s, '
+              f'{elapsed / len(predictions) * 1000:.2f} ms / img')
+
+
+if __name__ == '__main__':
+    main()
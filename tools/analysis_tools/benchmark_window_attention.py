@@ -0,0 +1,98 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""Benchmark the window attention of the Swin backbones.
+
+The explicit attention and ``F.scaled_dot_product_attention`` are compared on
+the blocks of each stage of a Swin-L sized backbone, e.g.::
+
+    python tools/analysis_tools/benchmark_window_attention.py \
+        --img-shape 512 640 --batch-size 1
+"""
+import argparse
+import time
+
+import torch
+from mmengine.logging import print_log
+
+from mmdet.models.backbones.swin import HAS_SDPA, ShiftWindowMSA
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the window attention of the Swin backbones.')
+    parser.add_argument(
+        '--img-shape',
+        type=int,
+        nargs=2,
+        default=[512, 640],
+        help='height and width of the input images.')
+    parser.add_argument(
+        '--batch-size', type=int, default=1, help='number of images.')
+    parser.add_argument(
+        '--embed-dims',
+        type=int,
+        default=192,
+        help='feature dimension of the first stage.')
+    parser.add_argument(
+        '--num-heads',
+        type=int,
+        nargs='+',
+        default=[6, 12, 24, 48],
+        help='number of heads of the stages.')
+    parser.add_argument(
+        '--window-size', type=int, default=12, help='size of the windows.')
+    parser.add_argument(
+        '--repeat', type=int, default=10, help='number of timed runs.')
+    parser.add_argument(
+        '--backward',
+        action='store_true',
+        help='time the forward and backward passes.')
+    parser.add_argument('--device', default='cpu', help='device to use.')
+    return parser.parse_args()
+
+
+def timeit(func, repeat, device):
+    func()
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    args = parse_args()
+    assert HAS_SDPA, 'F.scaled_dot_product_attention requires PyTorch 2.1.'
+    H, W = args.img_shape[0] // 4, args.img_shape[1] // 4
+    for stage, num_heads in enumerate(args.num_heads):
+        embed_dims = args.embed_dims * 2**stage
+        x = torch.randn(args.batch_size, H * W, embed_dims, device=args.device)
+        for shift_size in (0, args.window_size // 2):
+            attn = ShiftWindowMSA(
+                embed_dims=embed_dims,
+                num_heads=num_heads,
+                window_size=args.window_size,
+                shift_size=shift_size).to(args.device)
+            attn.init_weights()
+
+            def run():
+                if args.backward:
+                    attn(x, (H, W)).sum().backward()
+                else:
+                    with torch.no_grad():
+                        attn(x, (H, W))
+
+            times = []
+            for use_sdpa in (False, True):
+                attn.w_msa.use_sdpa = use_sdpa
+                times.append(timeit(run, args.repeat, args.device))
+            print_log(f'stage {stage} ({H}x{W}, shift {shift_size}): '
+                      f'explicit {times[0]:.2f} ms, sdpa {times[1]:.2f} ms, '
+                      f'speedup {times[0] / times[1]:.2f}x')
+        H, W = (H + 1) // 2, (W + 1) // 2
+
+
+if __name__ == '__main__':
+    main()
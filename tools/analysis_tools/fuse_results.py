@@ -1,12 +1,25 @@
 import argparse
+import itertools
+import json
+import os.path as osp
+import time
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 
-from mmengine.fileio import dump, load
+import numpy as np
+from mmengine.fileio import load
 from mmengine.logging import print_log
-from mmengine.utils import ProgressBar
+from mmengine.utils import ProgressBar, mkdir_or_exist
 from pycocotools.coco import COCO
 from pycocotools.cocoeval import COCOeval
 
-from mmdet.models.utils import weighted_boxes_fusion
+from mmdet.models.utils import fast_weighted_boxes_fusion
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 
 def parse_args():
@@ -14,11 +27,11 @@ def parse_args():
         prediction results using Weighted \
         Boxes Fusion from multiple models.')
     parser.add_argument(
-        'pred-results',
+        'pred_results',
         type=str,
         nargs='+',
         help='files of prediction results \
-                    from multiple models, json format.')
+                    from multiple models, json or json-lines format.')
     parser.add_argument('--annotation', type=str, help='annotation file path')
     parser.add_argument(
         '--weights',
@@ -55,88 +68,347 @@ def parse_args():
         type=str,
         default='outputs',
         help='Output directory of images or prediction results.')
+    parser.add_argument(
+        '--out-format',
+        choices=['json', 'jsonl'],
+        default='json',
+        help='format of the saved fusion results, the results are written '
+        'incrementally in both formats.')
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='stream the predictions grouped by image_id instead of loading '
+        'every prediction file fully into memory. The predictions of an '
+        'image are expected to be contiguous in each file, which is the case '
+        'for the results dumped by mmdet.')
+    parser.add_argument(
+        '--nproc',
+        type=int,
+        default=1,
+        help='number of processes used to fuse the images.')
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=64,
+        help='number of images fused by a process in one task.')
 
     args = parser.parse_args()
 
     return args
 
 
-def main():
-    args = parse_args()
+class StageTimer:
+    """Accumulate the wall time spent in each stage of the fusion."""
+
+    def __init__(self):
+        self.times = OrderedDict(
+            (stage, 0.) for stage in ('load', 'group', 'fuse', 'evaluate'))
+
+    @contextmanager
+    def __call__(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[stage] = self.times.get(stage, 0.) + \
+                time.perf_counter() - start
+
+    def add(self, stage, elapsed):
+        self.times[stage] = self.times.get(stage, 0.) + elapsed
+
+    def log(self):
+        print_log('Time of each stage: ' +
+                  ', '.join(f'{stage}: {elapsed:.2f} s'
+                            for stage, elapsed in self.times.items()))
+
+
+def iter_predictions(path):
+    """Iterate the predictions of a json or json-lines file.
+
+    json-lines files and, if ``ijson`` is installed, json files are read
+    incrementally, other json files are loaded at once.
+    """
+    if path.endswith('.jsonl'):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif ijson is not None:
+        with open(path, 'rb') as f:
+            yield from ijson.items(f, 'item', use_float=True)
+    else:
+        yield from load(path)
 
-    assert len(args.models_name) == len(args.pred_results), \
-        'the quantities of model names and prediction results are not equal'
 
-    cocoGT = COCO(args.annotation)
+def stream_image_groups(pred_results, timer, img_ids=None):
+    """Yield the predictions of all models grouped by image.
 
+    Every file is read incrementally and the consecutive predictions of the
+    same image form a group. The images are expected in the same order in
+    every file, which is the order of ``img_ids`` if given, else ascending
+    image id. The groups of the models are read in lockstep and an image is
+    yielded once every model has given its predictions of this image, has
+    read past it or has been exhausted, so only the images that some model
+    has not reached yet are held in memory. A model without predictions of
+    an image gives an empty list.
+
+    Yields:
+        tuple: image id and the list of predictions of each model.
+    """
+    num_models = len(pred_results)
+    if img_ids is None:
+        rank = None
+    else:
+        rank = {image_id: i for i, image_id in enumerate(img_ids)}
+    readers = [
+        itertools.groupby(iter_predictions(path), key=lambda p: p['image_id'])
+        for path in pred_results
+    ]
+    pending = dict()
+    exhausted = set()
+    last = [None] * num_models
+
+    def get_rank(image_id):
+        if rank is None:
+            return image_id
+        if image_id not in rank:
+            raise ValueError(
+                f'Image {image_id} is not in the annotation file.')
+        return rank[image_id]
+
+    def is_complete(image_rank, group):
+        for i, preds in enumerate(group):
+            passed = last[i] is not None and last[i] > image_rank
+            if preds is None and i not in exhausted and not passed:
+                return False
+        return True
+
+    while len(exhausted) < num_models:
+        for i, reader in enumerate(readers):
+            if i in exhausted:
+                continue
+            with timer('load'):
+                try:
+                    image_id, preds = next(reader)
+                    preds = list(preds)
+                except StopIteration:
+                    preds = None
+            with timer('group'):
+                if preds is None:
+                    exhausted.add(i)
+                else:
+                    image_rank = get_rank(image_id)
+                    if last[i] is not None and image_rank <= last[i]:
+                        raise ValueError(
+                            f'The predictions of image {image_id} are not '
+                            f'contiguous or not in order in {pred_results[i]}'
+                            ', please sort the predictions by image or '
+                            'disable `--stream`.')
+                    last[i] = image_rank
+                    _, group = pending.setdefault(
+                        image_rank, (image_id, [None] * num_models))
+                    group[i] = preds
+                ready = []
+                for image_rank in sorted(pending):
+                    image_id, group = pending[image_rank]
+                    if is_complete(image_rank, group):
+                        del pending[image_rank]
+                        ready.append(
+                            (image_id, [preds or [] for preds in group]))
+            yield from ready
+
+
+def load_image_groups(pred_results, timer, cocoGT=None):
+    """Load all the predictions into memory and group them by image."""
+    num_models = len(pred_results)
     predicts_raw = []
+    with timer('load'):
+        for path in pred_results:
+            predicts_raw.append(list(iter_predictions(path)))
 
-    models_name = ['model_' + str(i) for i in range(len(args.pred_results))]
+    with timer('group'):
+        predict = defaultdict(lambda: [[] for _ in range(num_models)])
+        if cocoGT is not None:
+            for image_id in cocoGT.getImgIds():
+                predict[image_id]
+        for i, pred_single in enumerate(predicts_raw):
+            for pred in pred_single:
+                predict[pred['image_id']][i].append(pred)
+    return predict
 
-    for model_name, path in \
-            zip(models_name, args.pred_results):
-        pred = load(path)
-        predicts_raw.append(pred)
 
-        if args.eval_single:
-            print_log(f'Evaluate {model_name}...')
-            cocoDt = cocoGT.loadRes(pred)
-            coco_eval = COCOeval(cocoGT, cocoDt, iouType='bbox')
-            coco_eval.evaluate()
-            coco_eval.accumulate()
-            coco_eval.summarize()
-
-    predict = {
-        str(image_id): {
-            'bboxes_list': [[] for _ in range(len(predicts_raw))],
-            'scores_list': [[] for _ in range(len(predicts_raw))],
-            'labels_list': [[] for _ in range(len(predicts_raw))]
-        }
-        for image_id in cocoGT.getImgIds()
-    }
-
-    for i, pred_single in enumerate(predicts_raw):
-        for pred in pred_single:
-            p = predict[str(pred['image_id'])]
-            p['bboxes_list'][i].append(pred['bbox'])
-            p['scores_list'][i].append(pred['score'])
-            p['labels_list'][i].append(pred['category_id'])
+def fuse_single_image(image_id, preds_list, fusion_cfg):
+    """Fuse the predictions of all models on one image.
 
-    result = []
-    prog_bar = ProgressBar(len(predict))
-    for image_id, res in predict.items():
-        bboxes, scores, labels = weighted_boxes_fusion(
-            res['bboxes_list'],
-            res['scores_list'],
-            res['labels_list'],
-            weights=args.weights,
-            iou_thr=args.fusion_iou_thr,
-            skip_box_thr=args.skip_box_thr,
-            conf_type=args.conf_type)
-
-        for bbox, score, label in zip(bboxes, scores, labels):
-            result.append({
-                'bbox': bbox.numpy().tolist(),
-                'category_id': int(label),
-                'image_id': int(image_id),
-                'score': float(score)
-            })
-
-        prog_bar.update()
+    The boxes of the predictions are in COCO (x, y, w, h) format, they are
+    converted to (x1, y1, x2, y2) for the fusion and back.
+    """
+    bboxes_list, scores_list, labels_list = [], [], []
+    for preds in preds_list:
+        bboxes = np.array([p['bbox'] for p in preds],
+                          dtype=np.float64).reshape(-1, 4)
+        bboxes[:, 2:] += bboxes[:, :2]
+        bboxes_list.append(bboxes)
+        scores_list.append([p['score'] for p in preds])
+        labels_list.append([p['category_id'] for p in preds])
 
-    if args.save_fusion_results:
-        out_file = args.out_dir + '/fusion_results.json'
-        dump(result, file=out_file)
-        print_log(
-            f'Fusion results have been saved to {out_file}.', logger='current')
+    bboxes, scores, labels = fast_weighted_boxes_fusion(
+        bboxes_list, scores_list, labels_list, **fusion_cfg)
+    if len(bboxes) == 0:
+        return []
+    bboxes = bboxes.numpy()
+    bboxes[:, 2:] -= bboxes[:, :2]
+
+    return [{
+        'bbox': bbox,
+        'category_id': label,
+        'image_id': image_id,
+        'score': score
+    } for bbox, score, label in zip(bboxes.tolist(), scores.tolist(),
+                                    labels.tolist())]
+
+
+def fuse_chunk(chunk, fusion_cfg):
+    """Fuse a chunk of images, return the results and the fusion time."""
+    start = time.perf_counter()
+    results = []
+    for image_id, preds_list in chunk:
+        results.extend(fuse_single_image(image_id, preds_list, fusion_cfg))
+    return results, time.perf_counter() - start
 
-    print_log('Evaluate fusion results using wbf...')
-    cocoDt = cocoGT.loadRes(result)
+
+def iter_fused_chunks(image_groups, fusion_cfg, nproc, chunk_size, timer):
+    """Fuse the images in chunks, in a process pool if ``nproc > 1``.
+
+    At most ``2 * nproc`` chunks are in flight so that the groups are not
+    read faster than they are fused. The fused chunks are yielded in order.
+    The fuse time is the time spent by the processes on fusing, summed over
+    the processes.
+    """
+    chunks = iter(lambda: list(itertools.islice(image_groups, chunk_size)), [])
+    if nproc <= 1:
+        for chunk in chunks:
+            results, elapsed = fuse_chunk(chunk, fusion_cfg)
+            timer.add('fuse', elapsed)
+            yield len(chunk), results
+        return
+
+    with ProcessPoolExecutor(nproc) as executor:
+        futures = deque()
+        for chunk in chunks:
+            futures.append(
+                (len(chunk), executor.submit(fuse_chunk, chunk, fusion_cfg)))
+            if len(futures) >= 2 * nproc:
+                num_images, future = futures.popleft()
+                results, elapsed = future.result()
+                timer.add('fuse', elapsed)
+                yield num_images, results
+        while futures:
+            num_images, future = futures.popleft()
+            results, elapsed = future.result()
+            timer.add('fuse', elapsed)
+            yield num_images, results
+
+
+class ResultWriter:
+    """Write the fused results incrementally to a json or json-lines
+    file."""
+
+    def __init__(self, out_file):
+        self.out_file = out_file
+        self.jsonl = out_file.endswith('.jsonl')
+        self.file = open(out_file, 'w')
+        self.first = True
+        if not self.jsonl:
+            self.file.write('[')
+
+    def write(self, results):
+        for result in results:
+            if self.jsonl:
+                self.file.write(json.dumps(result) + '\n')
+            else:
+                self.file.write(('' if self.first else ',') +
+                                json.dumps(result))
+                self.first = False
+
+    def close(self):
+        if not self.jsonl:
+            self.file.write(']')
+        self.file.close()
+
+
+def coco_evaluate(cocoGT, results):
+    """Evaluate results given as a list, a json or a json-lines file."""
+    if isinstance(results, str) and results.endswith('.jsonl'):
+        results = list(iter_predictions(results))
+    cocoDt = cocoGT.loadRes(results)
     coco_eval = COCOeval(cocoGT, cocoDt, iouType='bbox')
     coco_eval.evaluate()
     coco_eval.accumulate()
     coco_eval.summarize()
 
 
+def main():
+    args = parse_args()
+    timer = StageTimer()
+
+    cocoGT = COCO(args.annotation) if args.annotation else None
+
+    models_name = ['model_' + str(i) for i in range(len(args.pred_results))]
+
+    if args.eval_single and cocoGT is not None:
+        for model_name, path in zip(models_name, args.pred_results):
+            print_log(f'Evaluate {model_name}...')
+            with timer('evaluate'):
+                coco_evaluate(cocoGT, path)
+
+    if args.stream:
+        image_groups = stream_image_groups(
+            args.pred_results, timer,
+            cocoGT.getImgIds() if cocoGT is not None else None)
+        prog_bar = ProgressBar(
+            len(cocoGT.getImgIds()) if cocoGT is not None else 0)
+    else:
+        predict = load_image_groups(args.pred_results, timer, cocoGT)
+        image_groups = iter(predict.items())
+        prog_bar = ProgressBar(len(predict))
+
+    fusion_cfg = dict(
+        weights=args.weights,
+        iou_thr=args.fusion_iou_thr,
+        skip_box_thr=args.skip_box_thr,
+        conf_type=args.conf_type)
+
+    writer = None
+    if args.save_fusion_results:
+        mkdir_or_exist(args.out_dir)
+        out_file = osp.join(args.out_dir, f'fusion_results.{args.out_format}')
+        writer = ResultWriter(out_file)
+
+    result = []
+    for num_images, results in iter_fused_chunks(image_groups, fusion_cfg,
+                                                 args.nproc, args.chunk_size,
+                                                 timer):
+        if writer is not None:
+            writer.write(results)
+        else:
+            result.extend(results)
+        for _ in range(num_images):
+            prog_bar.update()
+
+    if writer is not None:
+        writer.close()
+        print_log(
+            f'Fusion results have been saved to {out_file}.', logger='current')
+        result = out_file
+
+    if cocoGT is not None:
+        print_log('Evaluate fusion results using wbf...')
+        with timer('evaluate'):
+            coco_evaluate(cocoGT, result)
+
+    timer.log()
+
+
 if __name__ == '__main__':
     main()
@@ -94,7 +94,14 @@ def inference(args, logger):
         result['pad_shape'] = data['data_samples'][0].pad_shape
         if hasattr(data['data_samples'][0], 'batch_input_shape'):
             result['pad_shape'] = data['data_samples'][0].batch_input_shape
-        model.forward = partial(_forward, data_samples=data['data_samples'])
+        # the extra streams of the multi-stream detectors, e.g. ``inputs2``
+        extra_inputs = {
+            key: value
+            for key, value in data.items()
+            if key.startswith('inputs') and key != 'inputs'
+        }
+        model.forward = partial(
+            _forward, data_samples=data['data_samples'], **extra_inputs)
         outputs = get_model_complexity_info(
             model,
             None,
@@ -0,0 +1,84 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""Extract the paired RGB/TIR objects of a dataset into an object bank.
+
+The bank is used by the ``CopyPasteObjectBank`` transform.
+
+Example:
+    python tools/misc/build_object_bank.py ${CONFIG} ${OUT_DIR}
+"""
+import argparse
+
+from mmengine.config import Config, DictAction
+from mmengine.logging import print_log
+from mmengine.registry import init_default_scope
+from mmengine.utils import ProgressBar
+
+from mmdet.datasets.transforms.my_transforms_possion import ObjectBank
+from mmdet.registry import DATASETS
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Extract the objects of a dataset into an object bank')
+    parser.add_argument('config', help='train config file path')
+    parser.add_argument('out_dir', help='output directory of the bank')
+    parser.add_argument(
+        '--min-size',
+        type=int,
+        default=4,
+        help='minimum width and height of the objects')
+    parser.add_argument(
+        '--max-black-ratio',
+        type=float,
+        default=0.1,
+        help='skip the objects with more black pixels than this ratio')
+    parser.add_argument(
+        '--cfg-options',
+        nargs='+',
+        action=DictAction,
+        help='override some settings in the used config, the key-value pair '
+        'in xxx=yyy format will be merged into config file. If the value to '
+        'be overwritten is a list, it should be like key="[a,b]" or key=a,b '
+        'It also allows nested list/tuple values, e.g. key="[(a,b),(c,d)]" '
+        'Note that the quotation marks are necessary and that no white space '
+        'is allowed.')
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    cfg = Config.fromfile(args.config)
+    if args.cfg_options is not None:
+        cfg.merge_from_dict(args.cfg_options)
+
+    # register all modules in mmdet into the registries
+    init_default_scope(cfg.get('default_scope', 'mmdet'))
+
+    # only load the images and the annotations
+    dataset_cfg = cfg.train_dataloader.dataset
+    dataset_cfg.pipeline = [
+        dict(type='LoadImageFromFile'),
+        dict(type='LoadImageFromFile2'),
+        dict(type='LoadAnnotations', with_bbox=True)
+    ]
+    dataset = DATASETS.build(dataset_cfg)
+
+    def samples():
+        progress_bar = ProgressBar(len(dataset))
+        for i in range(len(dataset)):
+            results = dataset.pipeline(dataset.get_data_info(i))
+            if results is not None:
+                yield results
+            progress_bar.update()
+
+    num_objects = ObjectBank.build(
+        samples(),
+        args.out_dir,
+        min_size=args.min_size,
+        max_black_ratio=args.max_black_ratio)
+    print_log(f'{num_objects} objects have been saved to {args.out_dir}.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""Pack the paired RGB/TIR images of a dataset into memory-mapped shards.
+
+The shards are loaded with the ``LoadPairedImagesFromShards`` transform,
+which replaces ``LoadImageFromFile`` and ``LoadImageFromFile2``.
+
+Example:
+    python tools/misc/pack_paired_images.py ${CONFIG} ${OUT_DIR} --decode
+"""
+import argparse
+import os.path as osp
+
+from mmengine.config import Config, DictAction
+from mmengine.fileio import get
+from mmengine.logging import print_log
+from mmengine.registry import init_default_scope
+from mmengine.utils import ProgressBar
+
+from mmdet.datasets.transforms.my_loading import PairedImageShards
+from mmdet.registry import DATASETS
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Pack the paired images of a dataset into shards')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('out_dir', help='output directory of the shards')
+    parser.add_argument(
+        '--split',
+        default='train',
+        choices=['train', 'val', 'test'],
+        help='the dataloader of the dataset to pack')
+    parser.add_argument(
+        '--decode',
+        action='store_true',
+        help='store the decoded images, e.g. for small images such as the '
+        '640x512 frames of DroneVehicle')
+    parser.add_argument(
+        '--shard-size',
+        type=int,
+        default=1024,
+        help='maximum size of a shard in MiB')
+    parser.add_argument(
+        '--cfg-options',
+        nargs='+',
+        action=DictAction,
+        help='override some settings in the used config, the key-value pair '
+        'in xxx=yyy format will be merged into config file. If the value to '
+        'be overwritten is a list, it should be like key="[a,b]" or key=a,b '
+        'It also allows nested list/tuple values, e.g. key="[(a,b),(c,d)]" '
+        'Note that the quotation marks are necessary and that no white space '
+        'is allowed.')
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    cfg = Config.fromfile(args.config)
+    if args.cfg_options is not None:
+        cfg.merge_from_dict(args.cfg_options)
+
+    # register all modules in mmdet into the registries
+    init_default_scope(cfg.get('default_scope', 'mmdet'))
+
+    dataset_cfg = cfg[f'{args.split}_dataloader'].dataset
+    dataset_cfg.pipeline = []
+    dataset = DATASETS.build(dataset_cfg)
+    data_root = dataset_cfg.get('data_root')
+    backend_args = dataset_cfg.get('backend_args')
+
+    def pairs():
+        progress_bar = ProgressBar(len(dataset))
+        keys = set()
+        for i in range(len(dataset)):
+            data_info = dataset.get_data_info(i)
+            key = data_info['img_path']
+            if data_root is not None:
+                key = osp.relpath(key, data_root)
+            if key not in keys:
+                keys.add(key)
+                yield (key,
+                       get(data_info['img_path'], backend_args=backend_args),
+                       get(data_info['img_path2'], backend_args=backend_args))
+            progress_bar.update()
+
+    num_pairs = PairedImageShards.build(
+        pairs(),
+        args.out_dir,
+        decode=args.decode,
+        shard_size=args.shard_size * 2**20)
+    print_log(f'{num_pairs} pairs have been saved to {args.out_dir}, load '
+              f'them with `LoadPairedImagesFromShards` and '
+              f'data_root={data_root!r}.')
+
+
+if __name__ == '__main__':
+    main()